@@ -1,45 +1,148 @@
-from anthropic import Anthropic
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 import json
 import os
+import threading
 import time
 from datetime import datetime
-from .config import get_model_id, get_active_model
-from .pattern_matcher import load_classic_patterns, match_classic_patterns, pre_screen_stocks
+from .claude_batch import BATCH_PRICE_RATIO, MessageBatchRunner
+from .claude_cache import ResponseCache, cacheable_response
+from .claude_client import FakeClaudeClient, create_client
+from .characteristic_predicates import FeatureFrame, compile_characteristics, evaluate_patterns, evaluate_predicates
+from .claude_metrics import summarize_calls
+from .claude_retry import CircuitOpenError, RetryPolicy, get_breaker, run_with_retry
+from .claude_executor import ClaudeExecutor, RateLimiter, estimate_tokens
+from .config import (
+    get_model_id, get_active_model, CLAUDE_CACHE_ENABLED, CLAUDE_MAX_IN_FLIGHT, CLAUDE_RPM_LIMIT, CLAUDE_TPM_LIMIT,
+    PREDICT_PROMPT_TOKEN_BUDGET, AI_VALIDATION_MODE, VALIDATION_PATTERNS_PER_CALL,
+    CLAUDE_CACHE_PATH, CLAUDE_STREAMING, FAKE_CLAUDE_CACHE_PATH,
+    LOCAL_SCORER_TOP_K, PREDICT_SCORER, PREDICT_LLM_TOP_K, PREDICT_MIN_SCREENED,
+    AI_MODELS, PREDICT_CASCADE_ENABLED, CASCADE_TIERS, CASCADE_BORDERLINE, CASCADE_COST_CEILING_USD,
+    LLM_RECORD_CALLS, LLM_RECORD_KEEP_SESSIONS, LLM_RECORD_MAX_AGE_DAYS,
+)
+from .pattern_matcher import is_matchable, load_classic_patterns, match_classic_patterns, match_stocks, pre_screen_stocks
+from .json_stream import JsonArrayStream
+from .llm_replay import ReplayClaudeClient, llm_call_record
+from .local_scorer import LocalScorer, load_scorer
+from .kline_codec import KLINE_LEGEND, SAMPLE_LEGEND, encode_klines, encode_samples
+from .prompt_packer import pack_by_budget
+from .quant_features import quantitative_features_batch
+
+# 提示词缓存计价（相对基础输入价格）
+CACHE_WRITE_PRICE_RATIO = 1.25
+CACHE_READ_PRICE_RATIO = 0.1
+
+MODEL_USAGE_FIELDS = (
+    'calls', 'input_tokens', 'output_tokens', 'batch_input_tokens', 'batch_output_tokens',
+    'cache_creation_input_tokens', 'cache_read_input_tokens', 'latency_seconds',
+)
+
+
+def model_price(model_id: str):
+    """模型的 (输入, 输出) 单价，美元 / 百万 token
+
+    - Sonnet: $3/M input, $15/M output
+    - Haiku: $0.25/M input, $1.25/M output
+    - Opus 或其他: $15/M input, $75/M output
+    """
+    model_id = model_id.lower()
+    if 'haiku' in model_id:
+        return 0.25, 1.25
+    if 'sonnet' in model_id:
+        return 3, 15
+    return 15, 75
+
+
+def usage_cost(model_id: str, usage: Dict) -> float:
+    """按 model_usage 条目计算成本（批次折扣、缓存读写倍率）"""
+    discount = 1 - BATCH_PRICE_RATIO
+    input_tokens = (usage['input_tokens'] - usage['batch_input_tokens'] * discount
+                    + usage['cache_creation_input_tokens'] * CACHE_WRITE_PRICE_RATIO
+                    + usage['cache_read_input_tokens'] * CACHE_READ_PRICE_RATIO)
+    output_tokens = usage['output_tokens'] - usage['batch_output_tokens'] * discount
+    input_price, output_price = model_price(model_id)
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
 
 class StockAnalyzer:
     """使用 Claude AI 进行股票分析"""
 
-    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None, db=None):
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None, db=None, client=None):
         """初始化StockAnalyzer
 
         Args:
             api_key: Anthropic API密钥（可选，无密钥时仅支持非AI功能）
             model: 模型ID（可选）
             db: StockDatabase实例（可选，用于保存预测结果）
+            client: Claude 客户端（可选，如 FakeClaudeClient；None 时按 config.CLAUDE_CLIENT 创建）
         """
         # 数据库依赖注入
         self.db = db
 
         # API密钥处理：无密钥时不崩溃，而是延迟初始化
         self.api_key = api_key
-        self.client = None
-        self.ai_enabled = False
+        self.client = client
 
-        if api_key:
+        if client is None:
             try:
-                self.client = Anthropic(api_key=api_key)
-                self.ai_enabled = True
+                self.client = create_client(api_key)
             except Exception as e:
                 print(f"⚠️  Claude API初始化失败: {e}")
                 print(f"   AI功能将不可用，但基础功能仍可正常运行")
+        self.ai_enabled = self.client is not None
 
         # API调用统计
         self.api_calls = 0
         self.api_errors = 0
         self.total_input_tokens = 0
         self.total_output_tokens = 0
+        self._stats_lock = threading.Lock()
+
+        # 并发执行与限速（多个批次/模式的调用并行发出）
+        self.rate_limiter = RateLimiter(CLAUDE_RPM_LIMIT, CLAUDE_TPM_LIMIT)
+        self.executor = ClaudeExecutor(CLAUDE_MAX_IN_FLIGHT)
+
+        # 重试退避策略与熔断器（熔断器进程内共享，所有调用方看到同一状态与 Retry-After 暂停）
+        self.retry_policy = RetryPolicy()
+        self.circuit_breaker = get_breaker("claude")
+
+        # 响应缓存（重跑相同提示词时直接返回；模拟客户端使用独立的缓存文件，避免与真实响应混用）
+        self.response_cache = None
+        if self.ai_enabled and CLAUDE_CACHE_ENABLED:
+            fake = isinstance(self.client, FakeClaudeClient)
+            self.response_cache = ResponseCache(FAKE_CLAUDE_CACHE_PATH if fake else CLAUDE_CACHE_PATH)
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # Message Batches（None 时使用 client.messages.batches，测试可注入 FakeBatchService）
+        self.batch_service = None
+        self.batch_input_tokens = 0
+        self.batch_output_tokens = 0
+
+        # 提示词前缀缓存的写入/读取 token（不计入 total_input_tokens，单独计价）
+        self.cache_creation_input_tokens = 0
+        self.cache_read_input_tokens = 0
+
+        # 最近一次预测的装箱统计与全部候选股票的量化特征
+        self.last_packing: Dict = {}
+        self.last_screened: List[Dict] = []
+
+        # 本地评分模型（首次使用时从 LOCAL_SCORER_DIR 加载最新版本，可直接赋值注入）
+        self.local_scorer: Optional[LocalScorer] = None
+        self.last_local_scoring: Dict = {}
+
+        # 最近一次预测流水线（筛选 → 本地评分 → Claude）各阶段的数量与耗时
+        self.last_pipeline: Dict = {}
+
+        # LLM 调用录制（需要数据库；每个分析器实例一个录制会话，可用 enable_replay 回放）
+        self.record_llm_calls = LLM_RECORD_CALLS
+        self.llm_session_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        self._llm_calls_pruned = False
+
+        # 按模型累计的用量（级联预测时各层级分别计价）与最近一次级联预测的统计
+        self.model_usage: Dict[str, Dict] = {}
+        self.last_cascade: Dict = {}
 
         # 从配置文件获取模型ID
         if model is None:
@@ -69,61 +172,256 @@ class StockAnalyzer:
         self,
         prompt: str,
         max_tokens: int = 4096,
-        max_retries: int = 3,
-        timeout: int = 60
+        max_retries: Optional[int] = None,
+        timeout: int = 60,
+        use_cache: bool = True,
+        cached_prefix: Optional[str] = None,
+        on_text: Optional[Callable[[Optional[str]], None]] = None,
+        model: Optional[str] = None,
+        task: str = 'other',
+        run_usage: Optional[Dict[str, Dict]] = None
     ) -> Optional[str]:
         """带重试和超时机制的Claude API调用
 
         Args:
             prompt: 提示词
             max_tokens: 最大token数
-            max_retries: 最大重试次数
+            max_retries: 最大尝试次数（None 使用 self.retry_policy，默认 config.CLAUDE_RETRY_MAX）；
+                退避带随机抖动并遵守 Retry-After，400 等不可重试的错误立即失败，熔断器打开时直接返回 None
             timeout: 超时时间（秒）
+            use_cache: 是否使用响应缓存（False 时强制请求 API，结果仍会写入缓存）
+            cached_prefix: 各次调用相同的静态前缀（模式列表、说明等），标记为提示词缓存，
+                只有 prompt 部分每次变化
+            on_text: 流式接收响应文本块（客户端支持 messages.stream 时边生成边回调，否则一次性回调全文）；
+                某次尝试中途失败时回调 None，之后的文本从头重新开始
+            model: 本次调用使用的模型ID（None 使用 self.model，级联预测时按层级指定）
+            task: 调用的任务类型（写入调用记录，按任务统计延迟与成本）
+            run_usage: 本次运行的按模型用量累计（{model: 用量}），成功调用的用量同时累加到其中
 
         Returns:
             API响应文本，失败返回None
         """
-        for attempt in range(max_retries):
+        model = model or self.model
+        call_started = time.monotonic()
+        full_prompt = cached_prefix + prompt if cached_prefix else prompt
+        if self.response_cache is not None and use_cache:
+            cached = self.response_cache.get(model, full_prompt, max_tokens)
+            if cached is not None and not cacheable_response(cached):
+                # 截断或无法解析的缓存响应：删除后重新请求
+                self.response_cache.delete(model, full_prompt, max_tokens)
+                cached = None
+            with self._stats_lock:
+                if cached is not None:
+                    self.cache_hits += 1
+                else:
+                    self.cache_misses += 1
+            if cached is not None:
+                print(f"   ♻️  命中响应缓存，跳过API调用")
+                self._log_call(model, task, 'cache_hit', total_seconds=time.monotonic() - call_started)
+                self._record_llm_call(model, task, 'cache', full_prompt, cached)
+                if on_text is not None:
+                    on_text(cached)
+                return cached
+
+        estimated_tokens = estimate_tokens(full_prompt)
+        policy = self.retry_policy
+        if max_retries is not None and max_retries != policy.max_retries:
+            policy = RetryPolicy(max_retries, policy.base_delay, policy.max_delay, policy.rate_limit_multiplier)
+        last_attempt = 0
+
+        def attempt_call(attempt: int) -> str:
+            nonlocal last_attempt
+            last_attempt = attempt
+            print(f"   Claude API调用 (尝试 {attempt + 1}/{policy.max_retries})...")
             try:
-                print(f"   Claude API调用 (尝试 {attempt + 1}/{max_retries})...")
+                waited = self.rate_limiter.acquire(estimated_tokens)
+                if waited > 1:
+                    print(f"   ⏳ 限速等待 {waited:.1f} 秒")
 
-                message = self.client.messages.create(
-                    model=self.model,
+                request = dict(
+                    model=model,
                     max_tokens=max_tokens,
                     timeout=timeout,  # 设置超时
-                    messages=[{"role": "user", "content": prompt}]
+                    messages=[{"role": "user", "content": self._user_content(prompt, cached_prefix)}]
                 )
+                streamed = on_text is not None and CLAUDE_STREAMING and hasattr(self.client.messages, 'stream')
+                started = time.monotonic()
+                if streamed:
+                    with self.client.messages.stream(**request) as stream:
+                        for text in stream.text_stream:
+                            on_text(text)
+                        message = stream.get_final_message()
+                else:
+                    message = self.client.messages.create(**request)
+            except Exception:
+                with self._stats_lock:
+                    self.api_errors += 1
+                if on_text is not None:
+                    on_text(None)
+                raise
+
+            # 更新API统计（并发调用共享计数）并写入调用记录
+            latency = time.monotonic() - started
+            response_text = self._accept_message(message, model, estimated_tokens, latency, run_usage)
+            self._log_call(model, task, 'success', message.usage, latency_seconds=latency,
+                           total_seconds=time.monotonic() - call_started, retries=attempt, streamed=streamed)
+            self._record_llm_call(model, task, 'api', full_prompt, response_text, message.usage, latency)
+            if self.response_cache is not None and cacheable_response(response_text, message.stop_reason):
+                self.response_cache.put(model, full_prompt, max_tokens, response_text,
+                                        message.usage.input_tokens, message.usage.output_tokens)
+            if on_text is not None and not streamed:
+                on_text(response_text)
+            return response_text
+
+        def on_retry(attempt: int, error: Exception, delay: float):
+            print(f"   ⚠️  API调用失败: {error}")
+            print(f"   等待 {delay:.1f} 秒后重试...")
 
-                # 更新API统计
-                self.api_calls += 1
-                self.total_input_tokens += message.usage.input_tokens
-                self.total_output_tokens += message.usage.output_tokens
+        try:
+            return run_with_retry(attempt_call, policy, self.circuit_breaker, on_retry)
+        except CircuitOpenError as e:
+            print(f"   🔌 {e}，跳过本次调用")
+            self._log_call(model, task, 'circuit_open', total_seconds=time.monotonic() - call_started)
+            return None
+        except Exception as e:
+            error_msg = str(e)
+            print(f"   ❌ API调用最终失败: {error_msg}")
+            print(f"   错误类型: {type(e).__name__}")
+            if hasattr(e, 'response'):
+                print(f"   响应: {e.response}")
+            self._log_call(model, task, 'error', total_seconds=time.monotonic() - call_started,
+                           retries=last_attempt, error=f"{type(e).__name__}: {error_msg[:200]}")
+            return None
+
+    @staticmethod
+    def _user_content(prompt: str, cached_prefix: Optional[str] = None):
+        """用户消息内容：有静态前缀时拆为两个文本块，前缀块带 cache_control"""
+        if not cached_prefix:
+            return prompt
+        return [
+            {"type": "text", "text": cached_prefix, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": prompt},
+        ]
+
+    def _record_usage(self, usage, batch: bool = False, model: Optional[str] = None, latency: float = 0.0,
+                      run_usage: Optional[Dict[str, Dict]] = None):
+        """累计一次成功调用的 token 用量（总计与按模型分别累计），返回 (缓存写入, 缓存读取) token 数
+
+        run_usage 为本次运行的按模型累计（级联预测按运行计算成本上限，不受并发运行影响）
+        """
+        cache_write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+        cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+        with self._stats_lock:
+            self.api_calls += 1
+            self.total_input_tokens += usage.input_tokens
+            self.total_output_tokens += usage.output_tokens
+            self.cache_creation_input_tokens += cache_write
+            self.cache_read_input_tokens += cache_read
+            if batch:
+                self.batch_input_tokens += usage.input_tokens
+                self.batch_output_tokens += usage.output_tokens
+
+            for usage_by_model in (self.model_usage, run_usage):
+                if usage_by_model is None:
+                    continue
+                entry = usage_by_model.setdefault(model or self.model, dict.fromkeys(MODEL_USAGE_FIELDS, 0))
+                entry['calls'] += 1
+                entry['input_tokens'] += usage.input_tokens
+                entry['output_tokens'] += usage.output_tokens
+                entry['cache_creation_input_tokens'] += cache_write
+                entry['cache_read_input_tokens'] += cache_read
+                entry['latency_seconds'] += latency
+                if batch:
+                    entry['batch_input_tokens'] += usage.input_tokens
+                    entry['batch_output_tokens'] += usage.output_tokens
+        return cache_write, cache_read
+
+    def _accept_message(self, message, model: str, estimated_tokens: int, latency: float,
+                        run_usage: Optional[Dict[str, Dict]] = None) -> str:
+        """登记一次成功响应的用量并按实际 token 数校正限速，返回响应文本"""
+        cache_write, cache_read = self._record_usage(message.usage, model=model, latency=latency,
+                                                     run_usage=run_usage)
+        self.rate_limiter.settle(estimated_tokens, message.usage.input_tokens + cache_write)
+        print(f"   ✅ API调用成功 (输入:{message.usage.input_tokens} 输出:{message.usage.output_tokens}"
+              f"{f' 缓存写:{cache_write} 缓存读:{cache_read}' if cache_write or cache_read else ''})")
+        return message.content[0].text
+
+    def _record_llm_call(self, model: str, task: str, source: str, prompt: str, response: str,
+                         usage=None, latency: float = 0.0):
+        """录制一次调用的完整提示词与响应（需要配置数据库，见 llm_replay）"""
+        if not self.db or not self.record_llm_calls:
+            return
+        try:
+            self.db.save_llm_call(llm_call_record(self.llm_session_id, model, task, source, prompt, response,
+                                                  usage, latency))
+            if self._start_llm_session():
+                self._report_pruned(self.db.prune_llm_calls(LLM_RECORD_KEEP_SESSIONS, LLM_RECORD_MAX_AGE_DAYS))
+        except Exception as e:
+            print(f"录制调用失败: {e}")
+
+    def _start_llm_session(self) -> bool:
+        """录制会话的第一次调用返回 True（此时清理旧录制，当前会话已计入保留数）"""
+        with self._stats_lock:
+            started, self._llm_calls_pruned = not self._llm_calls_pruned, True
+        return started
+
+    @staticmethod
+    def _report_pruned(deleted: int):
+        if deleted:
+            print(f"🧹 清理旧的 LLM 调用录制 {deleted} 条")
+
+    def enable_replay(self, session_id: Optional[str] = None, speed: float = 0.0) -> str:
+        """切换到回放模式：之后的调用由录制会话的响应返回，不访问 API、不录制、不使用响应缓存
 
-                response_text = message.content[0].text
-                print(f"   ✅ API调用成功 (输入:{message.usage.input_tokens} 输出:{message.usage.output_tokens})")
-                return response_text
+        Args:
+            session_id: 录制会话ID（None 为最近一次录制）
+            speed: 录制延迟的倍数（0 = 立即返回，1 = 按录制时的延迟等待）
 
-            except Exception as e:
-                self.api_errors += 1
-                error_msg = str(e)
-
-                # 检查是否是限流错误
-                is_rate_limit = "rate_limit" in error_msg.lower() or "429" in error_msg
-
-                if attempt < max_retries - 1:
-                    # 指数退避：2^attempt 秒，限流错误等待更久
-                    wait_time = (2 ** attempt) * (5 if is_rate_limit else 1)
-                    print(f"   ⚠️  API调用失败: {error_msg}")
-                    print(f"   等待 {wait_time} 秒后重试...")
-                    time.sleep(wait_time)
-                else:
-                    print(f"   ❌ API调用最终失败: {error_msg}")
-                    print(f"   错误类型: {type(e).__name__}")
-                    if hasattr(e, 'response'):
-                        print(f"   响应: {e.response}")
-                    return None
+        Returns:
+            回放的会话ID
 
-        return None
+        Raises:
+            ValueError: 未配置数据库或没有录制
+        """
+        if not self.db:
+            raise ValueError("回放需要配置数据库")
+        calls = self.db.get_llm_calls(session_id)
+        if not calls:
+            raise ValueError(f"没有找到录制的调用: {session_id or '最近一次录制'}")
+        self.client = ReplayClaudeClient(calls, speed=speed)
+        self.ai_enabled = True
+        self.response_cache = None
+        self.batch_service = None
+        self.record_llm_calls = False
+        print(f"⏪ 回放录制会话 {calls[0]['session_id']}（{len(calls)} 次调用）")
+        return calls[0]['session_id']
+
+    def _log_call(self, model: str, task: str, outcome: str, usage=None, **fields):
+        """写入一次调用记录（需要配置数据库；usage 为 API 返回的用量，用于记录 token 与成本）"""
+        if not self.db:
+            return
+        try:
+            self.db.save_claude_call(self._call_record(model, task, outcome, usage, **fields))
+        except Exception as e:
+            print(f"保存调用记录失败: {e}")
+
+    @staticmethod
+    def _call_record(model: str, task: str, outcome: str, usage=None, **fields) -> Dict:
+        """一次调用的记录（database.save_claude_call 的参数）"""
+        call = dict(fields, model=model, task=task, outcome=outcome)
+        if usage is not None:
+            entry = dict.fromkeys(MODEL_USAGE_FIELDS, 0)
+            entry['input_tokens'] = usage.input_tokens
+            entry['output_tokens'] = usage.output_tokens
+            entry['cache_creation_input_tokens'] = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+            entry['cache_read_input_tokens'] = getattr(usage, 'cache_read_input_tokens', 0) or 0
+            if fields.get('batch'):
+                entry['batch_input_tokens'] = usage.input_tokens
+                entry['batch_output_tokens'] = usage.output_tokens
+            call.update({key: entry[key] for key in ('input_tokens', 'output_tokens', 'cache_creation_input_tokens',
+                                                     'cache_read_input_tokens')})
+            call['cost_usd'] = usage_cost(model, entry)
+        return call
 
     def analyze_rising_patterns(self, sample_data: pd.DataFrame) -> List[Dict]:
         """分析上涨模式
@@ -138,10 +436,17 @@ class StockAnalyzer:
         if not self._check_ai_available():
             return []
 
+        # 使用带重试的API调用
+        response_text = self._call_claude_with_retry(self._analyze_prompt(sample_data), max_tokens=4096,
+                                                     task='analyze_patterns')
+        return self._parse_patterns(response_text)
+
+    def _analyze_prompt(self, sample_data: pd.DataFrame) -> str:
+        """上涨模式分析的提示词"""
         # 准备数据摘要
         data_summary = self._prepare_data_summary(sample_data)
 
-        prompt = f"""你是一位专业的股票技术分析师。我给你提供了{len(sample_data)}个历史上涨案例（3天后收盘价上涨≥8%的股票数据）。
+        return f"""你是一位专业的股票技术分析师。我给你提供了{len(sample_data)}个历史上涨案例（3天后收盘价上涨≥8%的股票数据）。
 
 请深入分析这些数据，总结出8-12种具有代表性的上涨模式特征。由于样本量很大，请尽量识别出更多细分的模式类型。
 
@@ -179,9 +484,9 @@ class StockAnalyzer:
 - highlight_description要具体，便于在K线图上可视化
 - 只返回JSON数组，不要其他文字"""
 
-        # 使用带重试的API调用
-        response_text = self._call_claude_with_retry(prompt, max_tokens=4096)
-
+    @staticmethod
+    def _parse_patterns(response_text: Optional[str]) -> List[Dict]:
+        """解析模式分析响应（调用失败或解析失败返回空列表）"""
         if not response_text:
             print("❌ Claude API调用失败，无法分析模式")
             return []
@@ -210,7 +515,12 @@ class StockAnalyzer:
         patterns: List[Dict],
         batch_size: int = 50,
         use_pre_screening: bool = True,
-        pattern_file: str = 'classic_patterns.json'
+        pattern_file: str = 'classic_patterns.json',
+        mode: str = 'sync',
+        on_prediction: Optional[Callable[[Dict], None]] = None,
+        cascade: Optional[bool] = None,
+        scorer: Optional[str] = None,
+        top_k: Optional[int] = None
     ) -> List[Dict]:
         """批量预测股票上涨概率（支持程序预筛选）
 
@@ -220,15 +530,69 @@ class StockAnalyzer:
             batch_size: 每批处理的股票数量
             use_pre_screening: 是否使用程序预筛选（降低成本）
             pattern_file: 经典模式定义文件路径
+            mode: 'sync' 并发同步调用；'batch' 通过 Message Batches 离线提交（延迟高、成本减半）
+            on_prediction: 每条预测可用时回调（sync 模式下流式解析，生成一条发布一条，并立即保存）
+            cascade: sync 模式下是否使用模型分级级联（None 读取 config.PREDICT_CASCADE_ENABLED）
+            scorer: 'claude' | 'local' 仅本地模型评分 | 'rank' 本地模型排序后交给 Claude（None 读取 config.PREDICT_SCORER）
+            top_k: 交给 Claude 评分的股票数（None 读取 config.PREDICT_LLM_TOP_K）
 
         Returns:
             List of predictions with probability
         """
+        plan = self._plan_prediction(stock_data, use_pre_screening, pattern_file, scorer, top_k)
+        if plan['scorer'] == 'local':
+            codes = [code for code in plan['ranked'] if code in plan['local_scores']][:LOCAL_SCORER_TOP_K]
+            return self._predict_local(codes, plan['local_scores'], plan['grouped'], plan['quant'], on_prediction)
+
+        batches, summaries = self._start_llm_stage(plan, batch_size)
+        prediction_date = datetime.now().strftime('%Y-%m-%d')
+        saved = set()  # 流式阶段已保存的预测
+
+        def publish(pred: Dict):
+            if self.db:
+                self._save_prediction(pred, prediction_date)
+                saved.add(id(pred))
+            if on_prediction:
+                on_prediction(pred)
+
+        streaming = CLAUDE_STREAMING or on_prediction is not None
+        cascade = PREDICT_CASCADE_ENABLED if cascade is None else cascade
+        if mode == 'batch':
+            batch_results = self._predict_batches_offline(batches, patterns, summaries)
+        elif cascade:
+            batch_results = [self._predict_cascade(batches, patterns, summaries, batch_size,
+                                                   publish if streaming else None)]
+        else:
+            # 首批先行写入提示词缓存，其余批次并发读取；流式开启时每条预测生成完毕即发布
+            batch_results = self.executor.map(
+                lambda batch: self._predict_batch(batch, patterns, summaries, publish if streaming else None),
+                batches,
+                warm_first=True,
+            )
+        return self._finish_prediction(plan, batch_results, prediction_date, saved)
+
+    def _plan_prediction(self, stock_data: pd.DataFrame, use_pre_screening: bool, pattern_file: str,
+                         scorer: Optional[str], top_k: Optional[int]) -> Dict:
+        """预测流水线的本地阶段（预筛选 → 本地模型排序 → 量化特征），不调用 Claude
+
+        Returns:
+            {'run_id', 'scorer', 'top_k', 'grouped', 'ranked', 'local_scores', 'quant', 'stages'}
+        """
         # 按股票代码分组
         grouped = stock_data.groupby('code')
         codes = list(grouped.groups.keys())
-
-        # 程序预筛选阶段
+        scorer = scorer or PREDICT_SCORER
+        if top_k is None:
+            top_k = PREDICT_LLM_TOP_K
+        elif top_k < 1:
+            raise ValueError(f"top_k 必须为正整数: {top_k}")
+        run_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        stages: Dict[str, Dict] = {}
+        self.last_pipeline = {'run_id': run_id, 'scorer': scorer, 'top_k': top_k, 'stages': stages}
+
+        # 阶段1：程序预筛选
+        started = time.monotonic()
+        screened = codes
         if use_pre_screening:
             print(f"\n🔍 程序预筛选阶段")
             print(f"   总股票数: {len(codes)}")
@@ -249,87 +613,484 @@ class StockAnalyzer:
                 candidate_codes = pre_screen_stocks(stocks_kline_data, classic_patterns)
                 print(f"   筛选后候选: {len(candidate_codes)} 只")
 
-                # 如果筛选后太少，取前50个
-                if len(candidate_codes) < 10:
-                    print(f"   ⚠️  候选太少，使用全部股票")
-                    codes = codes[:50]
+                # 筛选后太少：全部股票进入下一阶段排序，命中经典模式的候选排在前面
+                if len(candidate_codes) < PREDICT_MIN_SCREENED:
+                    print(f"   ⚠️  候选太少，全部股票进入排序阶段")
+                    matched = set(candidate_codes)
+                    screened = candidate_codes + [code for code in codes if code not in matched]
                 else:
-                    codes = candidate_codes[:50]  # 最多50只
+                    screened = candidate_codes
 
             except Exception as e:
                 print(f"   ⚠️  预筛选失败，使用全部股票: {e}")
-                codes = codes[:50]
         else:
             print(f"\n🔍 直接AI分析（未使用预筛选）")
-            codes = codes[:50]
-
+        stages['screen'] = self._stage_metrics(len(codes), len(screened), started)
+        self._save_ranking(run_id, 'screen', [(code, None) for code in screened])
+
+        # 阶段2：本地模型评分排序（local 模式到此为止，不调用 Claude）
+        started = time.monotonic()
+        local_scores = {}
+        if scorer in ('local', 'rank'):
+            local_scores = self._local_scores(stock_data[stock_data['code'].isin(screened)],
+                                              required=scorer == 'local')
+        if local_scores:
+            ranked = sorted(screened, key=lambda code: local_scores.get(code, -1), reverse=True)
+            stages['local_score'] = dict(self._stage_metrics(len(screened), len(local_scores), started),
+                                         model_version=self.local_scorer.version)
+            self._save_ranking(run_id, 'local_score', [(code, local_scores.get(code)) for code in ranked])
+        else:
+            ranked = screened
+            stages['local_score'] = {'skipped': True}
+
+        # 一次向量化计算全部候选股票的量化特征（预测结果直接复用，未被 AI 选中的股票也可展示）
+        candidates = stock_data[stock_data['code'].isin(ranked)]
+        quant = quantitative_features_batch(candidates)
+        names = candidates.groupby('code')['name'].first() if 'name' in candidates.columns else {}
+        self.last_screened = [
+            {'code': code, 'name': names.get(code, code), 'local_score': local_scores.get(code),
+             'matched_quantitative_data': quant.get(code, {})}
+            for code in ranked
+        ]
+
+        if scorer == 'local':
+            stages['llm'] = {'skipped': True}
+        return {'run_id': run_id, 'scorer': scorer, 'top_k': top_k, 'grouped': grouped, 'ranked': ranked,
+                'local_scores': local_scores, 'quant': quant, 'stages': stages}
+
+    def _start_llm_stage(self, plan: Dict, batch_size: int):
+        """阶段3 的准备：取排名前 top_k 的股票按 token 预算装箱，返回 (batches, summaries)"""
+        # 排名前 top_k 的股票交给 Claude 评分（LLM 开销随 top_k 而非候选数增长）
+        plan['llm_started'] = time.monotonic()
+        plan['usage_before'] = self._usage_snapshot()
+        plan['calls_before'] = self.api_calls
+        ranked, grouped, quant = plan['ranked'], plan['grouped'], plan['quant']
+        codes = plan['llm_codes'] = ranked[:plan['top_k']]
+        print(f"   🎯 排名前 {len(codes)}/{len(ranked)} 只股票交给 Claude 评分")
+
+        # 按 token 预算装箱（每只候选股票都进入某个请求，单个请求最多 batch_size 只）
+        summaries = {code: self._stock_summary(code, grouped.get_group(code)) for code in codes}
+        for code in codes:
+            summaries[code][1]['quantitative'] = quant.get(code, {})
+        sizes = [estimate_tokens(summaries[code][0]) for code in codes]
+        packing = pack_by_budget(sizes, PREDICT_PROMPT_TOKEN_BUDGET, max_items=batch_size)
+        self.last_packing = packing.report()
+        print(f"   📦 {len(codes)} 只股票装入 {len(packing.groups)} 个请求，"
+              f"装箱效率 {self.last_packing['efficiency']}%（预算 {PREDICT_PROMPT_TOKEN_BUDGET} tokens/请求）")
+
+        # 分批并发处理（在途请求数与 RPM/TPM 由 executor / rate_limiter 控制，结果按批次顺序合并）
+        batches = [{codes[i]: grouped.get_group(codes[i]) for i in group} for group in packing.groups]
+        return batches, summaries
+
+    def _finish_prediction(self, plan: Dict, batch_results, prediction_date: str, saved: set) -> List[Dict]:
+        """合并各批次结果、记录阶段3统计，保存流式阶段未保存的预测，返回概率最高的100条"""
+        stages = plan['stages']
         all_predictions = []
-
-        # 分批处理
-        for i in range(0, len(codes), batch_size):
-            batch_codes = codes[i:i + batch_size]
-            batch_data = {code: grouped.get_group(code) for code in batch_codes}
-
-            predictions = self._predict_batch(batch_data, patterns)
+        for predictions in batch_results:
             all_predictions.extend(predictions)
 
         # 按概率排序
         all_predictions.sort(key=lambda x: x['probability'], reverse=True)
+        stages['llm'] = dict(self._stage_metrics(len(plan['llm_codes']), len(all_predictions), plan['llm_started']),
+                             api_calls=self.api_calls - plan['calls_before'],
+                             cost_usd=round(self._cost_since(plan['usage_before']), 4))
+        self._save_ranking(plan['run_id'], 'llm', [(pred['code'], pred['probability']) for pred in all_predictions])
+        print("   ⏱️  " + "，".join(f"{name} {m['input']}→{m['output']} ({m['elapsed_ms']}ms)"
+                                 for name, m in stages.items() if not m.get('skipped')))
 
         # 保存预测结果到数据库（如果有DB依赖）
         if self.db:
-            from datetime import datetime
-            prediction_date = datetime.now().strftime('%Y-%m-%d')
-
             for pred in all_predictions[:100]:
-                try:
-                    self.db.save_prediction({
-                        'stock_code': pred['code'],
-                        'stock_name': pred.get('name', ''),
-                        'prediction_date': prediction_date,
-                        'matched_patterns': pred.get('matched_patterns', []),
-                        'probability': pred['probability'],
-                        'reasoning': pred.get('reasoning', '')
-                    })
-                except Exception as e:
-                    print(f"保存预测结果失败 {pred['code']}: {e}")
+                if id(pred) not in saved:
+                    self._save_prediction(pred, prediction_date)
         else:
             print("⚠️  未配置数据库，预测结果仅保存在内存中")
 
         return all_predictions[:100]  # 返回前100个
 
-    def _predict_batch(self, batch_data: Dict[str, pd.DataFrame], patterns: List[Dict]) -> List[Dict]:
-        """预测一批股票"""
+    @staticmethod
+    def _stage_metrics(input_count: int, output_count: int, started: float) -> Dict:
+        return {'input': input_count, 'output': output_count,
+                'elapsed_ms': round((time.monotonic() - started) * 1000, 1)}
+
+    def _save_ranking(self, run_id: str, stage: str, ranking: List):
+        """持久化预测流水线某一阶段的排名 [(code, score)]"""
+        if not self.db:
+            return
+        try:
+            self.db.save_prediction_ranking(run_id, stage, ranking)
+        except Exception as e:
+            print(f"保存{stage}阶段排名失败: {e}")
+
+    def _local_scores(self, stock_data: pd.DataFrame, required: bool = False) -> Dict[str, float]:
+        """本地模型为每只股票评分 {code: 0-100}，没有已训练的模型时返回空字典
+
+        Raises:
+            ValueError: required 为 True 且没有已训练的模型
+        """
+        if self.local_scorer is None:
+            self.local_scorer = load_scorer()
+        if self.local_scorer is None:
+            if required:
+                raise ValueError("未找到本地评分模型，请先运行 scripts/train_local_scorer.py")
+            print("   ⚠️  未找到本地评分模型，跳过本地排序")
+            return {}
+
+        started = time.monotonic()
+        scores = self.local_scorer.score(stock_data)
+        elapsed_ms = (time.monotonic() - started) * 1000
+        self.last_local_scoring = {
+            'version': self.local_scorer.version,
+            'model_type': self.local_scorer.model_type,
+            'stocks': len(scores),
+            'elapsed_ms': round(elapsed_ms, 1),
+        }
+        print(f"   🧮 本地模型 v{self.local_scorer.version} 为 {len(scores)} 只股票评分，耗时 {elapsed_ms:.1f}ms")
+        return scores
+
+    def _predict_local(self, codes: List[str], local_scores: Dict[str, float], grouped, quant: Dict[str, Dict],
+                       on_prediction: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """仅用本地模型的评分生成预测结果（按概率降序，保存并逐条发布）"""
+        prediction_date = datetime.now().strftime('%Y-%m-%d')
+        reason = f"本地模型 v{self.local_scorer.version}（{self.local_scorer.model_type}）评分"
+        predictions = []
+        for code in codes:
+            df = grouped.get_group(code).sort_values('date')
+            pred = {
+                'code': code,
+                'name': df['name'].iloc[0] if 'name' in df.columns else code,
+                'probability': local_scores[code],
+                'reason': reason,
+                'current_price': float(df['close'].iloc[-1]),
+                'last_date': str(df['date'].iloc[-1]),
+                'matched_quantitative_data': quant.get(code, {}),
+            }
+            if self.db:
+                self._save_prediction(pred, prediction_date)
+            if on_prediction:
+                on_prediction(pred)
+            predictions.append(pred)
+        return predictions
+
+    def _predict_cascade(self, batches: List[Dict[str, pd.DataFrame]], patterns: List[Dict], summaries: Dict,
+                         batch_size: int, publish: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """模型分级级联预测
+
+        低价层（CASCADE_TIERS[0]）为全部候选打分；概率落在 CASCADE_BORDERLINE 区间的临界股票
+        重新装箱后交给高价层（CASCADE_TIERS[-1]）复核，以高价层结果为准（高价层调用失败或漏掉的股票保留低价层结果）。
+        本次运行成本（已花费 + 在途预估）将超过 CASCADE_COST_CEILING_USD 时不再升级，保留低价层结果；
+        成本按本次运行自己的用量累计计算，并发的其他运行不占用本次的预算。
+        """
+        cheap_key, strong_key = CASCADE_TIERS[0], CASCADE_TIERS[-1]
+        cheap, strong = AI_MODELS[cheap_key]['model_id'], AI_MODELS[strong_key]['model_id']
+        low, high = CASCADE_BORDERLINE
+        run_usage: Dict[str, Dict] = {}
+
+        def run_cost() -> float:
+            with self._stats_lock:
+                return sum(usage_cost(model, entry) for model, entry in run_usage.items())
+
+        def borderline(pred: Dict) -> bool:
+            return low <= pred['probability'] <= high
+
+        def publish_settled(pred: Dict):
+            if publish and not borderline(pred):
+                publish(pred)
+
+        # 第一层：低价模型为全部候选打分，非临界结果立即发布
+        started = time.monotonic()
+        tier1 = [
+            pred
+            for preds in self.executor.map(
+                lambda batch: self._predict_batch(batch, patterns, summaries, publish_settled if publish else None,
+                                                  model=cheap, run_usage=run_usage),
+                batches,
+                warm_first=True,
+            )
+            for pred in preds
+        ]
+        tier1_seconds = time.monotonic() - started
+        final = [pred for pred in tier1 if not borderline(pred)]
+        pending = {pred['code']: pred for pred in tier1 if borderline(pred)}
+
+        # 第二层：临界股票按 token 预算重新装箱，在成本上限内升级到高价模型
+        data = {code: df for batch in batches for code, df in batch.items()}
+        codes = [code for code in pending if code in data]
+        for code, pred in pending.items():
+            if code not in data:  # 无K线可升级，保留低价层结果
+                final.append(pred)
+                if publish:
+                    publish(pred)
+        packing = pack_by_budget([estimate_tokens(summaries[code][0]) for code in codes],
+                                 PREDICT_PROMPT_TOKEN_BUDGET, max_items=batch_size)
+        escalations = [{codes[i]: data[codes[i]] for i in group} for group in packing.groups]
+        input_price, output_price = model_price(strong)
+        lock = threading.Lock()
+        reserved = [0.0]
+
+        def escalate(batch):
+            prefix, prompt, _ = self._build_predict_prompt(batch, patterns, summaries)
+            estimate = (estimate_tokens(prefix + prompt) * input_price + 100 * len(batch) * output_price) / 1_000_000
+            with lock:
+                if run_cost() + reserved[0] + estimate > CASCADE_COST_CEILING_USD:
+                    return None
+                reserved[0] += estimate
+            def publish_escalated(pred: Dict):
+                if pred.get('code') in batch:  # 只发布本批临界股票的复核结果
+                    publish(pred)
+
+            try:
+                return self._predict_batch(batch, patterns, summaries, publish_escalated if publish else None,
+                                           model=strong, run_usage=run_usage)
+            finally:
+                with lock:
+                    reserved[0] -= estimate
+
+        started = time.monotonic()
+        skipped = failed = 0
+        for batch, preds in zip(escalations, self.executor.map(escalate, escalations)):
+            if preds is None:
+                # 超出成本上限：保留低价层结果
+                skipped += len(batch)
+                kept = list(batch)
+            else:
+                strong_preds = {pred.get('code'): pred for pred in preds if pred.get('code') in batch}
+                final.extend(strong_preds.values())
+                # 高价层调用失败或漏掉的股票：保留低价层结果
+                kept = [code for code in batch if code not in strong_preds]
+                failed += len(kept)
+            for code in kept:
+                final.append(pending[code])
+                if publish:
+                    publish(pending[code])
+        tier2_seconds = time.monotonic() - started
+
+        candidates = sum(len(batch) for batch in batches)
+        tiers = {}
+        for key, model, seconds in ((cheap_key, cheap, tier1_seconds), (strong_key, strong, tier2_seconds)):
+            diff = run_usage.get(model) or dict.fromkeys(MODEL_USAGE_FIELDS, 0)
+            tiers[key] = {
+                'model': model,
+                'calls': diff['calls'],
+                'input_tokens': diff['input_tokens'] + diff['cache_creation_input_tokens'] + diff['cache_read_input_tokens'],
+                'output_tokens': diff['output_tokens'],
+                'avg_latency_seconds': round(diff['latency_seconds'] / diff['calls'], 3) if diff['calls'] else 0,
+                'wall_seconds': round(seconds, 3),
+                'cost_usd': round(usage_cost(model, diff), 4),
+            }
+        escalated = len(codes) - skipped
+        self.last_cascade = {
+            'tiers': tiers,
+            'candidates': candidates,
+            'borderline': len(codes),
+            'escalated': escalated,
+            'escalation_rate': round(escalated / candidates * 100, 1) if candidates else 0,
+            'skipped_by_cost_ceiling': skipped,
+            'escalation_failed': failed,
+            'cost_usd': round(run_cost(), 4),
+        }
+        print(f"   [级联] {AI_MODELS[cheap_key]['name']} 评估 {candidates} 只 → 临界 {len(codes)} 只，"
+              f"升级 {AI_MODELS[strong_key]['name']} {escalated} 只（{self.last_cascade['escalation_rate']}%）"
+              f"{f'，成本上限跳过 {skipped} 只' if skipped else ''}{f'，升级失败 {failed} 只' if failed else ''}，本次成本 ${self.last_cascade['cost_usd']}")
+        return final
+
+    def _usage_snapshot(self) -> Dict[str, Dict]:
+        with self._stats_lock:
+            return {model: dict(entry) for model, entry in self.model_usage.items()}
+
+    @staticmethod
+    def _usage_diff(before: Optional[Dict], after: Optional[Dict]) -> Dict:
+        before = before or dict.fromkeys(MODEL_USAGE_FIELDS, 0)
+        after = after or before
+        return {field: after[field] - before[field] for field in MODEL_USAGE_FIELDS}
+
+    def _cost_since(self, before: Dict[str, Dict]) -> float:
+        """自 before 快照以来的成本"""
+        return sum(
+            usage_cost(model, self._usage_diff(before.get(model), entry))
+            for model, entry in self._usage_snapshot().items()
+        )
+
+    def _save_prediction(self, pred: Dict, prediction_date: str):
+        try:
+            self.db.save_prediction({
+                'stock_code': pred['code'],
+                'stock_name': pred.get('name', ''),
+                'prediction_date': prediction_date,
+                'matched_patterns': pred.get('matched_patterns', []),
+                'probability': pred['probability'],
+                'reasoning': pred.get('reasoning', '')
+            })
+        except Exception as e:
+            print(f"保存预测结果失败 {pred.get('code')}: {e}")
+
+    def _predict_batch(self, batch_data: Dict[str, pd.DataFrame], patterns: List[Dict],
+                       summaries: Optional[Dict] = None,
+                       on_prediction: Optional[Callable[[Dict], None]] = None,
+                       model: Optional[str] = None, run_usage: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+        """预测一批股票（给出 on_prediction 时流式解析，每条预测闭合即回调；model 为空时使用 self.model）
+
+        run_usage 见 _call_claude_with_retry
+        """
         # 检查AI是否可用
         if not self._check_ai_available():
             return []
 
+        prefix, prompt, stock_metadata = self._build_predict_prompt(batch_data, patterns, summaries)
+        if on_prediction is not None:
+            return self._predict_batch_streaming(prefix, prompt, batch_data, stock_metadata, on_prediction, model,
+                                                 run_usage)
+
+        # 使用带重试的API调用（模式列表与说明作为缓存前缀）
+        response_text = self._call_claude_with_retry(prompt, max_tokens=4096, cached_prefix=prefix, model=model,
+                                                     task='predict', run_usage=run_usage)
+
+        if not response_text:
+            print("❌ Claude API调用失败，跳过该批次")
+            return []
+
+        return self._parse_predictions(response_text, batch_data, stock_metadata)
+
+    def _predict_batch_streaming(self, prefix: str, prompt: str, batch_data: Dict[str, pd.DataFrame],
+                                 stock_metadata: Dict[str, Dict], on_prediction: Callable[[Dict], None],
+                                 model: Optional[str] = None,
+                                 run_usage: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+        """流式预测一批股票：增量解析 JSON 数组，每条预测闭合即补全元数据并回调（重试时按代码去重）"""
+        on_text, published = self._prediction_stream(batch_data, stock_metadata, on_prediction)
+        response_text = self._call_claude_with_retry(prompt, max_tokens=4096, cached_prefix=prefix,
+                                                     on_text=on_text, model=model, task='predict',
+                                                     run_usage=run_usage)
+        return self._finish_prediction_stream(response_text, published, batch_data, stock_metadata, on_prediction)
+
+    def _prediction_stream(self, batch_data: Dict[str, pd.DataFrame], stock_metadata: Dict[str, Dict],
+                           on_prediction: Callable[[Dict], None]):
+        """流式响应的文本回调，返回 (on_text, published)：published 为已发布的 {code: prediction}"""
+        published: Dict[str, Dict] = {}
+        parser = [JsonArrayStream()]
+
+        def on_text(chunk: Optional[str]):
+            if chunk is None:  # 本次尝试中断，重试的响应从头开始
+                parser[0] = JsonArrayStream()
+                return
+            for pred in parser[0].feed(chunk):
+                code = pred.get('code') if isinstance(pred, dict) else None
+                if code is None or code in published or 'probability' not in pred:
+                    continue
+                self._enrich_prediction(pred, batch_data, stock_metadata)
+                published[code] = pred
+                on_prediction(pred)
+
+        return on_text, published
+
+    def _finish_prediction_stream(self, response_text: Optional[str], published: Dict[str, Dict],
+                                  batch_data: Dict[str, pd.DataFrame], stock_metadata: Dict[str, Dict],
+                                  on_prediction: Callable[[Dict], None]) -> List[Dict]:
+        """流式调用结束后返回该批次的全部预测（增量解析未得到结果时回退整体解析）"""
+        if not response_text:
+            print("❌ Claude API调用失败，跳过该批次")
+            return list(published.values())
+        if not published:
+            # 响应不是可增量解析的数组（如整段包在其他结构里），回退到整体解析
+            for pred in self._parse_predictions(response_text, batch_data, stock_metadata):
+                on_prediction(pred)
+                published[pred.get('code')] = pred
+        return list(published.values())
+
+    def _predict_batches_offline(self, batches: List[Dict[str, pd.DataFrame]], patterns: List[Dict],
+                                 summaries: Optional[Dict] = None) -> List[List[Dict]]:
+        """通过 Message Batches 一次提交全部批次，轮询完成后按 custom_id 映射回各批次
+
+        命中响应缓存的批次不再提交；批次接口不可用时回退到同步并发调用。
+        """
+        if not self._check_ai_available():
+            return [[] for _ in batches]
+
+        offline = self._offline_requests(batches, patterns, summaries)
+        try:
+            runner = MessageBatchRunner(self.batch_service or self.client.messages.batches)
+            messages = runner.run(offline['requests'])
+        except Exception as e:
+            print(f"⚠️  消息批次失败，回退同步调用: {e}")
+            return self.executor.map(lambda batch: self._predict_batch(batch, patterns, summaries), batches)
+        return self._offline_results(batches, offline, messages)
+
+    def _offline_requests(self, batches: List[Dict[str, pd.DataFrame]], patterns: List[Dict],
+                          summaries: Optional[Dict] = None) -> Dict:
+        """构建消息批次的请求（命中响应缓存的批次直接取缓存），返回 _offline_results 所需的状态"""
+        max_tokens = 4096
+        prompts = [self._build_predict_prompt(batch, patterns, summaries) for batch in batches]
+        responses: Dict[str, Optional[str]] = {}
+        full_prompts: Dict[str, str] = {}
+        requests = []
+        for i, (prefix, prompt, _) in enumerate(prompts):
+            custom_id = f"predict-{i}"
+            full_prompt = prefix + prompt
+            cached = self.response_cache.get(self.model, full_prompt, max_tokens) if self.response_cache else None
+            if cached is not None and not cacheable_response(cached):
+                self.response_cache.delete(self.model, full_prompt, max_tokens)
+                cached = None
+            if cached is not None:
+                with self._stats_lock:
+                    self.cache_hits += 1
+                self._log_call(self.model, 'predict', 'cache_hit', batch=True)
+                self._record_llm_call(self.model, 'predict', 'cache', full_prompt, cached)
+                responses[custom_id] = cached
+                continue
+            requests.append({
+                "custom_id": custom_id,
+                "params": {
+                    "model": self.model,
+                    "max_tokens": max_tokens,
+                    "messages": [{"role": "user", "content": self._user_content(prompt, prefix)}],
+                },
+            })
+            full_prompts[custom_id] = full_prompt
+        return {'max_tokens': max_tokens, 'prompts': prompts, 'responses': responses,
+                'full_prompts': full_prompts, 'requests': requests}
+
+    def _offline_results(self, batches: List[Dict[str, pd.DataFrame]], offline: Dict,
+                         messages: Dict[str, Optional[object]]) -> List[List[Dict]]:
+        """登记消息批次的结果（用量、调用记录、响应缓存）并解析为各批次的预测"""
+        responses, full_prompts = offline['responses'], offline['full_prompts']
+        for request in offline['requests']:
+            custom_id = request["custom_id"]
+            message = messages.get(custom_id)
+            if message is None:
+                with self._stats_lock:
+                    self.api_errors += 1
+                self._log_call(self.model, 'predict', 'error', batch=True,
+                               error="BatchResultError: 批次请求未成功")
+                continue
+            self._record_usage(message.usage, batch=True)
+            self._log_call(self.model, 'predict', 'success', message.usage, batch=True)
+            responses[custom_id] = message.content[0].text
+            self._record_llm_call(self.model, 'predict', 'batch', full_prompts[custom_id], responses[custom_id],
+                                  message.usage)
+            if self.response_cache is not None and cacheable_response(responses[custom_id], message.stop_reason):
+                self.response_cache.put(self.model, full_prompts[custom_id], offline['max_tokens'],
+                                        responses[custom_id], message.usage.input_tokens, message.usage.output_tokens)
+
+        results = []
+        for i, (batch, (_, _, stock_metadata)) in enumerate(zip(batches, offline['prompts'])):
+            response_text = responses.get(f"predict-{i}")
+            if not response_text:
+                print(f"❌ 批次 {i} 无结果，跳过")
+                results.append([])
+                continue
+            results.append(self._parse_predictions(response_text, batch, stock_metadata))
+        return results
+
+    def _build_predict_prompt(self, batch_data: Dict[str, pd.DataFrame], patterns: List[Dict],
+                              summaries: Optional[Dict] = None):
+        """构建一批股票的预测提示词，返回 (静态前缀, 本批提示词, stock_metadata)
+
+        summaries 为预先计算的 {code: (summary, metadata)}，缺失的股票在此计算
+        """
         # 准备批量数据摘要和元数据字典
         batch_summary = []
         stock_metadata = {}  # 存储每个股票的元数据
-
         for code, df in batch_data.items():
-            df_sorted = df.sort_values('date')
-            recent = df_sorted.tail(30)  # 最近30天（约1个月）
-
-            stock_name = df['name'].iloc[0] if 'name' in df.columns else code
-            current_price = float(recent['close'].iloc[-1])
-            last_date = str(recent['date'].iloc[-1])
-
-            # 保存元数据
-            stock_metadata[code] = {
-                'name': stock_name,
-                'current_price': current_price,
-                'last_date': last_date
-            }
-
-            summary = {
-                'code': code,
-                'name': stock_name,
-                'current_price': current_price,
-                'last_date': last_date,
-                'recent_data': recent[['date', 'open', 'close', 'high', 'low', 'volume']].to_dict('records')
-            }
+            summary, stock_metadata[code] = (summaries or {}).get(code) or self._stock_summary(code, df)
             batch_summary.append(summary)
 
         # 准备模式描述
@@ -338,18 +1099,15 @@ class StockAnalyzer:
             for i, p in enumerate(patterns)
         ])
 
-        prompt = f"""你是专业的股票预测分析师。
+        # 静态前缀：各批次相同（说明、模式列表、输出格式），作为提示词缓存
+        prefix = f"""你是专业的股票预测分析师。
 
 已知的上涨模式：
 {patterns_text}
 
-现在有{len(batch_summary)}只股票的最近数据，请根据上涨模式分析每只股票在未来3天上涨的概率。
+{KLINE_LEGEND}
 
-股票数据：
-{json.dumps(batch_summary[:10], ensure_ascii=False, indent=2)}
-{'...(还有更多股票)' if len(batch_summary) > 10 else ''}
-
-请对每只股票进行分析，评估其与上涨模式的相似度，给出0-100的上涨概率评分。
+请根据上涨模式分析每只股票在未来3天上涨的概率：评估其与上涨模式的相似度，给出0-100的上涨概率评分。
 
 返回JSON格式：
 [
@@ -365,15 +1123,58 @@ class StockAnalyzer:
 - 只返回概率大于60的股票
 - probability 是0-100的数值
 - reason 简短说明（不超过50字）
-- 只返回JSON数组，不要其他文字"""
+- 只返回JSON数组，不要其他文字
+"""
 
-        # 使用带重试的API调用
-        response_text = self._call_claude_with_retry(prompt, max_tokens=4096)
+        # 可变部分：本批股票数据
+        stocks_text = "\n\n".join(batch_summary)
+        prompt = f"""
+现在有{len(batch_summary)}只股票的最近数据：
 
-        if not response_text:
-            print("❌ Claude API调用失败，跳过该批次")
-            return []
+股票数据：
+{stocks_text}
+
+请对每只股票进行分析，只返回JSON数组。"""
+
+        return prefix, prompt, stock_metadata
+
+    @staticmethod
+    def _stock_summary(code: str, df: pd.DataFrame):
+        """单只股票最近30天的提示词数据（紧凑K线表），返回 (summary, metadata)"""
+        recent = df.sort_values('date').tail(30)  # 最近30天（约1个月）
+
+        stock_name = df['name'].iloc[0] if 'name' in df.columns else code
+        current_price = float(recent['close'].iloc[-1])
+        last_date = str(recent['date'].iloc[-1])
 
+        metadata = {
+            'name': stock_name,
+            'current_price': current_price,
+            'last_date': last_date
+        }
+        records = recent[['date', 'open', 'high', 'low', 'close', 'volume']].to_dict('records')
+        return encode_klines(records, code, stock_name), metadata
+
+    def _enrich_prediction(self, pred: Dict, batch_data: Dict[str, pd.DataFrame], stock_metadata: Dict[str, Dict]):
+        """合并单条预测的元数据（价格、日期、名称）与量化匹配度特征"""
+        code = pred.get('code')
+        if code in stock_metadata:
+            pred['current_price'] = stock_metadata[code]['current_price']
+            pred['last_date'] = stock_metadata[code]['last_date']
+            # 确保name一致
+            if 'name' not in pred or not pred['name']:
+                pred['name'] = stock_metadata[code]['name']
+
+            # 量化匹配度特征（优先使用批量预计算结果）
+            if 'quantitative' in stock_metadata[code]:
+                pred['matched_quantitative_data'] = stock_metadata[code]['quantitative']
+            elif code in batch_data:
+                quant_data = self._calculate_quantitative_features(batch_data[code])
+                pred['matched_quantitative_data'] = quant_data
+
+    def _parse_predictions(self, response_text: str, batch_data: Dict[str, pd.DataFrame],
+                           stock_metadata: Dict[str, Dict]) -> List[Dict]:
+        """解析预测响应，合并元数据与量化特征"""
         try:
             # 提取JSON（可能有markdown代码块）
             if "```json" in response_text:
@@ -385,18 +1186,7 @@ class StockAnalyzer:
 
             # 合并元数据和量化指标到预测结果
             for pred in predictions:
-                code = pred.get('code')
-                if code in stock_metadata:
-                    pred['current_price'] = stock_metadata[code]['current_price']
-                    pred['last_date'] = stock_metadata[code]['last_date']
-                    # 确保name一致
-                    if 'name' not in pred or not pred['name']:
-                        pred['name'] = stock_metadata[code]['name']
-
-                    # 计算量化匹配度特征
-                    if code in batch_data:
-                        quant_data = self._calculate_quantitative_features(batch_data[code])
-                        pred['matched_quantitative_data'] = quant_data
+                self._enrich_prediction(pred, batch_data, stock_metadata)
 
             return predictions
 
@@ -424,27 +1214,22 @@ class StockAnalyzer:
         print(f"\n📊 开始验证模式（SQL方法）")
         print(f"   验证样本数: {len(validation_data)}")
 
-        for pattern in patterns:
-            pattern_name = pattern['pattern_name']
-            characteristics = pattern.get('characteristics', [])
-
-            # 根据模式特征筛选匹配样本
-            matched_data = self._filter_by_characteristics(validation_data, characteristics)
+        # 特征描述编译为谓词后，全部模式对同一特征表一次求值为 (模式数 × 样本数) 布尔矩阵
+        features = FeatureFrame(validation_data)
+        matrix = evaluate_patterns(patterns, features)
+        matched_counts = matrix.sum(axis=1)
+        success_counts = matrix.astype(np.int64) @ validation_data['is_success'].to_numpy(dtype=np.int64)
+        validation_date = datetime.now().strftime('%Y-%m-%d')
 
-            if len(matched_data) > 0:
-                total_samples = len(matched_data)
-                success_samples = matched_data['is_success'].sum()
-                success_rate = (success_samples / total_samples) * 100
-            else:
-                total_samples = 0
-                success_samples = 0
-                success_rate = 0
+        for pattern, total_samples, success_samples in zip(patterns, matched_counts, success_counts):
+            total_samples, success_samples = int(total_samples), int(success_samples)
+            success_rate = (success_samples / total_samples) * 100 if total_samples > 0 else 0
 
             pattern['validated_success_rate'] = round(success_rate, 2)
             pattern['validation_sample_count'] = total_samples
-            pattern['validation_date'] = datetime.now().strftime('%Y-%m-%d')
+            pattern['validation_date'] = validation_date
 
-            print(f"   ✓ {pattern_name}: {success_rate:.1f}% ({success_samples}/{total_samples})")
+            print(f"   ✓ {pattern['pattern_name']}: {success_rate:.1f}% ({success_samples}/{total_samples})")
 
         return patterns
 
@@ -452,7 +1237,8 @@ class StockAnalyzer:
         self,
         patterns: List[Dict],
         validation_data: pd.DataFrame,
-        rise_threshold: float = 0.08
+        rise_threshold: float = 0.08,
+        mode: Optional[str] = None
     ) -> List[Dict]:
         """使用AI方法验证模式（更精确，有成本）
 
@@ -460,248 +1246,344 @@ class StockAnalyzer:
             patterns: AI识别的模式列表
             validation_data: 验证数据集
             rise_threshold: 上涨阈值
+            mode: 'multi' 多个模式合并为一次请求；'per_pattern' 每个模式一次请求；
+                  'local' 本地匹配器验证（无AI调用）。None 读取 config.AI_VALIDATION_MODE
 
         Returns:
             更新后的模式列表，包含validated_success_rate字段
         """
+        mode = mode or AI_VALIDATION_MODE
+        if mode == 'local':
+            return self.validate_patterns_local(patterns, validation_data, rise_threshold)
+
         # 检查AI是否可用
         if not self._check_ai_available():
-            print("⚠️  AI不可用，降级到SQL验证方法")
-            return self.validate_patterns_sql(patterns, validation_data, rise_threshold)
+            print("⚠️  AI不可用，降级到本地验证方法")
+            return self.validate_patterns_local(patterns, validation_data, rise_threshold)
 
-        print(f"\n📊 开始验证模式（AI方法）")
+        print(f"\n📊 开始验证模式（AI方法，{mode}）")
         print(f"   验证样本数: {len(validation_data)}")
 
         # 准备验证数据摘要（使用全部验证样本）
         validation_summary = self._prepare_data_summary(validation_data, limit=len(validation_data))
 
-        for i, pattern in enumerate(patterns):
-            pattern_name = pattern['pattern_name']
-            description = pattern['description']
-            characteristics = pattern['characteristics']
+        if mode == 'per_pattern':
+            # 各模式的验证请求并发发出
+            self.executor.map(
+                lambda pattern: self._validate_pattern_ai(pattern, validation_summary, len(validation_data)),
+                patterns,
+                warm_first=True,
+            )
+            return patterns
 
-            prompt = f"""你是专业的股票模式验证分析师。
+        # 多个模式合并为一次结构化请求（模式过多时拆分为几次，并发发出）
+        groups = [
+            patterns[i:i + VALIDATION_PATTERNS_PER_CALL]
+            for i in range(0, len(patterns), VALIDATION_PATTERNS_PER_CALL)
+        ]
+        unresolved = self.executor.map(
+            lambda group: self._validate_patterns_multi(group, validation_summary, len(validation_data)),
+            groups,
+            warm_first=True,
+        )
+        failed = [pattern for group in unresolved for pattern in group]
+        if failed:
+            print(f"   ⚠️  {len(failed)} 个模式未得到AI验证结果，改用本地验证")
+            self.validate_patterns_local(failed, validation_data, rise_threshold)
 
-已识别的模式:
-- 名称: {pattern_name}
-- 描述: {description}
-- 特征: {', '.join(characteristics)}
+        return patterns
 
-验证数据（最近1个月的历史样本，共{len(validation_data)}条）:
+    def _validate_patterns_multi(self, patterns: List[Dict], validation_summary: str, sample_count: int) -> List[Dict]:
+        """一次请求验证多个模式（结果写回 pattern），返回未得到有效结果的模式"""
+        prefix, prompt = self._multi_validation_prompt(patterns, validation_summary, sample_count)
+        response_text = self._call_claude_with_retry(
+            prompt, max_tokens=200 + 80 * len(patterns), timeout=60, cached_prefix=prefix, task='validate_multi'
+        )
+        return self._apply_multi_validation(patterns, response_text)
+
+    @staticmethod
+    def _multi_validation_prompt(patterns: List[Dict], validation_summary: str, sample_count: int):
+        """多模式验证的提示词，返回 (静态前缀, 本次提示词)"""
+        # 静态前缀：验证数据摘要与输出格式在各请求间相同，作为提示词缓存
+        prefix = f"""你是专业的股票模式验证分析师。
+
+验证数据（最近1个月的历史样本，共{sample_count}条）:
 {validation_summary}
 
-请分析这些验证数据中，有多少比例的样本符合上述模式特征。
+对于下面给出的每个模式，请统计这些验证数据中符合该模式特征的样本数，以及其中3天后实际上涨达标的样本数。
 
-返回JSON格式:
-{{
-    "matched_count": 匹配该模式的样本数量,
-    "total_count": 总样本数,
-    "success_rate": 成功率百分比（0-100）,
-    "analysis": "简要分析"
-}}
+返回JSON数组，每个模式一项:
+[
+    {{
+        "index": 模式序号,
+        "matched_count": 匹配该模式的样本数量,
+        "success_count": 匹配样本中上涨达标的数量,
+        "analysis": "简要分析（不超过30字）"
+    }}
+]
+
+只返回JSON数组，不要其他文字。
+"""
 
-只返回JSON，不要其他文字。"""
+        patterns_text = "\n".join(
+            f"{i + 1}. {p['pattern_name']}: {p['description']}（特征: {', '.join(p.get('characteristics', []))}）"
+            for i, p in enumerate(patterns)
+        )
+        prompt = f"""
+待验证的模式（共{len(patterns)}个）:
+{patterns_text}"""
+        return prefix, prompt
+
+    def _apply_multi_validation(self, patterns: List[Dict], response_text: Optional[str]) -> List[Dict]:
+        """解析多模式验证响应并写回 pattern，返回未得到有效结果的模式"""
+        if not response_text:
+            print(f"   ✗ {len(patterns)} 个模式的验证请求失败")
+            return patterns
 
-            # 使用带重试的API调用
-            response_text = self._call_claude_with_retry(prompt, max_tokens=500, timeout=30)
+        try:
+            if "```json" in response_text:
+                response_text = response_text.split("```json")[1].split("```")[0]
+            elif "```" in response_text:
+                response_text = response_text.split("```")[1].split("```")[0]
+            results = json.loads(response_text.strip())
+        except json.JSONDecodeError as e:
+            print(f"   ✗ 多模式验证结果解析失败: {e}")
+            return patterns
 
-            if not response_text:
-                print(f"   ✗ {pattern_name} API调用失败，设置为0")
-                pattern['validated_success_rate'] = 0
-                pattern['validation_sample_count'] = 0
-                pattern['validation_date'] = datetime.now().strftime('%Y-%m-%d')
+        resolved = set()
+        for result in results if isinstance(results, list) else []:
+            try:
+                index = int(result['index']) - 1
+                matched = int(result['matched_count'])
+                success = min(int(result['success_count']), matched)
+            except (KeyError, TypeError, ValueError):
                 continue
+            if not 0 <= index < len(patterns) or index in resolved:
+                continue
+            self._set_validation(patterns[index], matched, success)
+            resolved.add(index)
 
-            try:
-                # 提取JSON
-                if "```json" in response_text:
-                    response_text = response_text.split("```json")[1].split("```")[0]
-                elif "```" in response_text:
-                    response_text = response_text.split("```")[1].split("```")[0]
+        return [p for i, p in enumerate(patterns) if i not in resolved]
 
-                result = json.loads(response_text.strip())
+    @staticmethod
+    def _set_validation(pattern: Dict, matched: int, success: int):
+        """写回验证结果：成功率 = 匹配样本中上涨达标的比例"""
+        success_rate = success / matched * 100 if matched > 0 else 0
+        pattern['validated_success_rate'] = round(success_rate, 2)
+        pattern['validation_sample_count'] = matched
+        pattern['validation_date'] = datetime.now().strftime('%Y-%m-%d')
+        print(f"   ✓ {pattern['pattern_name']}: {success_rate:.1f}% ({success}/{matched})")
 
-                pattern['validated_success_rate'] = round(result['success_rate'], 2)
-                pattern['validation_sample_count'] = result['total_count']
-                pattern['validation_date'] = datetime.now().strftime('%Y-%m-%d')
+    def validate_patterns_local(
+        self,
+        patterns: List[Dict],
+        validation_data: pd.DataFrame,
+        rise_threshold: float = 0.08,
+        window_days: int = 30
+    ) -> List[Dict]:
+        """使用本地匹配器验证模式（无AI成本）
 
-                print(f"   ✓ {pattern_name}: {result['success_rate']:.1f}% ({result['matched_count']}/{result['total_count']})")
+        本地匹配器可识别的模式（经典模式、带 rules 的 AI 模式）在每个样本当日之前的K线窗口上匹配；
+        其余模式按特征描述筛选（同 validate_patterns_sql）。需要配置数据库以读取K线窗口。
 
-            except (json.JSONDecodeError, KeyError) as e:
-                print(f"   ✗ {pattern_name} 解析失败: {e}")
-                pattern['validated_success_rate'] = 0
-                pattern['validation_sample_count'] = 0
-                pattern['validation_date'] = datetime.now().strftime('%Y-%m-%d')
+        Args:
+            patterns: 模式列表
+            validation_data: 验证数据集（包含 is_success 或 rise_pct 字段）
+            rise_threshold: 上涨阈值
+            window_days: 每个样本用于匹配的K线天数
+
+        Returns:
+            更新后的模式列表，包含validated_success_rate字段
+        """
+        if 'is_success' not in validation_data.columns:
+            validation_data = validation_data.assign(
+                is_success=(validation_data['rise_pct'] >= rise_threshold * 100).astype(int)
+            )
+
+        matchable = [p for p in patterns if is_matchable(p)] if self.db else []
+        if matchable:
+            print(f"\n📊 开始验证模式（本地匹配器）")
+            print(f"   验证样本数: {len(validation_data)}，可匹配模式: {len(matchable)}")
+
+            klines, outcomes = self._validation_windows(validation_data, window_days)
+            matched_keys = [
+                {(m.get('pattern_id'), m.get('pattern_name')) for m in matches}
+                for matches in match_stocks(klines, matchable)
+            ]
+            for pattern in matchable:
+                key = (pattern.get('pattern_id'), pattern.get('pattern_name'))
+                hits = [success for keys, success in zip(matched_keys, outcomes) if key in keys]
+                self._set_validation(pattern, len(hits), int(sum(hits)))
+
+        matched_ids = {id(p) for p in matchable}
+        rest = [p for p in patterns if id(p) not in matched_ids]
+        if rest:
+            self.validate_patterns_sql(rest, validation_data, rise_threshold)
 
         return patterns
 
-    def _prepare_data_summary(self, df: pd.DataFrame, limit: int = 20) -> str:
-        """准备数据摘要用于提示词"""
-        sample = df.head(limit)
+    def _validation_windows(self, validation_data: pd.DataFrame, window_days: int):
+        """读取每个验证样本当日（含）之前 window_days 天的K线，返回 (klines, is_success 列表)"""
+        history = {}
+        klines, outcomes = [], []
+        for row in validation_data.itertuples(index=False):
+            if row.code not in history:
+                df = self.db.get_stock_data(row.code).sort_values('date')
+                history[row.code] = df[['date', 'open', 'high', 'low', 'close', 'volume']]
+            df = history[row.code]
+            window = df[df['date'].astype(str) <= str(row.date)].tail(window_days)
+            klines.append(window.to_dict('records'))
+            outcomes.append(int(row.is_success))
+        return klines, outcomes
+
+    def _validate_pattern_ai(self, pattern: Dict, validation_summary: str, sample_count: int) -> Dict:
+        """AI 验证单个模式（结果写回 pattern）"""
+        prefix, prompt = self._pattern_validation_prompt(pattern, validation_summary, sample_count)
+        # 使用带重试的API调用
+        response_text = self._call_claude_with_retry(prompt, max_tokens=500, timeout=30, cached_prefix=prefix,
+                                                     task='validate_pattern')
+        return self._apply_pattern_validation(pattern, response_text)
 
-        summary_lines = []
-        for _, row in sample.iterrows():
-            line = f"代码:{row['code']} 日期:{row['date']} 开:{row['open']:.2f} 收:{row['close']:.2f} 高:{row['high']:.2f} 低:{row['low']:.2f} 量:{row['volume']}"
-            if 'day2_close' in row:
-                line += f" → 次日收:{row['day2_close']:.2f} → 第3日收:{row['day3_close']:.2f}"
-            if 'rise_pct' in row:
-                line += f" (涨幅:{row['rise_pct']:.1f}%)"
-            summary_lines.append(line)
+    @staticmethod
+    def _pattern_validation_prompt(pattern: Dict, validation_summary: str, sample_count: int):
+        """单个模式验证的提示词，返回 (静态前缀, 本次提示词)"""
+        pattern_name = pattern['pattern_name']
+        description = pattern['description']
+        characteristics = pattern['characteristics']
 
-        return "\n".join(summary_lines)
+        # 静态前缀：验证数据摘要在各模式间相同，作为提示词缓存
+        prefix = f"""你是专业的股票模式验证分析师。
 
-    def _filter_by_characteristics(self, data: pd.DataFrame, characteristics: List[str]) -> pd.DataFrame:
-        """根据特征筛选样本"""
-        import re
+验证数据（最近1个月的历史样本，共{sample_count}条）:
+{validation_summary}
 
-        filtered = data.copy()
+对于下面给出的模式，请分析这些验证数据中，有多少比例的样本符合该模式特征。
 
-        # 预计算常用字段（如果SQL查询没有提供）
-        if 'day_change_pct' not in filtered.columns and 'open' in filtered.columns and 'close' in filtered.columns:
-            filtered['day_change_pct'] = ((filtered['close'] - filtered['open']) / filtered['open'] * 100)
+返回JSON格式:
+{{
+    "matched_count": 匹配该模式的样本数量,
+    "total_count": 总样本数,
+    "success_rate": 成功率百分比（0-100）,
+    "analysis": "简要分析"
+}}
 
-        if 'is_yang' not in filtered.columns and 'open' in filtered.columns and 'close' in filtered.columns:
-            filtered['is_yang'] = filtered['close'] > filtered['open']
-            filtered['is_yin'] = filtered['close'] < filtered['open']
+只返回JSON，不要其他文字。
+"""
 
-        if 'amplitude' not in filtered.columns and 'high' in filtered.columns and 'low' in filtered.columns:
-            filtered['amplitude'] = ((filtered['high'] - filtered['low']) / filtered['low'] * 100)
+        prompt = f"""
+已识别的模式:
+- 名称: {pattern_name}
+- 描述: {description}
+- 特征: {', '.join(characteristics)}"""
+        return prefix, prompt
 
-        for char in characteristics:
-            try:
-                char_lower = char.lower()
-
-                # 阳线特征
-                if '阳线' in char and 'is_yang' in filtered.columns:
-                    # 提取连续天数
-                    nums = re.findall(r'连续(\d+)', char)
-                    if nums:
-                        # 连续阳线暂时简化为单日阳线
-                        filtered = filtered[filtered['is_yang'] == True]
-                    else:
-                        filtered = filtered[filtered['is_yang'] == True]
-
-                # 阴线特征
-                elif '阴线' in char and 'is_yin' in filtered.columns:
-                    filtered = filtered[filtered['is_yin'] == True]
-
-                # 涨幅特征
-                elif ('涨幅' in char or '上涨' in char) and 'day_change_pct' in filtered.columns:
-                    nums = re.findall(r'(\d+\.?\d*)[%\-](\d+\.?\d*)', char)
-                    if nums:  # 范围：2-4%
-                        low, high = float(nums[0][0]), float(nums[0][1])
-                        filtered = filtered[(filtered['day_change_pct'] >= low) & (filtered['day_change_pct'] <= high)]
-                    else:
-                        nums = re.findall(r'[>=<超]+\s*(\d+\.?\d*)', char)
-                        if nums:
-                            threshold = float(nums[0])
-                            if '超过' in char or '>' in char or '>=' in char:
-                                filtered = filtered[filtered['day_change_pct'] >= threshold]
-                            elif '<' in char:
-                                filtered = filtered[filtered['day_change_pct'] < threshold]
-
-                # 振幅特征
-                elif '振幅' in char and 'amplitude' in filtered.columns:
-                    nums = re.findall(r'(\d+\.?\d*)', char)
-                    if nums:
-                        threshold = float(nums[0])
-                        if '超过' in char or '>' in char or '>=' in char:
-                            filtered = filtered[filtered['amplitude'] > threshold]
-                        elif '<' in char or '小于' in char:
-                            filtered = filtered[filtered['amplitude'] < threshold]
-
-                # 涨停特征
-                elif '涨停' in char or '一字板' in char:
-                    if 'day_change_pct' in filtered.columns:
-                        filtered = filtered[filtered['day_change_pct'] >= 9.5]
-
-                # 放量特征
-                elif '放量' in char and 'volume' in filtered.columns:
-                    nums = re.findall(r'(\d+\.?\d*)[%倍]', char)
-                    if nums:
-                        multiplier = float(nums[0])
-                        if '%' in char:
-                            multiplier = multiplier / 100 + 1
-                        vol_median = filtered['volume'].median()
-                        if vol_median > 0:
-                            filtered = filtered[filtered['volume'] >= vol_median * multiplier]
-                    else:
-                        vol_median = filtered['volume'].median()
-                        if vol_median > 0:
-                            filtered = filtered[filtered['volume'] > vol_median * 1.2]
-
-                # 缩量特征
-                elif '缩量' in char and 'volume' in filtered.columns:
-                    vol_median = filtered['volume'].median()
-                    if vol_median > 0:
-                        filtered = filtered[filtered['volume'] < vol_median * 0.8]
-
-                # 收盘价/开盘价关系
-                elif ('收盘价接近开盘价' in char or '收盘接近开盘' in char) and 'day_change_pct' in filtered.columns:
-                    filtered = filtered[filtered['day_change_pct'] < 0.5]  # 涨跌幅<0.5%
-
-                elif ('收盘价高于开盘价' in char or '收盘高于开盘' in char):
-                    if 'is_yang' in filtered.columns:
-                        nums = re.findall(r'(\d+\.?\d*)[%]', char)
-                        if nums:
-                            threshold = float(nums[0])
-                            filtered = filtered[(filtered['is_yang'] == True) & (filtered['day_change_pct'] >= threshold)]
-                        else:
-                            filtered = filtered[filtered['is_yang'] == True]
-
-                # 低开特征
-                elif ('低开' in char or '开盘价低于' in char) and 'prev_close' in filtered.columns and 'open' in filtered.columns:
-                    nums = re.findall(r'(\d+\.?\d*)[%]', char)
-                    if nums:
-                        threshold = float(nums[0]) / 100
-                        # 开盘价 < 前收 * (1 - threshold)
-                        filtered = filtered[filtered['open'] < filtered['prev_close'] * (1 - threshold)]
-                    else:
-                        # 简单低开
-                        filtered = filtered[filtered['open'] < filtered['prev_close']]
+    @staticmethod
+    def _apply_pattern_validation(pattern: Dict, response_text: Optional[str]) -> Dict:
+        """解析单个模式的验证响应并写回 pattern（失败时成功率记为0）"""
+        pattern_name = pattern['pattern_name']
+        if not response_text:
+            print(f"   ✗ {pattern_name} API调用失败，设置为0")
+            pattern['validated_success_rate'] = 0
+            pattern['validation_sample_count'] = 0
+            pattern['validation_date'] = datetime.now().strftime('%Y-%m-%d')
+            return pattern
 
-            except Exception as e:
-                print(f"   [警告] 特征'{char[:30]}'筛选失败: {e}")
-                continue
+        try:
+            # 提取JSON
+            if "```json" in response_text:
+                response_text = response_text.split("```json")[1].split("```")[0]
+            elif "```" in response_text:
+                response_text = response_text.split("```")[1].split("```")[0]
+
+            result = json.loads(response_text.strip())
+
+            pattern['validated_success_rate'] = round(result['success_rate'], 2)
+            pattern['validation_sample_count'] = result['total_count']
+            pattern['validation_date'] = datetime.now().strftime('%Y-%m-%d')
 
-        return filtered
+            print(f"   ✓ {pattern_name}: {result['success_rate']:.1f}% ({result['matched_count']}/{result['total_count']})")
+
+        except (json.JSONDecodeError, KeyError) as e:
+            print(f"   ✗ {pattern_name} 解析失败: {e}")
+            pattern['validated_success_rate'] = 0
+            pattern['validation_sample_count'] = 0
+            pattern['validation_date'] = datetime.now().strftime('%Y-%m-%d')
+
+        return pattern
+
+    def _prepare_data_summary(self, df: pd.DataFrame, limit: int = 20) -> str:
+        """准备数据摘要用于提示词（紧凑 CSV 编码，首行为格式说明）"""
+        sample = df.head(limit)
+        return f"{SAMPLE_LEGEND}\n{encode_samples(sample.to_dict('records'))}"
 
+    def _filter_by_characteristics(self, data: pd.DataFrame, characteristics: List[str]) -> pd.DataFrame:
+        """根据特征筛选样本（特征描述的解析规则见 characteristic_predicates）"""
+        mask = evaluate_predicates([compile_characteristics(characteristics)], FeatureFrame(data))[0]
+        return data[mask]
 
     def get_api_statistics(self) -> dict:
         """获取API调用统计信息"""
         return {
             'total_calls': self.api_calls,
             'total_errors': self.api_errors,
-            'success_rate': (self.api_calls - self.api_errors) / self.api_calls * 100 if self.api_calls > 0 else 0,
+            # api_calls 只计成功的请求，api_errors 为失败的尝试次数
+            'success_rate': round(self.api_calls / (self.api_calls + self.api_errors) * 100, 2)
+            if self.api_calls + self.api_errors > 0 else 0,
             'input_tokens': self.total_input_tokens,
             'output_tokens': self.total_output_tokens,
             'total_tokens': self.total_input_tokens + self.total_output_tokens,
-            'estimated_cost_usd': self._estimate_cost()
+            'batch_input_tokens': self.batch_input_tokens,
+            'batch_output_tokens': self.batch_output_tokens,
+            'cache_creation_input_tokens': self.cache_creation_input_tokens,
+            'cache_read_input_tokens': self.cache_read_input_tokens,
+            'last_packing': self.last_packing,
+            'last_cascade': self.last_cascade,
+            'last_pipeline': self.last_pipeline,
+            'circuit_breaker': self.circuit_breaker.stats(),
+            'models': self._model_statistics(),
+            'estimated_cost_usd': self._estimate_cost(),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'cache_hit_rate': round(self.cache_hits / (self.cache_hits + self.cache_misses) * 100, 2)
+            if self.cache_hits + self.cache_misses > 0 else 0
+        }
+
+    def get_call_metrics(self, days: int = 7) -> Dict:
+        """最近N天持久化调用记录的统计：延迟 p50/p95/p99、tokens/sec、按任务与按日的成本（需要配置数据库）"""
+        if not self.db:
+            return {}
+        try:
+            return summarize_calls(self.db.get_claude_calls(days))
+        except Exception as e:
+            print(f"读取调用记录失败: {e}")
+            return {}
+
+    def _model_statistics(self) -> Dict[str, Dict]:
+        """按模型的调用次数、token、平均延迟与成本"""
+        return {
+            model: {
+                'calls': entry['calls'],
+                'input_tokens': entry['input_tokens'],
+                'output_tokens': entry['output_tokens'],
+                'avg_latency_seconds': round(entry['latency_seconds'] / entry['calls'], 3) if entry['calls'] else 0,
+                'cost_usd': round(usage_cost(model, entry), 4),
+            }
+            for model, entry in self._usage_snapshot().items()
         }
 
     def _estimate_cost(self) -> float:
-        """估算API调用成本(美元)
-        
-        基于Claude API定价:
-        - Sonnet: $3/M input, $15/M output
-        - Haiku: $0.25/M input, $1.25/M output
+        """估算API调用成本(美元)，按各模型的实际用量分别计价（定价见 model_price）
+
+        - Message Batches 的 token 按上述价格的 50% 计
+        - 提示词缓存：写入按输入价 1.25 倍，读取按输入价 0.1 倍
         """
-        if 'haiku' in self.model.lower():
-            input_cost = (self.total_input_tokens / 1_000_000) * 0.25
-            output_cost = (self.total_output_tokens / 1_000_000) * 1.25
-        elif 'sonnet' in self.model.lower():
-            input_cost = (self.total_input_tokens / 1_000_000) * 3
-            output_cost = (self.total_output_tokens / 1_000_000) * 15
-        else:  # opus或其他
-            input_cost = (self.total_input_tokens / 1_000_000) * 15
-            output_cost = (self.total_output_tokens / 1_000_000) * 75
-        
-        return round(input_cost + output_cost, 4)
+        return round(sum(usage_cost(model, entry) for model, entry in self._usage_snapshot().items()), 4)
 
     def _calculate_quantitative_features(self, df: pd.DataFrame) -> dict:
         """计算股票的量化特征
 
-        分析最近30天的K线数据，提取量化指标用于前端展示
+        分析最近30天的K线数据，提取量化指标用于前端展示。
+        逐只计算的参考实现，批量计算见 quant_features.quantitative_features_batch
 
         Args:
             df: 股票K线数据（已按日期排序）
@@ -0,0 +1,341 @@
+"""StockAnalyzer 的 asyncio 调用路径 - Claude 请求在事件循环内并发，任务可随时取消
+
+    async_analyzer = AsyncStockAnalyzer(analyzer)          # 共享同步分析器的统计、缓存、限速与熔断器
+    task = asyncio.create_task(async_analyzer.predict_stock_probability(recent_data, patterns))
+    task.cancel()                                         # 在途的 Claude 请求与退避等待一并取消
+
+- Claude 调用使用 AsyncAnthropic（或 AsyncFakeClaudeClient），在途数由 ClaudeExecutor.map_async 的信号量限制，
+  限速与重试退避都用 asyncio.sleep，等待期间不占用线程。
+- SQLite 读写（调用记录、响应缓存、预测结果）经 AsyncDatabase 在独立的小线程池执行；
+  预筛选、本地评分等 CPU 密集的本地阶段交给 run_compute（另一个线程池），不阻塞事件循环，
+  也不占用数据库线程。
+- 提示词构建与响应解析复用 StockAnalyzer 的实现，两条路径的结果格式一致。
+  Message Batches 模式用 asyncio.sleep 轮询，任务取消时一并取消批次；
+  级联预测仍走同步实现（在 run_compute 中执行，取消任务不会中断已开始的级联）。
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from .analyzer import StockAnalyzer
+from .async_database import AsyncDatabase, run_blocking, run_compute
+from .claude_batch import MessageBatchRunner
+from .claude_cache import cacheable_response
+from .claude_client import create_async_client
+from .claude_executor import estimate_tokens
+from .claude_retry import CircuitOpenError, RetryPolicy, run_with_retry_async
+from .config import (
+    AI_VALIDATION_MODE, CLAUDE_STREAMING, LLM_RECORD_KEEP_SESSIONS, LLM_RECORD_MAX_AGE_DAYS, LOCAL_SCORER_TOP_K,
+    PREDICT_CASCADE_ENABLED, VALIDATION_PATTERNS_PER_CALL,
+)
+from .llm_replay import AsyncReplayClaudeClient, ReplayClaudeClient, llm_call_record
+
+
+class AsyncStockAnalyzer:
+    """StockAnalyzer 的异步版本：analyze_rising_patterns / predict_stock_probability / validate_patterns_ai"""
+
+    def __init__(self, analyzer: StockAnalyzer, client=None):
+        """
+        Args:
+            analyzer: 同步分析器（共享模型、统计、响应缓存、限速器、重试策略与熔断器）
+            client: 异步 Claude 客户端（None 时按 config.CLAUDE_CLIENT 创建）
+        """
+        self.analyzer = analyzer
+        self.client = client
+        if client is None and isinstance(analyzer.client, ReplayClaudeClient):
+            # 回放模式：与同步分析器共用同一录制队列
+            self.client = AsyncReplayClaudeClient(analyzer.client.log, speed=analyzer.client.speed)
+        elif client is None and analyzer.ai_enabled:
+            try:
+                self.client = create_async_client(analyzer.api_key)
+            except Exception as e:
+                print(f"⚠️  异步 Claude 客户端初始化失败: {e}")
+        self.ai_enabled = self.client is not None
+        self.db = AsyncDatabase(analyzer.db) if analyzer.db else None
+        self.response_cache = AsyncDatabase(analyzer.response_cache) if analyzer.response_cache else None
+
+    def _check_ai_available(self) -> bool:
+        if not self.ai_enabled:
+            print("❌ AI功能不可用：未配置ANTHROPIC_API_KEY")
+            return False
+        return True
+
+    async def _log_call(self, model: str, task: str, outcome: str, usage=None, **fields):
+        if not self.db:
+            return
+        try:
+            await self.db.save_claude_call(StockAnalyzer._call_record(model, task, outcome, usage, **fields))
+        except Exception as e:
+            print(f"保存调用记录失败: {e}")
+
+    async def _record_llm_call(self, model: str, task: str, source: str, prompt: str, response: str,
+                               usage=None, latency: float = 0.0):
+        if not self.db or not self.analyzer.record_llm_calls:
+            return
+        try:
+            await self.db.save_llm_call(llm_call_record(self.analyzer.llm_session_id, model, task, source, prompt,
+                                                        response, usage, latency))
+            if self.analyzer._start_llm_session():
+                self.analyzer._report_pruned(
+                    await self.db.prune_llm_calls(LLM_RECORD_KEEP_SESSIONS, LLM_RECORD_MAX_AGE_DAYS))
+        except Exception as e:
+            print(f"录制调用失败: {e}")
+
+    async def _call_claude_with_retry(
+        self,
+        prompt: str,
+        max_tokens: int = 4096,
+        max_retries: Optional[int] = None,
+        timeout: int = 60,
+        use_cache: bool = True,
+        cached_prefix: Optional[str] = None,
+        on_text: Optional[Callable[[Optional[str]], None]] = None,
+        model: Optional[str] = None,
+        task: str = 'other'
+    ) -> Optional[str]:
+        """StockAnalyzer._call_claude_with_retry 的异步版本（参数与返回值相同）"""
+        analyzer = self.analyzer
+        model = model or analyzer.model
+        call_started = time.monotonic()
+        full_prompt = cached_prefix + prompt if cached_prefix else prompt
+        if self.response_cache is not None and use_cache:
+            cached = await self.response_cache.get(model, full_prompt, max_tokens)
+            if cached is not None and not cacheable_response(cached):
+                await self.response_cache.delete(model, full_prompt, max_tokens)
+                cached = None
+            with analyzer._stats_lock:
+                if cached is not None:
+                    analyzer.cache_hits += 1
+                else:
+                    analyzer.cache_misses += 1
+            if cached is not None:
+                print(f"   ♻️  命中响应缓存，跳过API调用")
+                await self._log_call(model, task, 'cache_hit', total_seconds=time.monotonic() - call_started)
+                await self._record_llm_call(model, task, 'cache', full_prompt, cached)
+                if on_text is not None:
+                    on_text(cached)
+                return cached
+
+        estimated_tokens = estimate_tokens(full_prompt)
+        policy = analyzer.retry_policy
+        if max_retries is not None and max_retries != policy.max_retries:
+            policy = RetryPolicy(max_retries, policy.base_delay, policy.max_delay, policy.rate_limit_multiplier)
+        last_attempt = 0
+
+        async def attempt_call(attempt: int) -> str:
+            nonlocal last_attempt
+            last_attempt = attempt
+            print(f"   Claude API调用 (异步，尝试 {attempt + 1}/{policy.max_retries})...")
+            try:
+                waited = await analyzer.rate_limiter.acquire_async(estimated_tokens)
+                if waited > 1:
+                    print(f"   ⏳ 限速等待 {waited:.1f} 秒")
+
+                request = dict(
+                    model=model,
+                    max_tokens=max_tokens,
+                    timeout=timeout,
+                    messages=[{"role": "user", "content": analyzer._user_content(prompt, cached_prefix)}]
+                )
+                streamed = on_text is not None and CLAUDE_STREAMING
+                started = time.monotonic()
+                if streamed:
+                    async with self.client.messages.stream(**request) as stream:
+                        async for text in stream.text_stream:
+                            on_text(text)
+                        message = await stream.get_final_message()
+                else:
+                    message = await self.client.messages.create(**request)
+            except Exception:
+                with analyzer._stats_lock:
+                    analyzer.api_errors += 1
+                if on_text is not None:
+                    on_text(None)
+                raise
+
+            latency = time.monotonic() - started
+            response_text = analyzer._accept_message(message, model, estimated_tokens, latency)
+            await self._log_call(model, task, 'success', message.usage, latency_seconds=latency,
+                                 total_seconds=time.monotonic() - call_started, retries=attempt, streamed=streamed)
+            await self._record_llm_call(model, task, 'api', full_prompt, response_text, message.usage, latency)
+            if self.response_cache is not None and cacheable_response(response_text, message.stop_reason):
+                await self.response_cache.put(model, full_prompt, max_tokens, response_text,
+                                              message.usage.input_tokens, message.usage.output_tokens)
+            if on_text is not None and not streamed:
+                on_text(response_text)
+            return response_text
+
+        def on_retry(attempt: int, error: Exception, delay: float):
+            print(f"   ⚠️  API调用失败: {error}")
+            print(f"   等待 {delay:.1f} 秒后重试...")
+
+        try:
+            return await run_with_retry_async(attempt_call, policy, analyzer.circuit_breaker, on_retry)
+        except CircuitOpenError as e:
+            print(f"   🔌 {e}，跳过本次调用")
+            await self._log_call(model, task, 'circuit_open', total_seconds=time.monotonic() - call_started)
+            return None
+        except Exception as e:
+            error_msg = str(e)
+            print(f"   ❌ API调用最终失败: {error_msg}")
+            print(f"   错误类型: {type(e).__name__}")
+            await self._log_call(model, task, 'error', total_seconds=time.monotonic() - call_started,
+                                 retries=last_attempt, error=f"{type(e).__name__}: {error_msg[:200]}")
+            return None
+
+    async def analyze_rising_patterns(self, sample_data: pd.DataFrame) -> List[Dict]:
+        """分析上涨模式（同 StockAnalyzer.analyze_rising_patterns）"""
+        if not self._check_ai_available():
+            return []
+        response_text = await self._call_claude_with_retry(self.analyzer._analyze_prompt(sample_data),
+                                                           max_tokens=4096, task='analyze_patterns')
+        return self.analyzer._parse_patterns(response_text)
+
+    async def predict_stock_probability(
+        self,
+        stock_data: pd.DataFrame,
+        patterns: List[Dict],
+        batch_size: int = 50,
+        use_pre_screening: bool = True,
+        pattern_file: str = 'classic_patterns.json',
+        mode: str = 'sync',
+        on_prediction: Optional[Callable[[Dict], None]] = None,
+        cascade: Optional[bool] = None,
+        scorer: Optional[str] = None,
+        top_k: Optional[int] = None
+    ) -> List[Dict]:
+        """批量预测股票上涨概率（参数同 StockAnalyzer.predict_stock_probability）"""
+        analyzer = self.analyzer
+        cascade = PREDICT_CASCADE_ENABLED if cascade is None else cascade
+        if mode != 'batch' and cascade:
+            return await run_compute(analyzer.predict_stock_probability, stock_data, patterns, batch_size,
+                                     use_pre_screening, pattern_file, mode, on_prediction, cascade, scorer, top_k)
+
+        plan = await run_compute(analyzer._plan_prediction, stock_data, use_pre_screening, pattern_file, scorer, top_k)
+        if plan['scorer'] == 'local':
+            codes = [code for code in plan['ranked'] if code in plan['local_scores']][:LOCAL_SCORER_TOP_K]
+            return await run_compute(analyzer._predict_local, codes, plan['local_scores'], plan['grouped'],
+                                     plan['quant'], on_prediction)
+
+        batches, summaries = await run_compute(analyzer._start_llm_stage, plan, batch_size)
+        prediction_date = datetime.now().strftime('%Y-%m-%d')
+        saved = set()
+        if mode == 'batch':
+            batch_results = await self._predict_batches_offline(batches, patterns, summaries)
+            return await run_compute(analyzer._finish_prediction, plan, batch_results, prediction_date, saved)
+
+        pending: List[asyncio.Future] = []
+
+        def publish(pred: Dict):
+            if analyzer.db:
+                pending.append(asyncio.ensure_future(run_blocking(analyzer._save_prediction, pred, prediction_date)))
+                saved.add(id(pred))
+            if on_prediction:
+                on_prediction(pred)
+
+        streaming = CLAUDE_STREAMING or on_prediction is not None
+        try:
+            batch_results = await analyzer.executor.map_async(
+                lambda batch: self._predict_batch(batch, patterns, summaries, publish if streaming else None),
+                batches,
+                warm_first=True,
+            )
+            await asyncio.gather(*pending)
+        except asyncio.CancelledError:
+            for future in pending:
+                future.cancel()
+            raise
+        return await run_compute(analyzer._finish_prediction, plan, batch_results, prediction_date, saved)
+
+    async def _predict_batches_offline(self, batches: List[Dict[str, pd.DataFrame]], patterns: List[Dict],
+                                       summaries: Optional[Dict] = None) -> List[List[Dict]]:
+        """Message Batches 模式（同 StockAnalyzer._predict_batches_offline，轮询不占用线程，可取消）"""
+        analyzer = self.analyzer
+        if not self._check_ai_available():
+            return [[] for _ in batches]
+
+        offline = await run_compute(analyzer._offline_requests, batches, patterns, summaries)
+        try:
+            runner = MessageBatchRunner(analyzer.batch_service or self.client.messages.batches)
+            messages = await runner.run_async(offline['requests'])
+        except Exception as e:
+            print(f"⚠️  消息批次失败，回退同步调用: {e}")
+            return await analyzer.executor.map_async(lambda batch: self._predict_batch(batch, patterns, summaries),
+                                                     batches)
+        return await run_compute(analyzer._offline_results, batches, offline, messages)
+
+    async def _predict_batch(self, batch_data: Dict[str, pd.DataFrame], patterns: List[Dict],
+                             summaries: Optional[Dict] = None,
+                             on_prediction: Optional[Callable[[Dict], None]] = None,
+                             model: Optional[str] = None) -> List[Dict]:
+        analyzer = self.analyzer
+        if not self._check_ai_available():
+            return []
+        prefix, prompt, stock_metadata = analyzer._build_predict_prompt(batch_data, patterns, summaries)
+        if on_prediction is not None:
+            on_text, published = analyzer._prediction_stream(batch_data, stock_metadata, on_prediction)
+            response_text = await self._call_claude_with_retry(prompt, max_tokens=4096, cached_prefix=prefix,
+                                                               on_text=on_text, model=model, task='predict')
+            return analyzer._finish_prediction_stream(response_text, published, batch_data, stock_metadata,
+                                                      on_prediction)
+
+        response_text = await self._call_claude_with_retry(prompt, max_tokens=4096, cached_prefix=prefix,
+                                                           model=model, task='predict')
+        if not response_text:
+            print("❌ Claude API调用失败，跳过该批次")
+            return []
+        return analyzer._parse_predictions(response_text, batch_data, stock_metadata)
+
+    async def validate_patterns_ai(
+        self,
+        patterns: List[Dict],
+        validation_data: pd.DataFrame,
+        rise_threshold: float = 0.08,
+        mode: Optional[str] = None
+    ) -> List[Dict]:
+        """使用AI方法验证模式（参数同 StockAnalyzer.validate_patterns_ai）"""
+        analyzer = self.analyzer
+        mode = mode or AI_VALIDATION_MODE
+        if mode == 'local':
+            return await run_compute(analyzer.validate_patterns_local, patterns, validation_data, rise_threshold)
+        if not self._check_ai_available():
+            print("⚠️  AI不可用，降级到本地验证方法")
+            return await run_compute(analyzer.validate_patterns_local, patterns, validation_data, rise_threshold)
+
+        print(f"\n📊 开始验证模式（AI方法，{mode}，异步）")
+        print(f"   验证样本数: {len(validation_data)}")
+        validation_summary = analyzer._prepare_data_summary(validation_data, limit=len(validation_data))
+        sample_count = len(validation_data)
+
+        if mode == 'per_pattern':
+            async def validate_one(pattern: Dict) -> Dict:
+                prefix, prompt = analyzer._pattern_validation_prompt(pattern, validation_summary, sample_count)
+                response_text = await self._call_claude_with_retry(prompt, max_tokens=500, timeout=30,
+                                                                   cached_prefix=prefix, task='validate_pattern')
+                return analyzer._apply_pattern_validation(pattern, response_text)
+
+            await analyzer.executor.map_async(validate_one, patterns, warm_first=True)
+            return patterns
+
+        async def validate_group(group: List[Dict]) -> List[Dict]:
+            prefix, prompt = analyzer._multi_validation_prompt(group, validation_summary, sample_count)
+            response_text = await self._call_claude_with_retry(
+                prompt, max_tokens=200 + 80 * len(group), timeout=60, cached_prefix=prefix, task='validate_multi'
+            )
+            return analyzer._apply_multi_validation(group, response_text)
+
+        groups = [
+            patterns[i:i + VALIDATION_PATTERNS_PER_CALL]
+            for i in range(0, len(patterns), VALIDATION_PATTERNS_PER_CALL)
+        ]
+        unresolved = await analyzer.executor.map_async(validate_group, groups, warm_first=True)
+        failed = [pattern for group in unresolved for pattern in group]
+        if failed:
+            print(f"   ⚠️  {len(failed)} 个模式未得到AI验证结果，改用本地验证")
+            await run_compute(analyzer.validate_patterns_local, failed, validation_data, rise_threshold)
+
+        return patterns
@@ -0,0 +1,67 @@
+"""SQLite 对象的异步外观 - 供 asyncio 调用路径使用
+
+    adb = AsyncDatabase(db)                          # StockDatabase、ResponseCache 等同步对象
+    patterns = await adb.get_patterns()              # 任意同步方法均可 await
+    result = await run_blocking(fn, *args)           # 其他短小的 SQLite 调用
+    result = await run_compute(fn, *args)            # CPU 密集或耗时长的同步函数（预筛选、建索引等）
+
+本项目的数据库访问是 sqlite3 的“每次调用一个连接”模式，没有可用的异步驱动；
+这里把调用放到一个独立的小线程池执行：事件循环不被阻塞，也不占用 Starlette 的
+BackgroundTasks 线程池。每次调用仍各自打开连接，线程间不共享连接。
+
+两个线程池分开：SQLite 池只执行毫秒级的读写，耗时的本地计算走计算池，
+长任务占满计算池时其他接口的数据库读写不必排队。
+注意线程中的函数不能被 asyncio 取消打断，需要可取消的长等待应写成协程。
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, TypeVar
+
+from .config import ASYNC_COMPUTE_WORKERS, ASYNC_DB_WORKERS
+
+T = TypeVar("T")
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executor_lock = threading.Lock()
+
+
+def _get_executor(name: str, workers: int) -> ThreadPoolExecutor:
+    with _executor_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        return _executors[name]
+
+
+async def run_blocking(fn: Callable[..., T], *args, **kwargs) -> T:
+    """在数据库线程池中执行短小的阻塞函数（SQLite 读写）"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor("sqlite", ASYNC_DB_WORKERS),
+                                      functools.partial(fn, *args, **kwargs))
+
+
+async def run_compute(fn: Callable[..., T], *args, **kwargs) -> T:
+    """在计算线程池中执行 CPU 密集或耗时长的同步函数"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor("compute", ASYNC_COMPUTE_WORKERS),
+                                      functools.partial(fn, *args, **kwargs))
+
+
+class AsyncDatabase:
+    """把同步对象的方法包装为协程：await adb.method(...) 等价于在线程池中执行 target.method(...)"""
+
+    def __init__(self, target):
+        self.target = target
+
+    def __getattr__(self, name: str):
+        method = getattr(self.target, name)
+        if not callable(method):
+            return method
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            return await run_blocking(method, *args, **kwargs)
+
+        return call
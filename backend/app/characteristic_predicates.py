@@ -0,0 +1,233 @@
+"""特征描述谓词 - 将 AI 模式的文字特征一次编译为类型化谓词，批量向量化求值
+
+AI 模式的 characteristics 是自由文本（如 "涨幅2-4%"、"放量1.5倍"、"低开2%"），
+每条特征编译为若干 Predicate(字段, 运算符, 阈值[, 参照]) 的合取，按特征文本缓存：
+
+    features = FeatureFrame(validation_data)               # 派生列与成交量中位数只算一次
+    matrix = evaluate_patterns(patterns, features)         # (模式数 × 样本数) 布尔矩阵
+    matched = matrix.sum(axis=1)
+    success = matrix @ features.column('is_success')
+
+无法识别的特征编译为空列表（不施加约束）；样本缺少谓词所需字段时该谓词同样不生效。
+"""
+
+import operator
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+}
+
+
+class Predicate:
+    """单个类型化谓词：field op threshold（有参照时为 field op threshold × 参照）
+
+    参照可以是列名（如 prev_close），也可以是 FeatureFrame 的标量统计（如 volume_median）；
+    标量参照不大于 0 时谓词不生效。
+    """
+
+    def __init__(self, field: str, op: str, threshold, ref: Optional[str] = None):
+        if op not in OPERATORS:
+            raise ValueError(f"不支持的运算符: {op}")
+        self.field = field
+        self.op = op
+        self.threshold = threshold
+        self.ref = ref
+
+    @property
+    def key(self) -> Tuple:
+        return self.field, self.op, self.threshold, self.ref
+
+    def evaluate(self, features: 'FeatureFrame') -> Optional[np.ndarray]:
+        """返回布尔数组；字段缺失或参照无效时返回 None（不施加约束）"""
+        values = features.column(self.field)
+        if values is None:
+            return None
+        threshold = self.threshold
+        if self.ref is not None:
+            ref = features.scalar(self.ref)
+            if ref is None:
+                ref = features.column(self.ref)
+                if ref is None:
+                    return None
+            elif ref <= 0:
+                return None
+            threshold = ref * threshold
+        return np.asarray(OPERATORS[self.op](values, threshold), dtype=bool)
+
+    def __eq__(self, other):
+        return isinstance(other, Predicate) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        ref = f" × {self.ref}" if self.ref else ""
+        return f"Predicate({self.field} {self.op} {self.threshold}{ref})"
+
+
+class FeatureFrame:
+    """验证样本的特征列（派生列按需补齐，标量统计只计算一次）"""
+
+    def __init__(self, data: pd.DataFrame):
+        self.length = len(data)
+        self.columns: Dict[str, np.ndarray] = {col: data[col].to_numpy() for col in data.columns}
+        self.scalars: Dict[str, float] = {}
+
+        has_oc = 'open' in self.columns and 'close' in self.columns
+        if 'day_change_pct' not in self.columns and has_oc:
+            self.columns['day_change_pct'] = (data['close'] - data['open']).to_numpy() / data['open'].to_numpy() * 100
+        if 'is_yang' not in self.columns and has_oc:
+            self.columns['is_yang'] = self.columns['close'] > self.columns['open']
+            self.columns['is_yin'] = self.columns['close'] < self.columns['open']
+        if 'amplitude' not in self.columns and 'high' in self.columns and 'low' in self.columns:
+            self.columns['amplitude'] = (data['high'] - data['low']).to_numpy() / data['low'].to_numpy() * 100
+        if 'volume' in self.columns:
+            self.scalars['volume_median'] = float(data['volume'].median())
+
+    def column(self, name: str) -> Optional[np.ndarray]:
+        return self.columns.get(name)
+
+    def scalar(self, name: str) -> Optional[float]:
+        return self.scalars.get(name)
+
+
+# ---------- 编译 ----------
+_NUMBER = r'(\d+\.?\d*)'
+
+
+def _compile(char: str) -> List[Predicate]:
+    """按特征关键词解析为谓词合取（关键词优先级自上而下）"""
+    if '阳线' in char:
+        # 连续N天阳线暂时简化为单日阳线
+        return [Predicate('is_yang', '==', True)]
+
+    if '阴线' in char:
+        return [Predicate('is_yin', '==', True)]
+
+    if '涨幅' in char or '上涨' in char:
+        span = re.findall(_NUMBER + r'[%\-]' + _NUMBER, char)
+        if span:  # 范围：2-4%
+            low, high = float(span[0][0]), float(span[0][1])
+            return [Predicate('day_change_pct', '>=', low), Predicate('day_change_pct', '<=', high)]
+        nums = re.findall(r'[>=<超]+\s*' + _NUMBER, char)
+        if nums:
+            threshold = float(nums[0])
+            if '超过' in char or '>' in char:
+                return [Predicate('day_change_pct', '>=', threshold)]
+            if '<' in char:
+                return [Predicate('day_change_pct', '<', threshold)]
+        return []
+
+    if '振幅' in char:
+        nums = re.findall(_NUMBER, char)
+        if nums:
+            threshold = float(nums[0])
+            if '超过' in char or '>' in char:
+                return [Predicate('amplitude', '>', threshold)]
+            if '<' in char or '小于' in char:
+                return [Predicate('amplitude', '<', threshold)]
+        return []
+
+    if '涨停' in char or '一字板' in char:
+        return [Predicate('day_change_pct', '>=', 9.5)]
+
+    if '放量' in char:
+        nums = re.findall(_NUMBER + r'[%倍]', char)
+        if nums:
+            multiplier = float(nums[0])
+            if '%' in char:
+                multiplier = multiplier / 100 + 1
+            return [Predicate('volume', '>=', multiplier, ref='volume_median')]
+        return [Predicate('volume', '>', 1.2, ref='volume_median')]
+
+    if '缩量' in char:
+        return [Predicate('volume', '<', 0.8, ref='volume_median')]
+
+    if '收盘价接近开盘价' in char or '收盘接近开盘' in char:
+        return [Predicate('day_change_pct', '<', 0.5)]  # 涨跌幅<0.5%
+
+    if '收盘价高于开盘价' in char or '收盘高于开盘' in char:
+        nums = re.findall(_NUMBER + r'[%]', char)
+        predicates = [Predicate('is_yang', '==', True)]
+        if nums:
+            predicates.append(Predicate('day_change_pct', '>=', float(nums[0])))
+        return predicates
+
+    if '低开' in char or '开盘价低于' in char:
+        nums = re.findall(_NUMBER + r'[%]', char)
+        threshold = 1 - float(nums[0]) / 100 if nums else 1
+        # 开盘价 < 前收 * (1 - threshold)
+        return [Predicate('open', '<', threshold, ref='prev_close')]
+
+    return []
+
+
+_compiled_cache: Dict[str, List[Predicate]] = {}
+
+
+def compile_characteristic(char: str) -> List[Predicate]:
+    """编译单条特征描述（按文本缓存，同一描述只解析一次）"""
+    cached = _compiled_cache.get(char)
+    if cached is None:
+        try:
+            cached = _compile(char)
+        except ValueError as e:
+            print(f"   [警告] 特征'{char[:30]}'编译失败: {e}")
+            cached = []
+        _compiled_cache[char] = cached
+    return cached
+
+
+def compile_characteristics(characteristics: Sequence[str]) -> List[Predicate]:
+    """编译模式的全部特征，返回去重后的谓词合取"""
+    predicates: List[Predicate] = []
+    for char in characteristics:
+        for predicate in compile_characteristic(char):
+            if predicate not in predicates:
+                predicates.append(predicate)
+    return predicates
+
+
+# ---------- 求值 ----------
+def evaluate_predicates(predicate_sets: Sequence[Sequence[Predicate]], features: FeatureFrame) -> np.ndarray:
+    """对多组谓词合取求值，返回 (组数 × 样本数) 布尔矩阵
+
+    所有组中不同的谓词各只求值一次，组内按列取合取。
+    """
+    unique: Dict[Predicate, int] = {}
+    for predicates in predicate_sets:
+        for predicate in predicates:
+            unique.setdefault(predicate, len(unique))
+
+    # 谓词矩阵：第 0 行恒为 True，供不生效的谓词使用
+    columns = np.ones((len(unique) + 1, features.length), dtype=bool)
+    slots: Dict[Predicate, int] = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for predicate, index in unique.items():
+            result = predicate.evaluate(features)
+            if result is not None:
+                columns[index + 1] = result
+                slots[predicate] = index + 1
+            else:
+                slots[predicate] = 0
+
+    matrix = np.ones((len(predicate_sets), features.length), dtype=bool)
+    for row, predicates in enumerate(predicate_sets):
+        indices = [slots[p] for p in predicates if slots[p]]
+        if indices:
+            matrix[row] = columns[indices].all(axis=0)
+    return matrix
+
+
+def evaluate_patterns(patterns: Sequence[Dict], features: FeatureFrame) -> np.ndarray:
+    """对全部模式的 characteristics 求值，返回 (模式数 × 样本数) 布尔矩阵"""
+    return evaluate_predicates([compile_characteristics(p.get('characteristics', [])) for p in patterns], features)
@@ -0,0 +1,145 @@
+"""Claude 响应缓存 - 相同 (模型, 提示词, max_tokens) 的请求直接返回已保存的响应
+
+适用于任务崩溃后重跑、同一天重复验证等场景：命中缓存不产生 API 调用与费用。
+持久化在独立的 SQLite 文件中，支持 TTL 过期与按最近使用时间的容量淘汰。
+只缓存完整结束且能解析出 JSON 的响应（cacheable_response），被截断或无法解析的响应不会在 TTL 内被反复返回。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Optional
+
+from .config import CLAUDE_CACHE_MAX_ENTRIES, CLAUDE_CACHE_PATH, CLAUDE_CACHE_TTL_HOURS
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def cacheable_response(text: Optional[str], stop_reason: Optional[str] = "end_turn") -> bool:
+    """响应是否可以缓存：以 end_turn 结束（未被 max_tokens 截断），且能解析出 JSON（所有调用都要求 JSON 响应）"""
+    if stop_reason != "end_turn" or not text:
+        return False
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0]
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0]
+    try:
+        json.loads(text.strip())
+    except ValueError:
+        return False
+    return True
+
+
+class ResponseCache:
+    """提示词 → 响应文本的持久化缓存"""
+
+    def __init__(
+        self,
+        db_path: str = CLAUDE_CACHE_PATH,
+        ttl_hours: float = CLAUDE_CACHE_TTL_HOURS,
+        max_entries: int = CLAUDE_CACHE_MAX_ENTRIES,
+    ):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.init_db()
+
+    def get_connection(self):
+        return sqlite3.connect(self.db_path)
+
+    def init_db(self):
+        conn = self.get_connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS claude_response_cache (
+                model TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                max_tokens INTEGER NOT NULL,
+                response TEXT NOT NULL,
+                input_tokens INTEGER,
+                output_tokens INTEGER,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, prompt_hash, max_tokens)
+            )
+        ''')
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_claude_cache_last_used ON claude_response_cache(last_used)'
+        )
+        conn.commit()
+        conn.close()
+
+    def get(self, model: str, prompt: str, max_tokens: int) -> Optional[str]:
+        """查询缓存，未命中或已过期返回 None"""
+        key = (model, prompt_hash(prompt), max_tokens)
+        now = time.time()
+        conn = self.get_connection()
+        try:
+            row = conn.execute(
+                "SELECT response, created_at FROM claude_response_cache "
+                "WHERE model = ? AND prompt_hash = ? AND max_tokens = ?",
+                key,
+            ).fetchone()
+            if row and self.ttl_seconds > 0 and now - row[1] > self.ttl_seconds:
+                conn.execute(
+                    "DELETE FROM claude_response_cache WHERE model = ? AND prompt_hash = ? AND max_tokens = ?",
+                    key,
+                )
+                conn.commit()
+                row = None
+            if row:
+                conn.execute(
+                    "UPDATE claude_response_cache SET last_used = ? "
+                    "WHERE model = ? AND prompt_hash = ? AND max_tokens = ?",
+                    (now, *key),
+                )
+                conn.commit()
+        finally:
+            conn.close()
+
+        return row[0] if row else None
+
+    def put(self, model: str, prompt: str, max_tokens: int, response: str,
+            input_tokens: int = 0, output_tokens: int = 0):
+        """写入缓存，同时清理过期条目并按容量淘汰最久未使用的条目"""
+        now = time.time()
+        conn = self.get_connection()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO claude_response_cache "
+                "(model, prompt_hash, max_tokens, response, input_tokens, output_tokens, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (model, prompt_hash(prompt), max_tokens, response, input_tokens, output_tokens, now, now),
+            )
+            if self.ttl_seconds > 0:
+                conn.execute("DELETE FROM claude_response_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            overflow = conn.execute("SELECT COUNT(*) FROM claude_response_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM claude_response_cache WHERE rowid IN "
+                    "(SELECT rowid FROM claude_response_cache ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete(self, model: str, prompt: str, max_tokens: int):
+        """删除一条缓存（命中的响应无法使用时）"""
+        conn = self.get_connection()
+        conn.execute(
+            "DELETE FROM claude_response_cache WHERE model = ? AND prompt_hash = ? AND max_tokens = ?",
+            (model, prompt_hash(prompt), max_tokens),
+        )
+        conn.commit()
+        conn.close()
+
+    def clear(self):
+        conn = self.get_connection()
+        conn.execute("DELETE FROM claude_response_cache")
+        conn.commit()
+        conn.close()
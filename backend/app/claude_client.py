@@ -0,0 +1,361 @@
+"""Claude 客户端接口 - 真实 Anthropic 客户端或本地模拟客户端
+
+StockAnalyzer 与脚本只依赖 client.messages.create(...) / .stream(...) / .batches 接口，
+create_client() 按 config.CLAUDE_CLIENT（环境变量 CLAUDE_CLIENT 可覆盖）选择实现：
+
+    client = create_client(api_key)                  # "anthropic"：无密钥时返回 None
+    client = FakeClaudeClient(latency=0.5, error_rate=0.05, rate_limit_rate=0.1, seed=1)
+    client = create_async_client(api_key)            # 异步调用路径：AsyncAnthropic / AsyncFakeClaudeClient
+
+FakeClaudeClient 不访问网络、不产生费用：按提示词识别任务类型返回符合格式的 JSON，
+延迟服从对数正态分布，可按比例注入 5xx 错误与 429 限流，token 数按文本估算。
+同一 seed 下结果可复现，用于对并发、重试、缓存等改动做离线压测。
+"""
+
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from types import SimpleNamespace
+from typing import Callable, Dict, Optional
+
+from .claude_batch import FakeBatchService
+from .claude_executor import content_text, estimate_tokens
+from .config import (
+    CLAUDE_CLIENT, FAKE_CLAUDE_ERROR_RATE, FAKE_CLAUDE_LATENCY_SECONDS, FAKE_CLAUDE_LATENCY_SIGMA,
+    FAKE_CLAUDE_RATE_LIMIT_RATE, FAKE_CLAUDE_SEED,
+)
+
+
+def create_client(api_key: Optional[str] = None, backend: Optional[str] = None):
+    """按配置创建 Claude 客户端
+
+    Args:
+        api_key: Anthropic API 密钥（模拟客户端不需要）
+        backend: "anthropic" 或 "fake"，None 读取 config.CLAUDE_CLIENT
+
+    Returns:
+        客户端实例；真实客户端缺少密钥时返回 None
+    """
+    backend = backend or CLAUDE_CLIENT
+    if backend == "fake":
+        return FakeClaudeClient()
+    if backend != "anthropic":
+        raise ValueError(f"未知的 Claude 客户端类型: {backend}")
+    if not api_key:
+        return None
+    from anthropic import Anthropic
+    return Anthropic(api_key=api_key)
+
+
+def create_async_client(api_key: Optional[str] = None, backend: Optional[str] = None):
+    """按配置创建异步 Claude 客户端（AsyncAnthropic 或 AsyncFakeClaudeClient），参数同 create_client"""
+    backend = backend or CLAUDE_CLIENT
+    if backend == "fake":
+        return AsyncFakeClaudeClient()
+    if backend != "anthropic":
+        raise ValueError(f"未知的 Claude 客户端类型: {backend}")
+    if not api_key:
+        return None
+    from anthropic import AsyncAnthropic
+    return AsyncAnthropic(api_key=api_key)
+
+
+class FakeAPIError(Exception):
+    """模拟的 API 错误（消息格式与 anthropic SDK 一致，重试逻辑据此识别限流）"""
+
+    def __init__(self, status_code: int, error_type: str, retry_after: Optional[float] = None):
+        self.status_code = status_code
+        self.retry_after = retry_after
+        super().__init__(f"Error code: {status_code} - {{'type': 'error', 'error': {{'type': '{error_type}'}}}}")
+
+
+# ---------- 按任务类型生成响应 ----------
+def _predictions(prompt: str, rng: random.Random) -> str:
+    stocks = re.findall(r"^#(\d{6}) (\S*)", prompt, re.M)
+    return json.dumps([
+        {"code": code, "name": name, "probability": round(rng.uniform(60, 95), 1), "reason": "模拟预测"}
+        for code, name in stocks if rng.random() < 0.5
+    ], ensure_ascii=False)
+
+
+def _multi_validation(prompt: str, rng: random.Random) -> str:
+    count = int(re.search(r"待验证的模式（共(\d+)个）", prompt).group(1))
+    results = []
+    for i in range(count):
+        matched = rng.randint(0, 40)
+        results.append({"index": i + 1, "matched_count": matched,
+                        "success_count": rng.randint(0, matched), "analysis": "模拟验证"})
+    return json.dumps(results, ensure_ascii=False)
+
+
+def _single_validation(prompt: str, rng: random.Random) -> str:
+    found = re.search(r"共(\d+)条", prompt)
+    total = int(found.group(1)) if found else 100
+    matched = rng.randint(0, total)
+    return json.dumps({"matched_count": matched, "total_count": total,
+                       "success_rate": round(rng.uniform(0, 100), 1), "analysis": "模拟验证"}, ensure_ascii=False)
+
+
+def _rising_patterns(prompt: str, rng: random.Random) -> str:
+    codes = re.findall(r"^(\d{6}),", prompt, re.M) or ["000001"]
+    return json.dumps([
+        {
+            "pattern_name": f"模拟模式{i + 1}",
+            "description": "模拟的上涨模式描述",
+            "characteristics": ["连续阳线", "成交量放大", "突破前高"][: rng.randint(1, 3)],
+            "example_stock_code": rng.choice(codes),
+            "highlight_description": {"key_days": "最近3天", "key_features": ["成交量放大2倍"]},
+        }
+        for i in range(rng.randint(8, 12))
+    ], ensure_ascii=False)
+
+
+def _cluster_pattern(prompt: str, rng: random.Random) -> str:
+    multiplier = round(rng.uniform(1.3, 2.5), 2)
+    return json.dumps({
+        "pattern_name": "模拟放量突破",
+        "description": "模拟的簇模式",
+        "parameters": {"volume_multiplier": multiplier},
+        "match_rules": ["成交量大于前5日均量的倍数", "收盘价突破前5日最高价"],
+        "rules": {"min_bars": 10, "confidence": 0.6, "when": {"all": [
+            {">=": ["volume", {"mul": [{"mean": "volume", "n": 5, "lag": 1}, {"param": "volume_multiplier"}]}]},
+            {">": ["close", {"max": "high", "n": 5, "lag": 1}]},
+        ]}},
+    }, ensure_ascii=False)
+
+
+RESPONDERS = [
+    (re.compile(r"待验证的模式（共\d+个）"), _multi_validation),
+    (re.compile(r"已识别的模式:"), _single_validation),
+    (re.compile(r"^#\d{6} ", re.M), _predictions),
+    (re.compile(r"总结出.*种具有代表性的上涨模式"), _rising_patterns),
+    (re.compile(r"extract common patterns|提取可编程的模式定义"), _cluster_pattern),
+]
+
+
+def fake_response(prompt: str, rng: Optional[random.Random] = None) -> str:
+    """根据提示词识别任务类型，返回符合该任务输出格式的 JSON 文本"""
+    rng = rng or random.Random(0)
+    for pattern, respond in RESPONDERS:
+        if pattern.search(prompt):
+            return respond(prompt, rng)
+    return "[]"
+
+
+class FakeClaudeClient:
+    """本地模拟的 Anthropic 客户端（messages.create / stream / batches）
+
+    Args:
+        latency: 延迟中位数（秒）
+        latency_sigma: 对数正态分布的 sigma（0 表示固定延迟）
+        error_rate: 返回 529 overloaded 的概率
+        rate_limit_rate: 返回 429 限流的概率
+        output_tokens_per_second: 大于 0 时按输出 token 数追加生成耗时
+        first_token_fraction: 流式调用中首个文本块到达时间占总延迟的比例
+        seed: 随机种子（延迟、错误注入与响应内容可复现）
+        respond: 自定义响应函数 prompt -> 文本，默认按任务类型生成
+    """
+
+    def __init__(
+        self,
+        latency: float = FAKE_CLAUDE_LATENCY_SECONDS,
+        latency_sigma: float = FAKE_CLAUDE_LATENCY_SIGMA,
+        error_rate: float = FAKE_CLAUDE_ERROR_RATE,
+        rate_limit_rate: float = FAKE_CLAUDE_RATE_LIMIT_RATE,
+        output_tokens_per_second: float = 0,
+        first_token_fraction: float = 0.2,
+        seed: int = FAKE_CLAUDE_SEED,
+        respond: Optional[Callable[[str], str]] = None,
+    ):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.output_tokens_per_second = output_tokens_per_second
+        self.first_token_fraction = first_token_fraction
+        self.respond = respond
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._cached_prefixes = set()
+
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        self.messages = SimpleNamespace(
+            create=self.create,
+            stream=self.stream,
+            batches=FakeBatchService(respond=self._respond_params, polls_until_done=0),
+        )
+
+    def _respond(self, prompt: str, rng: random.Random) -> str:
+        return self.respond(prompt) if self.respond else fake_response(prompt, rng)
+
+    def _respond_params(self, params: Dict) -> str:
+        with self._lock:
+            rng = random.Random(self._rng.random())
+        return self._respond(content_text(params["messages"][0]["content"]), rng)
+
+    def _usage(self, content, text: str):
+        """按文本估算 token；带 cache_control 的前缀块首次计为缓存写入，之后计为缓存读取"""
+        cache_write = cache_read = 0
+        input_tokens = 0
+        blocks = [{"type": "text", "text": content}] if isinstance(content, str) else content
+        for block in blocks:
+            tokens = estimate_tokens(block.get("text", ""))
+            if block.get("cache_control"):
+                with self._lock:
+                    seen = block["text"] in self._cached_prefixes
+                    self._cached_prefixes.add(block["text"])
+                if seen:
+                    cache_read += tokens
+                else:
+                    cache_write += tokens
+            else:
+                input_tokens += tokens
+        return SimpleNamespace(input_tokens=input_tokens, output_tokens=estimate_tokens(text),
+                               cache_creation_input_tokens=cache_write, cache_read_input_tokens=cache_read)
+
+    def _begin(self):
+        """登记一次调用，抽取 (错误骰子, 延迟, 响应随机源)"""
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            roll = self._rng.random()
+            delay = self.latency * math.exp(self._rng.gauss(0, self.latency_sigma)) if self.latency_sigma else self.latency
+            rng = random.Random(self._rng.random())
+        return roll, delay, rng
+
+    def _end(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _reply(self, model: str, messages, timeout: Optional[float], roll: float, delay: float, rng: random.Random):
+        """按错误骰子决定结果，返回 (message, 耗时, error)：error 不为 None 时等待耗时后抛出"""
+        if roll < self.rate_limit_rate:
+            with self._lock:
+                self.rate_limited += 1
+            return None, min(delay, 0.05), FakeAPIError(429, "rate_limit_error", retry_after=1)
+        if roll < self.rate_limit_rate + self.error_rate:
+            with self._lock:
+                self.errors += 1
+            return None, delay, FakeAPIError(529, "overloaded_error")
+
+        content = messages[0]["content"]
+        text = self._respond(content_text(content), rng)
+        usage = self._usage(content, text)
+        if self.output_tokens_per_second > 0:
+            delay += usage.output_tokens / self.output_tokens_per_second
+        if timeout is not None and delay > timeout:
+            return None, timeout, TimeoutError("Request timed out.")
+        message = SimpleNamespace(
+            id=f"msg_fake_{rng.getrandbits(48):012x}", model=model, stop_reason="end_turn",
+            content=[SimpleNamespace(type="text", text=text)], usage=usage,
+        )
+        return message, delay, None
+
+    def create(self, model: str, max_tokens: int, messages, timeout: Optional[float] = None, **kwargs):
+        roll, delay, rng = self._begin()
+        try:
+            message, delay, error = self._reply(model, messages, timeout, roll, delay, rng)
+            time.sleep(delay)
+            if error is not None:
+                raise error
+            return message
+        finally:
+            self._end()
+
+    @contextmanager
+    def stream(self, model: str, max_tokens: int, messages, timeout: Optional[float] = None, **kwargs):
+        """流式调用（同 client.messages.stream）：首个文本块在延迟的 first_token_fraction 后到达"""
+        roll, delay, rng = self._begin()
+        try:
+            message, delay, error = self._reply(model, messages, timeout, roll, delay, rng)
+            if error is not None:
+                time.sleep(delay)
+                raise error
+            yield FakeMessageStream(message, delay, self.first_token_fraction)
+        finally:
+            self._end()
+
+
+class AsyncFakeClaudeClient(FakeClaudeClient):
+    """FakeClaudeClient 的异步版本（同 AsyncAnthropic：await messages.create，async with messages.stream）
+
+    延迟用 asyncio.sleep 模拟，in_flight / max_in_flight 统计的是同时挂起的协程数。
+    """
+
+    async def create(self, model: str, max_tokens: int, messages, timeout: Optional[float] = None, **kwargs):
+        roll, delay, rng = self._begin()
+        try:
+            message, delay, error = self._reply(model, messages, timeout, roll, delay, rng)
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+            return message
+        finally:
+            self._end()
+
+    @asynccontextmanager
+    async def stream(self, model: str, max_tokens: int, messages, timeout: Optional[float] = None, **kwargs):
+        roll, delay, rng = self._begin()
+        try:
+            message, delay, error = self._reply(model, messages, timeout, roll, delay, rng)
+            if error is not None:
+                await asyncio.sleep(delay)
+                raise error
+            yield AsyncFakeMessageStream(message, delay, self.first_token_fraction)
+        finally:
+            self._end()
+
+
+class FakeMessageStream:
+    """模拟的 MessageStream：text_stream 按固定块大小逐块产出，get_final_message 返回完整消息"""
+
+    def __init__(self, message, duration: float, first_token_fraction: float, chunk_size: int = 16):
+        self.message = message
+        self.duration = duration
+        self.first_token_fraction = first_token_fraction
+        self.chunk_size = chunk_size
+
+    def _chunks(self):
+        text = self.message.content[0].text
+        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+
+    @property
+    def text_stream(self):
+        chunks = self._chunks()
+        time.sleep(self.duration * self.first_token_fraction)
+        step = self.duration * (1 - self.first_token_fraction) / len(chunks)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(step)
+            yield chunk
+
+    def get_final_message(self):
+        return self.message
+
+
+class AsyncFakeMessageStream(FakeMessageStream):
+    """模拟的 AsyncMessageStream：async for 逐块产出，await get_final_message()"""
+
+    @property
+    async def text_stream(self):
+        chunks = self._chunks()
+        await asyncio.sleep(self.duration * self.first_token_fraction)
+        step = self.duration * (1 - self.first_token_fraction) / len(chunks)
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(step)
+            yield chunk
+
+    async def get_final_message(self):
+        return self.message
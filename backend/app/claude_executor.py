@@ -0,0 +1,152 @@
+"""Claude 调用并发执行器 - 限制同时在途请求数，并按账户的 RPM / TPM 配额限速
+
+用法：
+
+    limiter = RateLimiter(rpm=50, tpm=40000)
+    limiter.acquire(estimate_tokens(prompt))      # 每次请求前（可能阻塞）
+    limiter.settle(estimated, actual)             # 请求完成后按实际 token 数校正
+
+    executor = ClaudeExecutor(max_in_flight=4)
+    results = executor.map(run_batch, batches)    # 结果顺序与输入一致
+
+    # 异步调用路径：协程函数在同一事件循环内并发，等待限速时不占用线程
+    await limiter.acquire_async(estimated)
+    results = await executor.map_async(run_batch_async, batches)
+"""
+
+import asyncio
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_WIDE_CHARS = re.compile(r"[^\x00-\x7f]")
+
+
+def content_text(content) -> str:
+    """消息内容（字符串或文本块列表）拼接为纯文本"""
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数（中文约 1 字 1 token，ASCII 约 4 字符 1 token）"""
+    wide = len(_WIDE_CHARS.findall(text))
+    return wide + (len(text) - wide) // 4 + 1
+
+
+class TokenBucket:
+    """令牌桶：按每分钟速率匀速补充，容量默认等于一分钟的配额"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self, amount: float) -> float:
+        """尝试取出令牌，成功返回 0，否则返回还需等待的秒数"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """取出 amount 个令牌（超过容量时按容量计），不足时阻塞等待，返回等待秒数"""
+        if self.unlimited:
+            return 0.0
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            wait = self._take(amount)
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, amount: float = 1.0) -> float:
+        """acquire 的异步版本：不足时 asyncio.sleep，等待期间事件循环继续运行"""
+        if self.unlimited:
+            return 0.0
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            wait = self._take(amount)
+            if wait <= 0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def consume(self, amount: float):
+        """直接扣除（允许透支），用于按实际用量校正估算误差"""
+        if self.unlimited:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+
+
+class RateLimiter:
+    """请求数 (RPM) 与 token 数 (TPM) 两个令牌桶的组合"""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    def acquire(self, estimated_tokens: int) -> float:
+        """请求前调用，返回因限速等待的秒数"""
+        return self.requests.acquire(1) + self.tokens.acquire(estimated_tokens)
+
+    async def acquire_async(self, estimated_tokens: int) -> float:
+        return await self.requests.acquire_async(1) + await self.tokens.acquire_async(estimated_tokens)
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        """请求完成后按实际 token 数补扣或返还"""
+        self.tokens.consume(actual_tokens - min(estimated_tokens, self.tokens.capacity))
+
+
+class ClaudeExecutor:
+    """有界并发执行器：最多 max_in_flight 个调用同时在途，结果按输入顺序返回"""
+
+    def __init__(self, max_in_flight: int = 4):
+        self.max_in_flight = max(1, max_in_flight)
+
+    def map(self, fn: Callable[[T], R], items: Sequence[T], warm_first: bool = False) -> List[R]:
+        """并发执行 fn，warm_first=True 时先单独执行第一项（写入提示词缓存），其余再并发"""
+        items = list(items)
+        if self.max_in_flight == 1 or len(items) <= 1:
+            return [fn(item) for item in items]
+        head = [fn(items[0])] if warm_first else []
+        rest = items[len(head):]
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(rest)),
+                                thread_name_prefix="claude") as pool:
+            return head + list(pool.map(fn, rest))
+
+    async def map_async(self, fn: Callable[[T], Awaitable[R]], items: Sequence[T], warm_first: bool = False) -> List[R]:
+        """map 的异步版本：fn 为协程函数，由信号量限制在途数；任务被取消时未完成的调用一并取消"""
+        items = list(items)
+        head = [await fn(items[0])] if warm_first and items else []
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async def run(item):
+            async with semaphore:
+                return await fn(item)
+
+        return head + list(await asyncio.gather(*(run(item) for item in items[len(head):])))
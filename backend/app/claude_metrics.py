@@ -0,0 +1,71 @@
+"""Claude 调用指标汇总 - 由逐次调用记录（database.claude_calls）计算延迟分位数、吞吐与成本
+
+StockAnalyzer 每次调用结束（成功、最终失败、命中响应缓存或被熔断器拒绝）写入一条记录，服务重启后仍可统计：
+
+    calls = db.get_claude_calls(days=7)
+    report = summarize_calls(calls)     # 总体 / 按任务 / 按日 / 按任务×日
+
+延迟分位数只统计实际请求成功的同步调用（不含缓存命中与 Message Batches）；
+tokens/sec 为输出 token 数 / 请求耗时。
+"""
+
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+PERCENTILES = (50, 95, 99)
+
+
+def _group_summary(calls: pd.DataFrame) -> Dict:
+    """一组调用记录的统计"""
+    succeeded = calls['outcome'] == 'success'
+    failed = calls['outcome'] == 'error'
+    timed = calls[succeeded & (calls['batch'] == 0) & (calls['latency_seconds'] > 0)]
+    latency = timed['latency_seconds'].to_numpy(dtype=float)
+    attempts = int(succeeded.sum() + failed.sum())
+
+    summary = {
+        'calls': int(len(calls)),
+        'success': int(succeeded.sum()),
+        'errors': int(failed.sum()),
+        'cache_hits': int((calls['outcome'] == 'cache_hit').sum()),
+        'circuit_open': int((calls['outcome'] == 'circuit_open').sum()),
+        'retries': int(calls['retries'].sum()),
+        'success_rate': round(succeeded.sum() / attempts * 100, 2) if attempts else 0,
+        'input_tokens': int(calls['input_tokens'].sum()),
+        'output_tokens': int(calls['output_tokens'].sum()),
+        'cache_creation_input_tokens': int(calls['cache_creation_input_tokens'].sum()),
+        'cache_read_input_tokens': int(calls['cache_read_input_tokens'].sum()),
+        'cost_usd': round(float(calls['cost_usd'].sum()), 4),
+    }
+    if len(latency):
+        for p, value in zip(PERCENTILES, np.percentile(latency, PERCENTILES)):
+            summary[f'latency_p{p}'] = round(float(value), 3)
+        summary['tokens_per_second'] = round(float(timed['output_tokens'].sum() / latency.sum()), 1)
+    else:
+        summary.update({f'latency_p{p}': None for p in PERCENTILES})
+        summary['tokens_per_second'] = None
+    return summary
+
+
+def summarize_calls(calls: pd.DataFrame) -> Dict:
+    """汇总调用记录
+
+    Args:
+        calls: database.get_claude_calls 返回的 DataFrame
+
+    Returns:
+        {'overall': {...}, 'by_task': {task: {...}}, 'by_day': {day: {...}}, 'by_task_day': {task: {day: {...}}}}
+    """
+    if calls.empty:
+        return {'overall': {}, 'by_task': {}, 'by_day': {}, 'by_task_day': {}}
+    by_task_day: Dict[str, Dict] = {}
+    for (task, day), group in calls.groupby(['task', 'day']):
+        by_task_day.setdefault(task, {})[day] = _group_summary(group)
+    return {
+        'overall': _group_summary(calls),
+        'by_task': {task: _group_summary(group) for task, group in calls.groupby('task')},
+        'by_day': {day: _group_summary(group) for day, group in calls.groupby('day')},
+        'by_task_day': by_task_day,
+    }
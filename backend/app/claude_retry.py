@@ -0,0 +1,326 @@
+"""Claude 调用重试策略与熔断器
+
+    policy = RetryPolicy()                         # 指数退避 + 全抖动，遵守服务端 Retry-After
+    breaker = get_breaker("claude")                # 进程内共享：所有调用方共用同一熔断状态
+
+    result = run_with_retry(attempt, policy, breaker)              # 同步（线程中执行）
+    result = await run_with_retry_async(attempt, policy, breaker)  # 异步：等待期间事件循环继续运行
+
+- 退避：第 n 次重试等待 uniform(0, min(max_delay, base × 2^n × 倍率))，限流错误倍率更高；
+  响应带 Retry-After（或 retry-after-ms）时至少等待该时长。
+- 不可重试的错误（400/401/403/404 等请求本身的问题）立即失败。
+- 熔断器：最近 window 次尝试的失败率达到阈值后打开，冷却期内直接失败（不发请求）；
+  冷却结束后放行一次探测请求，成功（或不可重试的错误，说明 API 可达）则关闭；
+  探测被取消时只释放名额，熔断打开之前发出的请求结果不计入。
+- 协调：收到 Retry-After 时熔断器记录全局“暂停至”时间，其他调用方发请求前同样等待，
+  避免各自撞上限流。
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from .config import (
+    CLAUDE_BREAKER_COOLDOWN_SECONDS, CLAUDE_BREAKER_FAILURE_RATE, CLAUDE_BREAKER_MIN_CALLS, CLAUDE_BREAKER_WINDOW,
+    CLAUDE_RETRY_BASE_SECONDS, CLAUDE_RETRY_MAX, CLAUDE_RETRY_MAX_SECONDS, CLAUDE_RETRY_RATE_LIMIT_MULTIPLIER,
+)
+
+T = TypeVar("T")
+
+NON_RETRYABLE_STATUS = {400, 401, 403, 404, 413, 422}
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，调用被直接拒绝"""
+
+
+def status_code(error: Exception) -> Optional[int]:
+    code = getattr(error, "status_code", None)
+    if code is None and getattr(error, "response", None) is not None:
+        code = getattr(error.response, "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_rate_limit(error: Exception) -> bool:
+    message = str(error).lower()
+    return status_code(error) == 429 or "rate_limit" in message or "429" in message
+
+
+def is_retryable(error: Exception) -> bool:
+    return status_code(error) not in NON_RETRYABLE_STATUS
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """从错误中读取服务端建议的等待秒数（retry_after 属性或响应头 retry-after-ms / retry-after）"""
+    value = getattr(error, "retry_after", None)
+    if value is not None:
+        return max(0.0, float(value))
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    millis = headers.get("retry-after-ms")
+    if millis:
+        try:
+            return max(0.0, float(millis) / 1000)
+        except ValueError:
+            pass
+    seconds = headers.get("retry-after")
+    if not seconds:
+        return None
+    try:
+        return max(0.0, float(seconds))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(seconds).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class RetryPolicy:
+    """指数退避 + 全抖动的重试策略"""
+
+    def __init__(
+        self,
+        max_retries: int = CLAUDE_RETRY_MAX,
+        base_delay: float = CLAUDE_RETRY_BASE_SECONDS,
+        max_delay: float = CLAUDE_RETRY_MAX_SECONDS,
+        rate_limit_multiplier: float = CLAUDE_RETRY_RATE_LIMIT_MULTIPLIER,
+        seed: Optional[int] = None,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limit_multiplier = rate_limit_multiplier
+        self._rng = random.Random(seed)
+
+    def should_retry(self, attempt: int, error: Exception) -> bool:
+        """attempt 为刚失败的尝试序号（从 0 开始）"""
+        return attempt < self.max_retries - 1 and is_retryable(error)
+
+    def delay(self, attempt: int, error: Exception) -> float:
+        """第 attempt 次尝试失败后的等待秒数"""
+        multiplier = self.rate_limit_multiplier if is_rate_limit(error) else 1
+        ceiling = min(self.max_delay, self.base_delay * (2 ** attempt) * multiplier)
+        backoff = self._rng.uniform(0, ceiling)
+        retry_after = retry_after_seconds(error)
+        return max(backoff, retry_after) if retry_after is not None else backoff
+
+
+class CircuitBreaker:
+    """按最近 window 次尝试的失败率熔断（线程安全，可同时用于线程与协程调用方）
+
+    每次尝试先 admit() 领取凭证，结束时 record(success, ticket) 登记结果或 release(ticket) 放弃：
+    凭证记录放行时的熔断轮次，熔断打开之前发出、之后才返回的尝试结果不计入（也不会被当作探测结果）。
+    """
+
+    def __init__(
+        self,
+        window: int = CLAUDE_BREAKER_WINDOW,
+        failure_rate: float = CLAUDE_BREAKER_FAILURE_RATE,
+        min_calls: int = CLAUDE_BREAKER_MIN_CALLS,
+        cooldown: float = CLAUDE_BREAKER_COOLDOWN_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self._clock = clock
+        self._results = deque(maxlen=window)
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._epoch = 0  # 每次熔断打开加一
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def admit(self) -> Optional[Tuple[int, bool]]:
+        """放行一次请求并返回凭证 (熔断轮次, 是否探测)，拒绝时返回 None（半开状态只放行一个探测请求）"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return self._epoch, False
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return self._epoch, True
+            self.rejected += 1
+            return None
+
+    def allow(self) -> bool:
+        """是否放行一次请求（不带凭证的调用方随后用 record(success) 登记）"""
+        return self.admit() is not None
+
+    def record(self, success: bool, ticket: Optional[Tuple[int, bool]] = None):
+        """记录一次尝试的结果"""
+        with self._lock:
+            if ticket is not None:
+                epoch, probe = ticket
+                if probe:
+                    self._probing = False
+                if epoch != self._epoch or (self._opened_at is not None and not probe):
+                    return  # 熔断打开前发出的尝试
+            if self._opened_at is not None:
+                # 探测结果：成功关闭，失败重新计时
+                self._probing = False
+                if success:
+                    self._opened_at = None
+                    self._results.clear()
+                else:
+                    self._opened_at = self._clock()
+                return
+            self._results.append(success)
+            failures = self._results.count(False)
+            if len(self._results) >= self.min_calls and failures / len(self._results) >= self.failure_rate:
+                self._opened_at = self._clock()
+                self._epoch += 1
+                self.trips += 1
+                print(f"   🔌 熔断器打开：最近 {len(self._results)} 次调用失败 {failures} 次，"
+                      f"{self.cooldown:.0f} 秒内直接失败")
+
+    def release(self, ticket: Tuple[int, bool]):
+        """尝试没有结果（被取消等）：释放探测名额，不计入统计"""
+        if ticket[1]:
+            with self._lock:
+                self._probing = False
+
+    def pause(self, seconds: float):
+        """服务端要求等待时，所有调用方在此之前都不发请求"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def wait_time(self) -> float:
+        """距全局暂停结束的秒数"""
+        with self._lock:
+            return max(0.0, self._paused_until - self._clock())
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self._state(),
+                "recent_calls": len(self._results),
+                "recent_failures": self._results.count(False),
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str = "claude") -> CircuitBreaker:
+    """获取进程内共享的熔断器"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker()
+        return _breakers[name]
+
+
+def _admit(breaker: Optional[CircuitBreaker]) -> Optional[Tuple[int, bool]]:
+    if breaker is None:
+        return None
+    ticket = breaker.admit()
+    if ticket is None:
+        raise CircuitOpenError("Claude API 熔断中，暂停调用")
+    return ticket
+
+
+def _after_failure(attempt: int, error: Exception, policy: RetryPolicy, breaker: Optional[CircuitBreaker],
+                   ticket: Optional[Tuple[int, bool]],
+                   on_retry: Optional[Callable[[int, Exception, float], None]]) -> Optional[float]:
+    """登记失败并返回重试前的等待秒数，不再重试时返回 None"""
+    if breaker is not None:
+        # 不可重试的错误是请求本身的问题，说明 API 可达
+        breaker.record(not is_retryable(error), ticket)
+        retry_after = retry_after_seconds(error)
+        if retry_after and is_retryable(error):
+            breaker.pause(retry_after)
+    if not policy.should_retry(attempt, error):
+        return None
+    delay = policy.delay(attempt, error)
+    if on_retry is not None:
+        on_retry(attempt, error, delay)
+    return delay
+
+
+def run_with_retry(attempt_fn: Callable[[int], T], policy: RetryPolicy, breaker: Optional[CircuitBreaker] = None,
+                   on_retry: Optional[Callable[[int, Exception, float], None]] = None) -> T:
+    """同步执行 attempt_fn(attempt)，失败按策略重试
+
+    Raises:
+        CircuitOpenError: 熔断器打开
+        Exception: 最后一次尝试的错误（或不可重试的错误）
+    """
+    attempt = 0
+    while True:
+        ticket = _admit(breaker)
+        resolved = False
+        try:
+            paused = breaker.wait_time() if breaker is not None else 0
+            if paused > 0:
+                time.sleep(paused)
+            try:
+                result = attempt_fn(attempt)
+            except Exception as e:
+                resolved = True
+                delay = _after_failure(attempt, e, policy, breaker, ticket, on_retry)
+                if delay is None:
+                    raise
+            else:
+                resolved = True
+                if breaker is not None:
+                    breaker.record(True, ticket)
+                return result
+        finally:
+            if breaker is not None and not resolved:
+                breaker.release(ticket)
+        time.sleep(delay)
+        attempt += 1
+
+
+async def run_with_retry_async(attempt_fn: Callable[[int], Awaitable[T]], policy: RetryPolicy,
+                               breaker: Optional[CircuitBreaker] = None,
+                               on_retry: Optional[Callable[[int, Exception, float], None]] = None) -> T:
+    """异步版本：退避与全局暂停使用 asyncio.sleep，等待期间不阻塞事件循环（任务取消时立即退出）"""
+    attempt = 0
+    while True:
+        ticket = _admit(breaker)
+        resolved = False
+        try:
+            paused = breaker.wait_time() if breaker is not None else 0
+            if paused > 0:
+                await asyncio.sleep(paused)
+            try:
+                result = await attempt_fn(attempt)
+            except Exception as e:
+                resolved = True
+                delay = _after_failure(attempt, e, policy, breaker, ticket, on_retry)
+                if delay is None:
+                    raise
+            else:
+                resolved = True
+                if breaker is not None:
+                    breaker.record(True, ticket)
+                return result
+        finally:
+            # 取消（CancelledError）或其他未登记结果的退出：只释放探测名额
+            if breaker is not None and not resolved:
+                breaker.release(ticket)
+        await asyncio.sleep(delay)
+        attempt += 1
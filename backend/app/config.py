@@ -2,6 +2,7 @@
 AI 模型配置文件
 根据测试结果选择最优模型
 """
+import os
 
 # AI 模型配置选项
 AI_MODELS = {
@@ -62,6 +63,63 @@ AI_MODELS = {
 # 选项: "sonnet_4_5" (推荐) | "haiku_3_5" | "haiku_3_0" (当前) | "opus_4_5"
 ACTIVE_MODEL = "haiku_3_5"  # 测试 Haiku 3.5 (省钱)
 
+# Claude 调用并发与限速（按账户配额调整）
+CLAUDE_MAX_IN_FLIGHT = 4     # 同时在途的请求数，1 = 串行
+CLAUDE_RPM_LIMIT = 50        # 每分钟请求数上限，0 = 不限
+CLAUDE_TPM_LIMIT = 50000     # 每分钟输入 token 上限，0 = 不限
+PREDICT_PROMPT_TOKEN_BUDGET = 16000  # 预测请求中股票数据部分的 token 预算（超出部分拆分到新请求）
+CLAUDE_STREAMING = True      # 预测调用使用流式响应，每条预测生成完毕即发布并保存
+
+# Claude 调用重试：指数退避 + 全抖动，服务端返回 Retry-After 时至少等待该时长
+CLAUDE_RETRY_MAX = 3                      # 单次调用的最大尝试次数
+CLAUDE_RETRY_BASE_SECONDS = 1.0           # 首次重试的退避上限
+CLAUDE_RETRY_MAX_SECONDS = 30.0           # 单次退避上限
+CLAUDE_RETRY_RATE_LIMIT_MULTIPLIER = 5    # 限流（429）错误的退避倍率
+# 熔断器：最近 WINDOW 次尝试中失败率达到阈值后，冷却期内直接失败，不再请求
+CLAUDE_BREAKER_WINDOW = 20
+CLAUDE_BREAKER_FAILURE_RATE = 0.5
+CLAUDE_BREAKER_MIN_CALLS = 5              # 窗口内少于此次数时不熔断
+CLAUDE_BREAKER_COOLDOWN_SECONDS = 30.0
+
+# LLM 调用录制：每次调用的完整提示词与响应写入 llm_calls 表，可离线回放（见 app/llm_replay.py）
+# 默认关闭（完整提示词体积大），环境变量 LLM_RECORD_CALLS=1 开启；每个会话开始录制时按会话数与天数清理旧录制
+LLM_RECORD_CALLS = os.getenv("LLM_RECORD_CALLS", "0") == "1"
+LLM_RECORD_KEEP_SESSIONS = 10
+LLM_RECORD_MAX_AGE_DAYS = 14
+
+# 异步调用路径（/api/analyze、/api/predict 以 asyncio 任务运行）：SQLite 调用所用的独立线程数
+ASYNC_DB_WORKERS = 2
+ASYNC_COMPUTE_WORKERS = 2   # 预筛选、本地评分、级联预测、建索引等耗时同步工作的线程数（与 SQLite 线程分开）
+
+# Claude 客户端：anthropic = 真实 API；fake = 本地模拟（无网络、无费用，用于压测），环境变量 CLAUDE_CLIENT 可覆盖
+CLAUDE_CLIENT = os.getenv("CLAUDE_CLIENT", "anthropic")
+FAKE_CLAUDE_LATENCY_SECONDS = 0.8   # 模拟延迟中位数
+FAKE_CLAUDE_LATENCY_SIGMA = 0.4     # 对数正态分布 sigma
+FAKE_CLAUDE_ERROR_RATE = 0.0        # 529 overloaded 比例
+FAKE_CLAUDE_RATE_LIMIT_RATE = 0.0   # 429 限流比例
+FAKE_CLAUDE_SEED = 0
+FAKE_CLAUDE_CACHE_PATH = "../data/claude_cache_fake.db"  # 模拟客户端的响应缓存（与真实响应分开）
+
+# 模式验证方式：multi = 多个模式合并到一次请求；per_pattern = 每个模式一次请求；local = 本地匹配器（无 AI 调用）
+AI_VALIDATION_MODE = "multi"
+VALIDATION_PATTERNS_PER_CALL = 12  # multi 模式下单次请求验证的模式数上限
+
+# 模型分级级联预测：低价层为全部候选打分，只有概率落在临界区间的股票升级到高价层复核
+PREDICT_CASCADE_ENABLED = False
+CASCADE_TIERS = ["haiku_3_5", "sonnet_4_5"]  # AI_MODELS 的键，由低价到高价
+CASCADE_BORDERLINE = (60, 80)                # 低价层概率落在此区间（含端点）时升级
+CASCADE_COST_CEILING_USD = 0.5               # 单次预测的成本上限，达到后不再升级
+
+# Claude 响应缓存（相同模型 + 提示词 + max_tokens 直接复用，不产生费用）
+CLAUDE_CACHE_ENABLED = True
+CLAUDE_CACHE_PATH = "../data/claude_cache.db"
+CLAUDE_CACHE_TTL_HOURS = 24       # 过期时间，0 = 永不过期
+CLAUDE_CACHE_MAX_ENTRIES = 5000
+
+# Message Batches 离线模式（每日预测）
+CLAUDE_BATCH_POLL_SECONDS = 30    # 轮询间隔
+CLAUDE_BATCH_TIMEOUT_HOURS = 6    # 超时后取消批次并回退同步调用
+
 # 样本量配置
 SAMPLE_SIZES = {
     "test": 5,      # 测试模式
@@ -87,6 +145,40 @@ RECOMMENDED_PATTERN_COUNT = "focused"  # 5种模式
 # 上涨样本筛选条件
 RISE_THRESHOLD = 0.08  # 3天后收盘价上涨阈值: 8% (可调整为 0.06 或 0.10)
 
+# 模式匹配内核: "auto" (有 numba 用 numba，否则 numpy) | "numba" | "numpy" | "python"
+MATCHER_BACKEND = "auto"
+
+# 并行模式匹配（进程池）
+MATCH_WORKERS = 0           # 0 = CPU 核数, 1 = 串行
+MATCH_CHUNK_SIZE = 200      # 每个任务分片的股票数
+MATCH_PARALLEL_MIN = 400    # 股票数少于该值时串行执行（进程启动开销不划算）
+CASCADE_CALIBRATION_SAMPLE = 200  # 预选前抽样多少只股票校准检查阶段顺序，0 = 使用默认顺序
+
+# 匹配结果缓存：按 (股票, 最后K线日期, 数据版本, 模式定义哈希) 持久化，LRU 淘汰
+MATCH_CACHE_PATH = "../data/match_cache.db"
+MATCH_CACHE_SIZE = 500000   # 最多缓存条数（单只股票 × 单个模式为一条），0 = 关闭
+
+# 本地统计评分模型（scripts/train_local_scorer.py 训练）
+LOCAL_SCORER_DIR = "../data/models"   # 模型文件目录（按版本号保存）
+LOCAL_SCORER_MODEL = "logistic"       # "logistic" | "gbdt"（gbdt 需要 scikit-learn）
+LOCAL_SCORER_BACKEND = "auto"         # "auto" (有 scikit-learn 用 sklearn，否则 numpy) | "sklearn" | "numpy"
+LOCAL_SCORER_WINDOW = 30              # 特征窗口（天）
+LOCAL_SCORER_HORIZON = 2              # 标签：T+2 收盘相对 T 收盘涨幅 >= RISE_THRESHOLD（同验证样本口径）
+LOCAL_SCORER_TOP_K = 50               # 仅本地评分时返回概率最高的前 K 只
+# 预测流水线：程序预筛选 → 本地模型评分排序 → 排名前 K 只交给 Claude
+# 评分方式: "rank" 本地模型排序后交给 Claude（无模型时保持筛选顺序）| "claude" 不做本地排序
+#          | "local" 仅本地模型（无需 API 密钥）
+PREDICT_SCORER = "rank"
+PREDICT_LLM_TOP_K = 50       # 每次预测交给 Claude 的股票数（可按次覆盖），决定 LLM 开销上限
+PREDICT_MIN_SCREENED = 10    # 预筛选候选少于该值时全部股票进入排序阶段
+
+# 历史相似走势检索（app/analog_index.py）：每个 (股票, 日期) 窗口嵌入为标准化的价格 + 成交量向量
+ANALOG_WINDOWS = [20, 30]             # 支持的窗口长度（天），每个窗口一个索引文件
+ANALOG_INDEX_DIR = "../data/analog"
+ANALOG_HORIZONS = [1, 3, 5, 10]       # 返回相似窗口之后 T+h 的收盘涨幅
+ANALOG_VOLUME_WEIGHT = 0.5            # 成交量部分相对价格形态的权重
+ANALOG_TOP_K = 10
+
 
 def get_active_model():
     """获取当前激活的模型配置"""
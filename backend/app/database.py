@@ -1,6 +1,6 @@
 import sqlite3
 import pandas as pd
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 import os
 import json
@@ -112,6 +112,77 @@ class StockDatabase:
             ON predictions(stock_code, prediction_date)
         ''')
 
+        # 创建预测流水线中间排名表（筛选 / 本地评分 / Claude 各阶段）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS prediction_rankings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                rank INTEGER NOT NULL,
+                stock_code TEXT NOT NULL,
+                score REAL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_prediction_rankings_run
+            ON prediction_rankings(run_id, stage, rank)
+        ''')
+
+        # 创建 Claude 调用明细表（延迟、token、重试与结果）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS claude_calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                day TEXT NOT NULL,
+                model TEXT NOT NULL,
+                task TEXT NOT NULL,
+                outcome TEXT NOT NULL,
+                latency_seconds REAL DEFAULT 0,
+                total_seconds REAL DEFAULT 0,
+                input_tokens INTEGER DEFAULT 0,
+                output_tokens INTEGER DEFAULT 0,
+                cache_creation_input_tokens INTEGER DEFAULT 0,
+                cache_read_input_tokens INTEGER DEFAULT 0,
+                retries INTEGER DEFAULT 0,
+                batch INTEGER DEFAULT 0,
+                streamed INTEGER DEFAULT 0,
+                cost_usd REAL DEFAULT 0,
+                error TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_claude_calls_day
+            ON claude_calls(day, task)
+        ''')
+
+        # 创建 LLM 调用录制表（完整提示词与响应，按录制会话回放）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS llm_calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                task TEXT NOT NULL,
+                model TEXT NOT NULL,
+                source TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                response TEXT NOT NULL,
+                input_tokens INTEGER DEFAULT 0,
+                output_tokens INTEGER DEFAULT 0,
+                cache_creation_input_tokens INTEGER DEFAULT 0,
+                cache_read_input_tokens INTEGER DEFAULT 0,
+                latency_seconds REAL DEFAULT 0,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_llm_calls_session
+            ON llm_calls(session_id, id)
+        ''')
+
         conn.commit()
         conn.close()
 
@@ -220,6 +291,14 @@ class StockDatabase:
         conn.close()
         return df
 
+    def get_stock_data_after(self, after_date: str) -> pd.DataFrame:
+        """获取所有股票在指定日期之后（不含）的数据，按代码、日期升序"""
+        conn = self.get_connection()
+        query = 'SELECT * FROM stock_data WHERE date > ? ORDER BY code, date'
+        df = pd.read_sql_query(query, conn, params=(after_date,))
+        conn.close()
+        return df
+
     def get_recent_data_all_stocks(self, days: int = 30) -> pd.DataFrame:
         """获取所有股票最近N天的数据"""
         conn = self.get_connection()
@@ -845,6 +924,200 @@ class StockDatabase:
         conn.close()
         return results
     
+    def save_prediction_ranking(self, run_id: str, stage: str, ranking: List[tuple]):
+        """保存预测流水线某一阶段的排名
+
+        Args:
+            run_id: 预测运行ID
+            stage: 阶段名（screen / local_score / llm）
+            ranking: 按名次排列的 [(stock_code, score)]，score 可为 None
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.executemany('''
+            INSERT INTO prediction_rankings (run_id, stage, rank, stock_code, score)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(run_id, stage, rank, code, score) for rank, (code, score) in enumerate(ranking, 1)])
+
+        conn.commit()
+        conn.close()
+
+    def get_prediction_rankings(self, run_id: Optional[str] = None, limit: int = 100) -> Dict[str, List[dict]]:
+        """获取某次预测（默认最近一次）各阶段的排名，每个阶段最多返回 limit 条
+
+        Returns:
+            {stage: [{'rank', 'stock_code', 'score'}]}
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        if run_id is None:
+            cursor.execute('SELECT MAX(run_id) FROM prediction_rankings')
+            run_id = cursor.fetchone()[0]
+
+        cursor.execute('''
+            SELECT stage, rank, stock_code, score
+            FROM prediction_rankings
+            WHERE run_id = ? AND rank <= ?
+            ORDER BY stage, rank
+        ''', (run_id, limit))
+
+        rankings = {}
+        for stage, rank, code, score in cursor.fetchall():
+            rankings.setdefault(stage, []).append({'rank': rank, 'stock_code': code, 'score': score})
+
+        conn.close()
+        return rankings
+
+    def save_claude_call(self, call: dict):
+        """保存一次 Claude 调用记录
+
+        Args:
+            call: {'model', 'task', 'outcome' (success/error/cache_hit), 'latency_seconds', 'total_seconds',
+                   'input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens',
+                   'retries', 'batch', 'streamed', 'cost_usd', 'error'}，缺省字段按 0 / 空记录
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            INSERT INTO claude_calls (
+                day, model, task, outcome, latency_seconds, total_seconds,
+                input_tokens, output_tokens, cache_creation_input_tokens, cache_read_input_tokens,
+                retries, batch, streamed, cost_usd, error
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            call.get('day') or datetime.now().strftime('%Y-%m-%d'),
+            call['model'],
+            call.get('task', 'other'),
+            call['outcome'],
+            call.get('latency_seconds', 0),
+            call.get('total_seconds', 0),
+            call.get('input_tokens', 0),
+            call.get('output_tokens', 0),
+            call.get('cache_creation_input_tokens', 0),
+            call.get('cache_read_input_tokens', 0),
+            call.get('retries', 0),
+            int(call.get('batch', False)),
+            int(call.get('streamed', False)),
+            call.get('cost_usd', 0),
+            call.get('error')
+        ))
+
+        conn.commit()
+        conn.close()
+
+    def get_claude_calls(self, days: int = 7) -> pd.DataFrame:
+        """获取最近N天的 Claude 调用记录"""
+        conn = self.get_connection()
+        df = pd.read_sql_query('''
+            SELECT * FROM claude_calls
+            WHERE day >= date('now', 'localtime', ?)
+            ORDER BY id
+        ''', conn, params=(f'-{days} days',))
+        conn.close()
+        return df
+
+    def save_llm_call(self, call: dict):
+        """录制一次 LLM 调用
+
+        Args:
+            call: {'session_id', 'task', 'model', 'source' (api/cache/batch), 'prompt_hash', 'prompt', 'response',
+                   'input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens',
+                   'latency_seconds'}，缺省数值字段按 0 记录
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            INSERT INTO llm_calls (
+                session_id, task, model, source, prompt_hash, prompt, response,
+                input_tokens, output_tokens, cache_creation_input_tokens, cache_read_input_tokens, latency_seconds
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            call['session_id'],
+            call.get('task', 'other'),
+            call['model'],
+            call.get('source', 'api'),
+            call['prompt_hash'],
+            call['prompt'],
+            call['response'],
+            call.get('input_tokens', 0),
+            call.get('output_tokens', 0),
+            call.get('cache_creation_input_tokens', 0),
+            call.get('cache_read_input_tokens', 0),
+            call.get('latency_seconds', 0)
+        ))
+
+        conn.commit()
+        conn.close()
+
+    def get_llm_calls(self, session_id: Optional[str] = None) -> List[dict]:
+        """获取某个录制会话（默认最近一次）的全部调用，按录制顺序排列"""
+        conn = self.get_connection()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        if session_id is None:
+            cursor.execute('SELECT session_id FROM llm_calls ORDER BY id DESC LIMIT 1')
+            row = cursor.fetchone()
+            session_id = row[0] if row else None
+
+        cursor.execute('SELECT * FROM llm_calls WHERE session_id = ? ORDER BY id', (session_id,))
+        calls = [dict(row) for row in cursor.fetchall()]
+
+        conn.close()
+        return calls
+
+    def get_llm_sessions(self, limit: int = 20) -> List[dict]:
+        """最近的录制会话列表（调用数、token 数、录制时间）"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT session_id, COUNT(*), SUM(input_tokens), SUM(output_tokens), SUM(latency_seconds),
+                   GROUP_CONCAT(DISTINCT task), MIN(created_at), MAX(created_at)
+            FROM llm_calls
+            GROUP BY session_id
+            ORDER BY MAX(id) DESC
+            LIMIT ?
+        ''', (limit,))
+
+        sessions = [
+            {'session_id': session_id, 'calls': calls, 'input_tokens': input_tokens or 0,
+             'output_tokens': output_tokens or 0, 'latency_seconds': round(latency or 0, 3),
+             'tasks': sorted(tasks.split(',')) if tasks else [], 'started_at': started, 'ended_at': ended}
+            for session_id, calls, input_tokens, output_tokens, latency, tasks, started, ended in cursor.fetchall()
+        ]
+
+        conn.close()
+        return sessions
+
+    def prune_llm_calls(self, keep_sessions: int, max_age_days: Optional[float] = None) -> int:
+        """清理录制：只保留最近 keep_sessions 个会话，并删除 max_age_days 天之前的调用
+
+        Returns:
+            删除的调用数
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            DELETE FROM llm_calls WHERE session_id NOT IN (
+                SELECT session_id FROM llm_calls GROUP BY session_id ORDER BY MAX(id) DESC LIMIT ?
+            )
+        ''', (max(keep_sessions, 0),))
+        deleted = cursor.rowcount
+        if max_age_days is not None:
+            cursor.execute("DELETE FROM llm_calls WHERE created_at < datetime('now', ?)",
+                           (f'{-max_age_days} days',))
+            deleted += cursor.rowcount
+
+        conn.commit()
+        conn.close()
+        return deleted
+
     def verify_prediction(self, prediction_id: int, actual_rise: float, verified_date: str):
         """验证预测结果
         
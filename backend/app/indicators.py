@@ -0,0 +1,193 @@
+"""指标缓存 - 每只股票只解析/排序一次K线，派生指标按需计算并在各匹配器之间共享
+
+用法：
+
+    bundle = IndicatorBundle(kline_data)
+    view = bundle.view("classic")        # 命名窗口：不同匹配器的均量口径
+    view["volume_ratio"]                 # 首次访问时计算，之后复用
+    view.rolling("close", 20, "max")     # 滚动指标同样缓存
+    view.tail(30)                        # 末尾子窗口（NumPy 切片视图，无拷贝）
+"""
+
+import warnings
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+BASE_COLUMNS = ("open", "high", "low", "close", "volume")
+
+# 命名窗口：均量窗口长度与最少样本数（与原 match_classic_patterns / match_ai_patterns 的口径一致）
+WINDOWS: Dict[str, Dict[str, int]] = {
+    "classic": {"avg_volume": 20, "min_periods": 5},
+    "ai": {"avg_volume": 20, "min_periods": 3},
+}
+
+
+def shift(values: np.ndarray, n: int) -> np.ndarray:
+    """向后平移 n 根（前部补 NaN）"""
+    if n <= 0:
+        return values
+    out = np.full(len(values), np.nan)
+    if n < len(values):
+        out[n:] = values[:-n]
+    return out
+
+
+def rolling(values: np.ndarray, n: int, how: str, min_periods: Optional[int] = None) -> np.ndarray:
+    """滚动聚合（语义对齐 pandas.rolling，std 使用 ddof=1）
+
+    how: mean/sum/max/min/std/argmin/argmax/drawdown
+    （argmin/argmax 返回极值距当前K线的根数，drawdown 为窗口内最大回撤）
+    """
+    values = np.asarray(values, dtype=float)
+    length = len(values)
+    out = np.full(length, np.nan)
+    if length == 0:
+        return out
+    min_periods = n if min_periods is None else min_periods
+    padded = np.concatenate((np.full(n - 1, np.nan), values))
+    windows = sliding_window_view(padded, n)
+    valid = ~np.isnan(windows)
+    ok = valid.sum(axis=1) >= max(min_periods, 1)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        if how == "mean":
+            result = np.nanmean(windows, axis=1)
+        elif how == "sum":
+            result = np.nansum(windows, axis=1)
+        elif how == "max":
+            result = np.nanmax(windows, axis=1)
+        elif how == "min":
+            result = np.nanmin(windows, axis=1)
+        elif how == "std":
+            result = np.nanstd(windows, axis=1, ddof=1)
+        elif how in ("argmin", "argmax"):
+            fill = np.inf if how == "argmin" else -np.inf
+            filled = np.where(valid, windows, fill)
+            idx = filled.argmin(axis=1) if how == "argmin" else filled.argmax(axis=1)
+            result = (n - 1 - idx).astype(float)
+        elif how == "drawdown":
+            peaks = np.fmax.accumulate(windows, axis=1)
+            result = np.nanmax((peaks - windows) / peaks, axis=1)
+        else:
+            raise ValueError(f"不支持的滚动聚合: {how}")
+
+    out[ok] = result[ok]
+    return out
+
+
+class IndicatorBundle:
+    """单只股票的K线与派生指标缓存"""
+
+    def __init__(self, kline_data: List[Dict]):
+        df = pd.DataFrame(kline_data)
+        if df.empty:
+            self.dates = np.array([], dtype="datetime64[ns]")
+            self._base = {col: np.array([], dtype=float) for col in BASE_COLUMNS}
+        else:
+            dates = pd.to_datetime(df["date"]).to_numpy()
+            order = np.argsort(dates, kind="stable")
+            self.dates = dates[order]
+            self._base = {col: df[col].to_numpy(dtype=float)[order] for col in BASE_COLUMNS}
+        self._cache: Dict[str, np.ndarray] = {}
+        self._views: Dict[str, "IndicatorView"] = {}
+
+    @classmethod
+    def from_arrays(cls, dates: np.ndarray, ohlcv: np.ndarray) -> "IndicatorBundle":
+        """从紧凑数组构造（dates 为 datetime64/int64，ohlcv 形状为 (n, 5)，列序同 BASE_COLUMNS）"""
+        bundle = cls.__new__(cls)
+        order = np.argsort(dates, kind="stable")
+        bundle.dates = np.asarray(dates)[order].astype("datetime64[ns]")
+        bundle._base = {col: np.ascontiguousarray(ohlcv[order, i], dtype=float) for i, col in enumerate(BASE_COLUMNS)}
+        bundle._cache = {}
+        bundle._views = {}
+        return bundle
+
+    @classmethod
+    def of(cls, kline_data) -> "IndicatorBundle":
+        """已是 IndicatorBundle 时直接复用，否则从K线列表构造"""
+        return kline_data if isinstance(kline_data, cls) else cls(kline_data)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def view(self, name: str = "classic") -> "IndicatorView":
+        """获取命名窗口视图（同名视图共享缓存）"""
+        if name not in self._views:
+            if name not in WINDOWS:
+                raise ValueError(f"未定义的指标窗口: {name}")
+            self._views[name] = IndicatorView(self, self._base, WINDOWS[name], name)
+        return self._views[name]
+
+
+class IndicatorView(Mapping):
+    """命名窗口下的指标视图，可直接作为 DSL 规则的列字典使用"""
+
+    def __init__(self, bundle: IndicatorBundle, base: Dict[str, np.ndarray], spec: Dict[str, int], key: str,
+                 parent: Optional["IndicatorView"] = None, tail: int = 0):
+        self._bundle = bundle
+        self._base = base
+        self._spec = spec
+        self._key = key
+        self._parent = parent
+        self._tail = tail
+        self._cache: Dict[Tuple, np.ndarray] = {}
+        self._tails: Dict[int, "IndicatorView"] = {}
+
+    def __len__(self) -> int:
+        return len(self["close"])
+
+    def __iter__(self):
+        return iter(BASE_COLUMNS + ("pct_change", "avg_volume", "volume_ratio"))
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if self._parent is not None:
+            return self._parent[name][-self._tail:]
+        if name in self._base:
+            return self._base[name]
+        if name == "pct_change":
+            # 与窗口无关，在 bundle 级共享
+            if "pct_change" not in self._bundle._cache:
+                self._bundle._cache["pct_change"] = self._pct_change()
+            return self._bundle._cache["pct_change"]
+        if name == "avg_volume":
+            return self._cached(("avg_volume",), self._avg_volume)
+        if name == "volume_ratio":
+            return self._cached(("volume_ratio",), self._volume_ratio)
+        raise KeyError(name)
+
+    def rolling(self, column: str, n: int, how: str, min_periods: Optional[int] = None) -> np.ndarray:
+        """缓存的滚动指标（同一视图内相同参数只计算一次）"""
+        return self._cached(
+            ("rolling", column, n, how, min_periods),
+            lambda: rolling(self[column], n, how, min_periods),
+        )
+
+    def tail(self, n: int) -> "IndicatorView":
+        """最后 n 根的子视图：列为父视图的切片（无拷贝），滚动指标在子窗口上独立计算"""
+        if n not in self._tails:
+            self._tails[n] = IndicatorView(self._bundle, self._base, self._spec, f"{self._key}[-{n}:]", self, n)
+        return self._tails[n]
+
+    def _cached(self, key: Tuple, compute) -> np.ndarray:
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def _pct_change(self) -> np.ndarray:
+        close = self._base["close"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return close / shift(close, 1) - 1
+
+    def _avg_volume(self) -> np.ndarray:
+        volume = self._base["volume"]
+        window = min(self._spec["avg_volume"], len(volume))
+        min_periods = min(self._spec["min_periods"], len(volume))
+        return rolling(volume, max(window, 1), "mean", min_periods)
+
+    def _volume_ratio(self) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self._base["volume"] / self["avg_volume"]
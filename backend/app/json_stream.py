@@ -0,0 +1,76 @@
+"""增量 JSON 数组解析 - 流式响应中每个数组元素（对象）一闭合就立即产出
+
+    parser = JsonArrayStream()
+    for chunk in stream.text_stream:
+        for item in parser.feed(chunk):
+            publish(item)
+
+数组开始前的文字与 markdown 代码块标记（```json）会被跳过；无法解析的元素被丢弃并计入 errors。
+"""
+
+import json
+from typing import Any, List
+
+
+class JsonArrayStream:
+    """逐块喂入文本，返回本次新闭合的顶层数组元素"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0            # 下一个待扫描字符
+        self.started = False    # 已遇到顶层 '['
+        self.finished = False   # 已遇到顶层 ']'
+        self.depth = 0          # 数组内部的嵌套深度（0 = 元素之间）
+        self.in_string = False
+        self.escaped = False
+        self.item_start = -1
+        self.items = 0
+        self.errors = 0
+
+    def feed(self, chunk: str) -> List[Any]:
+        self.buffer += chunk
+        completed = []
+        text = self.buffer
+        i = self.pos
+        while i < len(text) and not self.finished:
+            ch = text[i]
+            if not self.started:
+                if ch == "[":
+                    self.started = True
+            elif self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                if self.depth == 0:
+                    self.item_start = i
+                self.depth += 1
+            elif ch in "}]":
+                if self.depth == 0:  # 顶层 ']'
+                    self.finished = True
+                else:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        completed.extend(self._emit(text[self.item_start:i + 1]))
+            i += 1
+
+        # 丢弃已处理的文本（保留未闭合元素）
+        keep = self.item_start if self.depth > 0 else i
+        self.buffer = text[keep:]
+        self.item_start = 0 if self.depth > 0 else -1
+        self.pos = i - keep
+        return completed
+
+    def _emit(self, raw: str) -> List[Any]:
+        try:
+            item = json.loads(raw)
+        except json.JSONDecodeError:
+            self.errors += 1
+            return []
+        self.items += 1
+        return [item]
@@ -0,0 +1,162 @@
+"""K线紧凑编码 - 替代提示词中逐条 JSON 的K线（重复键名、完整浮点精度、日期），大幅减少 token
+
+单只股票最近 N 天编码为一张表（encode_klines / decode_klines）：
+
+    #000001 平安银行 2025-01-02~2025-02-14 n=30 close=10.87 base=10.52 vol=1.234e+06
+    o,h,l,c,v
+    12,85,-40,56,1.08
+    ...
+
+- base 为首日开盘价，作为首日的"前收盘价"
+- o/h/l/c 为相对前一日收盘价的变化，单位基点（1bp = 0.01%）
+- v 为当日成交量 / 区间平均成交量（vol）
+- 解码时逐日还原价格；编码以还原后的收盘价为基准，误差不随天数累积（每个价格 < 0.5bp）
+
+历史样本表（encode_samples / decode_samples，用于模式分析与验证提示词）：
+
+    code,date,c,o,h,l,v,d2,d3,rise
+    000001,2025-01-02,10.52,-12,40,-55,1.31,320,870,8.7
+
+- c 为收盘价，o/h/l 与次日、第3日收盘 (d2/d3) 为相对当日收盘的基点
+- v 为成交量 / 样本平均成交量，rise 为涨幅（%）
+"""
+
+import json
+from typing import Callable, Dict, List, Optional
+
+from .claude_executor import estimate_tokens
+
+KLINE_COLUMNS = ["o", "h", "l", "c", "v"]
+
+# 放在提示词静态前缀中，说明编码格式
+KLINE_LEGEND = """K线数据格式（每只股票一张表）：
+- 表头行：#代码 名称 起始日~结束日 n=天数 close=最新收盘价 base=首日开盘价 vol=区间平均成交量
+- 之后每行一天（按时间顺序）：o,h,l,c 为开/高/低/收相对前一日收盘价的涨跌（基点，100=+1%；首日相对 base），v 为成交量/平均成交量"""
+
+SAMPLE_LEGEND = """样本数据格式（CSV）：c 为当日收盘价；o,h,l 为开/高/低相对收盘价的差（基点，100=+1%）；\
+v 为成交量/样本平均成交量；d2,d3 为次日、第3日收盘相对当日收盘（基点）；rise 为涨幅（%）"""
+
+
+def _bps(value: float, base: float) -> int:
+    return int(round((value / base - 1) * 10000)) if base else 0
+
+
+def _ratio(volume: float, avg: float) -> str:
+    return f"{volume / avg:.2f}".rstrip("0").rstrip(".") if avg else "0"
+
+
+def encode_klines(records: List[Dict], code: str = "", name: str = "") -> str:
+    """K线记录（date/open/high/low/close/volume，按时间升序）编码为紧凑表"""
+    name = (name or code).replace(" ", "")
+    if not records:
+        return f"#{code} {name} n=0"
+    base = float(records[0]["open"])
+    avg_volume = sum(float(r["volume"]) for r in records) / len(records)
+    first_date, last_date = str(records[0]["date"])[:10], str(records[-1]["date"])[:10]
+    header = (f"#{code} {name} {first_date}~{last_date} n={len(records)} "
+              f"close={float(records[-1]['close']):.2f} base={base:.4g} vol={avg_volume:.4g}")
+
+    # 以解码端可见的精度作为基准，保证还原误差不累积
+    prev = float(f"{base:.4g}")
+    avg_volume = float(f"{avg_volume:.4g}")
+    lines = [header, ",".join(KLINE_COLUMNS)]
+    for r in records:
+        o, h, l, c = (_bps(float(r[k]), prev) for k in ("open", "high", "low", "close"))
+        lines.append(f"{o},{h},{l},{c},{_ratio(float(r['volume']), avg_volume)}")
+        prev = prev * (1 + c / 10000)
+    return "\n".join(lines)
+
+
+def decode_klines(text: str) -> Dict:
+    """还原 encode_klines 的输出，返回 {code, name, first_date, last_date, records}
+
+    records 中没有日期（只保留首末日期），价格与成交量为近似值。
+    """
+    lines = text.strip().split("\n")
+    fields = lines[0].lstrip("#").split(" ")
+    meta = dict(f.split("=", 1) for f in fields if "=" in f)
+    plain = [f for f in fields if "=" not in f]
+    code = plain[0] if plain else ""
+    name = plain[1] if len(plain) > 1 else ""
+    dates = plain[2].split("~") if len(plain) > 2 else [None, None]
+
+    records = []
+    if int(meta.get("n", 0)):
+        prev, avg_volume = float(meta["base"]), float(meta["vol"])
+        columns = lines[1].split(",")
+        for line in lines[2:]:
+            row = dict(zip(columns, line.split(",")))
+            record = {
+                key: prev * (1 + int(row[col]) / 10000)
+                for key, col in (("open", "o"), ("high", "h"), ("low", "l"), ("close", "c"))
+            }
+            record["volume"] = float(row["v"]) * avg_volume
+            records.append(record)
+            prev = record["close"]
+    return {"code": code, "name": name, "first_date": dates[0], "last_date": dates[-1], "records": records}
+
+
+def encode_samples(rows: List[Dict]) -> str:
+    """历史样本（每行一只股票的一天，含可选的 day2_close/day3_close/rise_pct）编码为 CSV"""
+    if not rows:
+        return ""
+    has_future = "day2_close" in rows[0]
+    has_rise = "rise_pct" in rows[0]
+    avg_volume = sum(float(r["volume"]) for r in rows) / len(rows)
+
+    columns = ["code", "date", "c", "o", "h", "l", "v"]
+    if has_future:
+        columns += ["d2", "d3"]
+    if has_rise:
+        columns.append("rise")
+    lines = [",".join(columns)]
+    for r in rows:
+        close = float(r["close"])
+        values = [str(r["code"]), str(r["date"])[:10], f"{close:.2f}",
+                  *(str(_bps(float(r[k]), close)) for k in ("open", "high", "low")),
+                  _ratio(float(r["volume"]), avg_volume)]
+        if has_future:
+            values += [str(_bps(float(r["day2_close"]), close)), str(_bps(float(r["day3_close"]), close))]
+        if has_rise:
+            values.append(f"{float(r['rise_pct']):.1f}")
+        lines.append(",".join(values))
+    return "\n".join(lines)
+
+
+def decode_samples(text: str, avg_volume: float = 1.0) -> List[Dict]:
+    """还原 encode_samples 的输出（成交量按 avg_volume 还原，默认为相对值）"""
+    lines = text.strip().split("\n")
+    if not lines or not lines[0]:
+        return []
+    columns = lines[0].split(",")
+    rows = []
+    for line in lines[1:]:
+        row = dict(zip(columns, line.split(",")))
+        close = float(row["c"])
+        record = {"code": row["code"], "date": row["date"], "close": close, "volume": float(row["v"]) * avg_volume}
+        for key, col in (("open", "o"), ("high", "h"), ("low", "l"), ("day2_close", "d2"), ("day3_close", "d3")):
+            if col in row:
+                record[key] = close * (1 + int(row[col]) / 10000)
+        if "rise" in row:
+            record["rise_pct"] = float(row["rise"])
+        rows.append(record)
+    return rows
+
+
+def compare_encodings(records: List[Dict], code: str = "", name: str = "",
+                      count_tokens: Optional[Callable[[str], int]] = None) -> Dict:
+    """比较同一段K线的 JSON（现有提示词格式）与紧凑编码的 token 数
+
+    count_tokens 默认为本地估算，也可传入调用 messages.count_tokens 的函数得到精确值。
+    """
+    count_tokens = count_tokens or estimate_tokens
+    as_json = json.dumps(
+        {"code": code, "name": name, "recent_data": records}, ensure_ascii=False, indent=2, default=str
+    )
+    compact = encode_klines(records, code, name)
+    json_tokens, compact_tokens = count_tokens(as_json), count_tokens(compact)
+    return {
+        "json_tokens": json_tokens,
+        "compact_tokens": compact_tokens,
+        "ratio": round(compact_tokens / json_tokens, 3) if json_tokens else 0.0,
+    }
@@ -0,0 +1,128 @@
+"""LLM 调用录制与回放
+
+StockAnalyzer 把每次调用（实际请求、响应缓存命中、Message Batches 结果）的完整提示词、响应、模型、
+token 数与延迟录制到 llm_calls 表，同一个分析器实例的调用属于同一录制会话（analyzer.llm_session_id）。
+回放时由 ReplayClaudeClient 代替真实客户端，按录制内容返回响应，不访问网络、不产生费用：
+
+    analyzer = StockAnalyzer(api_key=None, db=db)
+    analyzer.enable_replay(session_id)                  # None = 最近一次录制
+    analyzer.predict_stock_probability(recent_data, patterns)
+    analyzer.client.misses                              # 提示词与录制不一致的调用数（提示词回归）
+
+- 匹配键为 (模型, 提示词哈希)：相同提示词的多次调用按录制顺序依次返回，与并发完成顺序无关。
+- 录制中没有的提示词抛出 ReplayMissError（status_code=404，重试策略视为不可重试），该调用按失败处理。
+- speed > 0 时按录制延迟 × speed 等待，用于离线复现性能；0 时立即返回。
+"""
+
+import threading
+from collections import defaultdict, deque
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple, Union
+
+from .claude_cache import prompt_hash
+from .claude_client import AsyncFakeClaudeClient, FakeClaudeClient
+from .claude_executor import content_text
+
+
+class ReplayMissError(Exception):
+    """录制中没有与本次请求匹配的调用"""
+
+    status_code = 404
+
+    def __init__(self, model: str, prompt: str):
+        super().__init__(f"录制中没有匹配的调用: model={model} prompt_hash={prompt_hash(prompt)[:12]}")
+
+
+def llm_call_record(session_id: str, model: str, task: str, source: str, prompt: str, response: str,
+                    usage=None, latency: float = 0.0) -> Dict:
+    """一次调用的录制记录（database.save_llm_call 的参数）"""
+    record = {
+        'session_id': session_id, 'model': model, 'task': task, 'source': source,
+        'prompt_hash': prompt_hash(prompt), 'prompt': prompt, 'response': response, 'latency_seconds': latency,
+    }
+    if usage is not None:
+        for key in ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens'):
+            record[key] = getattr(usage, key, 0) or 0
+    return record
+
+
+class ReplayLog:
+    """按 (模型, 提示词哈希) 分组的录制调用队列（线程安全）"""
+
+    def __init__(self, calls: List[Dict]):
+        self._queues: Dict[Tuple[str, str], deque] = defaultdict(deque)
+        for call in calls:
+            self._queues[(call['model'], call['prompt_hash'])].append(call)
+        self._lock = threading.Lock()
+        self.total = len(calls)
+
+    def next(self, model: str, prompt: str) -> Dict:
+        """取出与本次请求匹配的下一条录制调用
+
+        Raises:
+            ReplayMissError: 没有匹配的调用（或已全部用完）
+        """
+        with self._lock:
+            queue = self._queues.get((model, prompt_hash(prompt)))
+            if not queue:
+                raise ReplayMissError(model, prompt)
+            return queue.popleft()
+
+    @property
+    def remaining(self) -> int:
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+
+class ReplayClaudeClient(FakeClaudeClient):
+    """回放录制响应的 Claude 客户端（messages.create / stream / batches，接口同 FakeClaudeClient）
+
+    Args:
+        calls: database.get_llm_calls 返回的录制调用，或与其他回放客户端共用的 ReplayLog
+        speed: 录制延迟的倍数（0 = 不等待）
+    """
+
+    def __init__(self, calls: Union[List[Dict], ReplayLog], speed: float = 0.0):
+        super().__init__(latency=0, latency_sigma=0, error_rate=0, rate_limit_rate=0)
+        self.log = calls if isinstance(calls, ReplayLog) else ReplayLog(calls)
+        self.speed = speed
+        self.served = 0
+        self.misses = 0
+
+    def _next(self, model: str, prompt: str) -> Dict:
+        try:
+            call = self.log.next(model, prompt)
+        except ReplayMissError:
+            with self._lock:
+                self.misses += 1
+            raise
+        with self._lock:
+            self.served += 1
+        return call
+
+    def _reply(self, model: str, messages, timeout: Optional[float], roll: float, delay: float, rng):
+        try:
+            call = self._next(model, content_text(messages[0]["content"]))
+        except ReplayMissError as e:
+            return None, 0, e
+        usage = SimpleNamespace(
+            input_tokens=call['input_tokens'], output_tokens=call['output_tokens'],
+            cache_creation_input_tokens=call['cache_creation_input_tokens'],
+            cache_read_input_tokens=call['cache_read_input_tokens'],
+        )
+        message = SimpleNamespace(
+            id=f"msg_replay_{call['id']}", model=model, stop_reason="end_turn",
+            content=[SimpleNamespace(type="text", text=call['response'])], usage=usage,
+        )
+        return message, call['latency_seconds'] * self.speed, None
+
+    def _respond_params(self, params: Dict) -> str:
+        return self._next(params["model"], content_text(params["messages"][0]["content"]))['response']
+
+    def stats(self) -> Dict:
+        return {'recorded': self.log.total, 'served': self.served, 'misses': self.misses,
+                'unused': self.log.remaining}
+
+
+class AsyncReplayClaudeClient(ReplayClaudeClient, AsyncFakeClaudeClient):
+    """ReplayClaudeClient 的异步版本（用于 AsyncStockAnalyzer）"""
@@ -0,0 +1,327 @@
+"""本地统计评分模型 - 不调用 Claude，毫秒级给出全部候选股票的上涨概率
+
+以最近 window 天K线的工程特征为输入、T+horizon 收盘涨幅是否达到阈值为标签（与
+database.get_validation_samples 的 is_success 口径一致），训练二分类模型：
+
+    X, y, dates = build_training_set(stock_data)
+    scorer = LocalScorer.train(X, y, dates)              # 按时间切分验证集，记录 AUC
+    scorer.save()                                        # ../data/models/local_scorer_v0001.pkl + .json
+    scorer = load_scorer()                               # 默认加载最新版本
+    probabilities = scorer.score(recent_data)            # {code: 0-100}
+
+模型实现（config.LOCAL_SCORER_BACKEND）：
+- sklearn: LogisticRegression 或 HistGradientBoostingClassifier（需安装 scikit-learn）
+- numpy:   标准化 + L2 正则逻辑回归（牛顿法），无额外依赖（默认回退）
+
+模型文件按版本号递增保存，旁边的 .json 记录特征列表、训练参数与验证指标，便于不反序列化即可列出。
+"""
+
+import glob
+import json
+import os
+import pickle
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .config import (
+    LOCAL_SCORER_BACKEND, LOCAL_SCORER_DIR, LOCAL_SCORER_HORIZON, LOCAL_SCORER_MODEL, LOCAL_SCORER_WINDOW,
+    RISE_THRESHOLD,
+)
+
+try:
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    HAS_SKLEARN = True
+except ImportError:
+    HAS_SKLEARN = False
+
+FEATURE_NAMES = [
+    'ret_1', 'ret_5', 'ret_10', 'ret_20', 'volatility', 'body', 'day_range',
+    'volume_ratio_1', 'volume_ratio_5', 'amplitude', 'position', 'up_ratio',
+    'consolidation', 'days_after_gap',
+]
+
+
+# ---------- 特征 ----------
+def window_features(opens: np.ndarray, highs: np.ndarray, lows: np.ndarray, closes: np.ndarray,
+                    volumes: np.ndarray) -> np.ndarray:
+    """对 (样本数 × 天数) 的K线窗口矩阵计算特征，返回 (样本数 × len(FEATURE_NAMES))"""
+    n, days = closes.shape
+    last = closes[:, -1]
+
+    def ret(k: int) -> np.ndarray:
+        return last / closes[:, -1 - min(k, days - 1)] - 1
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily = closes[:, 1:] / closes[:, :-1] - 1
+        avg_volume = volumes.mean(axis=1)
+        high_max, low_min = highs.max(axis=1), lows.min(axis=1)
+
+        calm = np.abs(daily) < 0.03
+        consolidation = np.cumprod(calm[:, ::-1], axis=1).sum(axis=1)
+        gaps = lows[:, 1:] > highs[:, :-1]
+        days_after_gap = np.where(gaps.any(axis=1), np.argmax(gaps[:, ::-1], axis=1), days)
+
+        columns = [
+            ret(1), ret(5), ret(10), ret(20),
+            daily.std(axis=1),
+            closes[:, -1] / opens[:, -1] - 1,
+            (highs[:, -1] - lows[:, -1]) / closes[:, -2],
+            volumes[:, -1] / avg_volume,
+            volumes[:, -5:].mean(axis=1) / avg_volume,
+            (high_max - low_min) / low_min,
+            (last - low_min) / (high_max - low_min),
+            (daily > 0).mean(axis=1),
+            consolidation / days,
+            days_after_gap / days,
+        ]
+    return np.nan_to_num(np.column_stack(columns), nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def _ordered_groups(stock_data: pd.DataFrame):
+    """按 code、date 排序后逐只股票产出 (code, name, DataFrame)"""
+    ordered = stock_data.sort_values(['code', 'date'], kind='stable')
+    for code, df in ordered.groupby('code', sort=False):
+        name = df['name'].iloc[0] if 'name' in df.columns else code
+        yield code, name, df
+
+
+def _ohlcv(df: pd.DataFrame) -> List[np.ndarray]:
+    return [df[col].to_numpy(dtype=float) for col in ('open', 'high', 'low', 'close', 'volume')]
+
+
+def build_training_set(stock_data: pd.DataFrame, window: int = LOCAL_SCORER_WINDOW,
+                       horizon: int = LOCAL_SCORER_HORIZON, threshold: float = RISE_THRESHOLD,
+                       step: int = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """由历史K线构造训练集：每只股票按 step 滑动 window 天窗口
+
+    Returns:
+        (X 特征矩阵, y 标签 0/1, 每个样本窗口最后一天的日期)
+    """
+    features, labels, dates = [], [], []
+    for _, _, df in _ordered_groups(stock_data):
+        if len(df) < window + horizon:
+            continue
+        arrays = _ohlcv(df)
+        ends = np.arange(window - 1, len(df) - horizon, step)
+        windows = [np.lib.stride_tricks.sliding_window_view(a, window)[ends - window + 1] for a in arrays]
+        closes = arrays[3]
+        features.append(window_features(*windows))
+        labels.append((closes[ends + horizon] / closes[ends] - 1 >= threshold).astype(np.int8))
+        dates.append(df['date'].astype(str).to_numpy()[ends])
+    if not features:
+        return np.empty((0, len(FEATURE_NAMES))), np.empty(0, dtype=np.int8), np.empty(0, dtype=object)
+    return np.vstack(features), np.concatenate(labels), np.concatenate(dates)
+
+
+def latest_features(stock_data: pd.DataFrame, window: int = LOCAL_SCORER_WINDOW):
+    """每只股票最近 window 天的特征（不足 window 天的股票跳过），返回 (codes, names, X)"""
+    codes, names, rows = [], [], []
+    for code, name, df in _ordered_groups(stock_data):
+        if len(df) < window:
+            continue
+        codes.append(code)
+        names.append(name)
+        rows.append([a[-window:] for a in _ohlcv(df)])
+    if not rows:
+        return [], [], np.empty((0, len(FEATURE_NAMES)))
+    stacked = [np.vstack([r[i] for r in rows]) for i in range(5)]
+    return codes, names, window_features(*stacked)
+
+
+def roc_auc(y: np.ndarray, scores: np.ndarray) -> Optional[float]:
+    """ROC AUC（秩统计量，处理并列），只有一个类别时返回 None"""
+    positives = int(y.sum())
+    negatives = len(y) - positives
+    if positives == 0 or negatives == 0:
+        return None
+    ranks = pd.Series(scores).rank().to_numpy()
+    return float((ranks[y == 1].sum() - positives * (positives + 1) / 2) / (positives * negatives))
+
+
+# ---------- 模型 ----------
+class NumpyLogistic:
+    """标准化 + L2 正则逻辑回归（牛顿法），接口与 sklearn 分类器一致"""
+
+    def __init__(self, l2: float = 1.0, max_iter: int = 50, tol: float = 1e-8):
+        self.l2 = l2
+        self.max_iter = max_iter
+        self.tol = tol
+
+    def fit(self, X: np.ndarray, y: np.ndarray):
+        self.mean_ = X.mean(axis=0)
+        self.scale_ = X.std(axis=0)
+        self.scale_[self.scale_ == 0] = 1.0
+        Z = np.column_stack([np.ones(len(X)), (X - self.mean_) / self.scale_])
+        w = np.zeros(Z.shape[1])
+        penalty = np.full(Z.shape[1], self.l2)
+        penalty[0] = 0.0  # 截距不正则
+        for _ in range(self.max_iter):
+            p = 1 / (1 + np.exp(-np.clip(Z @ w, -30, 30)))
+            gradient = Z.T @ (p - y) + penalty * w
+            hessian = (Z * (p * (1 - p))[:, None]).T @ Z + np.diag(penalty)
+            delta = np.linalg.solve(hessian + 1e-9 * np.eye(len(w)), gradient)
+            w -= delta
+            if np.abs(delta).max() < self.tol:
+                break
+        self.coef_ = w
+        return self
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        Z = (X - self.mean_) / self.scale_
+        p = 1 / (1 + np.exp(-np.clip(self.coef_[0] + Z @ self.coef_[1:], -30, 30)))
+        return np.column_stack([1 - p, p])
+
+
+def _make_model(model_type: str, backend: str):
+    if backend == 'numpy':
+        if model_type != 'logistic':
+            raise ValueError(f"numpy 后端只支持 logistic 模型，不支持: {model_type}")
+        return NumpyLogistic()
+    if model_type == 'logistic':
+        return make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000))
+    if model_type == 'gbdt':
+        return HistGradientBoostingClassifier(max_iter=200, learning_rate=0.05)
+    raise ValueError(f"未知的本地模型类型: {model_type}")
+
+
+def _select_backend(requested: str) -> str:
+    if requested == 'sklearn' and not HAS_SKLEARN:
+        raise ValueError("未安装 scikit-learn，无法使用 sklearn 后端")
+    if requested in ('sklearn', 'numpy'):
+        return requested
+    if requested not in ('auto', ''):
+        raise ValueError(f"未知的本地模型后端: {requested}")
+    return 'sklearn' if HAS_SKLEARN else 'numpy'
+
+
+class LocalScorer:
+    """训练好的本地评分模型（含特征口径与版本元数据）"""
+
+    def __init__(self, model, model_type: str, backend: str, window: int = LOCAL_SCORER_WINDOW,
+                 horizon: int = LOCAL_SCORER_HORIZON, threshold: float = RISE_THRESHOLD,
+                 metrics: Optional[Dict] = None):
+        self.model = model
+        self.model_type = model_type
+        self.backend = backend
+        self.window = window
+        self.horizon = horizon
+        self.threshold = threshold
+        self.feature_names = list(FEATURE_NAMES)
+        self.metrics = metrics or {}
+        self.version = 0
+        self.created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    @classmethod
+    def train(cls, X: np.ndarray, y: np.ndarray, dates: Optional[np.ndarray] = None,
+              model_type: str = LOCAL_SCORER_MODEL, backend: str = LOCAL_SCORER_BACKEND,
+              valid_fraction: float = 0.2, **params) -> 'LocalScorer':
+        """训练模型：按日期取最后 valid_fraction 的样本做验证，再用全部样本重新拟合
+
+        Args:
+            params: 传给 LocalScorer（window/horizon/threshold，需与构造训练集时一致）
+
+        Raises:
+            ValueError: 样本为空或只有一个类别
+        """
+        if len(X) == 0 or len(np.unique(y)) < 2:
+            raise ValueError("训练样本为空或只有一个类别，无法训练本地评分模型")
+        backend = _select_backend(backend)
+        if backend == 'numpy' and model_type != 'logistic':
+            print(f"⚠️  numpy 后端不支持 {model_type} 模型（需安装 scikit-learn），改用逻辑回归")
+            model_type = 'logistic'
+
+        metrics = {'samples': int(len(y)), 'positive_rate': round(float(y.mean()), 4)}
+        n_valid = int(len(y) * valid_fraction)
+        if dates is not None and n_valid > 0:
+            # 验证集取最后的交易日（同一日期不跨训练/验证集，避免信息泄露）
+            cutoff = np.sort(dates)[-n_valid]
+            train_mask = dates < cutoff
+            if len(np.unique(y[train_mask])) == 2 and (~train_mask).any():
+                model = _make_model(model_type, backend).fit(X[train_mask], y[train_mask])
+                valid_scores = model.predict_proba(X[~train_mask])[:, 1]
+                auc = roc_auc(y[~train_mask], valid_scores)
+                metrics['valid_samples'] = int((~train_mask).sum())
+                metrics['valid_auc'] = round(auc, 4) if auc is not None else None
+                metrics['valid_from'] = str(np.sort(dates[~train_mask])[0])
+
+        model = _make_model(model_type, backend).fit(X, y)
+        train_auc = roc_auc(y, model.predict_proba(X)[:, 1])
+        metrics['train_auc'] = round(train_auc, 4) if train_auc is not None else None
+        return cls(model, model_type, backend, metrics=metrics, **params)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """上涨概率（0-1）"""
+        if X.shape[1] != len(self.feature_names):
+            raise ValueError(f"特征维度不匹配: 模型 {len(self.feature_names)}，输入 {X.shape[1]}")
+        return self.model.predict_proba(X)[:, 1]
+
+    def score(self, stock_data: pd.DataFrame) -> Dict[str, float]:
+        """为每只股票（最近 window 天）评分，返回 {code: 0-100 概率}"""
+        codes, _, X = latest_features(stock_data, self.window)
+        if not codes:
+            return {}
+        probabilities = self.predict_proba(X) * 100
+        return {code: round(float(p), 2) for code, p in zip(codes, probabilities)}
+
+    def metadata(self) -> Dict:
+        return {
+            'version': self.version,
+            'created_at': self.created_at,
+            'model_type': self.model_type,
+            'backend': self.backend,
+            'window': self.window,
+            'horizon': self.horizon,
+            'threshold': self.threshold,
+            'feature_names': self.feature_names,
+            'metrics': self.metrics,
+        }
+
+    def save(self, directory: str = LOCAL_SCORER_DIR) -> str:
+        """保存为下一个版本号，返回模型文件路径"""
+        os.makedirs(directory, exist_ok=True)
+        versions = [entry['version'] for entry in list_scorers(directory)]
+        self.version = max(versions, default=0) + 1
+        path = os.path.join(directory, f"local_scorer_v{self.version:04d}.pkl")
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+        with open(path[:-4] + '.json', 'w', encoding='utf-8') as f:
+            json.dump(self.metadata(), f, ensure_ascii=False, indent=2)
+        return path
+
+
+def list_scorers(directory: str = LOCAL_SCORER_DIR) -> List[Dict]:
+    """列出已保存的模型版本（读取 .json 元数据），按版本号升序"""
+    entries = []
+    for path in glob.glob(os.path.join(directory, 'local_scorer_v*.json')):
+        if re.search(r'local_scorer_v\d+\.json$', path) and os.path.exists(path[:-5] + '.pkl'):
+            with open(path, encoding='utf-8') as f:
+                entries.append(json.load(f))
+    return sorted(entries, key=lambda entry: entry['version'])
+
+
+def load_scorer(directory: str = LOCAL_SCORER_DIR, version: Optional[int] = None) -> Optional[LocalScorer]:
+    """加载指定版本（默认最新）的模型，目录中没有模型时返回 None
+
+    Raises:
+        ValueError: 指定版本不存在，或模型的特征口径与当前代码不一致
+    """
+    versions = [entry['version'] for entry in list_scorers(directory)]
+    if not versions:
+        if version is not None:
+            raise ValueError(f"本地评分模型 v{version} 不存在")
+        return None
+    version = version or max(versions)
+    if version not in versions:
+        raise ValueError(f"本地评分模型 v{version} 不存在")
+    with open(os.path.join(directory, f"local_scorer_v{version:04d}.pkl"), 'rb') as f:
+        scorer = pickle.load(f)
+    if scorer.feature_names != FEATURE_NAMES:
+        raise ValueError(f"本地评分模型 v{version} 的特征与当前版本不一致，请重新训练")
+    return scorer
@@ -1,9 +1,11 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+import asyncio
 import os
 import logging
-from typing import List
+import time
+from typing import Dict, List, Optional
 
 from .database import StockDatabase
 from .data_fetcher import StockDataFetcher
@@ -12,7 +14,11 @@ from .data_fetcher_tushare import TushareDataFetcher
 from .data_fetcher_akshare import AkShareDataFetcher
 from .data_fetcher_yfinance import YahooFinanceDataFetcher
 from .analyzer import StockAnalyzer
-from .config import get_sample_size, get_rise_threshold
+from .async_analyzer import AsyncStockAnalyzer
+from .async_database import AsyncDatabase, run_compute
+from .analog_index import AnalogIndex, build_analog_index, load_analog_index
+from .local_scorer import list_scorers
+from .config import get_sample_size, get_rise_threshold, PREDICT_SCORER, ANALOG_WINDOWS, ANALOG_TOP_K
 from .data_fetcher_akshare import fetch_sse_component_stocks
 from .models import (
     StockPrediction,
@@ -96,11 +102,18 @@ else:
 # 注入数据库依赖，允许无API Key启动
 analyzer = StockAnalyzer(api_key=api_key, db=db)
 
+# 分析与预测任务走 asyncio 路径（AsyncAnthropic + 异步数据库外观），以可取消的任务运行
+async_analyzer = AsyncStockAnalyzer(analyzer)
+async_db = AsyncDatabase(db)
+analog_indexes: Dict[int, AnalogIndex] = {}  # 已加载的相似检索索引（按窗口长度）
+running_tasks: Dict[str, asyncio.Task] = {}
+
 # 全局状态
 task_status = {
     "fetch_data": {"running": False, "progress": 0, "message": ""},
     "analyze": {"running": False, "progress": 0, "message": ""},
-    "predict": {"running": False, "progress": 0, "message": ""}
+    "predict": {"running": False, "progress": 0, "message": ""},
+    "analog_index": {"running": False, "progress": 0, "message": ""}
 }
 
 
@@ -246,12 +259,17 @@ async def get_task_status(task_name: str):
 
 
 @app.get("/api/claude-api-statistics")
-async def get_claude_api_statistics():
-    """获取Claude API调用统计和成本信息"""
+async def get_claude_api_statistics(days: int = 7):
+    """获取Claude API调用统计和成本信息
+
+    Args:
+        days: 持久化调用记录的统计天数（延迟分位数、tokens/sec、按任务/按日成本）
+    """
     try:
         # 从全局analyzer获取统计（如果存在）
         if 'analyzer' in globals() and analyzer is not None:
             stats = analyzer.get_api_statistics()
+            stats['history'] = analyzer.get_call_metrics(days)
             return {
                 "success": True,
                 "data": stats,
@@ -268,15 +286,52 @@ async def get_claude_api_statistics():
                     'input_tokens': 0,
                     'output_tokens': 0,
                     'total_tokens': 0,
-                    'estimated_cost_usd': 0.0
+                    'batch_input_tokens': 0,
+                    'batch_output_tokens': 0,
+                    'cache_creation_input_tokens': 0,
+                    'cache_read_input_tokens': 0,
+                    'last_packing': {},
+                    'last_cascade': {},
+                    'last_pipeline': {},
+                    'models': {},
+                    'history': {},
+                    'estimated_cost_usd': 0.0,
+                    'cache_hits': 0,
+                    'cache_misses': 0,
+                    'cache_hit_rate': 0
                 }
             }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取统计失败: {str(e)}")
 
 
+@app.get("/api/llm-sessions")
+async def get_llm_sessions(limit: int = 20):
+    """列出录制的 LLM 调用会话（可用 scripts/replay_llm_session.py 离线回放）"""
+    return {"current": analyzer.llm_session_id, "sessions": db.get_llm_sessions(limit)}
+
+
+def _start_task(task_name: str, coro) -> asyncio.Task:
+    """以 asyncio 任务运行（保留引用直到结束，可通过 /api/task/{task_name}/cancel 取消）"""
+    task_status[task_name]["running"] = True
+    task = asyncio.create_task(coro, name=task_name)
+    running_tasks[task_name] = task
+    task.add_done_callback(lambda done: running_tasks.pop(task_name, None))
+    return task
+
+
+@app.post("/api/task/{task_name}/cancel")
+async def cancel_task(task_name: str):
+    """取消正在运行的分析/预测任务（在途的 Claude 请求一并取消）"""
+    task = running_tasks.get(task_name)
+    if task is None or task.done():
+        return {"success": False, "message": "没有正在运行的任务"}
+    task.cancel()
+    return {"success": True, "message": "已请求取消"}
+
+
 @app.post("/api/analyze")
-async def analyze_patterns(request: AnalyzeRequest, background_tasks: BackgroundTasks):
+async def analyze_patterns(request: AnalyzeRequest):
     """
     区域2：分析上涨模式
     使用 Claude AI 分析历史数据，提取上涨模式
@@ -284,7 +339,7 @@ async def analyze_patterns(request: AnalyzeRequest, background_tasks: Background
     logger.info(f"收到模式分析请求: pattern_count={request.pattern_count}")
 
     # 检查AI是否可用
-    if not analyzer.ai_enabled:
+    if not async_analyzer.ai_enabled:
         logger.error("AI功能不可用：未配置ANTHROPIC_API_KEY")
         return {
             "success": False,
@@ -295,7 +350,7 @@ async def analyze_patterns(request: AnalyzeRequest, background_tasks: Background
         logger.warning("分析任务正在运行中，拒绝新请求")
         return {"success": False, "message": "分析任务正在运行中"}
 
-    def analyze_task(pattern_count: int):
+    async def analyze_task(pattern_count: int):
         try:
             logger.info(f"开始分析任务: pattern_count={pattern_count}")
             task_status["analyze"]["running"] = True
@@ -307,7 +362,7 @@ async def analyze_patterns(request: AnalyzeRequest, background_tasks: Background
             rise_threshold = get_rise_threshold()
 
             # 从数据库获取上涨样本
-            samples = db.get_rising_samples(sample_count=sample_size, rise_threshold=rise_threshold)
+            samples = await async_db.get_rising_samples(sample_count=sample_size, rise_threshold=rise_threshold)
 
             if samples.empty:
                 task_status["analyze"]["message"] = f"未找到符合条件的样本 (3天后上涨≥{rise_threshold*100}%)"
@@ -317,7 +372,7 @@ async def analyze_patterns(request: AnalyzeRequest, background_tasks: Background
             task_status["analyze"]["progress"] = 40
 
             # Step1: 使用 Claude 分析
-            patterns = analyzer.analyze_rising_patterns(samples)
+            patterns = await async_analyzer.analyze_rising_patterns(samples)
 
             if not patterns:
                 task_status["analyze"]["message"] = "分析失败"
@@ -327,7 +382,7 @@ async def analyze_patterns(request: AnalyzeRequest, background_tasks: Background
             task_status["analyze"]["progress"] = 60
 
             # Step2: 历史验证（新功能 - 核心卖点）
-            validation_samples = db.get_validation_samples(days_back=30, rise_threshold=rise_threshold)
+            validation_samples = await async_db.get_validation_samples(days_back=30, rise_threshold=rise_threshold)
 
             if not validation_samples.empty:
                 # 使用AI方法验证（精确但有成本）
@@ -337,7 +392,7 @@ async def analyze_patterns(request: AnalyzeRequest, background_tasks: Background
                     validation_samples = validation_samples.sample(n=max_validation, random_state=42)
                     print(f"   💡 验证样本过多，随机抽取{max_validation}个进行AI验证")
 
-                patterns = analyzer.validate_patterns_ai(patterns, validation_samples, rise_threshold)
+                patterns = await async_analyzer.validate_patterns_ai(patterns, validation_samples, rise_threshold)
             else:
                 print("   ⚠️  无验证数据，跳过验证步骤")
 
@@ -345,19 +400,23 @@ async def analyze_patterns(request: AnalyzeRequest, background_tasks: Background
             task_status["analyze"]["progress"] = 80
 
             # 保存模式（包含验证结果）
-            db.save_patterns(patterns)
+            await async_db.save_patterns(patterns)
 
             task_status["analyze"]["message"] = f"成功！识别出{len(patterns)}种模式（已验证）"
             task_status["analyze"]["progress"] = 100
             logger.info(f"分析任务完成: 识别出{len(patterns)}种模式")
 
+        except asyncio.CancelledError:
+            logger.info("分析任务已取消")
+            task_status["analyze"]["message"] = "已取消"
+            raise
         except Exception as e:
             logger.error(f"分析任务失败: {str(e)}", exc_info=True)
             task_status["analyze"]["message"] = f"错误: {str(e)}"
         finally:
             task_status["analyze"]["running"] = False
 
-    background_tasks.add_task(analyze_task, request.pattern_count)
+    _start_task("analyze", analyze_task(request.pattern_count))
 
     return {
         "success": True,
@@ -376,13 +435,16 @@ async def get_patterns():
 
 
 @app.post("/api/predict")
-async def predict_stocks(background_tasks: BackgroundTasks):
+async def predict_stocks(top_k: Optional[int] = Query(None, ge=1)):
     """
     区域3：预测股票上涨概率
     根据最近数据和已识别模式进行预测
+
+    Args:
+        top_k: 本次交给 Claude 评分的股票数（正整数，默认 config.PREDICT_LLM_TOP_K）
     """
-    # 检查AI是否可用
-    if not analyzer.ai_enabled:
+    # 检查AI是否可用（仅使用本地模型评分时不需要）
+    if not async_analyzer.ai_enabled and PREDICT_SCORER != "local":
         logger.error("AI功能不可用：未配置ANTHROPIC_API_KEY")
         return {
             "success": False,
@@ -392,14 +454,14 @@ async def predict_stocks(background_tasks: BackgroundTasks):
     if task_status["predict"]["running"]:
         return {"success": False, "message": "预测任务正在运行中"}
 
-    def predict_task():
+    async def predict_task():
         try:
             task_status["predict"]["running"] = True
             task_status["predict"]["message"] = "获取上涨模式..."
             task_status["predict"]["progress"] = 10
 
             # 获取已保存的模式
-            patterns = db.get_patterns()
+            patterns = await async_db.get_patterns()
 
             if not patterns:
                 task_status["predict"]["message"] = "请先执行数据分析"
@@ -409,7 +471,7 @@ async def predict_stocks(background_tasks: BackgroundTasks):
             task_status["predict"]["progress"] = 30
 
             # 获取所有股票最近30天的数据
-            recent_data = db.get_recent_data_all_stocks(days=30)
+            recent_data = await async_db.get_recent_data_all_stocks(days=30)
 
             if recent_data.empty:
                 task_status["predict"]["message"] = "没有数据"
@@ -418,8 +480,17 @@ async def predict_stocks(background_tasks: BackgroundTasks):
             task_status["predict"]["message"] = "AI预测中..."
             task_status["predict"]["progress"] = 50
 
+            # 流式发布：每条预测生成完毕即加入 partial，前端无需等待整个任务结束
+            partial = []
+            task_status["predict"]["partial"] = partial
+
+            def publish(pred):
+                partial.append(pred)
+                task_status["predict"]["message"] = f"AI预测中...已返回{len(partial)}条预测"
+
             # 使用 Claude 预测
-            predictions = analyzer.predict_stock_probability(recent_data, patterns)
+            predictions = await async_analyzer.predict_stock_probability(recent_data, patterns, on_prediction=publish,
+                                                                         top_k=top_k)
 
             task_status["predict"]["message"] = f"完成！找到{len(predictions)}只潜力股票"
             task_status["predict"]["progress"] = 100
@@ -427,6 +498,11 @@ async def predict_stocks(background_tasks: BackgroundTasks):
             # 保存预测结果到全局变量（简化版，生产环境应该存数据库）
             task_status["predict"]["result"] = predictions
 
+        except asyncio.CancelledError:
+            logger.info("预测任务已取消")
+            task_status["predict"]["message"] = "已取消"
+            task_status["predict"]["progress"] = 0
+            raise
         except Exception as e:
             logger.error(f"预测任务失败: {str(e)}", exc_info=True)
             task_status["predict"]["message"] = f"错误: {str(e)}"
@@ -434,7 +510,7 @@ async def predict_stocks(background_tasks: BackgroundTasks):
         finally:
             task_status["predict"]["running"] = False
 
-    background_tasks.add_task(predict_task)
+    _start_task("predict", predict_task())
 
     return {
         "success": True,
@@ -451,6 +527,11 @@ async def get_predictions(days: int = 1):
     Args:
         days: 从数据库读取最近N天的预测（默认1天，即最近一次）
     """
+    # 预测进行中：返回已流式到达的部分结果
+    if task_status["predict"]["running"] and task_status["predict"].get("partial"):
+        logger.info("返回进行中的部分预测结果")
+        return sorted(task_status["predict"]["partial"], key=lambda p: p["probability"], reverse=True)
+
     # 优先返回内存中的结果（刚完成的预测）
     if "result" in task_status["predict"]:
         logger.info("返回内存中的预测结果")
@@ -481,6 +562,100 @@ async def get_predictions(days: int = 1):
         return []
 
 
+@app.get("/api/predictions/screened")
+async def get_screened_stocks():
+    """获取最近一次预测的全部候选股票及其量化特征（含未被 AI 选中的股票）"""
+    return analyzer.last_screened
+
+
+@app.get("/api/predictions/pipeline")
+async def get_prediction_pipeline(run_id: Optional[str] = None, limit: int = 100):
+    """获取预测流水线各阶段（筛选 / 本地评分 / Claude）的耗时、数量与中间排名
+
+    Args:
+        run_id: 预测运行ID（默认最近一次）
+        limit: 每个阶段返回的排名条数
+    """
+    try:
+        rankings = db.get_prediction_rankings(run_id=run_id, limit=limit)
+    except Exception as e:
+        logger.error(f"读取预测排名失败: {e}")
+        rankings = {}
+    return {"pipeline": analyzer.last_pipeline, "rankings": rankings}
+
+
+@app.get("/api/local-scorer/versions")
+async def get_local_scorer_versions():
+    """列出已训练的本地评分模型版本及其验证指标"""
+    return {"versions": list_scorers(), "last_scoring": analyzer.last_local_scoring}
+
+
+# ===== 历史相似走势检索 API =====
+
+async def _get_analog_index(window: int) -> Optional[AnalogIndex]:
+    if window not in analog_indexes:
+        index = await run_compute(load_analog_index, window)
+        if index is None:
+            return None
+        analog_indexes[window] = index
+    return analog_indexes[window]
+
+
+@app.post("/api/similarity/index/build")
+async def build_similarity_index(window: int = 20):
+    """增量构建相似检索索引（只嵌入上次构建之后新增交易日结尾的窗口）"""
+    if window not in ANALOG_WINDOWS:
+        return {"success": False, "message": f"窗口长度只支持 {ANALOG_WINDOWS}"}
+    if task_status["analog_index"]["running"]:
+        return {"success": False, "message": "索引构建任务正在运行中"}
+
+    async def build_task():
+        try:
+            task_status["analog_index"]["message"] = f"构建 {window} 日窗口索引..."
+            task_status["analog_index"]["progress"] = 10
+            # 在副本上构建，完成后替换引用；构建期间查询继续使用旧索引
+            index = await run_compute(build_analog_index, db, window, analog_indexes.get(window))
+            analog_indexes[window] = index
+            stats = index.stats()
+            task_status["analog_index"]["message"] = f"索引完成：{stats['stocks']} 只股票，{stats['windows']} 个窗口"
+            task_status["analog_index"]["progress"] = 100
+        except asyncio.CancelledError:
+            task_status["analog_index"]["message"] = "已取消"
+            raise
+        except Exception as e:
+            logger.error(f"相似检索索引构建失败: {e}")
+            task_status["analog_index"]["message"] = f"错误: {str(e)}"
+        finally:
+            task_status["analog_index"]["running"] = False
+
+    _start_task("analog_index", build_task())
+    return {"success": True, "message": "索引构建任务已启动"}
+
+
+@app.get("/api/similarity/{code}")
+async def get_similar_windows(code: str, k: int = ANALOG_TOP_K, window: int = 20, end_date: Optional[str] = None,
+                              before_date: Optional[str] = None):
+    """查找与该股票截至 end_date（默认最新）的走势最相似的 k 个历史窗口及其后续收益
+
+    Args:
+        before_date: 只检索结尾早于该日期的窗口（回测时避免使用未来数据）
+    """
+    if window not in ANALOG_WINDOWS:
+        return {"success": False, "message": f"窗口长度只支持 {ANALOG_WINDOWS}"}
+    index = await _get_analog_index(window)
+    if index is None:
+        return {"success": False, "message": "相似检索索引尚未构建，请先调用 /api/similarity/index/build"}
+    started = time.monotonic()
+    try:
+        # 服务中的索引只读且不加锁，毫秒级检索直接在事件循环中执行
+        result = index.query_stock(code, k=k, end_date=end_date, before_date=before_date)
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
+    result["elapsed_ms"] = round((time.monotonic() - started) * 1000, 2)
+    result["index"] = index.stats()
+    return {"success": True, "data": result}
+
+
 @app.get("/api/stock/{code}/kline")
 async def get_stock_kline(code: str, days: int = 90):
     """获取指定股票的K线数据"""
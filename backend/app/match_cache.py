@@ -0,0 +1,172 @@
+"""模式匹配结果缓存 - 相同 (股票, 截止日期) 窗口与未改动的模式定义不再重复匹配
+
+缓存键：(code, last_date, data_version, pattern_hash)
+- data_version: 窗口内 日期 + OHLCV 的指纹，数据修订后自动失效
+- pattern_hash: 单个模式定义与匹配器版本的指纹，修改某个模式只会使该模式的缓存失效；
+  经典模式由代码匹配，匹配逻辑变化时由 pattern_matcher.MATCHER_VERSION 使全部缓存失效
+
+持久化在独立的 SQLite 文件中，按最近使用时间 (last_used) 做 LRU 淘汰。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from .config import MATCH_CACHE_PATH, MATCH_CACHE_SIZE
+
+CacheKey = Tuple[str, str, str, str]
+
+_QUERY_BATCH = 500  # SQLite 单条语句的参数上限以内
+
+
+def pattern_hash(pattern: Dict, matcher_version: str = "") -> str:
+    """模式定义指纹（键顺序无关），matcher_version 为匹配逻辑的版本"""
+    payload = matcher_version + json.dumps(pattern, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def window_fingerprint(dates: np.ndarray, ohlcv: np.ndarray) -> Tuple[str, str]:
+    """已按日期排序的窗口 → (最后K线日期, 数据版本)"""
+    if len(dates) == 0:
+        return "", "empty"
+    last_date = str(np.asarray(dates[-1:]).astype("datetime64[ns]").astype("datetime64[D]")[0])
+    digest = hashlib.sha1(np.ascontiguousarray(dates, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(ohlcv, dtype=float).tobytes())
+    return last_date, digest.hexdigest()[:16]
+
+
+def _to_builtin(value):
+    """numpy 标量转换为 JSON 可序列化的 Python 类型"""
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+class MatchCache:
+    """匹配结果的持久化 LRU 缓存（单条 = 单只股票窗口 × 单个模式）"""
+
+    def __init__(self, db_path: str = MATCH_CACHE_PATH, max_entries: int = MATCH_CACHE_SIZE):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.init_db()
+
+    def get_connection(self):
+        return sqlite3.connect(self.db_path)
+
+    def init_db(self):
+        conn = self.get_connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS match_cache (
+                code TEXT NOT NULL,
+                last_date TEXT NOT NULL,
+                data_version TEXT NOT NULL,
+                pattern_hash TEXT NOT NULL,
+                result TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (code, last_date, data_version, pattern_hash)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_match_cache_last_used ON match_cache(last_used)')
+        conn.commit()
+        conn.close()
+
+    def get_many(self, keys: Iterable[CacheKey]) -> Dict[CacheKey, list]:
+        """批量查询，命中的条目刷新 last_used"""
+        wanted = set(keys)
+        found: Dict[CacheKey, list] = {}
+        if not wanted:
+            return found
+        codes = sorted({key[0] for key in wanted})
+        conn = self.get_connection()
+        try:
+            for i in range(0, len(codes), _QUERY_BATCH):
+                batch = codes[i:i + _QUERY_BATCH]
+                rows = conn.execute(
+                    f"SELECT code, last_date, data_version, pattern_hash, result FROM match_cache "
+                    f"WHERE code IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for code, last_date, version, phash, result in rows:
+                    key = (code, last_date, version, phash)
+                    if key in wanted:
+                        found[key] = json.loads(result)
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE match_cache SET last_used = ? "
+                    "WHERE code = ? AND last_date = ? AND data_version = ? AND pattern_hash = ?",
+                    [(now, *key) for key in found],
+                )
+                conn.commit()
+        finally:
+            conn.close()
+        self.hits += len(found)
+        self.misses += len(wanted) - len(found)
+        return found
+
+    def put_many(self, entries: Dict[CacheKey, list]):
+        """批量写入，超出容量时淘汰最久未使用的条目"""
+        if not entries:
+            return
+        now = time.time()
+        conn = self.get_connection()
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO match_cache "
+                "(code, last_date, data_version, pattern_hash, result, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                [(*key, json.dumps(value, ensure_ascii=False, default=_to_builtin), now)
+                 for key, value in entries.items()],
+            )
+            self._evict(conn)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _evict(self, conn):
+        overflow = conn.execute("SELECT COUNT(*) FROM match_cache").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM match_cache WHERE rowid IN "
+                "(SELECT rowid FROM match_cache ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+
+    def clear(self):
+        conn = self.get_connection()
+        conn.execute("DELETE FROM match_cache")
+        conn.commit()
+        conn.close()
+
+    def stats(self) -> Dict:
+        conn = self.get_connection()
+        size = conn.execute("SELECT COUNT(*) FROM match_cache").fetchone()[0]
+        conn.close()
+        total = self.hits + self.misses
+        return {
+            "entries": size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0,
+        }
+
+
+_default_cache: Optional[MatchCache] = None
+
+
+def get_match_cache() -> Optional[MatchCache]:
+    """进程内共享的默认缓存（MATCH_CACHE_SIZE <= 0 时关闭，返回 None）"""
+    global _default_cache
+    if MATCH_CACHE_SIZE <= 0:
+        return None
+    if _default_cache is None:
+        _default_cache = MatchCache()
+    return _default_cache
@@ -0,0 +1,190 @@
+"""匹配器内核 - 横盘区间搜索与 AI000 突破扫描的热点循环
+
+三种实现，导入时自动选择：
+- numba:  将参考循环 JIT 编译为机器码（仅 CPU，需安装 numba）
+- numpy:  累积最大/最小值 + 前缀和的向量化实现（默认回退）
+- python: 纯 Python 参考循环（仅用于一致性测试与排查）
+
+可通过环境变量 MATCHER_BACKEND 或 config.MATCHER_BACKEND 强制指定。
+"""
+
+import math
+import os
+from typing import Callable, Dict
+
+import numpy as np
+
+from .config import MATCHER_BACKEND
+from .indicators import rolling, shift
+
+
+# ---------- 参考循环（numba 兼容写法） ----------
+def _consolidation_search_loop(high, low, close, volume_ratio, breakout_day,
+                               min_days, max_days, range_max, shrink_max):
+    """从 min_days 起寻找突破日前首个满足“窄幅 + 缩量”的横盘天数，未找到返回 -1"""
+    stop = min(max_days + 1, breakout_day)
+    for days in range(min_days, stop):
+        start = breakout_day - days
+        if start < 0:
+            break
+        hi = high[start]
+        lo = low[start]
+        close_sum = 0.0
+        vr_sum = 0.0
+        vr_count = 0
+        for j in range(start, breakout_day):
+            if high[j] > hi:
+                hi = high[j]
+            if low[j] < lo:
+                lo = low[j]
+            close_sum += close[j]
+            if not math.isnan(volume_ratio[j]):
+                vr_sum += volume_ratio[j]
+                vr_count += 1
+        price_range = (hi - lo) / (close_sum / days)
+        if price_range > range_max:
+            continue
+        if vr_count > 0 and vr_sum / vr_count <= shrink_max:
+            return days
+    return -1
+
+
+def _ai000_scan_loop(close, high, low, volume, rolling_vol, rolling_high, base_days, obs,
+                     vol_mult, price_inc, cons_range, momentum_th):
+    """自后向前寻找放量突破日，并检查突破前整理区间、突破后走势与整体涨幅"""
+    n = len(close)
+    overall_rise = (close[n - 1] - close[0]) / close[0]
+    for i in range(n - 1, base_days - 1, -1):
+        base_vol = rolling_vol[i]
+        prev_high = rolling_high[i - 1] if i > 0 else close[i]
+        if base_vol == 0 or prev_high <= 0:
+            continue
+        if volume[i] >= base_vol * vol_mult and (close[i] - prev_high) / prev_high >= price_inc:
+            window_start = max(0, i - obs)
+            length = i - window_start
+            if length < 5:
+                continue
+            hi = high[window_start]
+            lo = low[window_start]
+            close_sum = 0.0
+            for j in range(window_start, i):
+                if high[j] > hi:
+                    hi = high[j]
+                if low[j] < lo:
+                    lo = low[j]
+                close_sum += close[j]
+            if (hi - lo) / (close_sum / length) > cons_range:
+                continue
+            end = min(i + 5, n)
+            total_rise = (close[end - 1] - close[i]) / close[i] if end - i > 1 else 0.0
+            if total_rise < -0.05:
+                continue
+            if overall_rise < momentum_th:
+                continue
+            return True
+    return False
+
+
+# ---------- NumPy 向量化实现 ----------
+def _consolidation_search_numpy(high, low, close, volume_ratio, breakout_day,
+                                min_days, max_days, range_max, shrink_max):
+    stop = min(max_days + 1, breakout_day)
+    if stop <= min_days or min_days < 1:
+        return -1
+    days = np.arange(min_days, stop)
+    idx = days - 1
+    # 反转突破日之前的序列，累积量的第 d-1 项即 [b-d, b) 区间的统计
+    rev_high = np.maximum.accumulate(high[:breakout_day][::-1])
+    rev_low = np.minimum.accumulate(low[:breakout_day][::-1])
+    rev_close = np.cumsum(close[:breakout_day][::-1])
+    rev_vr = volume_ratio[:breakout_day][::-1]
+    valid = ~np.isnan(rev_vr)
+    vr_sum = np.cumsum(np.where(valid, rev_vr, 0.0))
+    vr_count = np.cumsum(valid)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        price_range = (rev_high[idx] - rev_low[idx]) / (rev_close[idx] / days)
+        avg_ratio = np.where(vr_count[idx] > 0, vr_sum[idx] / vr_count[idx], np.nan)
+    ok = ~(price_range > range_max) & (avg_ratio <= shrink_max)
+    hits = np.flatnonzero(ok)
+    return int(days[hits[0]]) if len(hits) else -1
+
+
+def _ai000_scan_numpy(close, high, low, volume, rolling_vol, rolling_high, base_days, obs,
+                      vol_mult, price_inc, cons_range, momentum_th):
+    n = len(close)
+    if (close[n - 1] - close[0]) / close[0] < momentum_th:
+        return False
+    i = np.arange(max(base_days, 0), n)
+    if len(i) == 0:
+        return False
+    prev_high = np.where(i > 0, rolling_high[np.maximum(i - 1, 0)], close[i])
+    base_vol = rolling_vol[i]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        candidate = ~((base_vol == 0) | (prev_high <= 0))
+        candidate &= (volume[i] >= base_vol * vol_mult) & ((close[i] - prev_high) / prev_high >= price_inc)
+        candidate &= (i - np.maximum(0, i - obs)) >= 5
+        if not candidate.any():
+            return False
+        # 突破前 [i-obs, i) 区间：窗口 obs、最少 1 根的滚动统计再平移 1 根
+        window_high = shift(rolling(high, obs, "max", 1), 1)[i]
+        window_low = shift(rolling(low, obs, "min", 1), 1)[i]
+        window_close = shift(rolling(close, obs, "mean", 1), 1)[i]
+        candidate &= ~((window_high - window_low) / window_close > cons_range)
+        end = np.minimum(i + 5, n)
+        total_rise = np.where(end - i > 1, (close[end - 1] - close[i]) / close[i], 0.0)
+        candidate &= ~(total_rise < -0.05)
+    return bool(candidate.any())
+
+
+KERNELS: Dict[str, Dict[str, Callable]] = {
+    "python": {
+        "consolidation_search": _consolidation_search_loop,
+        "ai000_scan": _ai000_scan_loop,
+    },
+    "numpy": {
+        "consolidation_search": _consolidation_search_numpy,
+        "ai000_scan": _ai000_scan_numpy,
+    },
+}
+
+try:
+    import numba
+
+    KERNELS["numba"] = {
+        "consolidation_search": numba.njit(cache=True, error_model="numpy")(_consolidation_search_loop),
+        "ai000_scan": numba.njit(cache=True, error_model="numpy")(_ai000_scan_loop),
+    }
+except ImportError:
+    pass
+
+
+def _select_backend() -> str:
+    requested = os.getenv("MATCHER_BACKEND", MATCHER_BACKEND)
+    if requested in KERNELS:
+        return requested
+    if requested not in ("auto", ""):
+        print(f"⚠️  匹配内核 {requested} 不可用，自动选择")
+    return "numba" if "numba" in KERNELS else "numpy"
+
+
+BACKEND = _select_backend()
+
+
+def consolidation_search(high: np.ndarray, low: np.ndarray, close: np.ndarray, volume_ratio: np.ndarray,
+                         breakout_day: int, min_days: int, max_days: int,
+                         range_max: float, shrink_max: float) -> int:
+    """横盘区间搜索，返回匹配的横盘天数，未找到返回 -1"""
+    return int(KERNELS[BACKEND]["consolidation_search"](
+        high, low, close, volume_ratio, int(breakout_day),
+        int(min_days), int(max_days), float(range_max), float(shrink_max),
+    ))
+
+
+def ai000_scan(close: np.ndarray, high: np.ndarray, low: np.ndarray, volume: np.ndarray,
+               rolling_vol: np.ndarray, rolling_high: np.ndarray, base_days: int, obs: int,
+               vol_mult: float, price_inc: float, cons_range: float, momentum_th: float) -> bool:
+    """AI000 放量突破扫描"""
+    return bool(KERNELS[BACKEND]["ai000_scan"](
+        close, high, low, volume, rolling_vol, rolling_high, int(base_days), int(obs),
+        float(vol_mult), float(price_inc), float(cons_range), float(momentum_th),
+    ))
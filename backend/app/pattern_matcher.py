@@ -1,11 +1,35 @@
 """模式匹配器 - 程序化匹配经典与 AI 模式（AI 规则放宽版）"""
 
 import json
-from typing import List, Dict, Optional
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 
+from .config import CASCADE_CALIBRATION_SAMPLE, MATCH_CHUNK_SIZE, MATCH_PARALLEL_MIN, MATCH_WORKERS
+from .indicators import BASE_COLUMNS, WINDOWS, IndicatorBundle, IndicatorView
+from .match_cache import MatchCache, get_match_cache, pattern_hash, window_fingerprint
+from .matcher_kernels import ai000_scan, consolidation_search
+from .pattern_rules import compile_pattern
+from .predicate_cascade import (
+    Checks, apply_cascade_orders, cascade_orders, cascade_stats, get_cascade, merge_counts, reset_stats,
+    snapshot_counts,
+)
+
+KlineInput = Union[List[Dict], IndicatorBundle]
+
+# 匹配逻辑版本：修改经典模式的匹配代码（_p00x_checks）、阈值、规则编译或指标计算时递增，
+# 使持久化的匹配结果缓存失效（indicators.WINDOWS 的参数已自动计入缓存键）
+MATCHER_VERSION = 1
+
+
+def matcher_version() -> str:
+    """匹配结果缓存键中的匹配器版本"""
+    return f"{MATCHER_VERSION}:{json.dumps(WINDOWS, sort_keys=True)}:"
+
 
 def load_classic_patterns(pattern_file: str = "classic_patterns.json") -> List[Dict]:
     """加载经典模式定义"""
@@ -14,20 +38,12 @@ def load_classic_patterns(pattern_file: str = "classic_patterns.json") -> List[D
     return data["patterns"]
 
 
-def match_classic_patterns(kline_data: List[Dict], patterns: List[Dict]) -> List[Dict]:
-    """匹配经典模式"""
+def match_classic_patterns(kline_data: KlineInput, patterns: List[Dict]) -> List[Dict]:
+    """匹配经典模式（kline_data 可传入已构建的 IndicatorBundle 以复用指标）"""
     if len(kline_data) < 5:
         return []
 
-    df = pd.DataFrame(kline_data)
-    df["date"] = pd.to_datetime(df["date"])
-    df = df.sort_values("date").reset_index(drop=True)
-
-    window_size = min(20, len(df))
-    min_periods = min(5, len(df))
-    df["avg_volume"] = df["volume"].rolling(window=window_size, min_periods=min_periods).mean()
-    df["volume_ratio"] = df["volume"] / df["avg_volume"]
-    df["pct_change"] = df["close"].pct_change()
+    view = IndicatorBundle.of(kline_data).view("classic")
 
     matched = []
     for pattern in patterns:
@@ -35,11 +51,13 @@ def match_classic_patterns(kline_data: List[Dict], patterns: List[Dict]) -> List
             continue
         pid = pattern.get("pattern_id")
         if pid == "P001":
-            result = _match_consolidation_breakout(df, pattern)
+            result = _match_consolidation_breakout(view, pattern)
         elif pid == "P002":
-            result = _match_v_reversal(df, pattern)
+            result = _match_v_reversal(view, pattern)
         elif pid == "P003":
-            result = _match_continuous_rise(df, pattern)
+            result = _match_continuous_rise(view, pattern)
+        elif pattern.get("rules"):
+            result = _match_rules(view, pattern)
         else:
             continue
         if result:
@@ -47,145 +65,240 @@ def match_classic_patterns(kline_data: List[Dict], patterns: List[Dict]) -> List
     return matched
 
 
-def match_ai_patterns(kline_data: List[Dict], patterns: List[Dict]) -> List[Dict]:
+def match_ai_patterns(kline_data: KlineInput, patterns: List[Dict]) -> List[Dict]:
     """
-    匹配 AI 模式（当前支持 AI000/AI001 的粗略规则）
-    再次放宽阈值，先确保有命中，再逐步收紧
+    匹配 AI 模式
+    带 rules 的模式走 DSL 编译求值；AI000/AI001 保留手写的放宽规则
     """
     if len(kline_data) < 10:
         return []
-    df = pd.DataFrame(kline_data)
-    df["date"] = pd.to_datetime(df["date"])
-    df = df.sort_values("date").reset_index(drop=True)
-    df["pct_change"] = df["close"].pct_change()
-    df["avg_volume"] = df["volume"].rolling(window=min(20, len(df)), min_periods=3).mean()
-    df["volume_ratio"] = df["volume"] / df["avg_volume"]
+    view = IndicatorBundle.of(kline_data).view("ai")
 
     matched = []
     for p in patterns:
         if p.get("pattern_type") != "ai_discovered" or not p.get("is_active", True):
             continue
         pid = p.get("pattern_id")
-        if pid == "AI000" and _match_ai000(df, p):
+        if p.get("rules"):
+            result = _match_rules(view, p)
+            if result:
+                matched.append(result)
+        elif pid == "AI000" and _match_ai000(view, p):
             matched.append({"pattern_id": pid, "pattern_name": p["pattern_name"], "confidence": 0.5})
-        elif pid == "AI001" and _match_ai001(df, p):
+        elif pid == "AI001" and _match_ai001(view, p):
             matched.append({"pattern_id": pid, "pattern_name": p["pattern_name"], "confidence": 0.5})
     return matched
 
 
-def match_all_patterns(kline_data: List[Dict], patterns: List[Dict]) -> List[Dict]:
-    """同时匹配经典与 AI 模式"""
-    classics = [p for p in patterns if p.get("pattern_type", "").startswith("classic") or p.get("pattern_id", "").startswith("P")]
-    ai = [p for p in patterns if p.get("pattern_type") == "ai_discovered" or p.get("pattern_id", "").startswith("AI")]
-    return match_classic_patterns(kline_data, classics) + match_ai_patterns(kline_data, ai)
+def match_all_patterns(kline_data: KlineInput, patterns: List[Dict]) -> List[Dict]:
+    """同时匹配经典与 AI 模式（共享同一份指标缓存）"""
+    bundle = IndicatorBundle.of(kline_data)
+    return (match_classic_patterns(bundle, [p for p in patterns if _is_classic(p)])
+            + match_ai_patterns(bundle, [p for p in patterns if _is_ai(p)]))
+
+
+def is_matchable(pattern: Dict) -> bool:
+    """本地匹配器能否识别该模式（手写匹配器或带 DSL rules）"""
+    if pattern.get("rules"):
+        return _is_classic(pattern) or pattern.get("pattern_type") == "ai_discovered"
+    pid = pattern.get("pattern_id") or ""
+    return pid in ("P001", "P002", "P003") or (pattern.get("pattern_type") == "ai_discovered"
+                                                and pid in ("AI000", "AI001"))
+
+
+def _is_classic(pattern: Dict) -> bool:
+    return pattern.get("pattern_type", "").startswith("classic") or pattern.get("pattern_id", "").startswith("P")
+
+
+def _is_ai(pattern: Dict) -> bool:
+    return pattern.get("pattern_type") == "ai_discovered" or pattern.get("pattern_id", "").startswith("AI")
+
+
+# ---------- 谓词级联 ----------
+# 每个手写匹配器拆为相互独立的合取检查（任意顺序结果相同），默认顺序把便宜的量能检查放在最前，
+# calibrate_cascades() 可按近期数据实测的通过率与耗时重排。
+def _memo(memo: Dict, key: str, compute):
+    if key not in memo:
+        memo[key] = compute()
+    return memo[key]
+
+
+def _run_cascade(name: str, checks: Optional[Checks]) -> bool:
+    return checks is not None and get_cascade(name, list(checks)).run(checks)
+
+
+# ---------- DSL 规则模式 ----------
+_rule_warnings: set = set()
+
+
+def _warn_rule_once(pattern: Dict, stage: str, error: Exception):
+    """同一模式的同一错误只提示一次（否则每只股票都会打印）"""
+    key = (pattern.get("pattern_id"), stage, str(error))
+    if key not in _rule_warnings:
+        _rule_warnings.add(key)
+        print(f"   [警告] 模式 {pattern.get('pattern_id')} 规则{stage}失败: {error}")
+
+
+def _rule_checks(view: IndicatorView, pattern: Dict) -> Optional[Checks]:
+    try:
+        compiled = compile_pattern(pattern)
+    except ValueError as e:
+        _warn_rule_once(pattern, "编译", e)
+        return None
+    return compiled.checks(view) if compiled is not None else None
+
+
+def _match_rules(view: IndicatorView, pattern: Dict) -> Optional[Dict]:
+    try:
+        matched = _run_cascade(pattern.get("pattern_id"), _rule_checks(view, pattern))
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        # 求值错误按未命中处理，不中断整批匹配
+        _warn_rule_once(pattern, "求值", e)
+        return None
+    if not matched:
+        return None
+    compiled = compile_pattern(pattern)
+    return {
+        "pattern_id": pattern.get("pattern_id"),
+        "pattern_name": pattern.get("pattern_name"),
+        "confidence": compiled.confidence,
+        "match_details": compiled.rule.get("details", "规则匹配"),
+    }
 
 
 # ---------- 经典模式 ----------
-def _match_consolidation_breakout(df: pd.DataFrame, pattern: Dict) -> Optional[Dict]:
+def _p001_checks(view: IndicatorView, pattern: Dict, memo: Dict) -> Optional[Checks]:
     params = pattern["parameters"]
-    last_idx = len(df) - 1
+    last_idx = len(view) - 1
     if last_idx < 5:
         return None
-    breakout_day = None
-    for i in range(last_idx, max(last_idx - 3, 0), -1):
-        day = df.iloc[i]
-        if day["volume_ratio"] >= params["breakout_volume_ratio"]["min"] and day["pct_change"] >= params["breakout_rise"]["min"]:
-            breakout_day = i
-            break
-    if breakout_day is None:
+
+    def breakout_day():
+        volume_ratio, pct_change = view["volume_ratio"], view["pct_change"]
+        for i in range(last_idx, max(last_idx - 3, 0), -1):
+            if volume_ratio[i] >= params["breakout_volume_ratio"]["min"] and pct_change[i] >= params["breakout_rise"]["min"]:
+                return i
         return None
-    consolidation_found = False
-    matched_days = 0
-    for days in range(params["consolidation_days"]["min"], min(params["consolidation_days"]["max"] + 1, breakout_day)):
-        start_idx = breakout_day - days
-        if start_idx < 0:
-            break
-        period = df.iloc[start_idx:breakout_day]
-        price_range = (period["high"].max() - period["low"].min()) / period["close"].mean()
-        if price_range > params["price_range_during_consolidation"]["max"]:
-            continue
-        avg_volume_ratio = period["volume_ratio"].mean()
-        if avg_volume_ratio <= params["volume_shrink_ratio"]["max"]:
-            consolidation_found = True
-            matched_days = days
-            break
-    if not consolidation_found:
+
+    def matched_days():
+        day = _memo(memo, "breakout_day", breakout_day)
+        if day is None:
+            return -1
+        return consolidation_search(
+            view["high"], view["low"], view["close"], view["volume_ratio"], day,
+            params["consolidation_days"]["min"], params["consolidation_days"]["max"],
+            params["price_range_during_consolidation"]["max"], params["volume_shrink_ratio"]["max"],
+        )
+
+    return {
+        "breakout": lambda: _memo(memo, "breakout_day", breakout_day) is not None,
+        "consolidation": lambda: _memo(memo, "matched_days", matched_days) >= 0,
+    }
+
+
+def _match_consolidation_breakout(view: IndicatorView, pattern: Dict) -> Optional[Dict]:
+    memo: Dict = {}
+    if not _run_cascade("P001", _p001_checks(view, pattern, memo)):
         return None
     return {
         "pattern_id": pattern["pattern_id"],
         "pattern_name": pattern["pattern_name"],
         "confidence": 0.85,
-        "match_details": f"横盘{matched_days}天后放量突破",
+        "match_details": f"横盘{memo['matched_days']}天后放量突破",
     }
 
 
-def _match_v_reversal(df: pd.DataFrame, pattern: Dict) -> Optional[Dict]:
+def _p002_checks(view: IndicatorView, pattern: Dict, memo: Dict) -> Optional[Checks]:
     params = pattern["parameters"]
-    last_idx = len(df) - 1
+    last_idx = len(view) - 1
     if last_idx < 4:
         return None
-    bottom_idx = df["close"].idxmin()
-    if bottom_idx >= last_idx - 1 or bottom_idx < 1:
-        return None
-    pre_bottom = df.iloc[: bottom_idx + 1]
-    peak_idx = pre_bottom["close"].idxmax()
-    decline_amplitude = (df["close"].iloc[peak_idx] - df["close"].iloc[bottom_idx]) / df["close"].iloc[peak_idx]
-    if decline_amplitude < params["decline_amplitude"]["min"]:
-        return None
-    rebound_rise = (df["close"].iloc[last_idx] - df["close"].iloc[bottom_idx]) / df["close"].iloc[bottom_idx]
-    if rebound_rise < params["rebound_rise"]["min"]:
-        return None
-    rebound_days = last_idx - bottom_idx
-    if rebound_days < params["rebound_days"]["min"]:
+    close = view["close"]
+
+    def bottom():
+        return _memo(memo, "bottom_idx", lambda: int(np.argmin(close)))
+
+    def decline():
+        peak_idx = int(np.argmax(close[: bottom() + 1]))
+        return (close[peak_idx] - close[bottom()]) / close[peak_idx]
+
+    def rebound():
+        return (close[last_idx] - close[bottom()]) / close[bottom()]
+
+    return {
+        "bottom_position": lambda: 1 <= bottom() < last_idx - 1,
+        "rebound_days": lambda: last_idx - bottom() >= params["rebound_days"]["min"],
+        "rebound": lambda: not _memo(memo, "rebound_rise", rebound) < params["rebound_rise"]["min"],
+        "decline": lambda: not _memo(memo, "decline_amplitude", decline) < params["decline_amplitude"]["min"],
+    }
+
+
+def _match_v_reversal(view: IndicatorView, pattern: Dict) -> Optional[Dict]:
+    memo: Dict = {}
+    if not _run_cascade("P002", _p002_checks(view, pattern, memo)):
         return None
     return {
         "pattern_id": pattern["pattern_id"],
         "pattern_name": pattern["pattern_name"],
         "confidence": 0.80,
-        "match_details": f"V型反转: 下跌{decline_amplitude*100:.1f}%后反弹{rebound_rise*100:.1f}%",
+        "match_details": f"V型反转: 下跌{memo['decline_amplitude']*100:.1f}%后反弹{memo['rebound_rise']*100:.1f}%",
     }
 
 
-def _match_continuous_rise(df: pd.DataFrame, pattern: Dict) -> Optional[Dict]:
+def _p003_checks(view: IndicatorView, pattern: Dict, memo: Dict) -> Optional[Checks]:
     params = pattern["parameters"]
-    last_idx = len(df) - 1
+    last_idx = len(view) - 1
     if last_idx < 5:
         return None
-    continuous_days = 0
-    total_rise = 0
-    has_pullback = False
-    volume_ratios = []
-    for i in range(last_idx, max(0, last_idx - 10), -1):
-        day = df.iloc[i]
-        if day["pct_change"] < params["daily_rise"]["min"]:
-            if day["pct_change"] < -0.01:
-                has_pullback = True
-            break
-        continuous_days += 1
-        total_rise += day["pct_change"]
-        volume_ratios.append(day["volume_ratio"])
-    if continuous_days < params["continuous_days"]["min"]:
-        return None
-    if total_rise < params["total_rise"]["min"]:
-        return None
-    if params.get("no_pullback", True) and has_pullback:
-        return None
-    if volume_ratios:
+    pct_change = view["pct_change"]
+    daily_min = params["daily_rise"]["min"]
+
+    def streak():
+        volume_ratio = view["volume_ratio"]
+        continuous_days, total_rise, has_pullback, volume_ratios = 0, 0, False, []
+        for i in range(last_idx, max(0, last_idx - 10), -1):
+            if pct_change[i] < daily_min:
+                if pct_change[i] < -0.01:
+                    has_pullback = True
+                break
+            continuous_days += 1
+            total_rise += pct_change[i]
+            volume_ratios.append(volume_ratio[i])
+        return continuous_days, total_rise, has_pullback, volume_ratios
+
+    def volume_ok():
+        volume_ratios = _memo(memo, "streak", streak)[3]
+        if not volume_ratios:
+            return True
         days_above_threshold = sum(1 for v in volume_ratios if v >= params["daily_volume_ratio"]["min"])
         if days_above_threshold < len(volume_ratios) * 0.6:
-            return None
-        if "max_volume_ratio" in params and max(volume_ratios) < params["max_volume_ratio"]["min"]:
-            return None
+            return False
+        return not ("max_volume_ratio" in params and max(volume_ratios) < params["max_volume_ratio"]["min"])
+
+    return {
+        # 最后一天不满足涨幅时连涨天数为 0，最便宜的淘汰条件
+        "last_day_rise": lambda: params["continuous_days"]["min"] < 1 or not pct_change[last_idx] < daily_min,
+        "continuous_days": lambda: _memo(memo, "streak", streak)[0] >= params["continuous_days"]["min"],
+        "total_rise": lambda: not _memo(memo, "streak", streak)[1] < params["total_rise"]["min"],
+        "no_pullback": lambda: not (params.get("no_pullback", True) and _memo(memo, "streak", streak)[2]),
+        "volume": volume_ok,
+    }
+
+
+def _match_continuous_rise(view: IndicatorView, pattern: Dict) -> Optional[Dict]:
+    memo: Dict = {}
+    if not _run_cascade("P003", _p003_checks(view, pattern, memo)):
+        return None
     return {
         "pattern_id": pattern["pattern_id"],
         "pattern_name": pattern["pattern_name"],
         "confidence": 0.90,
-        "match_details": f"连续{continuous_days}天放量上涨",
+        "match_details": f"连续{memo['streak'][0]}天放量上涨",
     }
 
 
 # ---------- AI 模式（放宽规则） ----------
-def _match_ai000(df: pd.DataFrame, pattern: Dict) -> bool:
+def _ai000_checks(view: IndicatorView, pattern: Dict, memo: Dict) -> Optional[Checks]:
     params = pattern.get("parameters", {})
     obs = params.get("observation_period", 30)
     base_days = params.get("base_volume_days", 4)
@@ -194,37 +307,37 @@ def _match_ai000(df: pd.DataFrame, pattern: Dict) -> bool:
     cons_range = max(0.20, params.get("consolidation_range", 0.12))
     momentum_th = max(0.03, params.get("momentum_threshold", 0.1))
 
-    if len(df) < obs + base_days:
-        return False
-    sub = df.tail(obs + base_days).copy()
-    sub["rolling_vol"] = sub["volume"].rolling(base_days, min_periods=base_days).mean()
-    sub["rolling_high"] = sub["close"].rolling(obs, min_periods=5).max()
-    for i in range(len(sub) - 1, base_days - 1, -1):
-        row = sub.iloc[i]
-        base_vol = sub["rolling_vol"].iloc[i]
-        prev_high = sub["rolling_high"].iloc[i - 1] if i > 0 else row["close"]
-        if base_vol == 0 or prev_high <= 0:
-            continue
-        if row["volume"] >= base_vol * vol_mult and (row["close"] - prev_high) / prev_high >= price_inc:
-            window_start = max(0, i - obs)
-            period = sub.iloc[window_start:i]
-            if len(period) < 5:
-                continue
-            price_range = (period["high"].max() - period["low"].min()) / period["close"].mean()
-            if price_range > cons_range:
-                continue
-            post = sub.iloc[i : i + 5]
-            total_rise = (post["close"].iloc[-1] - post["close"].iloc[0]) / post["close"].iloc[0] if len(post) > 1 else 0
-            if total_rise < -0.05:
-                continue
-            overall_rise = (sub["close"].iloc[-1] - sub["close"].iloc[0]) / sub["close"].iloc[0]
-            if overall_rise < momentum_th:
-                continue
-            return True
-    return False
+    if len(view) < obs + base_days:
+        return None
+    sub = view.tail(obs + base_days)
+    close, volume = sub["close"], sub["volume"]
+    rolling_vol = sub.rolling("volume", base_days, "mean", base_days)
+
+    def momentum():
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return not (close[-1] - close[0]) / close[0] < momentum_th
 
+    def volume_spike():
+        # 突破日的必要条件：放量达到基准均量的 vol_mult 倍
+        base = rolling_vol[max(base_days, 0):]
+        return bool(((volume[max(base_days, 0):] >= base * vol_mult) & (base != 0)).any())
 
-def _match_ai001(df: pd.DataFrame, pattern: Dict) -> bool:
+    return {
+        "volume_spike": volume_spike,
+        "momentum": momentum,
+        "breakout_scan": lambda: ai000_scan(
+            close, sub["high"], sub["low"], volume, rolling_vol,
+            sub.rolling("close", obs, "max", 5),
+            base_days, obs, vol_mult, price_inc, cons_range, momentum_th,
+        ),
+    }
+
+
+def _match_ai000(view: IndicatorView, pattern: Dict) -> bool:
+    return _run_cascade("AI000", _ai000_checks(view, pattern, {}))
+
+
+def _ai001_checks(view: IndicatorView, pattern: Dict, memo: Dict) -> Optional[Checks]:
     params = pattern.get("parameters", {})
     vol_th = params.get("volatility_threshold", 0.15)
     vol_range = params.get("volume_change_range", [0.5, 1.5])
@@ -234,46 +347,263 @@ def _match_ai001(df: pd.DataFrame, pattern: Dict) -> bool:
     price_comp = params.get("price_range_compression", 0.30)
     breakthrough = params.get("breakthrough_amplitude", 0.003)
 
-    if len(df) < cons_days[1] + 1:
-        return False
-    sub = df.tail(cons_days[1] + 5).copy()
-    prices = sub["close"]
-    if prices.std() / prices.mean() > vol_th:
-        return False
-    vol_mean = sub["volume"].mean()
-    if vol_mean <= 0:
-        return False
-    vol_ratio_range = (sub["volume"] / vol_mean).between(vol_range[0], vol_range[1]).mean()
-    if vol_ratio_range < 0.5:  # 更宽松
+    if len(view) < cons_days[1] + 1:
+        return None
+    sub = view.tail(cons_days[1] + 5)
+    close, high, low, volume = sub["close"], sub["high"], sub["low"], sub["volume"]
+    vol_mean = volume.mean()
+
+    def volume_stability():
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratios = volume / vol_mean
+        return not ((ratios >= vol_range[0]) & (ratios <= vol_range[1])).mean() < 0.5  # 更宽松
+
+    def breakout_window():
+        for win in range(cons_days[0], cons_days[1] + 1):
+            if len(sub) < win + 1:
+                continue
+            base_high, base_low, base_close = high[-(win + 1) : -1], low[-(win + 1) : -1], close[-(win + 1) : -1]
+            price_range = (base_high.max() - base_low.min()) / base_close.mean()
+            if price_range > price_comp:
+                continue
+            prev_high = base_high.max()
+            if prev_high <= 0:
+                continue
+            if (close[-1] - prev_high) / prev_high < breakthrough:
+                continue
+            total_rise = (close[-1] - base_close[0]) / base_close[0]
+            if not (mom_range[0] <= total_rise <= mom_range[1]):
+                continue
+            return True
         return False
 
-    for win in range(cons_days[0], cons_days[1] + 1):
-        if len(sub) < win + 1:
-            continue
-        base = sub.iloc[-(win + 1) : -1]
-        price_range = (base["high"].max() - base["low"].min()) / base["close"].mean()
-        if price_range > price_comp:
-            continue
-        last = sub.iloc[-1]
-        if last["volume"] < vol_mean * final_vol_inc:
-            continue
-        prev_high = base["high"].max()
-        if prev_high <= 0:
-            continue
-        if (last["close"] - prev_high) / prev_high < breakthrough:
+    return {
+        # 大多数股票在末日量能上被淘汰（与窗口无关，提前到最前）
+        "final_volume": lambda: vol_mean > 0 and not volume[-1] < vol_mean * final_vol_inc,
+        "volatility": lambda: not close.std(ddof=1) / close.mean() > vol_th,
+        "volume_stability": volume_stability,
+        "breakout_window": breakout_window,
+    }
+
+
+def _match_ai001(view: IndicatorView, pattern: Dict) -> bool:
+    return _run_cascade("AI001", _ai001_checks(view, pattern, {}))
+
+
+_STAGED_CHECKS = {
+    "P001": ("classic", _p001_checks),
+    "P002": ("classic", _p002_checks),
+    "P003": ("classic", _p003_checks),
+    "AI000": ("ai", _ai000_checks),
+    "AI001": ("ai", _ai001_checks),
+}
+
+
+def calibrate_cascades(klines: List[KlineInput], patterns: List[Dict]) -> Dict[str, List[str]]:
+    """在近期样本上测量各阶段通过率与耗时并重排级联顺序，返回新的阶段顺序"""
+    bundles = [IndicatorBundle.of(k) for k in klines]
+    orders = {}
+    for pattern in patterns:
+        if not pattern.get("is_active", True):
             continue
-        total_rise = (last["close"] - base["close"].iloc[0]) / base["close"].iloc[0]
-        if not (mom_range[0] <= total_rise <= mom_range[1]):
+        pid = pattern.get("pattern_id")
+        # 与 match_classic_patterns / match_ai_patterns 的分派顺序一致
+        window, builder = _STAGED_CHECKS.get(pid, (None, None))
+        if pattern.get("rules") and not (window == "classic" and _is_classic(pattern)):
+            window, builder = ("classic" if _is_classic(pattern) else "ai"), _rule_checks
+        elif builder is None:
             continue
-        return True
-    return False
-
-
-def pre_screen_stocks(stocks_kline_data: Dict[str, List[Dict]], patterns: List[Dict]) -> List[str]:
-    """程序化预选股票"""
-    candidates = []
-    for stock_code, kline_data in stocks_kline_data.items():
-        matched = match_all_patterns(kline_data, patterns)
-        if len(matched) >= 1:
-            candidates.append(stock_code)
-    return candidates
+        min_len = 5 if window == "classic" else 10
+        samples = []
+        for bundle in bundles:
+            if len(bundle) < min_len:
+                continue
+            view = bundle.view(window)
+            checks = _rule_checks(view, pattern) if builder is _rule_checks else builder(view, pattern, {})
+            if checks is not None:
+                samples.append(checks)
+        if samples:
+            orders[pid] = get_cascade(pid, list(samples[0])).calibrate(samples)
+    return orders
+
+
+# ---------- 批量 / 并行匹配 ----------
+def _pack_klines(klines: List[List[Dict]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """将多只股票的K线打包为紧凑数组：(日期 int64, OHLCV float64 (n, 5), 每只股票的起始偏移)"""
+    lengths = np.array([len(k) for k in klines], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    records = [row for kline in klines for row in kline]
+    if not records:
+        return np.array([], dtype=np.int64), np.empty((0, len(BASE_COLUMNS))), offsets
+    df = pd.DataFrame.from_records(records, columns=["date", *BASE_COLUMNS])
+    dates = pd.to_datetime(df["date"]).to_numpy().astype("datetime64[ns]").view(np.int64)
+    return dates, df[list(BASE_COLUMNS)].to_numpy(dtype=float), offsets
+
+
+def _pack_windows(windows: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """已拆分的 (dates, ohlcv) 窗口重新拼接为紧凑数组"""
+    offsets = np.concatenate(([0], np.cumsum([len(d) for d, _ in windows]))).astype(np.int64)
+    dates = np.concatenate([d for d, _ in windows]) if windows else np.array([], dtype=np.int64)
+    ohlcv = np.concatenate([o for _, o in windows]) if windows else np.empty((0, len(BASE_COLUMNS)))
+    return dates, ohlcv, offsets
+
+
+_worker_patterns: List[Dict] = []
+
+
+def _init_worker(patterns: List[Dict], orders: Optional[Dict[str, List[str]]] = None):
+    global _worker_patterns
+    _worker_patterns = patterns
+    apply_cascade_orders(orders or {})
+
+
+def _match_split(bundle: IndicatorBundle, pattern: Dict) -> List[List[Dict]]:
+    """单个模式的匹配结果，拆分为 [经典部分, AI 部分] 以便按 match_all_patterns 的顺序重组"""
+    return [
+        match_classic_patterns(bundle, [pattern]) if _is_classic(pattern) else [],
+        match_ai_patterns(bundle, [pattern]) if _is_ai(pattern) else [],
+    ]
+
+
+def _match_packed(task, patterns: Optional[List[Dict]] = None) -> List:
+    """子进程入口：逐只还原指标缓存并匹配
+
+    task 为 (packed, indices)：indices 为 None 时匹配全部模式，
+    否则只匹配给定下标的模式并返回每个模式的拆分结果。
+    """
+    (dates, ohlcv, offsets), indices = task
+    patterns = _worker_patterns if patterns is None else patterns
+    results = []
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        bundle = IndicatorBundle.from_arrays(dates[start:end], ohlcv[start:end])
+        if indices is None:
+            results.append(match_all_patterns(bundle, patterns))
+        else:
+            results.append([_match_split(bundle, patterns[j]) for j in indices])
+    return results
+
+
+def _match_packed_worker(task) -> Tuple[List, Dict]:
+    """子进程任务：返回匹配结果与本分片的级联阶段计数"""
+    reset_stats()
+    results = _match_packed(task)
+    return results, snapshot_counts()
+
+
+def _run_tasks(tasks: List, patterns: List[Dict], workers: int, parallel: bool) -> List:
+    """执行分片任务并按提交顺序展开结果；进程池不可用时回退串行"""
+    if parallel and workers > 1 and len(tasks) > 1:
+        try:
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(tasks)), initializer=_init_worker,
+                initargs=(patterns, cascade_orders()),
+            ) as executor:
+                # map 保持提交顺序，结果按原始顺序合并
+                results = []
+                for chunk, counts in executor.map(_match_packed_worker, tasks):
+                    results.extend(chunk)
+                    merge_counts(counts)
+                return results
+        except (BrokenProcessPool, OSError) as e:
+            print(f"⚠️  并行匹配失败，回退串行: {e}")
+    return [result for task in tasks for result in _match_packed(task, patterns)]
+
+
+def match_stocks(
+    klines: List[List[Dict]],
+    patterns: List[Dict],
+    workers: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    codes: Optional[List[str]] = None,
+    cache: Optional[MatchCache] = None,
+) -> List[List[Dict]]:
+    """批量匹配多只股票，返回与输入顺序一致的匹配结果列表
+
+    Args:
+        klines: 每只股票的K线列表
+        patterns: 模式定义
+        workers: 进程数（None 读取 config.MATCH_WORKERS，0 表示 CPU 核数，1 表示串行）
+        chunk_size: 每个任务分片的股票数（None 读取 config.MATCH_CHUNK_SIZE）
+        codes: 与 klines 对应的股票代码（启用缓存时必填）
+        cache: 匹配结果缓存，先查缓存，只重新计算缺失的 (股票窗口, 模式) 组合
+    """
+    workers = MATCH_WORKERS if workers is None else workers
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, chunk_size or MATCH_CHUNK_SIZE)
+
+    def is_parallel(count: int) -> bool:
+        return workers > 1 and count >= max(MATCH_PARALLEL_MIN, 2 * chunk_size)
+
+    if cache is None or codes is None:
+        if not is_parallel(len(klines)):
+            return [match_all_patterns(kline, patterns) for kline in klines]
+        tasks = [(_pack_klines(klines[i:i + chunk_size]), None) for i in range(0, len(klines), chunk_size)]
+        return _run_tasks(tasks, patterns, workers, parallel=True)
+
+    # 拆分为按日期排序的窗口并计算缓存键
+    dates, ohlcv, offsets = _pack_klines(klines)
+    windows, bases = [], []
+    for code, start, end in zip(codes, offsets[:-1], offsets[1:]):
+        order = np.argsort(dates[start:end], kind="stable")
+        window = (dates[start:end][order], ohlcv[start:end][order])
+        windows.append(window)
+        bases.append((str(code), *window_fingerprint(*window)))
+    version = matcher_version()
+    hashes = [pattern_hash(p, version) for p in patterns]
+    found = cache.get_many((*base, h) for base in bases for h in hashes)
+
+    # 按缺失的模式集合分组，只重新计算缺失部分（修改一个模式只重算该模式）
+    groups: Dict[Tuple[int, ...], List[int]] = {}
+    for i, base in enumerate(bases):
+        missing = tuple(j for j, h in enumerate(hashes) if (*base, h) not in found)
+        if missing:
+            groups.setdefault(missing, []).append(i)
+
+    computed = {}
+    for indices, members in groups.items():
+        tasks = [
+            (_pack_windows([windows[i] for i in members[k:k + chunk_size]]), indices)
+            for k in range(0, len(members), chunk_size)
+        ]
+        for i, splits in zip(members, _run_tasks(tasks, patterns, workers, is_parallel(len(members)))):
+            for j, split in zip(indices, splits):
+                computed[(*bases[i], hashes[j])] = split
+    cache.put_many(computed)
+    found.update(computed)
+
+    results = []
+    for base in bases:
+        splits = [found[(*base, h)] for h in hashes]
+        results.append([m for split in splits for m in split[0]] + [m for split in splits for m in split[1]])
+    return results
+
+
+def pre_screen_stocks(
+    stocks_kline_data: Dict[str, List[Dict]],
+    patterns: List[Dict],
+    workers: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    use_cache: bool = True,
+) -> List[str]:
+    """程序化预选股票（先查匹配结果缓存；股票数较多时自动分片到进程池并行匹配）
+
+    匹配前在本批数据的抽样上校准各模式的检查阶段顺序，匹配后打印逐阶段通过率。
+    """
+    codes = list(stocks_kline_data.keys())
+    klines = [stocks_kline_data[c] for c in codes]
+    if CASCADE_CALIBRATION_SAMPLE > 0 and klines:
+        step = max(1, len(klines) // CASCADE_CALIBRATION_SAMPLE)
+        calibrate_cascades(klines[::step][:CASCADE_CALIBRATION_SAMPLE], patterns)
+    reset_stats()
+
+    cache = get_match_cache() if use_cache else None
+    results = match_stocks(klines, patterns, workers, chunk_size, codes, cache)
+
+    for name, stages in cascade_stats().items():
+        if stages and stages[0]["evaluated"]:
+            summary = " → ".join(
+                f"{st['stage']} {st['pass_rate']:.0%}" if st["pass_rate"] is not None else f"{st['stage']} -"
+                for st in stages
+            )
+            print(f"   [级联] {name} ({stages[0]['evaluated']}只): {summary}")
+    return [code for code, matched in zip(codes, results) if len(matched) >= 1]
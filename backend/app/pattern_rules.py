@@ -0,0 +1,457 @@
+"""模式规则 DSL - 声明式规则一次编译为向量化 NumPy 求值器
+
+规则使用 JSON 描述，可直接写在模式定义的 ``rules`` 字段中（经典模式与 AI 模式通用）：
+
+    {
+        "window": 30,            # 匹配时只取最近 N 根 K 线（可选）
+        "min_bars": 10,          # 最少 K 线数量（可选）
+        "confidence": 0.6,       # 命中置信度（可选）
+        "when": <条件表达式>
+    }
+
+序列表达式（对每根 K 线求值，返回等长数组）：
+    "close"                                  列名: open/high/low/close/volume/pct_change/avg_volume/volume_ratio
+    1.5                                      常数
+    {"param": "breakout_rise.min"}           引用模式 parameters（点号路径，列表用下标）
+    {"lag": expr, "n": 1}                    向前平移 n 根
+    {"mean": expr, "n": 20, "lag": 1}        滚动聚合: mean/max/min/std/sum/argmin/argmax/drawdown
+                                             （argmin/argmax 返回极值距今的K线数，drawdown 为窗口内最大回撤）
+    {"change": expr, "n": 5}                 n 日变化率 expr / lag(expr, n) - 1
+    {"add"|"sub"|"mul"|"div": [a, b]}        四则运算
+    {"abs": expr}
+
+条件表达式（返回布尔数组）：
+    {">=": [a, b]}                           比较: > >= < <= ==
+    {"between": [x, lo, hi]}
+    {"all": [...]} / {"any": [...]} / {"not": cond}
+    {"count": cond, "n": 10, "min": 6}       最近 n 根中满足次数 ≥ min（或 "ratio": 0.6）
+    {"streak": cond, "min": 3}               截至当日连续满足 ≥ min 根
+    {"within": cond, "n": 3}                 最近 n 根内至少满足一次
+    {"seq": [c1, c2, ...], "gap": 5}         c1 之后 gap 根内出现 c2，依此类推，最后一个条件落在当日
+"""
+
+import hashlib
+import json
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from .indicators import BASE_COLUMNS, IndicatorBundle, rolling as _rolling, shift as _shift
+
+_ROLLING_OPS = ("mean", "max", "min", "std", "sum", "argmin", "argmax", "drawdown")
+_ARITH_OPS = {
+    "add": np.add,
+    "sub": np.subtract,
+    "mul": np.multiply,
+    "div": np.divide,
+}
+_CMP_OPS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+}
+
+# 经典模式的 DSL 表达（参数引用 classic_patterns.json 中的 parameters）
+# 与手写匹配器等价的向量化近似，便于全历史扫描
+CLASSIC_RULES: Dict[str, Dict] = {
+    "P001": {
+        "window": 30,
+        "min_bars": 6,
+        "confidence": 0.85,
+        "when": {
+            "within": {
+                "all": [
+                    {">=": ["volume_ratio", {"param": "breakout_volume_ratio.min"}]},
+                    {">=": ["pct_change", {"param": "breakout_rise.min"}]},
+                    {"<=": [
+                        {"div": [
+                            {"sub": [
+                                {"max": "high", "n": {"param": "consolidation_days.min"}, "lag": 1},
+                                {"min": "low", "n": {"param": "consolidation_days.min"}, "lag": 1},
+                            ]},
+                            {"mean": "close", "n": {"param": "consolidation_days.min"}, "lag": 1},
+                        ]},
+                        {"param": "price_range_during_consolidation.max"},
+                    ]},
+                    {"<=": [
+                        {"mean": "volume_ratio", "n": {"param": "consolidation_days.min"}, "lag": 1},
+                        {"param": "volume_shrink_ratio.max"},
+                    ]},
+                ]
+            },
+            "n": 3,
+        },
+    },
+    "P002": {
+        "window": 30,
+        "min_bars": 5,
+        "confidence": 0.80,
+        "when": {
+            "all": [
+                {">=": [{"drawdown": "close", "n": 30, "min_periods": 5}, {"param": "decline_amplitude.min"}]},
+                {">=": [
+                    {"sub": [{"div": ["close", {"min": "close", "n": 30, "min_periods": 5}]}, 1]},
+                    {"param": "rebound_rise.min"},
+                ]},
+                {">=": [{"argmin": "close", "n": 30, "min_periods": 5}, {"param": "rebound_days.min"}]},
+            ]
+        },
+    },
+    "P003": {
+        "window": 30,
+        "min_bars": 6,
+        "confidence": 0.90,
+        "when": {
+            "all": [
+                {"streak": {">=": ["pct_change", {"param": "daily_rise.min"}]}, "min": {"param": "continuous_days.min"}},
+                {">=": [{"sum": "pct_change", "n": {"param": "continuous_days.min"}}, {"param": "total_rise.min"}]},
+                {"count": {">=": ["volume_ratio", {"param": "daily_volume_ratio.min"}]},
+                 "n": {"param": "continuous_days.min"}, "ratio": 0.6},
+                {">=": [{"max": "volume_ratio", "n": {"param": "continuous_days.min"}},
+                        {"param": "max_volume_ratio.min"}]},
+            ]
+        },
+    },
+}
+
+
+class CompiledRule:
+    """编译后的规则：对整段K线一次性求值，返回逐日命中数组"""
+
+    def __init__(self, rule: Dict, evaluator: Callable, fingerprint: str,
+                 stages: Optional[Dict[str, Callable]] = None):
+        self.rule = rule
+        self.window = rule.get("window")
+        self.min_bars = int(rule.get("min_bars", 1))
+        self.confidence = float(rule.get("confidence", 0.5))
+        self.fingerprint = fingerprint
+        self._evaluator = evaluator
+        # 顶层 all 的各子条件：供谓词级联逐个判定最后一根K线并提前退出
+        self._stages = stages or {"when": evaluator}
+
+    def evaluate(self, columns: Mapping[str, np.ndarray]) -> np.ndarray:
+        """对每根K线求值（全历史向量化扫描）"""
+        memo: Dict[str, np.ndarray] = {}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = self._evaluator(columns, memo)
+        return np.asarray(result, dtype=bool)
+
+    def match(self, columns: Mapping[str, np.ndarray]) -> bool:
+        """判断最后一根K线（as-of 日）是否命中"""
+        checks = self.checks(columns)
+        return checks is not None and all(check() for check in checks.values())
+
+    def checks(self, columns: Mapping[str, np.ndarray]) -> Optional[Dict[str, Callable[[], bool]]]:
+        """最后一根K线的分阶段检查 {阶段名: 检查函数}（各子条件共享中间结果），K线不足时返回 None"""
+        length = len(columns["close"])
+        if length < self.min_bars or length == 0:
+            return None
+        if self.window and length > self.window:
+            columns = columns.tail(self.window) if hasattr(columns, "tail") else _TailView(columns, self.window)
+        memo: Dict[str, np.ndarray] = {}
+
+        def check(part: Callable) -> bool:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                hits = np.asarray(part(columns, memo), dtype=bool)
+            return bool(hits[-1]) if hits.ndim else bool(hits)
+
+        return {name: (lambda part=part: check(part)) for name, part in self._stages.items()}
+
+
+def columns_from_frame(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """从已排序的K线 DataFrame 构造列字典（补齐常用派生列）"""
+    columns = {
+        col: df[col].to_numpy(dtype=float)
+        for col in df.columns
+        if col != "date" and pd.api.types.is_numeric_dtype(df[col])
+    }
+    close = columns["close"]
+    volume = columns["volume"]
+    if "pct_change" not in columns:
+        prev = np.concatenate(([np.nan], close[:-1]))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            columns["pct_change"] = close / prev - 1
+    if "avg_volume" not in columns:
+        columns["avg_volume"] = _rolling(volume, min(20, len(volume)), "mean", min(5, len(volume)))
+    if "volume_ratio" not in columns:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            columns["volume_ratio"] = volume / columns["avg_volume"]
+    return columns
+
+
+def rule_for_pattern(pattern: Dict) -> Optional[Dict]:
+    """获取模式的 DSL 规则（显式 rules 优先，其次是经典模式内置规则）"""
+    rules = pattern.get("rules")
+    if rules:
+        return rules
+    return CLASSIC_RULES.get(pattern.get("pattern_id", ""))
+
+
+# 规则可引用的列（IndicatorView 提供的基础列与派生列）
+RULE_COLUMNS = BASE_COLUMNS + ("pct_change", "avg_volume", "volume_ratio")
+
+# 指纹 → 编译结果；编译失败的定义只缓存错误信息（每次抛出新的 ValueError），不再重复编译
+_compiled_cache: Dict[str, Any] = {}
+
+
+def compile_rule(rule: Dict, params: Optional[Dict] = None) -> CompiledRule:
+    """编译规则（按规则+参数指纹缓存，同一定义只编译一次）
+
+    Raises:
+        ValueError: 规则结构非法，或引用了不存在的参数、不在 RULE_COLUMNS 中的列
+    """
+    params = params or {}
+    fingerprint = hashlib.sha1(
+        json.dumps([rule, params], sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    ).hexdigest()
+    cached = _compiled_cache.get(fingerprint)
+    if isinstance(cached, str):
+        raise ValueError(cached)
+    if cached is not None:
+        return cached
+    try:
+        if "when" not in rule:
+            raise ValueError("规则缺少 when 条件")
+        compiler = _Compiler(params)
+        evaluator = compiler.condition(rule["when"])
+        stages = None
+        if isinstance(rule["when"], dict) and list(rule["when"]) == ["all"]:
+            stages = {f"all[{i}]": compiler.condition(c) for i, c in enumerate(rule["when"]["all"])}
+    except ValueError as e:
+        _compiled_cache[fingerprint] = str(e)
+        raise
+    compiled = CompiledRule(rule, evaluator, fingerprint, stages)
+    _compiled_cache[fingerprint] = compiled
+    return compiled
+
+
+def compile_pattern(pattern: Dict) -> Optional[CompiledRule]:
+    """编译模式的规则，无规则时返回 None"""
+    rule = rule_for_pattern(pattern)
+    if not rule:
+        return None
+    return compile_rule(rule, pattern.get("parameters", {}))
+
+
+def scan_history(kline_data: List[Dict], pattern: Dict) -> List[str]:
+    """在整段历史上扫描模式，返回命中日期列表"""
+    compiled = compile_pattern(pattern)
+    if compiled is None or not kline_data:
+        return []
+    bundle = IndicatorBundle(kline_data)
+    hits = compiled.evaluate(bundle.view("classic"))
+    hits[: compiled.min_bars - 1] = False
+    return [str(d)[:10] for d in bundle.dates[hits]]
+
+
+# ---------- 编译器 ----------
+class _Compiler:
+    def __init__(self, params: Dict):
+        self.params = params
+
+    def _resolve_param(self, path: str) -> Any:
+        value: Any = self.params
+        for part in str(path).split("."):
+            if isinstance(value, dict) and part in value:
+                value = value[part]
+            elif isinstance(value, (list, tuple)) and part.isdigit() and int(part) < len(value):
+                value = value[int(part)]
+            else:
+                raise ValueError(f"规则引用了不存在的参数: {path}")
+        return value
+
+    def _scalar(self, node: Any) -> float:
+        if isinstance(node, dict) and "param" in node:
+            node = self._resolve_param(node["param"])
+        if isinstance(node, bool) or not isinstance(node, (int, float)):
+            raise ValueError(f"需要数值: {node!r}")
+        return float(node)
+
+    def _int(self, node: Any) -> int:
+        value = int(round(self._scalar(node)))
+        if value < 1:
+            raise ValueError(f"窗口长度必须 ≥1: {node!r}")
+        return value
+
+    @staticmethod
+    def _memo(key: str, fn: Callable) -> Callable:
+        def run(columns, memo):
+            if key not in memo:
+                memo[key] = fn(columns, memo)
+            return memo[key]
+        return run
+
+    @staticmethod
+    def _key(*parts: Any) -> str:
+        return json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+
+    # ----- 序列 -----
+    def series(self, node: Any) -> Callable:
+        if isinstance(node, str):
+            name = node
+            if name not in RULE_COLUMNS:
+                raise ValueError(f"规则引用了不存在的列: {name}（可用: {', '.join(RULE_COLUMNS)}）")
+            return self._memo(self._key("col", name), lambda cols, memo: _column(cols, name))
+        if isinstance(node, (int, float)) and not isinstance(node, bool):
+            value = float(node)
+            return lambda cols, memo: np.full(len(cols["close"]), value)
+        if not isinstance(node, dict):
+            raise ValueError(f"无法识别的序列表达式: {node!r}")
+
+        if "param" in node:
+            value = self._scalar(node)
+            return lambda cols, memo: np.full(len(cols["close"]), value)
+
+        for op in _ROLLING_OPS:
+            if op in node:
+                inner = self.series(node[op])
+                n = self._int(node.get("n", 20))
+                lag = int(self._scalar(node.get("lag", 0)))
+                min_periods = self._int(node["min_periods"]) if "min_periods" in node else None
+                key = self._key(op, node[op], n, lag, min_periods)
+
+                column = node[op] if isinstance(node[op], str) else None
+
+                def rolling(cols, memo, inner=inner, n=n, op=op, lag=lag, mp=min_periods, column=column):
+                    # 指标视图上的基础列滚动走共享缓存，多个模式复用
+                    if column is not None and hasattr(cols, "rolling"):
+                        return _shift(cols.rolling(column, n, op, mp), lag)
+                    return _shift(_rolling(inner(cols, memo), n, op, mp), lag)
+                return self._memo(key, rolling)
+
+        if "lag" in node:
+            inner = self.series(node["lag"])
+            n = self._int(node.get("n", 1))
+            return self._memo(self._key("lag", node["lag"], n), lambda cols, memo: _shift(inner(cols, memo), n))
+
+        if "change" in node:
+            inner = self.series(node["change"])
+            n = self._int(node.get("n", 1))
+            return lambda cols, memo: (lambda v: v / _shift(v, n) - 1)(inner(cols, memo))
+
+        for op, ufunc in _ARITH_OPS.items():
+            if op in node:
+                args = node[op]
+                if not isinstance(args, list) or len(args) != 2:
+                    raise ValueError(f"{op} 需要两个参数")
+                left, right = self.series(args[0]), self.series(args[1])
+                return lambda cols, memo, f=ufunc: f(left(cols, memo), right(cols, memo))
+
+        if "abs" in node:
+            inner = self.series(node["abs"])
+            return lambda cols, memo: np.abs(inner(cols, memo))
+
+        raise ValueError(f"无法识别的序列表达式: {node!r}")
+
+    # ----- 条件 -----
+    def condition(self, node: Any) -> Callable:
+        if not isinstance(node, dict) or not node:
+            raise ValueError(f"无法识别的条件表达式: {node!r}")
+
+        for op, ufunc in _CMP_OPS.items():
+            if op in node:
+                args = node[op]
+                if not isinstance(args, list) or len(args) != 2:
+                    raise ValueError(f"{op} 需要两个参数")
+                left, right = self.series(args[0]), self.series(args[1])
+                return lambda cols, memo, f=ufunc: f(left(cols, memo), right(cols, memo))
+
+        if "between" in node:
+            args = node["between"]
+            if not isinstance(args, list) or len(args) != 3:
+                raise ValueError("between 需要三个参数")
+            x, lo, hi = (self.series(a) for a in args)
+            return lambda cols, memo: (lambda v: (v >= lo(cols, memo)) & (v <= hi(cols, memo)))(x(cols, memo))
+
+        if "all" in node or "any" in node:
+            op = "all" if "all" in node else "any"
+            parts = [self.condition(c) for c in node[op]]
+            if not parts:
+                raise ValueError(f"{op} 至少需要一个条件")
+            reducer = np.logical_and if op == "all" else np.logical_or
+
+            def combine(cols, memo):
+                result = parts[0](cols, memo)
+                for part in parts[1:]:
+                    result = reducer(result, part(cols, memo))
+                return result
+            return combine
+
+        if "not" in node:
+            inner = self.condition(node["not"])
+            return lambda cols, memo: ~inner(cols, memo)
+
+        if "count" in node:
+            inner = self.condition(node["count"])
+            n = self._int(node.get("n", 1))
+            if "ratio" in node:
+                threshold = np.ceil(self._scalar(node["ratio"]) * n - 1e-9)
+            else:
+                threshold = self._scalar(node.get("min", 1))
+            return lambda cols, memo: _rolling(inner(cols, memo).astype(float), n, "sum") >= threshold
+
+        if "streak" in node:
+            inner = self.condition(node["streak"])
+            threshold = self._scalar(node.get("min", 1))
+            return lambda cols, memo: _streak(inner(cols, memo)) >= threshold
+
+        if "within" in node:
+            inner = self.condition(node["within"])
+            n = self._int(node.get("n", 1))
+            return lambda cols, memo: _within(inner(cols, memo), n)
+
+        if "seq" in node:
+            steps = [self.condition(c) for c in node["seq"]]
+            if not steps:
+                raise ValueError("seq 至少需要一个条件")
+            gap = self._int(node.get("gap", 1))
+
+            def sequence(cols, memo):
+                state = steps[0](cols, memo)
+                for step in steps[1:]:
+                    prior = _shift(state.astype(float), 1)
+                    state = step(cols, memo) & _within(np.nan_to_num(prior) > 0, gap)
+                return state
+            return sequence
+
+        raise ValueError(f"无法识别的条件表达式: {node!r}")
+
+
+# ---------- 向量化原语 ----------
+class _TailView(Mapping):
+    """只读视图：按需截取最后 N 根（不强制计算未使用的列）"""
+
+    def __init__(self, columns: Mapping[str, np.ndarray], window: int):
+        self._columns = columns
+        self._window = window
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._columns[name][-self._window:]
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+
+def _column(columns: Mapping[str, np.ndarray], name: str) -> np.ndarray:
+    try:
+        return np.asarray(columns[name], dtype=float)
+    except KeyError:
+        raise ValueError(f"规则引用了不存在的列: {name}")
+
+
+def _streak(mask: np.ndarray) -> np.ndarray:
+    mask = np.asarray(mask, dtype=bool)
+    idx = np.arange(len(mask))
+    last_false = np.maximum.accumulate(np.where(~mask, idx, -1))
+    return idx - last_false
+
+
+def _within(mask: np.ndarray, n: int) -> np.ndarray:
+    counts = _rolling(np.asarray(mask, dtype=float), n, "sum", 1)
+    return np.nan_to_num(counts) > 0
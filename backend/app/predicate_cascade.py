@@ -0,0 +1,134 @@
+"""谓词级联 - 把模式判定拆成有序的检查阶段，首个失败阶段即提前退出
+
+每个模式的判定被拆为若干相互独立的合取条件（阶段），任意顺序结果相同，
+因此可以按实测的选择性与耗时重新排序：最可能淘汰股票且最便宜的检查放在最前。
+
+用法：
+
+    cascade = get_cascade("AI001", ["final_volume", "volatility", ...])
+    cascade.run({"final_volume": lambda: ..., "volatility": lambda: ...})
+    cascade.calibrate(samples)           # samples: 每个样本的 {阶段名: 检查函数}
+    cascade_stats()                      # 各阶段通过率
+"""
+
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+Checks = Dict[str, Callable[[], bool]]
+
+
+class PredicateCascade:
+    """单个模式的有序检查阶段与逐阶段统计"""
+
+    def __init__(self, name: str, stages: Sequence[str]):
+        self.name = name
+        self.stages = list(stages)
+        self.order = list(stages)
+        self.evaluated = {stage: 0 for stage in stages}
+        self.passed = {stage: 0 for stage in stages}
+        self.cost = {stage: 0.0 for stage in stages}        # 校准得到的平均耗时（秒）
+        self.selectivity = {stage: 1.0 for stage in stages}  # 校准得到的通过率
+
+    def run(self, checks: Checks) -> bool:
+        """按当前顺序执行检查，遇到第一个失败阶段立即返回 False"""
+        for stage in self.order:
+            self.evaluated[stage] += 1
+            if not checks[stage]():
+                return False
+            self.passed[stage] += 1
+        return True
+
+    def calibrate(self, samples: Iterable[Checks]) -> List[str]:
+        """在近期数据上独立测量每个阶段的通过率与耗时，并据此重排
+
+        对相互独立的过滤条件，按 耗时 / (1 - 通过率) 升序执行时期望总耗时最小。
+        """
+        runs = {stage: 0 for stage in self.stages}
+        passes = {stage: 0 for stage in self.stages}
+        elapsed = {stage: 0.0 for stage in self.stages}
+        for checks in samples:
+            for stage in self.stages:
+                start = time.perf_counter()
+                ok = checks[stage]()
+                elapsed[stage] += time.perf_counter() - start
+                runs[stage] += 1
+                passes[stage] += bool(ok)
+        if not any(runs.values()):
+            return self.order
+
+        for stage in self.stages:
+            self.cost[stage] = elapsed[stage] / runs[stage]
+            self.selectivity[stage] = passes[stage] / runs[stage]
+
+        def rank(stage: str) -> float:
+            reject = 1.0 - self.selectivity[stage]
+            return self.cost[stage] / reject if reject > 0 else float("inf")
+
+        self.order = sorted(self.stages, key=lambda s: (rank(s), self.stages.index(s)))
+        return self.order
+
+    def reset_stats(self):
+        for stage in self.stages:
+            self.evaluated[stage] = 0
+            self.passed[stage] = 0
+
+    def stats(self) -> List[Dict]:
+        """按执行顺序返回各阶段统计（pass_rate 为到达该阶段的样本中通过的比例）"""
+        return [
+            {
+                "stage": stage,
+                "evaluated": self.evaluated[stage],
+                "passed": self.passed[stage],
+                "pass_rate": self.passed[stage] / self.evaluated[stage] if self.evaluated[stage] else None,
+                "calibrated_pass_rate": self.selectivity[stage],
+                "calibrated_cost_us": self.cost[stage] * 1e6,
+            }
+            for stage in self.order
+        ]
+
+
+_cascades: Dict[str, PredicateCascade] = {}
+
+
+def get_cascade(name: str, stages: Sequence[str]) -> PredicateCascade:
+    """获取（或创建）命名级联；阶段集合变化（如规则被修改）时重建"""
+    cascade = _cascades.get(name)
+    if cascade is None or set(cascade.stages) != set(stages):
+        cascade = _cascades[name] = PredicateCascade(name, stages)
+    return cascade
+
+
+def cascade_stats() -> Dict[str, List[Dict]]:
+    return {name: cascade.stats() for name, cascade in _cascades.items()}
+
+
+def cascade_orders() -> Dict[str, List[str]]:
+    return {name: list(cascade.order) for name, cascade in _cascades.items()}
+
+
+def apply_cascade_orders(orders: Dict[str, List[str]]):
+    """应用已校准的阶段顺序（用于把主进程的校准结果同步到子进程）"""
+    for name, order in orders.items():
+        get_cascade(name, order).order = list(order)
+
+
+def snapshot_counts() -> Dict[str, Dict[str, List[int]]]:
+    return {
+        name: {stage: [c.evaluated[stage], c.passed[stage]] for stage in c.stages}
+        for name, c in _cascades.items()
+    }
+
+
+def merge_counts(counts: Dict[str, Dict[str, List[int]]]):
+    """合并子进程返回的阶段计数"""
+    for name, stages in counts.items():
+        cascade = get_cascade(name, list(stages))
+        for stage, (evaluated, passed) in stages.items():
+            cascade.evaluated[stage] += evaluated
+            cascade.passed[stage] += passed
+
+
+def reset_stats(name: Optional[str] = None):
+    for key, cascade in _cascades.items():
+        if name is None or key == name:
+            cascade.reset_stats()
@@ -0,0 +1,72 @@
+"""提示词装箱 - 按 token 预算把股票数据装入尽量少的请求，保证每只候选股票都被评估
+
+    packing = pack_by_budget(sizes, budget=8000, max_items=50)
+    packing.groups        # 每个请求包含的下标
+    packing.efficiency    # 实际装载 token / (请求数 × 预算)
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+
+class Packing:
+    """装箱结果"""
+
+    def __init__(self, groups: List[List[int]], budget: int, sizes: List[int], oversized: int = 0):
+        self.groups = groups
+        self.budget = budget
+        self.sizes = sizes
+        self.oversized = oversized  # 单个条目就超过预算、独占一个请求的数量
+
+    @property
+    def used_tokens(self) -> int:
+        return sum(self.sizes)
+
+    @property
+    def efficiency(self) -> float:
+        if not self.groups or self.budget <= 0:
+            return 0.0
+        return self.used_tokens / (len(self.groups) * self.budget)
+
+    def report(self) -> Dict:
+        return {
+            "items": len(self.sizes),
+            "requests": len(self.groups),
+            "budget_tokens": self.budget,
+            "payload_tokens": self.used_tokens,
+            "oversized": self.oversized,
+            "efficiency": round(self.efficiency * 100, 1),
+        }
+
+
+def pack_by_budget(sizes: Sequence[int], budget: int, max_items: Optional[int] = None) -> Packing:
+    """首次适应递减 (First-Fit Decreasing) 装箱
+
+    Args:
+        sizes: 每个条目的估算 token 数
+        budget: 单个请求可变部分的 token 预算
+        max_items: 单个请求最多条目数（限制输出长度），None 不限
+
+    Returns:
+        Packing，groups 内的下标按原始顺序排列
+    """
+    sizes = [int(s) for s in sizes]
+    bins: List[List[int]] = []
+    loads: List[int] = []
+    oversized = 0
+    for idx in sorted(range(len(sizes)), key=lambda i: -sizes[i]):
+        size = sizes[idx]
+        if size > budget:
+            oversized += 1
+            bins.append([idx])
+            loads.append(size)
+            continue
+        for b, load in enumerate(loads):
+            if load + size <= budget and (max_items is None or len(bins[b]) < max_items):
+                bins[b].append(idx)
+                loads[b] += size
+                break
+        else:
+            bins.append([idx])
+            loads.append(size)
+    groups = sorted((sorted(group) for group in bins), key=lambda g: g[0])
+    return Packing(groups=groups, budget=budget, sizes=sizes, oversized=oversized)
@@ -0,0 +1,96 @@
+"""量化特征批量计算 - 一次向量化计算全部候选股票的前端展示指标
+
+与 StockAnalyzer._calculate_quantitative_features（逐只股票的参考实现）输出逐项一致：
+
+    features = quantitative_features_batch(stock_data)   # {code: {'consolidationDays': ..., ...}}
+
+按股票取最近 window 天后，将天数相同的股票堆叠为 (股票数 × 天数) 矩阵，
+横盘天数、缺口检测等逐日回溯循环改为按行的累积乘积 / 反向 argmax。
+"""
+
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+
+def quantitative_features_batch(stock_data: pd.DataFrame, window: int = 30) -> Dict[str, Dict]:
+    """批量计算量化特征
+
+    Args:
+        stock_data: 多只股票的K线数据（需包含 code/date/high/low/close/volume 列）
+        window: 每只股票取最近的天数
+
+    Returns:
+        {股票代码: 量化特征字典}，不足5天的股票为空字典
+    """
+    if stock_data.empty:
+        return {}
+    ordered = stock_data.sort_values(['code', 'date'], kind='stable')
+    recent = ordered.groupby('code', sort=False).tail(window)
+    lengths = recent.groupby('code', sort=False).size()
+
+    features: Dict[str, Dict] = {}
+    for length, group in lengths.groupby(lengths):
+        codes = list(group.index)
+        if length < 5:
+            features.update({code: {} for code in codes})
+            continue
+        # 数据已按 code、date 排序，同长度股票的行可直接整形为矩阵
+        rows = recent[recent['code'].isin(codes)]
+        shape = (len(codes), length)
+        block = _features_block(
+            rows['high'].values.reshape(shape),
+            rows['low'].values.reshape(shape),
+            rows['close'].values.reshape(shape),
+            rows['volume'].values.reshape(shape),
+        )
+        features.update(zip(rows['code'].values[::length], block))
+    return features
+
+
+def _features_block(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray, volumes: np.ndarray):
+    """对 (股票数 × 天数) 矩阵逐行计算特征，返回与行顺序一致的字典列表"""
+    n, days = closes.shape
+
+    # 成交量
+    avg_volume = volumes.mean(axis=1)
+    recent_5_avg = volumes[:, -5:].mean(axis=1)
+    if days >= 15:
+        avg_volume_before = volumes[:, :15].mean(axis=1)
+        avg_volume_during = volumes[:, 15:].mean(axis=1)
+    else:
+        avg_volume_before = avg_volume_during = avg_volume
+
+    # 振幅：(最高-最低)/最低
+    low_min = lows.min(axis=1)
+    amplitude = (highs.max(axis=1) - low_min) / low_min * 100
+
+    # 横盘天数：从最后一天往前连续日涨跌幅 < 3% 的天数
+    calm = np.abs((closes[:, 1:] - closes[:, :-1]) / closes[:, :-1]) < 0.03
+    consolidation = np.cumprod(calm[:, ::-1], axis=1).sum(axis=1)
+
+    # 最近一次缺口（今日最低 > 昨日最高）
+    gaps = lows[:, 1:] > highs[:, :-1]
+    has_gap = gaps.any(axis=1)
+    days_ago = np.argmax(gaps[:, ::-1], axis=1)  # 距最后一天的天数
+    last = days - 2 - days_ago                    # 缺口前一天的下标
+    rows = np.arange(n)
+    prev_high = highs[rows, last]
+    gap_size = (lows[rows, last + 1] - prev_high) / prev_high * 100
+
+    results = []
+    for i in range(n):
+        volume_ratio = recent_5_avg[i] / avg_volume[i] if avg_volume[i] > 0 else 1.0
+        gap = float(gap_size[i]) if has_gap[i] else 0.0
+        results.append({
+            'consolidationDays': int(consolidation[i]) if consolidation[i] >= 3 else 0,
+            'avgVolumeBefore': round(float(avg_volume_before[i]), 2),
+            'avgVolumeDuring': round(float(avg_volume_during[i]), 2),
+            'volumeRatio': round(float(volume_ratio), 2),
+            'gapSize': round(gap, 2) if gap > 0 else 0,
+            'daysAfterGap': int(days_ago[i]) if gap > 0 else 0,
+            'amplitude': round(float(amplitude[i]), 2),
+            'recent5DaysAvgVolume': round(float(recent_5_avg[i]), 2),
+        })
+    return results
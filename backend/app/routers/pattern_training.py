@@ -13,8 +13,10 @@ import numpy as np
 import pandas as pd
 from fastapi import APIRouter, BackgroundTasks, HTTPException
 
+from app.claude_client import create_client
 from app.database import StockDatabase
-from app.pattern_matcher import load_classic_patterns, match_all_patterns
+from app.match_cache import get_match_cache
+from app.pattern_matcher import load_classic_patterns, match_stocks
 from app.models import TrainingRequest
 
 router = APIRouter(prefix="/api/training", tags=["Pattern Training"])
@@ -100,8 +102,13 @@ async def filter_special_samples(request: TrainingRequest, background_tasks: Bac
 
             special_samples: List[Dict[str, Any]] = []
             classic_samples: List[Dict[str, Any]] = []
-            for i, sample in enumerate(samples_with_context):
-                matched = match_all_patterns(sample["kline_data"], patterns)
+            all_matched = match_stocks(
+                [s["kline_data"] for s in samples_with_context],
+                patterns,
+                codes=[s["code"] for s in samples_with_context],
+                cache=get_match_cache(),
+            )
+            for i, (sample, matched) in enumerate(zip(samples_with_context, all_matched)):
                 if len(matched) == 0:
                     special_samples.append(
                         {
@@ -316,7 +323,6 @@ async def extract_ai_patterns(background_tasks: BackgroundTasks):
 
     def task():
         try:
-            import anthropic
             from dotenv import load_dotenv
 
             training_status["extract_ai_patterns"].update(running=True, progress=10, message="加载环境...")
@@ -324,7 +330,7 @@ async def extract_ai_patterns(background_tasks: BackgroundTasks):
             env_path = _root_path("backend", ".env")
             if os.path.exists(env_path):
                 load_dotenv(env_path)
-            api_key = os.environ.get("ANTHROPIC_API_KEY")
+            client = create_client(os.environ.get("ANTHROPIC_API_KEY"))
 
             clustered_file = _root_path("clustered_samples.json")
             if not os.path.exists(clustered_file):
@@ -339,7 +345,7 @@ async def extract_ai_patterns(background_tasks: BackgroundTasks):
 
             def analyze_cluster(cluster_id: int, cluster_samples: List[Dict[str, Any]], cluster_stats: Dict[str, Any]):
                 # 无 API Key 时返回占位模式
-                if not api_key:
+                if client is None:
                     return {
                         "pattern_name": f"AI模式{cluster_id}",
                         "description": "占位：未配置 API Key",
@@ -351,7 +357,6 @@ async def extract_ai_patterns(background_tasks: BackgroundTasks):
                         "cluster_stats": cluster_stats,
                         "match_rules": [],
                     }
-                client = anthropic.Anthropic(api_key=api_key)
                 prompt = f"""你是资深量化分析师，请基于簇特征提取可编程的模式定义：
 簇大小: {len(cluster_samples)}
 簇特征: {json.dumps(cluster_stats, ensure_ascii=False)}
@@ -504,6 +509,7 @@ async def validate_patterns(background_tasks: BackgroundTasks):
             stats: Dict[str, Dict[str, Any]] = {}
             processed = 0
 
+            prepared = []
             for sample in samples:
                 code = sample["code"]
                 base_date = sample["date"]
@@ -527,8 +533,16 @@ async def validate_patterns(background_tasks: BackgroundTasks):
                     )
                 if len(kline_data) < 10:
                     continue
-
-                matched = match_all_patterns(kline_data, patterns)
+                prepared.append((code, base_date, kline_data))
+
+            # 先收集K线再批量匹配（命中缓存的窗口直接复用，样本多时自动并行）
+            all_matched = match_stocks(
+                [kline for _, _, kline in prepared],
+                patterns,
+                codes=[code for code, _, _ in prepared],
+                cache=get_match_cache(),
+            )
+            for (code, base_date, _), matched in zip(prepared, all_matched):
                 if not matched:
                     continue
 
@@ -37,14 +37,15 @@ class PatternScheduler:
             patterns = self._load_patterns()
             print(f"   加载了 {len(patterns)} 个模式")
 
-            # 预测（启用程序预筛选）
+            # 预测（启用程序预筛选；定时任务不需要即时结果，走 Message Batches 离线模式）
             print("\n3. 开始预测...")
             predictions = self.analyzer.predict_stock_probability(
                 stock_data,
                 patterns,
                 batch_size=30,
                 use_pre_screening=True,
-                pattern_file='classic_patterns.json'
+                pattern_file='classic_patterns.json',
+                mode='batch'
             )
 
             print(f"\n4. 预测完成，共 {len(predictions)} 只股票")
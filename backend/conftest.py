@@ -0,0 +1,109 @@
+"""
+测试共用的 Claude 模拟客户端与测试数据（以 fixture 提供，不调用真实 API）
+"""
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.analyzer import StockAnalyzer
+from app.claude_executor import ClaudeExecutor, RateLimiter, content_text, estimate_tokens
+from app.claude_retry import CircuitBreaker
+
+
+class SlowClient:
+    """模拟 messages.create：固定延迟，记录最大并发数"""
+
+    def __init__(self, latency=0.2, respond=None):
+        self.latency = latency
+        self.respond = respond or (lambda prompt: "[]")
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.messages = SimpleNamespace(create=self.create)
+
+    def create(self, model, max_tokens, messages, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+        self.last_content = messages[0]["content"]
+        prompt = content_text(self.last_content)
+        return SimpleNamespace(
+            content=[SimpleNamespace(text=self.respond(prompt))], stop_reason="end_turn",
+            usage=SimpleNamespace(input_tokens=estimate_tokens(prompt), output_tokens=10),
+        )
+
+
+def _make_analyzer(client, max_in_flight=4):
+    analyzer = StockAnalyzer(api_key=None, model="claude-3-5-haiku-20241022")
+    analyzer.client, analyzer.ai_enabled = client, True
+    analyzer.executor = ClaudeExecutor(max_in_flight)
+    analyzer.rate_limiter = RateLimiter(0, 0)
+    analyzer.circuit_breaker = CircuitBreaker()
+    analyzer.response_cache = None
+    return analyzer
+
+
+def _make_stock_data(n_codes, days=30):
+    rng = np.random.default_rng(0)
+    rows = []
+    for c in range(n_codes):
+        closes = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, days)))
+        for d, date in enumerate(pd.date_range("2025-01-01", periods=days)):
+            rows.append({"code": f"{c:06d}", "name": f"股票{c}", "date": date.strftime("%Y-%m-%d"),
+                         "open": closes[d], "high": closes[d] * 1.01, "low": closes[d] * 0.99,
+                         "close": closes[d], "volume": 1000.0})
+    return pd.DataFrame(rows)
+
+
+def _make_validation_data(n=20):
+    return pd.DataFrame([
+        {"code": f"{i % 4:06d}", "date": f"2025-01-{20 + i % 10:02d}", "open": 10.0, "high": 10.5, "low": 9.8,
+         "close": 10.2, "volume": 1000.0, "day2_close": 10.5, "day3_close": 11.2,
+         "rise_pct": 9.8 if i % 2 else 1.0, "is_success": i % 2}
+        for i in range(n)
+    ])
+
+
+def _predict_all(params):
+    """为提示词中出现的每只股票返回一条预测"""
+    codes = sorted(set(re.findall(r"^#(\d{6}) ", content_text(params["messages"][0]["content"]), re.M)))
+    return json.dumps([{"code": c, "name": "", "probability": 70 + i, "reason": "r"} for i, c in enumerate(codes)])
+
+
+@pytest.fixture
+def slow_client():
+    """SlowClient 工厂：slow_client(latency=0.2, respond=None)"""
+    return SlowClient
+
+
+@pytest.fixture
+def make_analyzer():
+    """分析器工厂：make_analyzer(client, max_in_flight=4)，不限速、不使用响应缓存"""
+    return _make_analyzer
+
+
+@pytest.fixture
+def make_stock_data():
+    """K线数据工厂：make_stock_data(n_codes, days=30)，股票代码 000000 起连续编号"""
+    return _make_stock_data
+
+
+@pytest.fixture
+def make_validation_data():
+    """验证样本工厂：make_validation_data(n=20)，奇数行上涨达标"""
+    return _make_validation_data
+
+
+@pytest.fixture
+def predict_all():
+    """Message Batches / 模拟客户端的响应函数：为请求中的每只股票返回一条预测"""
+    return _predict_all
@@ -0,0 +1,72 @@
+"""Claude 调用吞吐压测 - 使用本地模拟客户端，无网络、无费用，同一 seed 结果可复现
+
+用法：
+    python scripts/benchmark_claude.py --stocks 200 --latency 0.8 --rate-limit 0.05 --in-flight 4
+"""
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import pandas as pd
+
+from app.analyzer import StockAnalyzer
+from app.claude_client import FakeClaudeClient
+from app.claude_executor import ClaudeExecutor, RateLimiter
+
+
+def make_stock_data(n_codes: int, days: int = 30, seed: int = 0) -> pd.DataFrame:
+    """生成随机游走K线"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    dates = pd.date_range("2025-01-01", periods=days).strftime("%Y-%m-%d")
+    for c in range(n_codes):
+        closes = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, days)))
+        frames.append(pd.DataFrame({
+            "code": f"{c:06d}", "name": f"股票{c}", "date": dates, "open": closes * 0.995,
+            "high": closes * 1.01, "low": closes * 0.99, "close": closes,
+            "volume": rng.uniform(1e5, 1e6, days),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟客户端下的预测吞吐压测")
+    parser.add_argument("--stocks", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.8, help="延迟中位数（秒）")
+    parser.add_argument("--sigma", type=float, default=0.4, help="延迟对数正态 sigma")
+    parser.add_argument("--errors", type=float, default=0.0, help="529 比例")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="429 比例")
+    parser.add_argument("--in-flight", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=0)
+    parser.add_argument("--tpm", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    client = FakeClaudeClient(latency=args.latency, latency_sigma=args.sigma, error_rate=args.errors,
+                              rate_limit_rate=args.rate_limit, seed=args.seed)
+    analyzer = StockAnalyzer(api_key=None, client=client)
+    analyzer.response_cache = None
+    analyzer.executor = ClaudeExecutor(args.in_flight)
+    analyzer.rate_limiter = RateLimiter(args.rpm, args.tpm)
+
+    stock_data = make_stock_data(args.stocks, seed=args.seed)
+    patterns = [{"pattern_name": f"模式{i}", "description": "压测模式"} for i in range(8)]
+
+    start = time.monotonic()
+    predictions = analyzer.predict_stock_probability(stock_data, patterns, batch_size=args.batch_size,
+                                                     use_pre_screening=False)
+    elapsed = time.monotonic() - start
+
+    stats = analyzer.get_api_statistics()
+    print(f"\n耗时 {elapsed:.2f}s，请求 {client.calls} 次（成功 {stats['total_calls']}，"
+          f"529 {client.errors}，429 {client.rate_limited}），峰值并发 {client.max_in_flight}")
+    print(f"吞吐 {stats['total_calls'] / elapsed:.2f} 请求/秒，预测 {len(predictions)} 条，"
+          f"输入 {stats['input_tokens']} + 缓存读 {stats['cache_read_input_tokens']} tokens")
+
+
+if __name__ == '__main__':
+    main()
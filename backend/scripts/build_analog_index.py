@@ -0,0 +1,45 @@
+"""构建历史相似走势检索索引 - 增量：只嵌入上次构建之后新增交易日结尾的窗口
+
+用法：
+    python scripts/build_analog_index.py                    # config.ANALOG_WINDOWS 中的全部窗口
+    python scripts/build_analog_index.py --window 20 --query 600000
+"""
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app.analog_index import build_analog_index
+from app.config import ANALOG_INDEX_DIR, ANALOG_TOP_K, ANALOG_WINDOWS
+from app.database import StockDatabase
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建相似检索索引")
+    parser.add_argument("--window", type=int, action="append", help="窗口长度（可重复，默认全部）")
+    parser.add_argument("--dir", default=ANALOG_INDEX_DIR, help="索引保存目录")
+    parser.add_argument("--query", default=None, help="构建后查询该股票的相似窗口")
+    parser.add_argument("--k", type=int, default=ANALOG_TOP_K)
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    db = StockDatabase(db_path=os.path.join(script_dir, '..', '..', 'data', 'stocks.db'))
+    for window in args.window or ANALOG_WINDOWS:
+        start = time.monotonic()
+        index = build_analog_index(db, window, directory=args.dir)
+        print(f"   耗时 {time.monotonic() - start:.1f}s，{index.stats()}")
+        if not args.query:
+            continue
+        start = time.monotonic()
+        result = index.query_stock(args.query, k=args.k)
+        print(f"\n{result['code']} {result['name']} {result['start_date']} ~ {result['end_date']}"
+              f"（查询 {(time.monotonic() - start) * 1000:.1f}ms）")
+        for match in result['matches']:
+            print(f"   {match['similarity']:.3f}  {match['code']} {match['name']}  "
+                  f"{match['start_date']} ~ {match['end_date']}  后续 {match['forward_returns']}")
+        print(f"   汇总 {result['summary']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""提示词编码对比 - 统计同一批股票K线在 JSON 与紧凑编码下的 token 数
+
+用法：
+    python scripts/compare_prompt_encoding.py            # 本地估算 token
+    python scripts/compare_prompt_encoding.py --api      # 调用 messages.count_tokens 精确计数（需 ANTHROPIC_API_KEY）
+"""
+import argparse
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app.config import get_model_id
+from app.database import StockDatabase
+from app.kline_codec import compare_encodings
+
+
+def api_token_counter():
+    """返回调用 Anthropic token 计数接口的函数"""
+    from anthropic import Anthropic
+
+    client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    model = get_model_id()
+
+    def count(text: str) -> int:
+        result = client.messages.count_tokens(model=model, messages=[{"role": "user", "content": text}])
+        return result.input_tokens
+
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比K线 JSON 与紧凑编码的 token 数")
+    parser.add_argument("--stocks", type=int, default=20, help="抽样股票数")
+    parser.add_argument("--days", type=int, default=30, help="每只股票的天数")
+    parser.add_argument("--api", action="store_true", help="使用 API 精确计数")
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    db = StockDatabase(db_path=os.path.join(script_dir, '..', '..', 'data', 'stocks.db'))
+    count_tokens = api_token_counter() if args.api else None
+
+    json_total = compact_total = 0
+    for code in db.get_all_stock_codes()[:args.stocks]:
+        df = db.get_stock_data(code, days=args.days).sort_values('date')
+        if df.empty:
+            continue
+        name = df['name'].iloc[0] if 'name' in df.columns else code
+        records = df[['date', 'open', 'high', 'low', 'close', 'volume']].to_dict('records')
+        report = compare_encodings(records, code, name, count_tokens=count_tokens)
+        json_total += report['json_tokens']
+        compact_total += report['compact_tokens']
+        print(f"{code} {name}: JSON {report['json_tokens']:>6}  紧凑 {report['compact_tokens']:>5}  ({report['ratio']:.1%})")
+
+    if json_total:
+        print(f"\n合计: JSON {json_total} tokens → 紧凑 {compact_total} tokens，"
+              f"节省 {1 - compact_total / json_total:.1%}")
+    else:
+        print("⚠️  数据库中没有K线数据")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,19 +6,22 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 import json
-import anthropic
 from dotenv import load_dotenv
 
+from app.claude_client import create_client
+from app.pattern_rules import compile_rule
+
 # 加载.env文件
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
 
-def analyze_cluster_with_ai(cluster_samples, cluster_id, cluster_stats):
+def analyze_cluster_with_ai(cluster_samples, cluster_id, cluster_stats, client=None):
     """使用Claude Sonnet 4.5分析簇样本,提取模式
 
     Args:
         cluster_samples: 簇样本列表（包含完整K线数据）
         cluster_id: 簇ID
         cluster_stats: 簇的统计特征
+        client: Claude 客户端（None 时按配置创建，CLAUDE_CLIENT=fake 为本地模拟）
 
     Returns:
         提取的模式定义字典
@@ -44,6 +47,16 @@ def analyze_cluster_with_ai(cluster_samples, cluster_id, cluster_stats):
    - description: Pattern description (Chinese)
    - parameters: Key parameters (thresholds, ratios, days, etc.)
    - match_rules: Matching rules (step-by-step description in Chinese)
+   - rules: The same matching rules in the declarative rule DSL below, so the pattern can be screened without new code
+
+**Rule DSL** (JSON, evaluated on every daily bar, the pattern matches when "when" is true on the last bar):
+- Series: column names "open"/"high"/"low"/"close"/"volume"/"pct_change"/"volume_ratio", numbers,
+  {{"param": "name"}} (reference to parameters, dotted path, list index like "range.0"),
+  {{"lag": series, "n": 1}}, rolling {{"mean"|"max"|"min"|"std"|"sum"|"argmin"|"argmax"|"drawdown": series, "n": 20, "lag": 1}},
+  {{"change": series, "n": 5}}, {{"add"|"sub"|"mul"|"div": [a, b]}}, {{"abs": series}}
+- Conditions: {{">"|">="|"<"|"<="|"==": [a, b]}}, {{"between": [x, lo, hi]}}, {{"all": [...]}}, {{"any": [...]}}, {{"not": cond}},
+  {{"count": cond, "n": 10, "min": 6}}, {{"streak": cond, "min": 3}}, {{"within": cond, "n": 3}}, {{"seq": [c1, c2], "gap": 5}}
+- Top level: {{"window": 30, "min_bars": 10, "confidence": 0.6, "when": cond}}
 
 **Notes**:
 - Pattern must be reproducible and programmatically implementable
@@ -54,7 +67,9 @@ Please output the pattern definition in JSON format directly, no other text.
 """
 
     # 调用Claude API
-    client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+    client = client or create_client(os.environ.get("ANTHROPIC_API_KEY"))
+    if client is None:
+        raise ValueError("未配置 ANTHROPIC_API_KEY（可设置 CLAUDE_CLIENT=fake 使用本地模拟客户端）")
 
     message = client.messages.create(
         model="claude-sonnet-4-20250514",
@@ -79,6 +94,14 @@ Please output the pattern definition in JSON format directly, no other text.
 
     pattern = json.loads(response_text)
 
+    # 校验 DSL 规则，无法编译时丢弃（模式仍保留，仅无法程序化筛选）
+    if pattern.get("rules"):
+        try:
+            compile_rule(pattern["rules"], pattern.get("parameters", {}))
+        except ValueError as e:
+            print(f"  ! Invalid rules dropped: {e}")
+            pattern.pop("rules")
+
     # 添加元数据
     pattern["pattern_id"] = f"AI{cluster_id:03d}"
     pattern["pattern_type"] = "ai_discovered"
@@ -114,6 +137,7 @@ def main():
 
     print("Starting AI pattern extraction...")
     print(f"API Key configured: {'ANTHROPIC_API_KEY' in os.environ}")
+    client = create_client(os.environ.get("ANTHROPIC_API_KEY"))
 
     new_patterns = []
     total_cost = 0
@@ -143,7 +167,7 @@ def main():
 
         # 用AI提取模式
         try:
-            pattern = analyze_cluster_with_ai(cluster_samples, cluster_id, cluster_stats)
+            pattern = analyze_cluster_with_ai(cluster_samples, cluster_id, cluster_stats, client=client)
             new_patterns.append(pattern)
 
             print(f"  OK Pattern extracted: {pattern['pattern_name']}")
@@ -0,0 +1,82 @@
+"""离线回放录制的 LLM 调用会话 - 无网络、无费用，用于复现性能与提示词回归
+
+用法：
+    python scripts/replay_llm_session.py --list
+    python scripts/replay_llm_session.py --session 20260101093000123456 --mode calls --speed 1 --in-flight 4
+    python scripts/replay_llm_session.py --mode predict          # 用数据库当前数据重跑预测，未命中即提示词有变化
+
+- calls：按录制顺序把每次调用的提示词重新发出（经过限速、重试与并发控制），speed=1 时按录制延迟等待，
+  用于对比不同并发/限速配置下的耗时。
+- predict：以数据库中的模式与最近30天数据重跑完整预测流水线，响应来自录制；
+  数据或提示词变化导致的未命中数量即提示词回归的范围。
+"""
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app.analyzer import StockAnalyzer
+from app.claude_executor import ClaudeExecutor, RateLimiter
+from app.database import StockDatabase
+from app.llm_replay import ReplayClaudeClient
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放录制的 LLM 调用会话")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data', 'stocks.db'))
+    parser.add_argument("--session", default=None, help="录制会话ID（默认最近一次）")
+    parser.add_argument("--mode", choices=["calls", "predict"], default="calls")
+    parser.add_argument("--speed", type=float, default=0.0, help="录制延迟的倍数，0 = 立即返回")
+    parser.add_argument("--in-flight", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=0)
+    parser.add_argument("--tpm", type=float, default=0)
+    parser.add_argument("--list", action="store_true", help="列出录制会话")
+    args = parser.parse_args()
+
+    db = StockDatabase(args.db)
+    if args.list:
+        for session in db.get_llm_sessions():
+            print(f"{session['session_id']}  {session['calls']:>4} 次调用  {','.join(session['tasks'])}  "
+                  f"输入 {session['input_tokens']} / 输出 {session['output_tokens']} tokens  "
+                  f"录制延迟合计 {session['latency_seconds']}s  {session['started_at']}")
+        return
+
+    calls = db.get_llm_calls(args.session)
+    if not calls:
+        print(f"❌ 没有找到录制的调用: {args.session or '最近一次录制'}")
+        return
+    print(f"⏪ 回放录制会话 {calls[0]['session_id']}（{len(calls)} 次调用，速度 ×{args.speed}）")
+
+    # 不传 db：回放不写入预测结果与调用录制
+    client = ReplayClaudeClient(calls, speed=args.speed)
+    analyzer = StockAnalyzer(api_key=None, client=client)
+    analyzer.response_cache = None
+    analyzer.executor = ClaudeExecutor(args.in_flight)
+    analyzer.rate_limiter = RateLimiter(args.rpm, args.tpm)
+
+    start = time.monotonic()
+    if args.mode == "calls":
+        responses = analyzer.executor.map(
+            lambda call: analyzer._call_claude_with_retry(call['prompt'], model=call['model'], task=call['task'],
+                                                          max_retries=1),
+            calls)
+        print(f"响应 {sum(r is not None for r in responses)}/{len(calls)} 次")
+    else:
+        patterns = db.get_patterns()
+        recent_data = db.get_recent_data_all_stocks(days=30)
+        predictions = analyzer.predict_stock_probability(recent_data, patterns)
+        print(f"预测 {len(predictions)} 条")
+    elapsed = time.monotonic() - start
+
+    stats = client.stats()
+    recorded_latency = sum(call['latency_seconds'] for call in calls)
+    print(f"\n耗时 {elapsed:.2f}s（录制延迟合计 {recorded_latency:.2f}s），峰值并发 {client.max_in_flight}")
+    print(f"回放 {stats['served']} 次，未命中 {stats['misses']} 次，未使用的录制 {stats['unused']} 条")
+    if stats['misses']:
+        print("⚠️  存在未命中：提示词或输入数据与录制时不同")
+
+
+if __name__ == '__main__':
+    main()
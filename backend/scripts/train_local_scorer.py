@@ -0,0 +1,58 @@
+"""训练本地统计评分模型 - 由数据库中的历史K线构造特征与 T+2 涨幅标签，保存为新版本
+
+用法：
+    python scripts/train_local_scorer.py                      # 默认 config.LOCAL_SCORER_MODEL
+    python scripts/train_local_scorer.py --model gbdt --step 2
+    python scripts/train_local_scorer.py --list               # 列出已保存的版本
+"""
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import pandas as pd
+
+from app.config import LOCAL_SCORER_BACKEND, LOCAL_SCORER_DIR, LOCAL_SCORER_MODEL
+from app.database import StockDatabase
+from app.local_scorer import LocalScorer, build_training_set, list_scorers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="训练本地评分模型")
+    parser.add_argument("--model", default=LOCAL_SCORER_MODEL, help="logistic | gbdt")
+    parser.add_argument("--backend", default=LOCAL_SCORER_BACKEND, help="auto | sklearn | numpy")
+    parser.add_argument("--days", type=int, default=500, help="每只股票使用最近多少天的K线")
+    parser.add_argument("--step", type=int, default=1, help="滑动窗口步长")
+    parser.add_argument("--dir", default=LOCAL_SCORER_DIR, help="模型保存目录")
+    parser.add_argument("--list", action="store_true", help="只列出已保存的版本")
+    args = parser.parse_args()
+
+    if args.list:
+        for entry in list_scorers(args.dir):
+            print(f"v{entry['version']}  {entry['created_at']}  {entry['model_type']}/{entry['backend']}  "
+                  f"{entry['metrics']}")
+        return
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    db = StockDatabase(db_path=os.path.join(script_dir, '..', '..', 'data', 'stocks.db'))
+    frames = [db.get_stock_data(code, days=args.days) for code in db.get_all_stock_codes()]
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        print("⚠️  数据库中没有K线数据")
+        return
+    stock_data = pd.concat(frames, ignore_index=True)
+
+    start = time.monotonic()
+    X, y, dates = build_training_set(stock_data, step=args.step)
+    print(f"训练样本 {len(y)} 条（正样本 {int(y.sum())}），构造耗时 {time.monotonic() - start:.1f}s")
+
+    start = time.monotonic()
+    scorer = LocalScorer.train(X, y, dates, model_type=args.model, backend=args.backend)
+    path = scorer.save(args.dir)
+    print(f"✅ 训练完成，耗时 {time.monotonic() - start:.1f}s，已保存 v{scorer.version}: {path}")
+    print(f"   指标: {scorer.metrics}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+历史相似走势检索单元测试
+"""
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.analog_index import AnalogIndex, build_analog_index, embed_windows, load_analog_index
+
+
+def make_stock_data(n_codes=30, days=120, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2025-01-01", periods=days).strftime("%Y-%m-%d")
+    frames = []
+    for c in range(n_codes):
+        closes = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, days)))
+        frames.append(pd.DataFrame({
+            "code": f"{c:06d}", "name": f"股票{c}", "date": dates, "open": closes, "high": closes * 1.01,
+            "low": closes * 0.99, "close": closes, "volume": rng.uniform(1e5, 1e6, days),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def plant_analog(data, source="000000", target="000001", target_end=59, window=20):
+    """把 source 最后 window 天的走势（价格 ×3、成交量 ×2）复制到 target 历史中以 target_end 结尾的位置"""
+    src = data[data["code"] == source].tail(window)
+    rows = data.index[data["code"] == target][target_end - window + 1:target_end + 1]
+    data.loc[rows, "close"] = src["close"].to_numpy() * 3
+    data.loc[rows, "volume"] = src["volume"].to_numpy() * 2
+    return data
+
+
+class TestEmbedding:
+    """测试窗口嵌入"""
+
+    def test_unit_vectors_and_scale_invariance(self):
+        rng = np.random.default_rng(1)
+        closes = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, (5, 20)), axis=1))
+        volumes = rng.uniform(1e5, 1e6, (5, 20))
+        vectors = embed_windows(closes, volumes)
+        assert vectors.shape == (5, 40) and vectors.dtype == np.float32
+        assert np.allclose(np.linalg.norm(vectors, axis=1), 1, atol=1e-5)
+        assert np.allclose(embed_windows(closes * 7, volumes * 3), vectors, atol=1e-4)
+
+    def test_flat_window_is_finite(self):
+        vectors = embed_windows(np.full((1, 20), 5.0), np.zeros((1, 20)))
+        assert np.isfinite(vectors).all()
+
+
+class TestAnalogIndex:
+    """测试增量构建、检索与持久化"""
+
+    def test_incremental_matches_full_build(self):
+        data = make_stock_data()
+        full = AnalogIndex(20)
+        assert full.update(data) == 30 * (120 - 19)
+
+        incremental = AnalogIndex(20)
+        before = incremental.update(data[data["date"] <= "2025-02-28"])
+        assert before + incremental.update(data) == full.size
+        assert incremental.update(data) == 0
+        # 增量构建的行顺序不同，按 (股票, 窗口结尾) 对齐后比较
+        rows = [np.lexsort((idx._ends[:idx.size], idx._owners[:idx.size])) for idx in (incremental, full)]
+        assert np.allclose(incremental._vectors[rows[0]], full._vectors[rows[1]], atol=1e-6)
+
+    def test_finds_planted_analog_with_forward_returns(self):
+        data = plant_analog(make_stock_data())
+        index = AnalogIndex(20)
+        index.update(data)
+
+        result = index.query_stock("000000", k=5)
+        best = result["matches"][0]
+        assert (best["code"], best["end_date"]) == ("000001", "2025-03-01")
+        assert best["similarity"] > 0.999
+        closes = data[data["code"] == "000001"]["close"].to_numpy()
+        assert best["forward_returns"]["t+3"] == round(closes[62] / closes[59] - 1, 4)
+        assert result["summary"]["t+1"]["count"] == 5
+
+        # 同一只股票的结果互不重叠，也不与查询窗口重叠
+        by_code = {}
+        for match in result["matches"]:
+            by_code.setdefault(match["code"], []).append(pd.Timestamp(match["end_date"]))
+        by_code.setdefault("000000", []).append(pd.Timestamp(result["end_date"]))
+        for ends in by_code.values():
+            ends.sort()
+            assert all((b - a).days >= 20 for a, b in zip(ends, ends[1:]))
+
+    def test_before_date_and_recent_forward_returns(self):
+        data = plant_analog(make_stock_data())
+        index = AnalogIndex(20)
+        index.update(data)
+
+        result = index.query_stock("000000", k=10, before_date="2025-03-01")
+        assert all(m["end_date"] < "2025-03-01" for m in result["matches"])
+        assert "000001" not in [m["code"] for m in result["matches"][:1]]
+
+        # 最近的窗口尚无 T+10 收益，增量追加数据后补齐
+        index = AnalogIndex(20)
+        index.update(data[data["date"] <= "2025-03-05"])
+        query = data[data["code"] == "000000"].tail(20)
+        vector = embed_windows(query["close"].to_numpy()[None], query["volume"].to_numpy()[None])[0]
+        match = index.search(vector, k=1)[0]
+        assert (match["code"], match["end_date"]) == ("000001", "2025-03-01")
+        assert match["forward_returns"]["t+3"] is not None and match["forward_returns"]["t+5"] is None
+        index.update(data)
+        match = index.query_stock("000000", k=1)["matches"][0]
+        assert match["end_date"] == "2025-03-01" and match["forward_returns"]["t+10"] is not None
+
+    def test_unknown_stock_and_short_history(self):
+        index = AnalogIndex(20)
+        index.update(make_stock_data(n_codes=2, days=15))
+        with pytest.raises(ValueError):
+            index.query_stock("999999")
+        with pytest.raises(ValueError):
+            index.query_stock("000000")
+
+    def test_query_speed(self):
+        index = AnalogIndex(30)
+        index.update(make_stock_data(n_codes=600, days=330))
+        assert index.size == 600 * 301
+        index.query_stock("000000", k=10)
+        started = time.monotonic()
+        for _ in range(5):
+            index.query_stock("000000", k=10)
+        assert (time.monotonic() - started) / 5 < 0.1
+
+    def test_build_from_database_is_incremental(self, tmp_path):
+        from app.database import StockDatabase
+
+        data = make_stock_data(n_codes=5, days=80)
+        db = StockDatabase(str(tmp_path / "stocks.db"))
+        db.save_stock_data(data[data["date"] <= "2025-02-20"])
+        directory = str(tmp_path / "analog")
+
+        first = build_analog_index(db, 20, directory=directory)
+        assert first.size == 5 * (51 - 19)
+        db.save_stock_data(data[data["date"] > "2025-02-20"])
+        index = build_analog_index(db, 20, index=first, directory=directory)
+        assert index is not first and index.size == 5 * (80 - 19)
+        # 传入的索引在构建期间保持不变（服务中的查询继续使用它）
+        assert first.size == 5 * (51 - 19) and first.last_dates()["000000"] == "2025-02-20"
+        assert first.query_stock("000000", k=3)["end_date"] == "2025-02-20"
+        assert load_analog_index(20, directory).size == index.size
+        assert load_analog_index(30, directory) is None
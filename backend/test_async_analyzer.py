@@ -0,0 +1,201 @@
+"""
+asyncio 调用路径单元测试（AsyncFakeClaudeClient，不调用真实 API）
+"""
+import asyncio
+import json
+import re
+import time
+
+import pytest
+
+from app.analyzer import StockAnalyzer
+from app.async_analyzer import AsyncStockAnalyzer
+from app.async_database import AsyncDatabase, run_blocking, run_compute
+from app.claude_batch import FakeBatchService
+from app.claude_client import AsyncFakeClaudeClient
+from app.claude_executor import ClaudeExecutor, RateLimiter, content_text
+from app.claude_retry import CircuitBreaker, RetryPolicy
+
+PATTERNS = [{"pattern_name": "p", "description": "d"}]
+
+
+def make_async_analyzer(client, max_in_flight=4, db=None):
+    analyzer = StockAnalyzer(api_key=None, model="claude-3-5-haiku-20241022", db=db)
+    analyzer.executor = ClaudeExecutor(max_in_flight)
+    analyzer.rate_limiter = RateLimiter(0, 0)
+    analyzer.circuit_breaker = CircuitBreaker()
+    analyzer.retry_policy = RetryPolicy(base_delay=0)
+    analyzer.response_cache = None
+    return AsyncStockAnalyzer(analyzer, client=client)
+
+
+def all_above_60(prompt):
+    """每只股票都返回 70 分（结果与调用顺序无关）"""
+    return json.dumps([{"code": code, "name": name, "probability": 70, "reason": "r"}
+                       for code, name in re.findall(r"^#(\d{6}) (\S*)", prompt, re.M)])
+
+
+class TestAsyncAnalyzer:
+    """测试异步预测、分析与验证"""
+
+    def test_predict_bounds_in_flight(self, monkeypatch, make_stock_data):
+        monkeypatch.setattr("app.async_analyzer.CLAUDE_STREAMING", False)
+        monkeypatch.setattr("app.analyzer.CLAUDE_STREAMING", False)
+        client = AsyncFakeClaudeClient(latency=0.05, latency_sigma=0, respond=all_above_60)
+        async_analyzer = make_async_analyzer(client, max_in_flight=3)
+
+        predictions = asyncio.run(async_analyzer.predict_stock_probability(
+            make_stock_data(40), PATTERNS, batch_size=5, use_pre_screening=False, cascade=False, scorer="claude"))
+
+        assert len(predictions) == 40 and all(p["probability"] == 70 and "current_price" in p for p in predictions)
+        assert client.calls == 8 and client.max_in_flight == 3
+        stages = async_analyzer.analyzer.last_pipeline["stages"]
+        assert stages["llm"]["api_calls"] == 8 and stages["llm"]["output"] == 40
+
+    def test_streaming_publishes_and_saves(self, tmp_path, make_stock_data):
+        from app.database import StockDatabase
+
+        client = AsyncFakeClaudeClient(latency=0.02, latency_sigma=0, respond=all_above_60)
+        async_analyzer = make_async_analyzer(client, db=StockDatabase(str(tmp_path / "stocks.db")))
+        published = []
+        predictions = asyncio.run(async_analyzer.predict_stock_probability(
+            make_stock_data(12), PATTERNS, batch_size=4, use_pre_screening=False, cascade=False, scorer="claude",
+            on_prediction=published.append))
+
+        assert sorted(p["code"] for p in published) == sorted(p["code"] for p in predictions)
+        assert len(async_analyzer.analyzer.db.get_prediction_rankings()["llm"]) == 12
+        metrics = async_analyzer.analyzer.get_call_metrics()
+        assert metrics["overall"]["success"] == 3
+
+    def test_analyze_and_validate(self, make_validation_data):
+        client = AsyncFakeClaudeClient(latency=0, latency_sigma=0, seed=2)
+        async_analyzer = make_async_analyzer(client)
+
+        async def run():
+            patterns = await async_analyzer.analyze_rising_patterns(make_validation_data())
+            return await async_analyzer.validate_patterns_ai(patterns, make_validation_data(), mode="multi")
+
+        patterns = asyncio.run(run())
+        assert 8 <= len(patterns) <= 12 and all("validated_success_rate" in p for p in patterns)
+        assert async_analyzer.analyzer.get_api_statistics()["total_calls"] == client.calls == 2
+
+    def test_retries_with_async_client(self):
+        client = AsyncFakeClaudeClient(latency=0, latency_sigma=0, error_rate=1.0)
+        async_analyzer = make_async_analyzer(client)
+        assert asyncio.run(async_analyzer._call_claude_with_retry("x", max_retries=2)) is None
+        assert client.errors == 2 and async_analyzer.analyzer.api_errors == 2
+
+
+class TestCancellation:
+    """测试任务取消与事件循环不被阻塞"""
+
+    def test_cancel_stops_in_flight_calls(self, make_stock_data):
+        client = AsyncFakeClaudeClient(latency=5, latency_sigma=0)
+        async_analyzer = make_async_analyzer(client, max_in_flight=4)
+
+        async def run():
+            task = asyncio.create_task(async_analyzer.predict_stock_probability(
+                make_stock_data(20), PATTERNS, batch_size=5, use_pre_screening=False, cascade=False,
+                scorer="claude"))
+            while client.in_flight == 0:
+                await asyncio.sleep(0.01)
+            started = time.monotonic()
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return time.monotonic() - started
+
+        assert asyncio.run(run()) < 1
+        assert client.in_flight == 0
+
+    def test_loop_stays_responsive(self):
+        client = AsyncFakeClaudeClient(latency=0.2, latency_sigma=0, respond=lambda prompt: "[]")
+        async_analyzer = make_async_analyzer(client, max_in_flight=8)
+
+        async def run():
+            ticks = []
+
+            async def ticker():
+                while len(ticks) < 10:
+                    ticks.append(time.monotonic())
+                    await asyncio.sleep(0.01)
+
+            calls = [async_analyzer._call_claude_with_retry(f"prompt {i}") for i in range(8)]
+            await asyncio.gather(ticker(), *calls)
+            return ticks
+
+        ticks = asyncio.run(run())
+        assert ticks[-1] - ticks[0] < 0.2 and client.max_in_flight == 8
+
+    def test_async_database_facade(self, tmp_path):
+        from app.database import StockDatabase
+
+        db = StockDatabase(str(tmp_path / "stocks.db"))
+        adb = AsyncDatabase(db)
+
+        async def run():
+            await adb.save_prediction_ranking("r1", "screen", [("000001", None), ("000002", None)])
+            return await adb.get_prediction_rankings(run_id="r1")
+
+        rankings = asyncio.run(run())
+        assert [r["stock_code"] for r in rankings["screen"]] == ["000001", "000002"]
+
+    def test_records_and_replays(self, tmp_path):
+        from app.database import StockDatabase
+        from app.llm_replay import AsyncReplayClaudeClient
+
+        db = StockDatabase(str(tmp_path / "stocks.db"))
+        client = AsyncFakeClaudeClient(latency=0, latency_sigma=0, respond=all_above_60)
+        recorder = make_async_analyzer(client, db=db)
+        recorder.analyzer.record_llm_calls = True
+        asyncio.run(recorder._call_claude_with_retry("#000001 x", task="predict"))
+        assert [c["source"] for c in db.get_llm_calls(recorder.analyzer.llm_session_id)] == ["api"]
+
+        analyzer = StockAnalyzer(api_key=None, model="claude-3-5-haiku-20241022", db=db)
+        analyzer.enable_replay()
+        replay = AsyncStockAnalyzer(analyzer)
+        assert isinstance(replay.client, AsyncReplayClaudeClient)
+        response = asyncio.run(replay._call_claude_with_retry("#000001 x", task="predict"))
+        assert response == all_above_60("#000001 x") and replay.client.stats()["misses"] == 0
+
+    def test_batch_mode_polls_without_threads_and_cancels(self, make_stock_data):
+        client = AsyncFakeClaudeClient(latency=0, latency_sigma=0, respond=all_above_60)
+        async_analyzer = make_async_analyzer(client)
+        service = FakeBatchService(respond=lambda params: "[]", polls_until_done=10 ** 6)
+        async_analyzer.analyzer.batch_service = service
+
+        async def run():
+            task = asyncio.create_task(async_analyzer.predict_stock_probability(
+                make_stock_data(10), PATTERNS, batch_size=5, use_pre_screening=False, mode="batch",
+                scorer="claude"))
+            while not service._batches:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        assert [batch["status"] for batch in service._batches.values()] == ["canceling"]
+
+    def test_batch_mode_results(self, make_stock_data):
+        client = AsyncFakeClaudeClient(latency=0, latency_sigma=0)
+        async_analyzer = make_async_analyzer(client)
+        async_analyzer.analyzer.batch_service = FakeBatchService(
+            respond=lambda params: all_above_60(content_text(params["messages"][0]["content"])), polls_until_done=0)
+
+        predictions = asyncio.run(async_analyzer.predict_stock_probability(
+            make_stock_data(10), PATTERNS, batch_size=5, use_pre_screening=False, mode="batch", scorer="claude"))
+        assert len(predictions) == 10 and client.calls == 0
+        assert async_analyzer.analyzer.get_api_statistics()["batch_input_tokens"] > 0
+
+    def test_long_compute_does_not_block_database(self):
+        async def run():
+            jobs = [asyncio.ensure_future(run_compute(time.sleep, 0.5)) for _ in range(4)]
+            await asyncio.sleep(0.01)
+            started = time.monotonic()
+            await run_blocking(lambda: None)
+            waited = time.monotonic() - started
+            await asyncio.gather(*jobs)
+            return waited
+
+        assert asyncio.run(run()) < 0.2
@@ -0,0 +1,75 @@
+"""
+特征描述谓词编译与批量求值单元测试
+"""
+import numpy as np
+import pandas as pd
+
+from app.analyzer import StockAnalyzer
+from app.characteristic_predicates import FeatureFrame, Predicate, compile_characteristic, evaluate_patterns
+
+
+def make_validation_data(n=100000, seed=0):
+    rng = np.random.default_rng(seed)
+    prev_close = rng.uniform(5, 50, n)
+    opens = prev_close * (1 + rng.normal(0, 0.02, n))
+    closes = opens * (1 + rng.normal(0, 0.03, n))
+    return pd.DataFrame({
+        "open": opens, "close": closes, "prev_close": prev_close,
+        "high": np.maximum(opens, closes) * 1.01, "low": np.minimum(opens, closes) * 0.99,
+        "volume": rng.lognormal(12, 0.5, n), "is_success": rng.integers(0, 2, n),
+    })
+
+
+class TestCharacteristicPredicates:
+    """测试特征描述的编译与矩阵求值"""
+
+    def test_compile_to_typed_predicates(self):
+        assert compile_characteristic("涨幅2-4%") == [Predicate("day_change_pct", ">=", 2.0),
+                                                     Predicate("day_change_pct", "<=", 4.0)]
+        assert compile_characteristic("连续3天阳线") == [Predicate("is_yang", "==", True)]
+        assert compile_characteristic("放量50%") == [Predicate("volume", ">=", 1.5, ref="volume_median")]
+        assert compile_characteristic("振幅超过5%") == [Predicate("amplitude", ">", 5.0)]
+        assert compile_characteristic("低开2%") == [Predicate("open", "<", 0.98, ref="prev_close")]
+        assert compile_characteristic("均线多头排列") == []
+        # 按文本缓存：同一描述只解析一次
+        assert compile_characteristic("放量50%") is compile_characteristic("放量50%")
+
+    def test_matrix_matches_pandas_filters(self):
+        data = make_validation_data(n=5000)
+        change = (data["close"] - data["open"]) / data["open"] * 100
+        median = data["volume"].median()
+        patterns = [
+            {"characteristics": ["涨幅2-4%", "放量1.5倍"]},
+            {"characteristics": ["收盘价高于开盘价1%", "缩量"]},
+            {"characteristics": ["低开", "振幅<3%"]},
+            {"characteristics": ["均线多头排列"]},
+        ]
+        matrix = evaluate_patterns(patterns, FeatureFrame(data))
+
+        amplitude = (data["high"] - data["low"]) / data["low"] * 100
+        expected = [
+            (change >= 2) & (change <= 4) & (data["volume"] >= median * 1.5),
+            (data["close"] > data["open"]) & (change >= 1) & (data["volume"] < median * 0.8),
+            (data["open"] < data["prev_close"]) & (amplitude < 3),
+            np.ones(len(data), dtype=bool),
+        ]
+        for row, mask in zip(matrix, expected):
+            assert np.array_equal(row, np.asarray(mask))
+
+    def test_missing_fields_are_ignored(self):
+        data = make_validation_data(n=100).drop(columns=["prev_close"])
+        matrix = evaluate_patterns([{"characteristics": ["低开2%", "阳线"]}], FeatureFrame(data))
+        assert np.array_equal(matrix[0], (data["close"] > data["open"]).to_numpy())
+
+    def test_validate_patterns_sql_vectorized(self):
+        data = make_validation_data()
+        patterns = [{"pattern_name": f"模式{i}", "characteristics": [f"涨幅{i % 5}-{i % 5 + 3}%", "放量"]}
+                    for i in range(50)]
+        StockAnalyzer(api_key=None).validate_patterns_sql(patterns, data)
+
+        change = (data["close"] - data["open"]) / data["open"] * 100
+        loud = data["volume"] > data["volume"].median() * 1.2
+        for i, pattern in enumerate(patterns):
+            mask = (change >= i % 5) & (change <= i % 5 + 3) & loud
+            assert pattern["validation_sample_count"] == int(mask.sum())
+            assert pattern["validated_success_rate"] == round(data["is_success"][mask].mean() * 100, 2)
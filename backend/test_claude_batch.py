@@ -0,0 +1,45 @@
+"""
+Message Batches 离线预测单元测试
+"""
+from app.claude_batch import FakeBatchService, MessageBatchRunner
+from app.claude_cache import ResponseCache
+
+
+class TestMessageBatches:
+    """测试 Message Batches 离线模式"""
+
+    def test_runner_polls_until_ended(self):
+        service = FakeBatchService(polls_until_done=3, failed_ids={"b"})
+        requests = [{"custom_id": cid, "params": {"messages": [{"role": "user", "content": cid}]}} for cid in "ab"]
+        results = MessageBatchRunner(service, poll_seconds=0).run(requests)
+        assert results["a"].content[0].text == "[]" and results["b"] is None
+
+    def test_predict_batch_mode(self, tmp_path, slow_client, make_analyzer, make_stock_data, predict_all):
+        from app.database import StockDatabase
+
+        client = slow_client(latency=0)
+        analyzer = make_analyzer(client)
+        analyzer.db = StockDatabase(str(tmp_path / "stocks.db"))
+        analyzer.response_cache = ResponseCache(str(tmp_path / "cache.db"))
+        analyzer.batch_service = FakeBatchService(respond=predict_all, polls_until_done=0, failed_ids={"predict-1"})
+        run = lambda: analyzer.predict_stock_probability(
+            make_stock_data(30), [{"pattern_name": "p", "description": "d"}],
+            batch_size=10, use_pre_screening=False, mode="batch",
+        )
+        predictions = run()
+        # 第 2 批失败，其余两批各 10 只股票映射回原代码
+        assert len(predictions) == 20
+        assert {p["code"] for p in predictions} < {f"{c:06d}" for c in range(30)}
+        assert all("current_price" in p for p in predictions)
+        assert client.max_in_flight == 0  # 未走同步调用
+
+        stats = analyzer.get_api_statistics()
+        assert stats["total_calls"] == 2 and stats["total_errors"] == 1
+        assert stats["batch_input_tokens"] == stats["input_tokens"] > 0
+        full_price = (stats["input_tokens"] * 0.25 + stats["output_tokens"] * 1.25) / 1_000_000
+        assert abs(stats["estimated_cost_usd"] - round(full_price / 2, 4)) < 1e-4
+
+        # 再次预测：成功的两批命中缓存，失败的一批重新提交；缓存命中与失败都写入调用记录
+        assert len(run()) == 20
+        overall = analyzer.get_call_metrics()["overall"]
+        assert overall["success"] == 2 and overall["cache_hits"] == 2 and overall["errors"] == 2
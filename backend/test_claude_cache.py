@@ -0,0 +1,91 @@
+"""
+Claude 响应缓存与提示词前缀缓存单元测试
+"""
+import re
+import time
+from types import SimpleNamespace
+
+from app.claude_cache import ResponseCache
+
+
+class TestResponseCache:
+    """测试响应缓存"""
+
+    def test_replay_hits_cache(self, tmp_path, slow_client, make_analyzer):
+        client = slow_client(latency=0)
+        calls = []
+        create = client.messages.create
+        client.messages.create = lambda **kw: calls.append(1) or create(**kw)
+        analyzer = make_analyzer(client)
+        analyzer.response_cache = ResponseCache(str(tmp_path / "cache.db"))
+
+        assert analyzer._call_claude_with_retry("提示词", max_tokens=100) == "[]"
+        assert analyzer._call_claude_with_retry("提示词", max_tokens=100) == "[]"
+        assert len(calls) == 1
+        analyzer._call_claude_with_retry("提示词", max_tokens=200)
+        analyzer._call_claude_with_retry("提示词", max_tokens=100, use_cache=False)
+        assert len(calls) == 3
+
+        stats = analyzer.get_api_statistics()
+        assert stats["cache_hits"] == 1 and stats["cache_misses"] == 2
+        assert stats["total_calls"] == 3
+
+    def test_truncated_or_unparseable_responses_not_cached(self, tmp_path, slow_client, make_analyzer):
+        """max_tokens 截断或无法解析的响应不写入缓存；已缓存的无效响应命中时删除并重新请求"""
+        client = slow_client(latency=0, respond=lambda prompt: '[{"code": "000001"')
+        create = client.messages.create
+        stop_reason = ["max_tokens"]
+        client.messages.create = lambda **kw: SimpleNamespace(**dict(vars(create(**kw)), stop_reason=stop_reason[0]))
+        analyzer = make_analyzer(client)
+        analyzer.response_cache = cache = ResponseCache(str(tmp_path / "cache.db"))
+
+        analyzer._call_claude_with_retry("截断", max_tokens=100)
+        assert cache.get(analyzer.model, "截断", 100) is None
+        stop_reason[0] = "end_turn"
+        analyzer._call_claude_with_retry("无法解析", max_tokens=100)
+        assert cache.get(analyzer.model, "无法解析", 100) is None
+
+        cache.put(analyzer.model, "旧条目", 100, "not json")
+        client.respond = lambda prompt: "```json\n[]\n```"
+        assert analyzer._call_claude_with_retry("旧条目", max_tokens=100) == "```json\n[]\n```"
+        assert analyzer.cache_hits == 0 and analyzer.api_calls == 3
+        assert cache.get(analyzer.model, "旧条目", 100) == "```json\n[]\n```"
+
+    def test_ttl_and_size_eviction(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache.db"), ttl_hours=1, max_entries=2)
+        for i in range(3):
+            cache.put("m", f"p{i}", 10, f"r{i}")
+        assert cache.get("m", "p0", 10) is None
+        assert cache.get("m", "p2", 10) == "r2"
+
+        cache.ttl_seconds = 0.001
+        time.sleep(0.01)
+        assert cache.get("m", "p2", 10) is None
+
+class TestPromptCaching:
+    """测试提示词前缀缓存"""
+
+    def test_static_prefix_marked_and_cache_tokens_priced(self, slow_client, make_analyzer, make_stock_data):
+        client = slow_client(latency=0)
+        analyzer = make_analyzer(client, max_in_flight=1)
+        create = client.messages.create
+
+        def with_cache_usage(**kwargs):
+            message = create(**kwargs)
+            message.usage.cache_creation_input_tokens = 0 if analyzer.api_calls else 2000
+            message.usage.cache_read_input_tokens = 2000 if analyzer.api_calls else 0
+            return message
+
+        client.messages.create = with_cache_usage
+        patterns = [{"pattern_name": f"模式{i}", "description": "描述" * 50} for i in range(5)]
+        analyzer.predict_stock_probability(make_stock_data(20), patterns, batch_size=10, use_pre_screening=False)
+
+        prefix, variable = client.last_content
+        assert prefix["cache_control"] == {"type": "ephemeral"}
+        assert "模式4" in prefix["text"] and "股票1" not in prefix["text"]
+        assert re.search(r"^#\d{6} ", variable["text"], re.M)
+
+        stats = analyzer.get_api_statistics()
+        assert stats["cache_creation_input_tokens"] == 2000 and stats["cache_read_input_tokens"] == 2000
+        expected = ((stats["input_tokens"] + 2000 * 1.25 + 2000 * 0.1) * 0.25 + stats["output_tokens"] * 1.25) / 1e6
+        assert abs(stats["estimated_cost_usd"] - round(expected, 4)) < 1e-4
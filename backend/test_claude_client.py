@@ -0,0 +1,61 @@
+"""
+本地模拟 Claude 客户端单元测试
+"""
+import json
+
+import pytest
+
+from app.analyzer import StockAnalyzer
+from app.claude_client import FakeAPIError, FakeClaudeClient, create_client, fake_response
+from app.claude_executor import RateLimiter
+
+
+class TestFakeClient:
+    """测试本地模拟客户端"""
+
+    def test_create_client(self):
+        assert isinstance(create_client(backend="fake"), FakeClaudeClient)
+        assert create_client(None, backend="anthropic") is None
+        with pytest.raises(ValueError):
+            create_client("key", backend="openai")
+
+    def test_errors_reproducible_by_seed(self):
+        def outcomes(seed):
+            client = FakeClaudeClient(latency=0, latency_sigma=0, error_rate=0.2, rate_limit_rate=0.2, seed=seed)
+            result = []
+            for _ in range(30):
+                try:
+                    client.messages.create(model="m", max_tokens=10, messages=[{"role": "user", "content": "hi"}])
+                    result.append(200)
+                except FakeAPIError as e:
+                    assert ("429" in str(e)) == (e.status_code == 429)
+                    result.append(e.status_code)
+            return result
+
+        assert outcomes(1) == outcomes(1) != outcomes(2)
+        assert {200, 429, 529} <= set(outcomes(1))
+
+    def test_analyzer_end_to_end(self, monkeypatch, make_stock_data, make_validation_data):
+        monkeypatch.setattr("app.analyzer.CLAUDE_CACHE_ENABLED", False)
+        client = FakeClaudeClient(latency=0.01, latency_sigma=0.5, seed=3)
+        analyzer = StockAnalyzer(api_key=None, client=client)
+        analyzer.rate_limiter = RateLimiter(0, 0)
+        assert analyzer.ai_enabled
+
+        predictions = analyzer.predict_stock_probability(make_stock_data(30), [{"pattern_name": "p", "description": "d"}],
+                                                         batch_size=10, use_pre_screening=False)
+        assert predictions and all(60 <= p["probability"] <= 95 for p in predictions)
+
+        patterns = analyzer.analyze_rising_patterns(make_validation_data())
+        assert 8 <= len(patterns) <= 12 and all("characteristics" in p for p in patterns)
+        analyzer.validate_patterns_ai(patterns, make_validation_data(), mode="multi")
+        assert all("validated_success_rate" in p for p in patterns)
+
+        stats = analyzer.get_api_statistics()
+        assert stats["total_calls"] == client.calls and stats["cache_read_input_tokens"] > 0
+
+    def test_cluster_response_has_valid_rules(self):
+        from app.pattern_rules import compile_rule
+
+        pattern = json.loads(fake_response("Analyze ... and extract common patterns."))
+        assert compile_rule(pattern["rules"], pattern["parameters"]) is not None
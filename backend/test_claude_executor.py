@@ -0,0 +1,54 @@
+"""
+Claude 并发执行器与限速单元测试（不调用真实 API）
+"""
+import threading
+import time
+
+from app.claude_executor import ClaudeExecutor, RateLimiter, TokenBucket
+
+
+class TestRateLimiting:
+    """测试令牌桶限速"""
+
+    def test_token_bucket_rate(self):
+        bucket = TokenBucket(rate_per_minute=1200, capacity=1)  # 每秒 20 个
+        start = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+        assert time.monotonic() - start >= 0.18
+
+    def test_settle_overdraws_bucket(self):
+        limiter = RateLimiter(rpm=0, tpm=6000)
+        limiter.acquire(100)
+        limiter.settle(100, 1100)
+        assert limiter.tokens.tokens <= 6000 - 1100 + 1
+
+
+class TestClaudeExecutor:
+    """测试并发执行"""
+
+    def test_ordered_and_bounded(self):
+        in_flight, peak, lock = [0], [0], threading.Lock()
+
+        def work(i):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.05 * (5 - i % 5))
+            with lock:
+                in_flight[0] -= 1
+            return i * i
+
+        assert ClaudeExecutor(3).map(work, range(10)) == [i * i for i in range(10)]
+        assert peak[0] == 3
+
+    def test_predict_batches_run_concurrently(self, slow_client, make_analyzer, make_stock_data):
+        """首批写入提示词缓存后，其余批次并发调用，总耗时接近两批耗时"""
+        client = slow_client(latency=0.3)
+        analyzer = make_analyzer(client, max_in_flight=4)
+        start = time.monotonic()
+        analyzer.predict_stock_probability(make_stock_data(50), [{"pattern_name": "p", "description": "d"}],
+                                           batch_size=10, use_pre_screening=False)
+        assert client.max_in_flight == 4
+        assert time.monotonic() - start < 0.3 * 3
+        assert analyzer.api_calls == 5
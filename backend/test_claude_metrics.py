@@ -0,0 +1,44 @@
+"""
+Claude 调用记录与延迟/成本统计单元测试
+"""
+import time
+
+from app.claude_cache import ResponseCache
+from app.claude_client import FakeClaudeClient
+
+
+class TestCallMetrics:
+    """测试调用记录持久化与延迟/成本统计"""
+
+    def test_records_and_summary(self, tmp_path, make_analyzer, make_stock_data):
+        from app.database import StockDatabase
+
+        client = FakeClaudeClient(latency=0.01, latency_sigma=0.5, seed=5)
+        analyzer = make_analyzer(client)
+        analyzer.db = StockDatabase(str(tmp_path / "stocks.db"))
+        analyzer.response_cache = ResponseCache(str(tmp_path / "cache.db"))
+        analyzer.predict_stock_probability(make_stock_data(30), [{"pattern_name": "p", "description": "d"}],
+                                           batch_size=5, use_pre_screening=False, cascade=False)
+        analyzer._call_claude_with_retry("#000001 x", task="predict")  # 新提示词：实际请求
+        analyzer._call_claude_with_retry("#000001 x", task="predict")  # 命中缓存
+
+        client.error_rate = 1.0
+        assert analyzer._call_claude_with_retry("boom", max_retries=1, task="validate_multi") is None
+
+        report = analyzer.get_call_metrics()
+        overall = report["overall"]
+        assert overall["success"] == 7 and overall["errors"] == 1 and overall["cache_hits"] == 1
+        assert overall["success_rate"] == 87.5
+        assert 0 < overall["latency_p50"] <= overall["latency_p95"] <= overall["latency_p99"]
+        assert overall["tokens_per_second"] > 0 and overall["cost_usd"] > 0
+
+        assert set(report["by_task"]) == {"predict", "validate_multi"}
+        assert report["by_task"]["validate_multi"]["errors"] == 1
+        today = time.strftime("%Y-%m-%d")
+        assert report["by_day"][today]["cost_usd"] == overall["cost_usd"]
+        assert report["by_task_day"]["predict"][today]["success"] == 7
+
+    def test_success_rate_counts_attempts(self, slow_client, make_analyzer):
+        analyzer = make_analyzer(slow_client(latency=0))
+        analyzer.api_calls, analyzer.api_errors = 3, 1
+        assert analyzer.get_api_statistics()["success_rate"] == 75.0
@@ -0,0 +1,166 @@
+"""
+重试退避与熔断器单元测试
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.claude_client import FakeAPIError, FakeClaudeClient
+from app.claude_retry import CircuitBreaker, RetryPolicy, retry_after_seconds, run_with_retry, run_with_retry_async
+from app.llm_replay import ReplayMissError
+
+
+class FlakyCall:
+    """前 failures 次调用抛出指定错误，之后返回 ok"""
+
+    def __init__(self, error, failures=10 ** 6):
+        self.error = error
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self, attempt):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return "ok"
+
+
+class TestRetryPolicy:
+    """测试抖动退避、Retry-After、不可重试错误与熔断器"""
+
+    def test_full_jitter_bounds(self):
+        policy = RetryPolicy(base_delay=1, max_delay=8, rate_limit_multiplier=5, seed=0)
+        overloaded = FakeAPIError(529, "overloaded_error")
+        delays = [policy.delay(2, overloaded) for _ in range(200)]
+        assert all(0 <= d <= 4 for d in delays) and len(set(delays)) > 100
+        # 限流错误倍率更高，但不超过 max_delay
+        assert max(policy.delay(3, FakeAPIError(529, "rate_limit_error")) for _ in range(200)) <= 8
+
+    def test_retry_after_honored(self):
+        policy = RetryPolicy(base_delay=0.001, seed=0)
+        assert policy.delay(0, FakeAPIError(429, "rate_limit_error", retry_after=7)) >= 7
+
+        response = SimpleNamespace(status_code=429, headers={"retry-after-ms": "1500"})
+        assert retry_after_seconds(SimpleNamespace(response=response)) == 1.5
+        response.headers = {"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}
+        assert retry_after_seconds(SimpleNamespace(response=response)) == 0
+
+    def test_retry_after_pauses_other_callers(self, monkeypatch):
+        slept = []
+        monkeypatch.setattr("app.claude_retry.time.sleep", slept.append)
+        breaker = CircuitBreaker(min_calls=100)
+        call = FlakyCall(FakeAPIError(429, "rate_limit_error", retry_after=3), failures=1)
+        assert run_with_retry(call, RetryPolicy(base_delay=0), breaker) == "ok"
+        assert slept[0] == 3 and 2 < breaker.wait_time() <= 3
+
+    def test_non_retryable_fails_immediately(self, monkeypatch):
+        monkeypatch.setattr("app.claude_retry.time.sleep", lambda seconds: None)
+        breaker = CircuitBreaker(min_calls=1)
+        call = FlakyCall(FakeAPIError(400, "invalid_request_error"))
+        with pytest.raises(FakeAPIError):
+            run_with_retry(call, RetryPolicy(max_retries=5, base_delay=0), breaker)
+        # 请求本身的错误说明 API 可达，不会触发熔断
+        assert call.calls == 1 and breaker.state == "closed"
+
+    def test_breaker_opens_and_probes(self):
+        now = [0.0]
+        breaker = CircuitBreaker(window=10, failure_rate=0.5, min_calls=4, cooldown=30, clock=lambda: now[0])
+        for success in (True, False, False, True):
+            assert breaker.allow()
+            breaker.record(success)
+        assert breaker.state == "open" and not breaker.allow()
+
+        now[0] = 31
+        assert breaker.state == "half_open"
+        assert breaker.allow() and not breaker.allow()  # 只放行一个探测请求
+        breaker.record(False)
+        assert breaker.state == "open"
+
+        now[0] = 62
+        assert breaker.allow()
+        breaker.record(True)
+        assert breaker.state == "closed" and breaker.stats()["trips"] == 1
+
+    @staticmethod
+    def tripped_breaker(now):
+        breaker = CircuitBreaker(window=10, failure_rate=0.5, min_calls=2, cooldown=30, clock=lambda: now[0])
+        for _ in range(2):
+            breaker.record(False, breaker.admit())
+        now[0] = 31
+        assert breaker.state == "half_open"
+        return breaker
+
+    def test_non_retryable_probe_closes_breaker(self):
+        now = [0.0]
+        breaker = self.tripped_breaker(now)
+        with pytest.raises(ReplayMissError):
+            run_with_retry(FlakyCall(ReplayMissError("m", "p")), RetryPolicy(base_delay=0), breaker)
+        assert breaker.state == "closed" and breaker.allow()
+
+    def test_cancelled_probe_releases_slot(self):
+        now = [0.0]
+        breaker = self.tripped_breaker(now)
+
+        async def scenario():
+            async def hang(attempt):
+                await asyncio.sleep(10)
+
+            task = asyncio.create_task(run_with_retry_async(hang, RetryPolicy(base_delay=0), breaker))
+            await asyncio.sleep(0.01)
+            assert not breaker.allow()  # 探测进行中
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(scenario())
+        # 取消不计结果：仍为半开，下一个调用方可以探测
+        assert breaker.state == "half_open" and breaker.allow()
+
+    def test_results_from_before_trip_are_ignored(self):
+        now = [0.0]
+        breaker = CircuitBreaker(window=10, failure_rate=0.5, min_calls=2, cooldown=30, clock=lambda: now[0])
+        stale = breaker.admit()
+        for _ in range(2):
+            breaker.record(False, breaker.admit())
+        breaker.record(True, stale)  # 熔断前发出的请求此时才返回
+        assert breaker.state == "open"
+        now[0] = 31
+        probe = breaker.admit()
+        breaker.record(True, stale)
+        assert breaker.state == "half_open" and not breaker.allow()
+        breaker.record(True, probe)
+        assert breaker.state == "closed"
+
+    def test_analyzer_fails_fast_when_open(self, make_analyzer):
+        client = FakeClaudeClient(latency=0, latency_sigma=0, error_rate=1.0)
+        analyzer = make_analyzer(client)
+        analyzer.retry_policy = RetryPolicy(max_retries=2, base_delay=0)
+        analyzer.circuit_breaker = CircuitBreaker(min_calls=4, cooldown=60)
+
+        assert analyzer._call_claude_with_retry("a") is None and analyzer._call_claude_with_retry("b") is None
+        assert client.errors == 4 and analyzer.circuit_breaker.state == "open"
+        assert analyzer._call_claude_with_retry("c") is None
+        assert client.errors == 4 and analyzer.get_api_statistics()["circuit_breaker"]["rejected"] == 1
+
+    def test_async_backoff_does_not_block_loop(self):
+        async def scenario():
+            ticks = []
+
+            async def ticker():
+                for _ in range(5):
+                    ticks.append(time.monotonic())
+                    await asyncio.sleep(0.01)
+
+            flaky = FlakyCall(FakeAPIError(529, "overloaded_error", retry_after=0.1), failures=1)
+
+            async def attempt(n):
+                return flaky(n)
+
+            result, _ = await asyncio.gather(run_with_retry_async(attempt, RetryPolicy(base_delay=0)), ticker())
+            return result, ticks
+
+        result, ticks = asyncio.run(scenario())
+        # 退避 0.1 秒期间其他协程照常运行
+        assert result == "ok" and len(ticks) == 5 and ticks[-1] - ticks[0] < 0.1
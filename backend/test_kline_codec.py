@@ -0,0 +1,60 @@
+"""
+K线紧凑编码单元测试
+"""
+import numpy as np
+import pandas as pd
+
+from app.analyzer import StockAnalyzer
+from app.kline_codec import compare_encodings, decode_klines, decode_samples, encode_klines, encode_samples
+
+
+def make_records(days=30, seed=0):
+    rng = np.random.default_rng(seed)
+    closes = 10 * np.exp(np.cumsum(rng.normal(0, 0.03, days)))
+    opens = closes * (1 + rng.normal(0, 0.01, days))
+    return [
+        {"date": f"2025-01-{d + 1:02d}", "open": float(opens[d]), "close": float(closes[d]),
+         "high": float(max(opens[d], closes[d]) * 1.02), "low": float(min(opens[d], closes[d]) * 0.98),
+         "volume": float(rng.integers(1e5, 5e6))}
+        for d in range(days)
+    ]
+
+
+class TestKlineCodec:
+    """测试编码/解码往返与 token 节省"""
+
+    def test_round_trip_without_drift(self):
+        records = make_records(days=250)
+        decoded = decode_klines(encode_klines(records, "600000", "浦发 银行"))
+        assert decoded["code"] == "600000" and decoded["name"] == "浦发银行"
+        assert decoded["first_date"] == "2025-01-01" and len(decoded["records"]) == 250
+        avg_volume = np.mean([r["volume"] for r in records])
+        for original, restored in zip(records, decoded["records"]):
+            for key in ("open", "high", "low", "close"):
+                assert abs(restored[key] / original[key] - 1) < 1e-4  # 0.5bp 取整 + base 有效数字
+            assert abs(restored["volume"] - original["volume"]) <= 0.0051 * avg_volume  # 比值保留两位小数
+
+    def test_samples_round_trip(self):
+        rows = [{"code": "000001", "date": pd.Timestamp("2025-01-02"), "open": 10.0, "high": 10.6, "low": 9.8,
+                 "close": 10.5, "volume": 2000.0, "day2_close": 11.0, "day3_close": 11.4, "rise_pct": 8.57},
+                {"code": "000002", "date": "2025-01-03", "open": 5.0, "high": 5.2, "low": 4.9,
+                 "close": 5.1, "volume": 1000.0, "day2_close": 5.4, "day3_close": 5.6, "rise_pct": 9.8}]
+        text = encode_samples(rows)
+        assert text.split("\n")[0] == "code,date,c,o,h,l,v,d2,d3,rise"
+        decoded = decode_samples(text, avg_volume=1500.0)
+        assert decoded[0]["date"] == "2025-01-02" and decoded[1]["rise_pct"] == 9.8
+        assert abs(decoded[0]["day3_close"] - 11.4) < 1e-3 and abs(decoded[1]["volume"] - 1000) < 10
+
+    def test_compact_uses_far_fewer_tokens(self):
+        report = compare_encodings(make_records(), "600000", "浦发银行")
+        assert report["ratio"] < 0.5
+
+    def test_prompts_use_compact_tables(self):
+        df = pd.DataFrame(make_records())
+        df["code"], df["name"] = "600000", "浦发银行"
+        summary, metadata = StockAnalyzer._stock_summary("600000", df)
+        assert summary.startswith("#600000 浦发银行 2025-01-01~2025-01-30 n=30")
+        assert metadata["current_price"] == df["close"].iloc[-1]
+
+        text = StockAnalyzer(api_key=None)._prepare_data_summary(df, limit=5)
+        assert len(text.split("\n")) == 1 + 1 + 5  # 格式说明 + 表头 + 5 行
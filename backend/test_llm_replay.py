@@ -0,0 +1,89 @@
+"""
+LLM 调用录制与确定性回放单元测试
+"""
+import pytest
+
+from app.claude_client import FakeClaudeClient
+from app.claude_retry import RetryPolicy
+
+
+class TestLlmReplay:
+    """测试 LLM 调用录制与确定性回放"""
+
+    @pytest.fixture
+    def recording(self, tmp_path, make_analyzer, make_stock_data):
+        """录制一次预测：返回 (录制用的分析器, 模拟客户端, 预测结果)"""
+        from app.database import StockDatabase
+
+        client = FakeClaudeClient(latency=0.01, latency_sigma=0.5, seed=7)
+        analyzer = make_analyzer(client)
+        analyzer.db = StockDatabase(str(tmp_path / "stocks.db"))
+        analyzer.record_llm_calls = True
+        predictions = analyzer.predict_stock_probability(
+            make_stock_data(30), [{"pattern_name": "p", "description": "d"}], batch_size=5,
+            use_pre_screening=False, cascade=False, scorer="claude")
+        return analyzer, client, predictions
+
+    def test_replay_reproduces_predictions(self, recording, slow_client, make_analyzer, make_stock_data):
+        recorder, client, recorded = recording
+        calls = recorder.db.get_llm_calls(recorder.llm_session_id)
+        assert len(calls) == client.calls == 6
+        assert all(call["source"] == "api" and call["task"] == "predict" and call["input_tokens"] > 0
+                   for call in calls)
+
+        analyzer = make_analyzer(slow_client())
+        analyzer.db = recorder.db
+        assert analyzer.enable_replay() == recorder.llm_session_id
+        replayed = analyzer.predict_stock_probability(
+            make_stock_data(30), [{"pattern_name": "p", "description": "d"}], batch_size=5,
+            use_pre_screening=False, cascade=False, scorer="claude")
+
+        key = lambda p: (p["code"], p["probability"])
+        assert sorted(map(key, replayed)) == sorted(map(key, recorded))
+        assert analyzer.client.stats() == {"recorded": 6, "served": 6, "misses": 0, "unused": 0}
+        assert client.calls == 6
+        assert len(recorder.db.get_llm_sessions()) == 1  # 回放不再录制
+
+    def test_changed_prompt_misses_without_retry(self, recording, slow_client, make_analyzer):
+        recorder, _, _ = recording
+        analyzer = make_analyzer(slow_client())
+        analyzer.db = recorder.db
+        analyzer.retry_policy = RetryPolicy(base_delay=0)
+        analyzer.enable_replay(recorder.llm_session_id)
+
+        assert analyzer._call_claude_with_retry("提示词已修改", max_retries=3) is None
+        assert analyzer.client.misses == 1 and analyzer.client.stats()["unused"] == 6
+
+    def test_replay_requires_recording(self, tmp_path, slow_client, make_analyzer):
+        from app.database import StockDatabase
+
+        analyzer = make_analyzer(slow_client())
+        with pytest.raises(ValueError):
+            analyzer.enable_replay()
+        analyzer.db = StockDatabase(str(tmp_path / "stocks.db"))
+        with pytest.raises(ValueError):
+            analyzer.enable_replay()
+
+    def test_recording_is_opt_in_and_pruned(self, tmp_path, monkeypatch, slow_client, make_analyzer):
+        """默认不录制；每个录制会话开始时只保留最近的会话"""
+        from app import analyzer as analyzer_module
+        from app.database import StockDatabase
+
+        db = StockDatabase(str(tmp_path / "stocks.db"))
+        analyzer = make_analyzer(slow_client(latency=0))
+        analyzer.db = db
+        analyzer._call_claude_with_retry("x")
+        assert db.get_llm_sessions() == []
+
+        monkeypatch.setattr(analyzer_module, "LLM_RECORD_KEEP_SESSIONS", 2)
+        sessions = []
+        for i in range(4):
+            analyzer = make_analyzer(slow_client(latency=0))
+            analyzer.db, analyzer.record_llm_calls = db, True
+            analyzer.llm_session_id = f"s{i}"
+            analyzer._call_claude_with_retry(f"a{i}")
+            analyzer._call_claude_with_retry(f"b{i}")
+            sessions.append(analyzer.llm_session_id)
+        assert [s["session_id"] for s in db.get_llm_sessions()] == sessions[:1:-1]
+        assert len(db.get_llm_calls(sessions[-1])) == 2
+        assert db.prune_llm_calls(10, max_age_days=-1) == 4
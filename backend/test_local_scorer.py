@@ -0,0 +1,155 @@
+"""
+本地统计评分模型单元测试
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.analyzer import StockAnalyzer
+from app.local_scorer import FEATURE_NAMES, LocalScorer, build_training_set, list_scorers, load_scorer
+
+
+def make_stock_data(n_codes=40, days=120, seed=0):
+    """随机游走K线，随机植入“放量后两日大涨”的信号"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    dates = pd.date_range("2025-01-01", periods=days).strftime("%Y-%m-%d")
+    for c in range(n_codes):
+        returns = rng.normal(0, 0.01, days)
+        volumes = rng.uniform(1e5, 2e5, days)
+        for t in rng.choice(np.arange(30, days - 2), size=days // 15, replace=False):
+            volumes[t] *= 5
+            returns[t + 1:t + 3] = 0.05
+        closes = 10 * np.exp(np.cumsum(returns))
+        frames.append(pd.DataFrame({
+            "code": f"{c:06d}", "name": f"股票{c}", "date": dates, "open": closes * 0.998,
+            "high": closes * 1.01, "low": closes * 0.99, "close": closes, "volume": volumes,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.fixture(scope="module")
+def trained():
+    X, y, dates = build_training_set(make_stock_data())
+    return LocalScorer.train(X, y, dates, backend="numpy"), (X, y, dates)
+
+
+class TestLocalScorer:
+    """测试训练、评分与版本化保存"""
+
+    def test_training_set_shape(self, trained):
+        _, (X, y, dates) = trained
+        assert X.shape == (40 * (120 - 30 - 2 + 1), len(FEATURE_NAMES))
+        assert set(np.unique(y)) == {0, 1} and len(dates) == len(y)
+
+    def test_learns_planted_signal(self, trained):
+        scorer, _ = trained
+        assert scorer.metrics["valid_auc"] > 0.8
+        scores = scorer.score(make_stock_data(n_codes=20, seed=1))
+        assert len(scores) == 20 and all(0 <= p <= 100 for p in scores.values())
+
+    def test_versioned_artifacts(self, trained, tmp_path):
+        scorer, _ = trained
+        directory = str(tmp_path)
+        assert load_scorer(directory) is None
+
+        scorer.save(directory)
+        scorer.save(directory)
+        versions = list_scorers(directory)
+        assert [v["version"] for v in versions] == [1, 2]
+        assert versions[0]["feature_names"] == FEATURE_NAMES and versions[0]["backend"] == "numpy"
+
+        data = make_stock_data(n_codes=5, seed=2)
+        assert load_scorer(directory).version == 2
+        assert load_scorer(directory, version=1).score(data) == scorer.score(data)
+        with pytest.raises(ValueError):
+            load_scorer(directory, version=3)
+
+    def test_single_class_rejected(self):
+        with pytest.raises(ValueError):
+            LocalScorer.train(np.zeros((10, len(FEATURE_NAMES))), np.zeros(10, dtype=np.int8), backend="numpy")
+
+
+class TestLocalScoringInPredict:
+    """测试 predict_stock_probability 的本地评分模式"""
+
+    def test_local_only_without_api_key(self, trained):
+        analyzer = StockAnalyzer(api_key=None)
+        analyzer.local_scorer = trained[0]
+        stock_data = make_stock_data(n_codes=60, days=40, seed=3)
+        predictions = analyzer.predict_stock_probability(stock_data, [], use_pre_screening=False, scorer="local")
+
+        assert len(predictions) == 50  # LOCAL_SCORER_TOP_K
+        probabilities = [p["probability"] for p in predictions]
+        assert probabilities == sorted(probabilities, reverse=True)
+        assert predictions[0]["reason"].startswith("本地模型") and predictions[0]["matched_quantitative_data"]
+        assert analyzer.last_local_scoring["stocks"] == 60
+
+    def test_rank_orders_candidates_for_claude(self, trained, monkeypatch):
+        analyzer = StockAnalyzer(api_key=None)
+        analyzer.local_scorer = trained[0]
+        sent = []
+        monkeypatch.setattr(analyzer, "_predict_batch",
+                            lambda batch, *args, **kwargs: sent.extend(batch) or [])
+        stock_data = make_stock_data(n_codes=60, days=40, seed=3)
+        analyzer.predict_stock_probability(stock_data, [], use_pre_screening=False, scorer="rank", cascade=False)
+
+        scores = trained[0].score(stock_data)
+        top = sorted(scores, key=scores.get, reverse=True)[:50]
+        assert sorted(sent) == sorted(top)
+
+    def test_local_requires_model(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("app.analyzer.load_scorer", lambda: load_scorer(str(tmp_path)))
+        with pytest.raises(ValueError):
+            StockAnalyzer(api_key=None).predict_stock_probability(make_stock_data(n_codes=3), [],
+                                                                  use_pre_screening=False, scorer="local")
+
+
+class TestPredictionPipeline:
+    """测试 筛选 → 本地评分 → Claude top-K 的分阶段流水线"""
+
+    def run(self, trained, tmp_path, monkeypatch, top_k, screened=None):
+        from app.database import StockDatabase
+
+        analyzer = StockAnalyzer(api_key=None, db=StockDatabase(str(tmp_path / "stocks.db")))
+        analyzer.local_scorer = trained[0]
+        sent = []
+        monkeypatch.setattr(analyzer, "_predict_batch", lambda batch, *args, **kwargs: sent.extend(batch) or [
+            {"code": code, "probability": 70.0} for code in batch])
+        if screened is not None:
+            monkeypatch.setattr("app.analyzer.load_classic_patterns", lambda path: [])
+            monkeypatch.setattr("app.analyzer.pre_screen_stocks", lambda klines, patterns: screened)
+        stock_data = make_stock_data(n_codes=30, days=40, seed=4)
+        predictions = analyzer.predict_stock_probability(stock_data, [], use_pre_screening=screened is not None,
+                                                         scorer="rank", cascade=False, top_k=top_k)
+        return analyzer, stock_data, sent, predictions
+
+    def test_only_top_k_reach_llm(self, trained, tmp_path, monkeypatch):
+        analyzer, stock_data, sent, predictions = self.run(trained, tmp_path, monkeypatch, top_k=7)
+
+        scores = trained[0].score(stock_data)
+        assert sorted(sent) == sorted(sorted(scores, key=scores.get, reverse=True)[:7])
+        assert len(predictions) == 7
+
+        stages = analyzer.last_pipeline["stages"]
+        assert (stages["screen"]["input"], stages["screen"]["output"]) == (30, 30)
+        assert stages["local_score"]["output"] == 30 and stages["local_score"]["model_version"] == trained[0].version
+        assert (stages["llm"]["input"], stages["llm"]["output"]) == (7, 7)
+        assert all(stage["elapsed_ms"] >= 0 for stage in stages.values())
+
+        rankings = analyzer.db.get_prediction_rankings()
+        assert [r["stock_code"] for r in rankings["local_score"][:7]] == sorted(scores, key=scores.get,
+                                                                                  reverse=True)[:7]
+        assert len(rankings["screen"]) == 30 and len(rankings["llm"]) == 7
+
+    def test_few_candidates_rank_first_instead_of_alphabetical(self, trained, tmp_path, monkeypatch):
+        analyzer, _, _, _ = self.run(trained, tmp_path, monkeypatch, top_k=5, screened=["000021", "000007"])
+        screen = analyzer.db.get_prediction_rankings()["screen"]
+        assert [r["stock_code"] for r in screen[:3]] == ["000021", "000007", "000000"]
+        assert len(screen) == 30
+
+    def test_non_positive_top_k_rejected(self, trained, tmp_path, monkeypatch):
+        """top_k=0 不会被当作“未指定”而回退到默认值"""
+        for top_k in (0, -3):
+            with pytest.raises(ValueError):
+                self.run(trained, tmp_path, monkeypatch, top_k=top_k)
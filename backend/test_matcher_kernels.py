@@ -0,0 +1,65 @@
+"""
+匹配器内核一致性测试（numba / numpy 与纯 Python 参考实现逐项比对）
+"""
+import numpy as np
+import pytest
+
+from app import matcher_kernels
+from app.indicators import rolling
+from app.matcher_kernels import KERNELS
+
+BACKENDS = [name for name in KERNELS if name != "python"]
+REFERENCE = KERNELS["python"]
+
+
+def random_series(rng, n):
+    close = 10 * np.exp(np.cumsum(rng.normal(0.003, 0.03, n)))
+    high = close * (1 + rng.uniform(0, 0.03, n))
+    low = close * (1 - rng.uniform(0, 0.03, n))
+    volume = rng.uniform(500, 1500, n)
+    spikes = rng.random(n) < 0.2
+    volume[spikes] *= rng.uniform(1.5, 4.0, spikes.sum())
+    return close, high, low, volume
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+class TestKernelParity:
+    """各后端与参考实现结果一致"""
+
+    def test_consolidation_search(self, backend):
+        rng = np.random.default_rng(11)
+        kernel = KERNELS[backend]["consolidation_search"]
+        for _ in range(500):
+            n = int(rng.integers(6, 60))
+            close, high, low, volume = random_series(rng, n)
+            volume_ratio = volume / rolling(volume, min(20, n), "mean", min(5, n))
+            breakout_day = int(rng.integers(1, n))
+            args = (high, low, close, volume_ratio, breakout_day,
+                    int(rng.integers(1, 5)), int(rng.integers(3, 15)),
+                    float(rng.uniform(0.02, 0.3)), float(rng.uniform(0.6, 1.6)))
+            assert kernel(*args) == REFERENCE["consolidation_search"](*args)
+
+    def test_ai000_scan(self, backend):
+        rng = np.random.default_rng(12)
+        kernel = KERNELS[backend]["ai000_scan"]
+        hits = 0
+        for _ in range(500):
+            obs, base_days = int(rng.integers(5, 30)), int(rng.integers(1, 6))
+            close, high, low, volume = random_series(rng, obs + base_days)
+            rolling_vol = rolling(volume, base_days, "mean", base_days)
+            rolling_high = rolling(close, obs, "max", 5)
+            args = (close, high, low, volume, rolling_vol, rolling_high, base_days, obs,
+                    float(rng.uniform(1.0, 2.5)), float(rng.uniform(0.0, 0.08)),
+                    float(rng.uniform(0.1, 0.6)), float(rng.uniform(-0.2, 0.2)))
+            expected = REFERENCE["ai000_scan"](*args)
+            assert bool(kernel(*args)) == expected
+            hits += expected
+        assert hits > 0  # 确保用例覆盖了命中分支
+
+
+def test_backend_selection(monkeypatch):
+    """未知后端回退到可用的默认实现"""
+    monkeypatch.setenv("MATCHER_BACKEND", "gpu")
+    assert matcher_kernels._select_backend() in ("numba", "numpy")
+    monkeypatch.setenv("MATCHER_BACKEND", "numpy")
+    assert matcher_kernels._select_backend() == "numpy"
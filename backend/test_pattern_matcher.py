@@ -0,0 +1,211 @@
+"""
+模式匹配器与指标缓存单元测试
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.indicators import IndicatorBundle
+from app.match_cache import MatchCache
+from app.predicate_cascade import PredicateCascade, _cascades
+from app import pattern_matcher
+from app.pattern_matcher import (
+    calibrate_cascades, load_classic_patterns, match_all_patterns, match_stocks, pre_screen_stocks,
+)
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), "..")
+
+
+def load_all_patterns():
+    """经典模式 + AI 模式"""
+    patterns = load_classic_patterns(os.path.join(ROOT_DIR, "classic_patterns.json"))
+    with open(os.path.join(ROOT_DIR, "new_patterns.json"), "r", encoding="utf-8") as f:
+        patterns.extend(json.load(f)["patterns"])
+    return patterns
+
+
+def random_kline(rng, n):
+    """生成随机K线（日期乱序，模拟数据库返回顺序）"""
+    closes = 10 * np.exp(np.cumsum(rng.normal(0.002, 0.02, n)))
+    volumes = rng.uniform(500, 1500, n)
+    volumes[-3:] *= rng.uniform(1.0, 3.0)
+    dates = pd.date_range("2025-01-01", periods=n, freq="D")
+    return [
+        {
+            "date": dates[i].strftime("%Y-%m-%d"),
+            "open": closes[i] * 0.995,
+            "high": closes[i] * 1.02,
+            "low": closes[i] * 0.98,
+            "close": closes[i],
+            "volume": volumes[i],
+        }
+        for i in rng.permutation(n)
+    ]
+
+
+class TestIndicatorBundle:
+    """测试指标缓存"""
+
+    def test_sorted_and_matches_pandas(self):
+        """按日期排序，派生指标与 pandas 口径一致"""
+        kline = random_kline(np.random.default_rng(1), 40)
+        bundle = IndicatorBundle(kline)
+        df = pd.DataFrame(kline).sort_values("date").reset_index(drop=True)
+
+        view = bundle.view("classic")
+        np.testing.assert_allclose(view["close"], df["close"])
+        np.testing.assert_allclose(view["pct_change"], df["close"].pct_change(), equal_nan=True)
+        expected = df["volume"] / df["volume"].rolling(20, min_periods=5).mean()
+        np.testing.assert_allclose(view["volume_ratio"], expected, equal_nan=True)
+
+        ai_expected = df["volume"] / df["volume"].rolling(20, min_periods=3).mean()
+        np.testing.assert_allclose(bundle.view("ai")["volume_ratio"], ai_expected, equal_nan=True)
+
+    def test_lazy_shared_cache(self):
+        """指标按需计算一次，命名窗口之间共享与窗口无关的列"""
+        bundle = IndicatorBundle(random_kline(np.random.default_rng(2), 30))
+        classic, ai = bundle.view("classic"), bundle.view("ai")
+        assert bundle.view("classic") is classic
+        assert classic["pct_change"] is ai["pct_change"]
+        assert classic["volume_ratio"] is classic["volume_ratio"]
+        assert classic.rolling("close", 5, "max") is classic.rolling("close", 5, "max")
+
+        tail = classic.tail(10)
+        assert np.shares_memory(tail["close"], classic["close"])
+        np.testing.assert_allclose(tail.rolling("volume", 4, "mean"),
+                                   pd.Series(tail["volume"]).rolling(4).mean(), equal_nan=True)
+
+    def test_unknown_window(self):
+        with pytest.raises(ValueError):
+            IndicatorBundle([]).view("weekly")
+
+
+class TestPatternMatching:
+    """测试模式匹配"""
+
+    def test_bundle_and_list_inputs_agree(self):
+        """传入 K 线列表与预构建的 IndicatorBundle 结果一致"""
+        patterns = load_all_patterns()
+        rng = np.random.default_rng(3)
+        for _ in range(50):
+            kline = random_kline(rng, int(rng.integers(5, 45)))
+            assert match_all_patterns(kline, patterns) == match_all_patterns(IndicatorBundle(kline), patterns)
+
+    def test_broken_rules_do_not_abort_matching(self, monkeypatch, capsys):
+        """无法编译或求值出错的规则按未命中处理，每个模式只警告一次"""
+        patterns = load_all_patterns()
+        broken = {"pattern_id": "AI900", "pattern_type": "ai_discovered", "rules": {"when": {">": ["turnover", 1]}}}
+        failing = {"pattern_id": "AI901", "pattern_type": "ai_discovered", "rules": {"when": {">": ["close", 0]}}}
+        original_checks = pattern_matcher._rule_checks
+
+        def checks(view, pattern):
+            if pattern is failing:
+                return {"boom": lambda: np.asarray([1, 2])[5] > 0}
+            return original_checks(view, pattern)
+
+        monkeypatch.setattr(pattern_matcher, "_rule_checks", checks)
+        rng = np.random.default_rng(5)
+        klines = [random_kline(rng, 40) for _ in range(5)]
+        capsys.readouterr()
+        for kline in klines:
+            assert match_all_patterns(kline, patterns + [broken, failing]) == match_all_patterns(kline, patterns)
+        output = capsys.readouterr().out
+        assert output.count("AI900") == 1 and output.count("AI901") == 1
+
+    def test_parallel_matches_serial(self, monkeypatch):
+        """进程池分片匹配与串行结果一致且保持输入顺序"""
+        monkeypatch.setattr(pattern_matcher, "MATCH_PARALLEL_MIN", 0)
+        patterns = load_all_patterns()
+        rng = np.random.default_rng(4)
+        klines = [random_kline(rng, int(rng.integers(5, 45))) for _ in range(40)]
+        serial = [match_all_patterns(kline, patterns) for kline in klines]
+        assert match_stocks(klines, patterns, workers=2, chunk_size=7) == serial
+
+        stocks = {f"{i:06d}": kline for i, kline in enumerate(klines)}
+        expected = [code for code, matched in zip(stocks, serial) if matched]
+        assert pre_screen_stocks(stocks, patterns, workers=2, chunk_size=7, use_cache=False) == expected
+
+
+class TestMatchCache:
+    """测试匹配结果缓存"""
+
+    def test_cached_results_and_partial_recompute(self, tmp_path):
+        """缓存结果与直接匹配一致；修改一个模式只重算该模式"""
+        cache = MatchCache(str(tmp_path / "match_cache.db"), max_entries=10000)
+        patterns = load_all_patterns()
+        rng = np.random.default_rng(5)
+        klines = [random_kline(rng, int(rng.integers(5, 45))) for _ in range(30)]
+        codes = [f"{i:06d}" for i in range(len(klines))]
+        expected = [match_all_patterns(kline, patterns) for kline in klines]
+
+        assert match_stocks(klines, patterns, workers=1, codes=codes, cache=cache) == expected
+        assert cache.hits == 0 and cache.misses == len(klines) * len(patterns)
+        assert match_stocks(klines, patterns, workers=1, codes=codes, cache=cache) == expected
+        assert cache.hits == len(klines) * len(patterns)
+
+        edited = [dict(p) for p in patterns]
+        edited[0]["is_active"] = False
+        misses = cache.misses
+        assert match_stocks(klines, edited, workers=1, codes=codes, cache=cache) == \
+            [match_all_patterns(kline, edited) for kline in klines]
+        assert cache.misses - misses == len(klines)
+
+    def test_matcher_version_invalidates_cache(self, tmp_path, monkeypatch):
+        """匹配逻辑版本或指标窗口参数变化后，已缓存的结果全部失效"""
+        cache = MatchCache(str(tmp_path / "match_cache.db"), max_entries=10000)
+        patterns = load_all_patterns()
+        klines = [random_kline(np.random.default_rng(7), 30)]
+        match_stocks(klines, patterns, workers=1, codes=["000001"], cache=cache)
+
+        monkeypatch.setattr(pattern_matcher, "MATCHER_VERSION", pattern_matcher.MATCHER_VERSION + 1)
+        misses = cache.misses
+        match_stocks(klines, patterns, workers=1, codes=["000001"], cache=cache)
+        assert cache.misses - misses == len(patterns)
+
+        monkeypatch.setitem(pattern_matcher.WINDOWS, "classic", {"avg_volume": 10, "min_periods": 5})
+        misses = cache.misses
+        match_stocks(klines, patterns, workers=1, codes=["000001"], cache=cache)
+        assert cache.misses - misses == len(patterns)
+
+    def test_lru_eviction(self, tmp_path):
+        cache = MatchCache(str(tmp_path / "match_cache.db"), max_entries=2)
+        cache.put_many({("000001", "2025-01-01", "v", "a"): [[], []]})
+        cache.put_many({("000002", "2025-01-01", "v", "a"): [[], []]})
+        cache.get_many([("000001", "2025-01-01", "v", "a")])
+        cache.put_many({("000003", "2025-01-01", "v", "a"): [[], []]})
+        assert cache.stats()["entries"] == 2
+        assert ("000002", "2025-01-01", "v", "a") not in cache.get_many([("000002", "2025-01-01", "v", "a")])
+
+
+class TestPredicateCascade:
+    """测试谓词级联"""
+
+    def test_early_exit_and_stats(self):
+        calls = []
+        cascade = PredicateCascade("demo", ["cheap", "costly"])
+        checks = {"cheap": lambda: calls.append("cheap") or False, "costly": lambda: calls.append("costly") or True}
+        assert cascade.run(checks) is False
+        assert calls == ["cheap"]
+        stats = {st["stage"]: st for st in cascade.stats()}
+        assert stats["cheap"]["pass_rate"] == 0 and stats["costly"]["evaluated"] == 0
+
+    def test_calibrate_puts_selective_stage_first(self):
+        cascade = PredicateCascade("demo", ["loose", "strict"])
+        samples = [{"loose": lambda: True, "strict": lambda i=i: i % 10 == 0} for i in range(50)]
+        assert cascade.calibrate(samples) == ["strict", "loose"]
+
+    def test_stage_order_does_not_change_results(self, monkeypatch):
+        """任意阶段顺序下匹配结果一致（全局级联的顺序在测试结束后恢复）"""
+        patterns = load_all_patterns()
+        rng = np.random.default_rng(6)
+        klines = [random_kline(rng, int(rng.integers(5, 45))) for _ in range(40)]
+        expected = [match_all_patterns(kline, patterns) for kline in klines]
+        for cascade in _cascades.values():
+            monkeypatch.setattr(cascade, "order", list(cascade.order))
+        calibrate_cascades(klines, patterns)
+        for cascade in _cascades.values():
+            cascade.order = cascade.order[::-1]
+        assert [match_all_patterns(kline, patterns) for kline in klines] == expected
@@ -0,0 +1,147 @@
+"""
+模式规则 DSL 单元测试
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.pattern_matcher import load_classic_patterns, match_ai_patterns
+from app.pattern_rules import (
+    CLASSIC_RULES,
+    _Compiler,
+    columns_from_frame,
+    compile_pattern,
+    compile_rule,
+    scan_history,
+)
+
+CLASSIC_PATTERN_FILE = os.path.join(os.path.dirname(__file__), "..", "classic_patterns.json")
+
+
+def make_kline(closes, volumes=None):
+    """根据收盘价序列构造K线"""
+    volumes = volumes or [1000.0] * len(closes)
+    dates = pd.date_range("2025-01-01", periods=len(closes), freq="D")
+    return [
+        {
+            "date": d.strftime("%Y-%m-%d"),
+            "open": c * 0.99,
+            "high": c * 1.01,
+            "low": c * 0.98,
+            "close": c,
+            "volume": v,
+        }
+        for d, c, v in zip(dates, closes, volumes)
+    ]
+
+
+class TestRuleCompiler:
+    """测试规则编译与向量化求值"""
+
+    @pytest.fixture
+    def columns(self):
+        rng = np.random.default_rng(7)
+        closes = list(10 + np.cumsum(rng.normal(0, 0.2, 60)))
+        volumes = list(rng.uniform(800, 1600, 60))
+        df = pd.DataFrame(make_kline(closes, volumes))
+        return df, columns_from_frame(df)
+
+    @pytest.mark.parametrize("how", ["mean", "max", "min", "std", "sum"])
+    def test_rolling_matches_pandas(self, columns, how):
+        """滚动聚合与 pandas.rolling 结果一致"""
+        df, cols = columns
+        rule = {"when": {">=": [{how: "close", "n": 5, "min_periods": 3}, -1e9]}}
+        compiled = compile_rule(rule)
+        expected = getattr(df["close"].rolling(5, min_periods=3), how)()
+        assert compiled.evaluate(cols).tolist() == expected.notna().tolist()
+
+        values = _Compiler({}).series({how: "close", "n": 5, "min_periods": 3})(cols, {})
+        np.testing.assert_allclose(values, expected.to_numpy(), equal_nan=True)
+
+    def test_param_reference_and_cache(self):
+        """参数引用在编译期解析，相同定义只编译一次"""
+        rule = {"when": {">=": ["close", {"param": "level.min"}]}}
+        first = compile_rule(rule, {"level": {"min": 10}})
+        assert compile_rule(rule, {"level": {"min": 10}}) is first
+        assert compile_rule(rule, {"level": {"min": 11}}) is not first
+
+    def test_invalid_rule_raises(self):
+        with pytest.raises(ValueError):
+            compile_rule({"when": {">=": ["close", {"param": "missing"}]}})
+        with pytest.raises(ValueError):
+            compile_rule({"when": {"unknown": []}})
+        with pytest.raises(ValueError):
+            compile_rule({"window": 10})
+        # 未知列在编译期拒绝，重复编译按缓存的错误信息抛出新的异常（不复用同一异常对象）
+        errors = []
+        for _ in range(2):
+            with pytest.raises(ValueError, match="turnover") as info:
+                compile_rule({"when": {">": [{"mean": "turnover", "n": 5}, 1]}})
+            errors.append(info.value)
+        assert errors[0] is not errors[1]
+
+    def test_streak_and_sequence(self):
+        """连续满足与先后顺序条件"""
+        closes = [10, 10, 10, 10.5, 11, 11.5, 11.5, 11.5, 12.5]
+        df = pd.DataFrame(make_kline(closes))
+        cols = columns_from_frame(df)
+
+        streak = compile_rule({"when": {"streak": {">": ["pct_change", 0]}, "min": 3}})
+        assert streak.evaluate(cols).tolist() == [False] * 5 + [True] + [False] * 3
+
+        seq = compile_rule({
+            "when": {"seq": [{"streak": {">": ["pct_change", 0]}, "min": 3},
+                             {">=": ["pct_change", 0.05]}], "gap": 3}
+        })
+        assert seq.match(cols)
+        too_far = compile_rule({
+            "when": {"seq": [{"streak": {">": ["pct_change", 0]}, "min": 3},
+                             {">=": ["pct_change", 0.05]}], "gap": 2}
+        })
+        assert not too_far.match(cols)
+
+
+class TestPatternRules:
+    """测试模式级 DSL 集成"""
+
+    def test_classic_rules_compile(self):
+        """经典模式可用 DSL 表达"""
+        patterns = load_classic_patterns(CLASSIC_PATTERN_FILE)
+        for pattern in patterns:
+            assert pattern["pattern_id"] in CLASSIC_RULES
+            assert compile_pattern(pattern) is not None
+
+    def test_classic_continuous_rise(self):
+        """P003 DSL 在连续放量上涨时命中"""
+        pattern = next(p for p in load_classic_patterns(CLASSIC_PATTERN_FILE) if p["pattern_id"] == "P003")
+        closes = [10.0] * 20 + [10.3, 10.6, 11.0, 11.4]
+        volumes = [1000.0] * 20 + [1600.0, 1800.0, 2000.0, 2200.0]
+        hits = scan_history(make_kline(closes, volumes), pattern)
+        assert hits and hits[-1] == make_kline(closes)[-1]["date"]
+
+    def test_ai_pattern_with_rules(self):
+        """带 rules 的 AI 模式无需手写代码即可匹配"""
+        pattern = {
+            "pattern_id": "AI009",
+            "pattern_name": "放量突破",
+            "pattern_type": "ai_discovered",
+            "parameters": {"volume_multiplier": 1.8},
+            "rules": {
+                "min_bars": 10,
+                "confidence": 0.7,
+                "when": {"all": [
+                    {">=": ["volume", {"mul": [{"mean": "volume", "n": 5, "lag": 1},
+                                               {"param": "volume_multiplier"}]}]},
+                    {">": ["close", {"max": "high", "n": 5, "lag": 1}]},
+                ]},
+            },
+        }
+        closes = [10.0] * 15 + [10.8]
+        volumes = [1000.0] * 15 + [2500.0]
+        matched = match_ai_patterns(make_kline(closes, volumes), [pattern])
+        assert [m["pattern_id"] for m in matched] == ["AI009"]
+        assert matched[0]["confidence"] == 0.7
+
+        assert match_ai_patterns(make_kline(closes, [1000.0] * 16), [pattern]) == []
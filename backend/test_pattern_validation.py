@@ -0,0 +1,64 @@
+"""
+多模式合并验证与本地验证单元测试
+"""
+import json
+import re
+from types import SimpleNamespace
+
+import pandas as pd
+
+from app.analyzer import StockAnalyzer
+
+
+class TestPatternValidation:
+    """测试多模式合并验证与本地验证"""
+
+    def test_patterns_validated_in_one_call(self, slow_client, make_analyzer, make_validation_data):
+        def respond(prompt):
+            count = int(re.search(r"待验证的模式（共(\d+)个）", prompt).group(1))
+            return json.dumps([{"index": i + 1, "matched_count": 10, "success_count": i} for i in range(count)])
+
+        client = slow_client(latency=0, respond=respond)
+        analyzer = make_analyzer(client)
+        patterns = [{"pattern_name": f"模式{i}", "description": "d", "characteristics": ["阳线"]} for i in range(5)]
+        analyzer.validate_patterns_ai(patterns, make_validation_data(), mode="multi")
+
+        assert analyzer.api_calls == 1
+        assert [p["validated_success_rate"] for p in patterns] == [0, 10, 20, 30, 40]
+        assert all(p["validation_sample_count"] == 10 for p in patterns)
+
+    def test_missing_results_fall_back_to_local(self, monkeypatch, slow_client, make_analyzer, make_validation_data):
+        monkeypatch.setattr("app.analyzer.VALIDATION_PATTERNS_PER_CALL", 2)
+        client = slow_client(latency=0, respond=lambda prompt: '[{"index": 1, "matched_count": 4, "success_count": 3}]')
+        analyzer = make_analyzer(client)
+        patterns = [{"pattern_name": f"模式{i}", "description": "d", "characteristics": ["阳线"]} for i in range(3)]
+        analyzer.validate_patterns_ai(patterns, make_validation_data(), mode="multi")
+
+        assert analyzer.api_calls == 2
+        assert patterns[0]["validated_success_rate"] == 75.0
+        # 模式1 未返回结果，按特征筛选（全部样本为阳线，一半上涨达标）
+        assert patterns[1]["validated_success_rate"] == 50.0 and patterns[1]["validation_sample_count"] == 20
+
+    def test_local_matcher_needs_no_llm(self, make_validation_data):
+        pattern = {
+            "pattern_id": "AI009", "pattern_name": "放量突破", "pattern_type": "ai_discovered",
+            "description": "d", "characteristics": [],
+            "rules": {"min_bars": 10, "when": {"all": [
+                {">=": ["volume", {"mul": [{"mean": "volume", "n": 5, "lag": 1}, 1.8]}]},
+                {">": ["close", {"max": "high", "n": 5, "lag": 1}]},
+            ]}},
+        }
+        history = pd.DataFrame([
+            {"date": f"2025-01-{d + 1:02d}", "open": 10.0, "high": 10.1, "low": 9.9,
+             "close": 10.8 if d == 19 else 10.0, "volume": 3000.0 if d == 19 else 1000.0}
+            for d in range(25)
+        ])
+        db = SimpleNamespace(get_stock_data=lambda code: history.iloc[::-1])
+        analyzer = StockAnalyzer(api_key=None, db=db)
+        validation = make_validation_data(4).assign(date=["2025-01-20", "2025-01-20", "2025-01-21", "2025-01-22"],
+                                                     is_success=[1, 0, 1, 1])
+        analyzer.validate_patterns_ai([pattern], validation, mode="local")
+
+        # 只有 01-20 两个样本命中（1 个上涨达标）
+        assert pattern["validation_sample_count"] == 2 and pattern["validated_success_rate"] == 50.0
+        assert analyzer.api_calls == 0
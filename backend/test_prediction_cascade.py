@@ -0,0 +1,111 @@
+"""
+模型分级级联预测单元测试
+"""
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from app.claude_retry import RetryPolicy
+from app.claude_executor import content_text
+
+
+class TestModelCascade:
+    """测试模型分级级联预测"""
+
+    @pytest.fixture
+    def tiered_client(self, slow_client):
+        """分级模拟客户端工厂 tiered_client(strong=None)
+
+        低价模型：0-3 号 90 分，4-7 号 70 分（临界），其余不返回；高价模型：一律 85 分。
+        strong(codes) 给出时替代高价模型的评分（返回 {code: 分数}，或直接抛出异常）
+        """
+        def build(strong=None):
+            client = slow_client(latency=0)
+            create = client.create
+
+            def tiered(model, max_tokens, messages, **kwargs):
+                codes = re.findall(r"^#(\d{6}) ", content_text(messages[0]["content"]), re.M)
+                if "haiku" in model:
+                    scores = {c: 90 if int(c) < 4 else 70 for c in codes if int(c) < 8}
+                else:
+                    scores = strong(codes) if strong else {c: 85 for c in codes}
+                client.respond = lambda prompt: json.dumps(
+                    [{"code": c, "name": "", "probability": p, "reason": model} for c, p in scores.items()])
+                return create(model=model, max_tokens=max_tokens, messages=messages, **kwargs)
+
+            client.messages.create = tiered
+            return client
+
+        return build
+
+    def test_borderline_escalated_to_strong_tier(self, tiered_client, make_analyzer, make_stock_data):
+        analyzer = make_analyzer(tiered_client(), max_in_flight=1)
+        predictions = analyzer.predict_stock_probability(make_stock_data(10), [{"pattern_name": "p", "description": "d"}],
+                                                         batch_size=10, use_pre_screening=False, cascade=True)
+
+        by_code = {p["code"]: p for p in predictions}
+        assert sorted(by_code) == [f"{c:06d}" for c in range(8)]
+        assert all(by_code[f"{c:06d}"]["probability"] == 90 for c in range(4))
+        assert all(by_code[f"{c:06d}"]["reason"].startswith("claude-sonnet") for c in range(4, 8))
+
+        cascade = analyzer.last_cascade
+        assert cascade["escalated"] == 4 and cascade["escalation_rate"] == 40.0
+        assert cascade["tiers"]["haiku_3_5"]["calls"] == 1 and cascade["tiers"]["sonnet_4_5"]["calls"] == 1
+        # 两层分别按各自单价计价
+        models = analyzer.get_api_statistics()["models"]
+        assert cascade["cost_usd"] == round(sum(m["cost_usd"] for m in models.values()), 4)
+        assert models["claude-sonnet-4-5-20250929"]["cost_usd"] > 0
+
+    @pytest.mark.parametrize("strong", [
+        lambda codes: (_ for _ in ()).throw(RuntimeError("strong tier down")),
+        lambda codes: {"garbage": 0},
+        lambda codes: {c: 85 for c in codes[:1]},
+    ], ids=["raises", "garbage", "partial"])
+    def test_failed_escalation_keeps_cheap_results(self, strong, tiered_client, make_analyzer, make_stock_data):
+        """高价层失败或漏掉的临界股票保留低价层结果，级联结果不少于低价层"""
+        analyzer = make_analyzer(tiered_client(strong), max_in_flight=1)
+        analyzer.retry_policy = RetryPolicy(max_retries=1, base_delay=0)
+        published = []
+        predictions = analyzer.predict_stock_probability(make_stock_data(10), [{"pattern_name": "p", "description": "d"}],
+                                                         batch_size=10, use_pre_screening=False, cascade=True,
+                                                         on_prediction=published.append)
+
+        by_code = {p["code"]: p for p in predictions}
+        assert sorted(by_code) == [f"{c:06d}" for c in range(8)]
+        assert sorted(p["code"] for p in published) == sorted(by_code)
+        strong_codes = {code for code, p in by_code.items() if p["reason"].startswith("claude-sonnet")}
+        assert analyzer.last_cascade["escalation_failed"] == 4 - len(strong_codes)
+        assert all(by_code[f"{c:06d}"]["probability"] == 70 for c in range(4, 8) if f"{c:06d}" not in strong_codes)
+
+    def test_cost_ceiling_keeps_cheap_results(self, monkeypatch, tiered_client, make_analyzer, make_stock_data):
+        monkeypatch.setattr("app.analyzer.CASCADE_COST_CEILING_USD", 0)
+        analyzer = make_analyzer(tiered_client(), max_in_flight=1)
+        predictions = analyzer.predict_stock_probability(make_stock_data(10), [{"pattern_name": "p", "description": "d"}],
+                                                         batch_size=10, use_pre_screening=False, cascade=True)
+
+        assert sorted(p["probability"] for p in predictions) == [70] * 4 + [90] * 4
+        assert analyzer.last_cascade["skipped_by_cost_ceiling"] == 4 and analyzer.last_cascade["escalated"] == 0
+        assert analyzer.api_calls == 1
+
+    def test_concurrent_runs_do_not_share_budget(self, monkeypatch, tiered_client, make_analyzer, make_stock_data):
+        """成本上限按本次运行计算：同一分析器上其他运行的花费不计入"""
+        monkeypatch.setattr("app.analyzer.CASCADE_COST_CEILING_USD", 1.0)
+        client = tiered_client()
+        analyzer = make_analyzer(client, max_in_flight=1)
+        create = client.messages.create
+
+        def with_concurrent_run(**kwargs):
+            # 模拟并发运行在第一层期间花掉远超上限的费用
+            analyzer._record_usage(SimpleNamespace(input_tokens=10_000_000, output_tokens=0),
+                                   model="claude-sonnet-4-5-20250929")
+            return create(**kwargs)
+
+        client.messages.create = with_concurrent_run
+        analyzer.predict_stock_probability(make_stock_data(10), [{"pattern_name": "p", "description": "d"}],
+                                           batch_size=10, use_pre_screening=False, cascade=True)
+        cascade = analyzer.last_cascade
+        assert cascade["escalated"] == 4 and cascade["skipped_by_cost_ceiling"] == 0
+        assert 0 < cascade["cost_usd"] < 1.0
+        assert cascade["tiers"]["sonnet_4_5"]["calls"] == 1
@@ -0,0 +1,53 @@
+"""
+流式响应与增量 JSON 解析单元测试
+"""
+import json
+import time
+from types import SimpleNamespace
+
+from app.analyzer import StockAnalyzer
+from app.claude_client import FakeClaudeClient
+from app.claude_executor import ClaudeExecutor, RateLimiter
+from app.json_stream import JsonArrayStream
+
+
+class TestStreaming:
+    """测试流式响应与增量 JSON 解析"""
+
+    def test_incremental_array_parser(self):
+        items = [{"code": f"{i:06d}", "reason": 'a "}]{[" \\ 说明', "nested": [1, {"x": i}]} for i in range(4)]
+        text = "好的：\n```json\n" + json.dumps(items, ensure_ascii=False, indent=2) + "\n```"
+        for size in (1, 5, 64):
+            parser = JsonArrayStream()
+            emitted = []
+            for i in range(0, len(text), size):
+                emitted.append(parser.feed(text[i:i + size]))
+            assert [item for batch in emitted for item in batch] == items
+            # 每个元素在数组结束前就已产出
+            assert size > 1 or sum(map(len, emitted[:text.rindex("]")])) == len(items)
+
+        parser = JsonArrayStream()
+        assert parser.feed('[{"a": 1}, {bad}, {"b": 2}]') == [{"a": 1}, {"b": 2}] and parser.errors == 1
+
+    def test_predictions_published_and_saved_before_task_ends(self, monkeypatch, make_stock_data, predict_all):
+        monkeypatch.setattr("app.analyzer.CLAUDE_CACHE_ENABLED", False)
+        client = FakeClaudeClient(latency=0.4, latency_sigma=0, first_token_fraction=0.1, seed=5,
+                                  respond=lambda prompt: predict_all(
+                                      {"messages": [{"content": prompt}]}))
+        saved, arrivals = [], []
+        db = SimpleNamespace(save_prediction=lambda row: saved.append((time.monotonic(), row["stock_code"])))
+        analyzer = StockAnalyzer(api_key=None, db=db, client=client)
+        analyzer.rate_limiter, analyzer.executor = RateLimiter(0, 0), ClaudeExecutor(1)
+
+        start = time.monotonic()
+        predictions = analyzer.predict_stock_probability(
+            make_stock_data(10), [{"pattern_name": "p", "description": "d"}], batch_size=10,
+            use_pre_screening=False, on_prediction=lambda p: arrivals.append((time.monotonic() - start, p)),
+        )
+        elapsed = time.monotonic() - start
+
+        assert len(arrivals) == len(predictions) == 10
+        assert arrivals[0][0] < elapsed / 2  # 首条结果远早于整批完成
+        assert all("current_price" in p for _, p in arrivals)
+        assert sorted(code for _, code in saved) == [f"{c:06d}" for c in range(10)]  # 逐条保存，且不重复
+        assert saved[0][0] - start < elapsed / 2
@@ -0,0 +1,36 @@
+"""
+按 token 预算装箱单元测试
+"""
+import re
+
+from app.prompt_packer import pack_by_budget
+
+
+class TestPromptPacking:
+    """测试按 token 预算装箱"""
+
+    def test_first_fit_decreasing(self):
+        packing = pack_by_budget([60, 50, 40, 30, 20, 150], budget=100)
+        assert sorted(i for group in packing.groups for i in group) == list(range(6))
+        assert [5] in packing.groups and packing.oversized == 1
+        assert all(sum([60, 50, 40, 30, 20][i] for i in g) <= 100 for g in packing.groups if g != [5])
+        assert len(packing.groups) == 3
+        assert packing.report()["efficiency"] == round(350 / 300 * 100, 1)
+
+    def test_max_items_per_request(self):
+        packing = pack_by_budget([1] * 25, budget=1000, max_items=10)
+        assert [len(g) for g in packing.groups] == [10, 10, 5]
+
+    def test_every_stock_reaches_a_prompt(self, monkeypatch, slow_client, make_analyzer, make_stock_data):
+        """不再截断为前 10 只：每只股票都出现在某个请求中，超出预算的拆分到新请求"""
+        monkeypatch.setattr("app.analyzer.PREDICT_PROMPT_TOKEN_BUDGET", 1000)
+        prompts = []
+        client = slow_client(latency=0, respond=lambda prompt: prompts.append(prompt) or "[]")
+        analyzer = make_analyzer(client, max_in_flight=1)
+        analyzer.predict_stock_probability(make_stock_data(12), [{"pattern_name": "p", "description": "d"}],
+                                           batch_size=50, use_pre_screening=False)
+
+        seen = [code for prompt in prompts for code in re.findall(r"^#(\d{6}) ", prompt, re.M)]
+        assert sorted(seen) == [f"{c:06d}" for c in range(12)]
+        assert len(prompts) == analyzer.last_packing["requests"] > 1
+        assert analyzer.get_api_statistics()["last_packing"]["items"] == 12
@@ -0,0 +1,64 @@
+"""
+量化特征批量计算单元测试
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from app.analyzer import StockAnalyzer
+from app.claude_client import FakeClaudeClient
+from app.quant_features import quantitative_features_batch
+
+
+def make_stock_data(n_codes=60, seed=0):
+    """随机K线，天数在 40/30/20/12/4 间轮换，行顺序打乱"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for c in range(n_codes):
+        days = [40, 30, 20, 12, 4][c % 5]
+        closes = 10 * np.exp(np.cumsum(rng.normal(0, 0.025, days)))
+        volumes = rng.integers(100000, 10000000, days) if c % 2 else rng.uniform(1e5, 1e7, days)
+        frames.append(pd.DataFrame({
+            "code": f"{c:06d}", "name": f"股票{c}",
+            "date": pd.date_range("2025-01-01", periods=days).strftime("%Y-%m-%d"),
+            "open": closes, "high": closes * (1 + rng.uniform(0, 0.02, days)),
+            "low": closes * (1 - rng.uniform(0, 0.02, days)), "close": closes, "volume": volumes,
+        }))
+    return pd.concat(frames).sample(frac=1, random_state=seed)
+
+
+class TestQuantitativeFeaturesBatch:
+    """测试批量计算与逐只参考实现一致"""
+
+    def test_matches_reference_exactly(self):
+        stock_data = make_stock_data()
+        batch = quantitative_features_batch(stock_data)
+        analyzer = StockAnalyzer(api_key=None)
+
+        assert len(batch) == 60
+        for code, df in stock_data.groupby("code"):
+            expected = analyzer._calculate_quantitative_features(df)
+            assert batch[code] == expected
+            assert [type(v) for v in batch[code].values()] == [type(v) for v in expected.values()]
+        # 随机数据中应同时覆盖有/无缺口、有/无横盘的情况
+        gaps = [f["gapSize"] for f in batch.values() if f]
+        assert 0 in gaps and any(gaps)
+        assert any(f["consolidationDays"] for f in batch.values() if f)
+
+    def test_predictions_and_screened_stocks_share_features(self, monkeypatch):
+        monkeypatch.setattr("app.analyzer.CLAUDE_CACHE_ENABLED", False)
+        stock_data = make_stock_data(n_codes=10)
+        stock_data = stock_data[stock_data["code"].map(lambda c: int(c) % 5 < 3)]  # 只保留不少于20天的股票
+
+        client = FakeClaudeClient(latency=0, latency_sigma=0, respond=lambda prompt: json.dumps(
+            [{"code": "000000", "name": "股票0", "probability": 80, "reason": "r"}]))
+        analyzer = StockAnalyzer(api_key=None, client=client)
+        predictions = analyzer.predict_stock_probability(stock_data, [{"pattern_name": "p", "description": "d"}],
+                                                         use_pre_screening=False, cascade=False)
+
+        screened = {s["code"]: s for s in analyzer.last_screened}
+        assert len(screened) == 6
+        assert predictions[0]["matched_quantitative_data"] == screened["000000"]["matched_quantitative_data"]
+        assert predictions[0]["matched_quantitative_data"] == analyzer._calculate_quantitative_features(
+            stock_data[stock_data["code"] == "000000"])